@@ -2,6 +2,7 @@
 pragma solidity ^0.8.20;
 
 import "@openzeppelin/contracts/access/AccessControl.sol";
+import "@openzeppelin/contracts/utils/cryptography/MerkleProof.sol";
 
 /// @title Migrations + TouristRegistry Combined
 /// @notice Combined file containing both the Migrations helper contract and the TouristRegistry
@@ -68,6 +69,16 @@ contract TouristRegistry is AccessControl {
     address[] private registeredTourists;                    // List of tourist addresses
     mapping(bytes32 => Attestation[]) private attestations;  // subjectHash => attestations
 
+    // Batched attestations: one Merkle root covers many (subjectHash, cid) leaves.
+    // leaf = keccak256(abi.encode(subjectHash, cid)); pairs hashed sorted (OpenZeppelin MerkleProof)
+    struct RootAnchor {
+        uint256 timestamp;
+        address issuer;
+        uint256 leafCount;
+        string meta;
+    }
+    mapping(bytes32 => RootAnchor) private kycRoots;          // merkle root => anchor
+
     // ------------------------
     // Events
     // ------------------------
@@ -89,6 +100,14 @@ contract TouristRegistry is AccessControl {
         string meta
     );
 
+    event KycRootAnchored(
+        bytes32 indexed root,
+        address indexed issuer,
+        uint256 leafCount,
+        uint256 timestamp,
+        string meta
+    );
+
     // ------------------------
     // Constructor
     // ------------------------
@@ -211,6 +230,49 @@ contract TouristRegistry is AccessControl {
         return attestations[subjectHash].length;
     }
 
+    // ------------------------
+    // Batched (Merkle root) KYC attestations
+    // ------------------------
+
+    function anchorKycRoot(
+        bytes32 root,
+        uint256 leafCount,
+        string calldata meta
+    ) external onlyRole(VERIFIER_ROLE) {
+        require(root != bytes32(0), "Empty root");
+        require(kycRoots[root].timestamp == 0, "Root already anchored");
+        kycRoots[root] = RootAnchor({
+            timestamp: block.timestamp,
+            issuer: _msgSender(),
+            leafCount: leafCount,
+            meta: meta
+        });
+        emit KycRootAnchored(root, _msgSender(), leafCount, block.timestamp, meta);
+    }
+
+    function getKycRoot(bytes32 root)
+        external
+        view
+        returns (uint256 timestamp, address issuer, uint256 leafCount, string memory meta)
+    {
+        RootAnchor storage r = kycRoots[root];
+        return (r.timestamp, r.issuer, r.leafCount, r.meta);
+    }
+
+    /// @notice True when (subjectHash, cid) is included under an anchored root.
+    function verifyKycLeaf(
+        bytes32 root,
+        bytes32 subjectHash,
+        string calldata cid,
+        bytes32[] calldata proof
+    ) external view returns (bool) {
+        if (kycRoots[root].timestamp == 0) {
+            return false;
+        }
+        bytes32 leaf = keccak256(abi.encode(subjectHash, cid));
+        return MerkleProof.verifyCalldata(proof, root, leaf);
+    }
+
     // ------------------------
     // Role Management Wrappers
     // ------------------------
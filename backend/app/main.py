@@ -1,12 +1,23 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 # Routers
 from app.routes import tourists
 from app.routes.zones import router as zones_router
 from app.routes import kyc_routes  # ✅ add this
+from app.routes.admin_routes import router as admin_router
 
 from app.routes.location_routes import router as location_router
+from app.services.idempotency_service import IdempotencyConflict, IdempotencyInFlight
+from app.services.blockchain_service import CHAIN, ChainUnavailableError
+from app.services.kyc_batch_anchor import KYC_ANCHORER
+from app.services.chain_indexer import CHAIN_INDEXER
+from app.services.anchor_queue import ANCHOR_JOBS
+from app.services.crypto_worker import CRYPTO, CryptoBusyError
+from app.services.key_rotation import KEY_ROTATION
+from app.services import digital_id_service
+from app.db import session as db_session
 
 app = FastAPI(title="Tourist Digital ID Backend with Blockchain")
 
@@ -33,6 +44,62 @@ app.include_router(tourists.alerts_router, prefix="/alerts", tags=["Alerts"])
 
 app.include_router(location_router)
 
+# Key status and rotation jobs (router has prefix="/admin", admin role only)
+app.include_router(admin_router)
+
+
+@app.exception_handler(IdempotencyConflict)
+async def _idempotency_conflict(request: Request, exc: IdempotencyConflict):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+
+@app.exception_handler(IdempotencyInFlight)
+async def _idempotency_in_flight(request: Request, exc: IdempotencyInFlight):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+
+@app.exception_handler(ChainUnavailableError)
+async def _chain_unavailable(request: Request, exc: ChainUnavailableError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+@app.exception_handler(CryptoBusyError)
+async def _crypto_busy(request: Request, exc: CryptoBusyError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.on_event("startup")
+async def _check_settings():
+    # refuse to start without the digital ID key (unkeyed IDs are computable from a phone number)
+    digital_id_service.require_secret()
+
+
+@app.on_event("startup")
+async def _start_chain_client():
+    # connects in a background thread; the API serves requests while the node is unreachable
+    CHAIN.start()
+    # resume Merkle batches queued before a restart (both DB engines hold attestations)
+    KYC_ANCHORER.watch(tourists.engine)
+    KYC_ANCHORER.watch(db_session.engine)
+    CHAIN_INDEXER.start(tourists.engine)
+    # durable anchoring jobs; also adopt users left pending before the queue existed
+    ANCHOR_JOBS.start(tourists.engine)
+    tourists.requeue_pending_anchors()
+    # spawn the crypto worker processes now rather than on the first registration
+    CRYPTO.start()
+    # continue key rotation jobs left running before a restart
+    KEY_ROTATION.start(tourists.engine, {"profiles": tourists.engine, "kyc": db_session.engine})
+
+
+@app.on_event("shutdown")
+async def _stop_chain_client():
+    KEY_ROTATION.stop()
+    ANCHOR_JOBS.stop()
+    CHAIN_INDEXER.stop()
+    CHAIN.stop()
+    CRYPTO.stop()
+
+
 @app.on_event("startup")
 async def _print_routes():
     print("Registered routes:")
@@ -46,3 +113,15 @@ async def _print_routes():
 @app.get("/", tags=["Root"])
 async def root():
     return {"message": "✅ Tourist Blockchain Digital ID Backend Running"}
+
+
+@app.get("/health", tags=["Root"])
+async def health():
+    chain = CHAIN.status()
+    return {
+        "status": "ok" if chain["state"] == "ready" else "degraded",
+        "chain": chain,
+        "indexer": CHAIN_INDEXER.stats(),
+        "anchor_queue": ANCHOR_JOBS.stats(),
+        "crypto_worker": CRYPTO.stats(),
+    }
@@ -14,6 +14,7 @@ class RegistrationStatus(BaseModel):
     phone_number: str
     state: str
     digital_id: Optional[str] = None
+    onchain_pending: Optional[bool] = None  # ID issued, chain registration not mined yet
 
 class TouristResponse(BaseModel):
     phone_number: str
@@ -14,7 +14,7 @@ class User(Base):
     phone_number = Column(String(32), unique=True, index=True, nullable=False)
     full_name = Column(String(256))
     email = Column(String(256))
-    did = Column(String(512))           # DID or tx hash
+    did = Column(String(512), index=True)  # DID or tx hash (gateways look users up by it)
     kyc_id = Column(String(512))
     profile = Column(JSON)              # pointer: {"ipfs_cid": "...", "encrypted_key_b64": "...", "iv_b64": "...", "key_meta": {...}}
     state = Column(String(64), nullable=False, default="unregistered", index=True)
@@ -48,6 +48,10 @@ class Itinerary(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     user = relationship("User", back_populates="itineraries")
 
+    __table_args__ = (
+        Index("ix_itineraries_user_date", "user_id", "date"),
+    )
+
 class KYCRecord(Base):
     __tablename__ = "kyc_records"
     id = Column(Integer, primary_key=True)
@@ -93,6 +97,16 @@ class Attestation(Base):
     attestation_index = Column(Integer)  # on-chain attestation index if available
     meta = Column(JSON)
     created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    # filled by the chain indexer from the emitting log (NULL until the event is indexed)
+    event_name = Column(String(32))     # "KycAnchored" | "TouristRegistered"
+    block_number = Column(Integer)
+    block_hash = Column(String(66))
+    log_index = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_attestations_subject_block", "subject_hash", "block_number"),
+        Index("ix_attestations_tx_log", "tx_hash", "log_index"),
+    )
 
 class Location(Base):
     __tablename__ = "locations"
@@ -156,3 +170,73 @@ class AuditLog(Base):
     target = Column(String(256))
     meta = Column(JSON)
     created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+    id = Column(Integer, primary_key=True)
+    scope = Column(String(64), nullable=False)        # e.g. "register", "sos", "kyc_submit"
+    key = Column(String(255), nullable=False)         # client Idempotency-Key header
+    request_hash = Column(String(64), nullable=False) # sha256 of the request body
+    status_code = Column(Integer)                     # NULL while the first request is in flight
+    response = Column(JSON)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+    __table_args__ = (
+        UniqueConstraint("scope", "key", name="uq_idempotency_scope_key"),
+    )
+
+
+class ChainCheckpoint(Base):
+    """Last block a chain indexer has fully processed (plus recent hashes for reorg checks)."""
+    __tablename__ = "chain_checkpoints"
+    name = Column(String(64), primary_key=True)
+    block_number = Column(Integer, nullable=False)
+    block_hash = Column(String(66))
+    recent_blocks = Column(JSON)  # [[number, hash], ...] newest last
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+class AnchorJob(Base):
+    """Durable on-chain anchoring work item (drained by app/services/anchor_queue.py)."""
+    __tablename__ = "anchor_jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(32), nullable=False)          # e.g. "register_tourist"
+    subject_id = Column(Integer, nullable=False)       # users.id for register_tourist
+    payload = Column(JSON)
+    status = Column(String(16), nullable=False, default="queued")  # queued | submitted | done | dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)
+    tx_hash = Column(String(128))
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_anchor_jobs_status_next", "status", "next_attempt_at"),
+        Index("ix_anchor_jobs_kind_subject", "kind", "subject_id"),
+    )
+
+class KeyRotationJob(Base):
+    """Resumable rewrap of stored data keys under the current keys (app/services/key_rotation.py)."""
+    __tablename__ = "key_rotation_jobs"
+    id = Column(Integer, primary_key=True)
+    target = Column(String(32), nullable=False)        # "profiles" (users.profile) | "kyc" (kyc_records)
+    # running | paused | done | done_with_errors (rows left under the previous keys) | failed
+    status = Column(String(16), nullable=False, default="running", index=True)
+    cursor = Column(Integer, nullable=False, default=0)  # highest row id handled
+    total = Column(Integer)                            # rows in the target when the job was created
+    scanned = Column(Integer, nullable=False, default=0)
+    rewrapped = Column(Integer, nullable=False, default=0)
+    current = Column(Integer, nullable=False, default=0)   # already under the target keys
+    skipped = Column(Integer, nullable=False, default=0)   # not ours to rewrap (base64-dev, kms) or changed meanwhile
+    failed = Column(Integer, nullable=False, default=0)
+    failed_ids = Column(JSON)                          # row ids that could not be rewrapped (retried at the end)
+    target_keys = Column(JSON)                         # {"server_key_version": ..., "master_key_id": ...}
+    max_per_second = Column(Float)
+    active_seconds = Column(Float, nullable=False, default=0.0)
+    owner = Column(String(64))                         # process holding the lease
+    heartbeat_at = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    finished_at = Column(DateTime)
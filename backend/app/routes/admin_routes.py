@@ -0,0 +1,68 @@
+# app/routes/admin_routes.py
+"""Admin operations: key status and key rotation jobs (see app/services/key_rotation.py)."""
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+
+from app.auth import require_role
+from app.services.key_rotation import KEY_ROTATION, keys_status
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_role("admin"))])
+
+
+class KeyRotationRequest(BaseModel):
+    target: str  # "profiles" | "kyc"
+    max_per_second: Optional[float] = None  # rewraps/s; 0 = unthrottled, None = KEY_ROTATION_MAX_PER_SECOND
+
+
+@router.get("/keys")
+def admin_keys():
+    """Key versions new records are wrapped with, the previous keys still accepted, and whether they can go."""
+    return keys_status()
+
+
+@router.post("/key-rotation", status_code=status.HTTP_202_ACCEPTED)
+def start_key_rotation(req: KeyRotationRequest):
+    """Rewrap every stored data key of target under the current keys, in the background."""
+    try:
+        return KEY_ROTATION.create(req.target, max_per_second=req.max_per_second)
+    except ValueError as e:
+        code = 409 if "already open" in str(e) else 400
+        raise HTTPException(status_code=code, detail=str(e))
+
+
+@router.get("/key-rotation")
+def list_key_rotations(limit: int = 20):
+    return KEY_ROTATION.list(limit)
+
+
+@router.get("/key-rotation/{job_id}")
+def key_rotation_progress(job_id: int):
+    job = KEY_ROTATION.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Key rotation job not found")
+    return job
+
+
+def _set_status(job_id: int, new_status: str):
+    try:
+        return KEY_ROTATION.set_status(job_id, new_status)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/key-rotation/{job_id}/pause")
+def pause_key_rotation(job_id: int):
+    """Stop after the current chunk; the cursor is kept for resume."""
+    return _set_status(job_id, "paused")
+
+
+@router.post("/key-rotation/{job_id}/resume")
+def resume_key_rotation(job_id: int):
+    return _set_status(job_id, "running")
@@ -1,22 +1,36 @@
 # app/routes/kyc_routes.py
 import os
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
+import logging
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from sqlalchemy.orm import Session
 
 from app.services import kyc_service
 from app.services import blockchain_service
+from app.services.crypto_worker import CryptoBusyError
+from app.services.kyc_grants import GRANT_JOBS
+from app.services.kyc_batch_anchor import KYC_ANCHORER, ensure_attestation_table, verify_attestation_row
+from app.services.chain_indexer import latest_attestation
+from app.models.tourist_models import Attestation
+from app.utils.merkle import leaf_hash, to_bytes32, to_hex, verify_proof
+from app.services.idempotency_service import IDEMPOTENCY, request_fingerprint
 from app.db.session import get_db
 from app.models.kyc_model import KYCRecord
 
 # Auth dependency - implement per earlier suggestion (JWT/OAuth2)
 from app.auth import get_current_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/kyc", tags=["kyc"])
 
-MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 5 * 1024 * 1024))  # 5 MB default
+# uploads are encrypted and streamed to IPFS chunk by chunk (kyc_service.submit_kyc_file) and
+# downloads are streamed back the same way (kyc_service.open_kyc_file), so the limit bounds
+# spool disk and IPFS storage, not server memory
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))  # 50 MB default
 ALLOWED_CONTENT_TYPES = {"application/pdf", "image/png", "image/jpeg", "application/json", "text/plain"}
 
 
@@ -29,6 +43,7 @@ class KYCSubmitResponse(BaseModel):
     kyc_id: int
     ipfs_cid: str
     tx_hash: Optional[str] = None
+    attestation_id: Optional[int] = None  # batched anchoring: poll /kyc/attestation/verify with it
 
 
 class KYCDecisionRequest(BaseModel):
@@ -39,32 +54,55 @@ class KYCDecisionRequest(BaseModel):
 
 
 @router.post("/submit", response_model=KYCSubmitResponse)
-def kyc_submit(req: KYCSubmitRequest, db: Session = Depends(get_db), user=Depends(get_current_user)):
+def kyc_submit(
+    req: KYCSubmitRequest,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     """
     Submit structured KYC JSON. Protected endpoint (requires authentication).
     Expects kyc_service.submit_kyc to perform encryption, IPFS upload, on-chain anchoring, DB insert.
+    A retry with the same Idempotency-Key returns the first response (no second upload/anchor).
     """
     # Basic server-side validation
     if not req.phone_number or not isinstance(req.kyc_data, dict):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid payload")
 
+    if idempotency_key:
+        replay = IDEMPOTENCY.begin(db, "kyc_submit", idempotency_key, request_fingerprint(req.dict()))
+        if replay is not None:
+            return JSONResponse(status_code=replay[0], content=replay[1], headers={"Idempotent-Replayed": "true"})
+
     try:
         out = kyc_service.submit_kyc(db, req.phone_number, req.kyc_data, actor=user)
-        return KYCSubmitResponse(
+        resp = KYCSubmitResponse(
             kyc_id=int(out["kyc_id"]),
             ipfs_cid=out["ipfs_cid"],
             tx_hash=out.get("tx_hash"),
+            attestation_id=out.get("attestation_id"),
         )
     except ValueError as e:
+        if idempotency_key:
+            IDEMPOTENCY.abort(db, "kyc_submit", idempotency_key)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except CryptoBusyError as e:
+        if idempotency_key:
+            IDEMPOTENCY.abort(db, "kyc_submit", idempotency_key)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
+        if idempotency_key:
+            IDEMPOTENCY.abort(db, "kyc_submit", idempotency_key)
         # Don't leak internal exceptions to clients in prod - log server-side instead (not shown)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
+    if idempotency_key:
+        IDEMPOTENCY.complete(db, "kyc_submit", idempotency_key, resp.dict())
+    return resp
+
 
 @router.post("/upload", status_code=201)
-async def kyc_upload(
-    request: Request,
+def kyc_upload(
     phone_number: str = Form(...),
     meta: Optional[str] = Form(""),
     file: UploadFile = File(...),
@@ -75,29 +113,38 @@ async def kyc_upload(
     Secure binary upload flow:
       - enforce size/type limits
       - optional malware/AV scan hook
-      - encrypt locally using per-record symmetric key
-      - upload encrypted blob to IPFS
+      - encrypt locally using per-record symmetric key, in chunks, straight from the spooled
+        upload file into the IPFS request (the file is never held in memory as a whole)
       - anchor ipfs cid on-chain with only a hash or CID (no PII)
       - store metadata and encrypted sym-key mapping in DB
+    Sync endpoint: FastAPI runs it in the threadpool, so encryption and the IPFS upload do not
+    block the event loop.
     """
     # Validate content-type
     content_type = file.content_type or ""
     if content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file type")
 
-    content = await file.read()
-    if len(content) > MAX_UPLOAD_BYTES:
+    fileobj = file.file
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    if size > MAX_UPLOAD_BYTES:
         raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
 
     # Optional: place to call malware scanner (ClamAV) or quarantine
     # Example placeholder:
-    if hasattr(kyc_service, "scan_bytes_for_malware"):
-        clean_ok = kyc_service.scan_bytes_for_malware(content)
+    if hasattr(kyc_service, "scan_file_for_malware"):
+        clean_ok = kyc_service.scan_file_for_malware(fileobj)
+        fileobj.seek(0)
         if not clean_ok:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Uploaded file failed malware scan")
 
     try:
-        out = kyc_service.submit_kyc(db, phone_number, {"filename": file.filename, "content_bytes": content, "meta": meta}, actor=user)
+        out = kyc_service.submit_kyc_file(
+            db, phone_number, fileobj, size,
+            filename=file.filename, content_type=content_type, meta=meta, actor=user,
+        )
         return {
             "kyc_id": int(out["kyc_id"]),
             "ipfs_cid": out["ipfs_cid"],
@@ -116,22 +163,40 @@ async def kyc_upload(
 
 @router.get("/{kyc_id}/download")
 def kyc_download(kyc_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    """Decrypt KYC blob for review. Protected; only authorized roles should be allowed."""
+    """
+    Decrypt KYC blob for review. Protected; only authorized roles should be allowed.
+    JSON submissions come back as {"kyc_id", "kyc_data"}; uploaded files are streamed as the
+    original bytes (decrypted chunk by chunk in the crypto worker pool), with the filename in
+    Content-Disposition.
+    """
     # Authorize user: you can check role or use additional DB ACL
     # For example:
     if user.get("role") not in ("admin", "verifier"):
         raise HTTPException(status_code=403, detail="Forbidden")
 
     try:
+        if kyc_service.is_kyc_file(db, kyc_id):
+            manifest, chunks = kyc_service.open_kyc_file(db, kyc_id, actor=user)
+            headers = {"Content-Disposition": 'attachment; filename="%s"' % _safe_filename(manifest.get("filename"))}
+            if manifest.get("size") is not None:
+                headers["Content-Length"] = str(manifest["size"])
+            return StreamingResponse(chunks, media_type=manifest.get("content_type") or "application/octet-stream",
+                                     headers=headers)
         data = kyc_service.get_kyc(db, kyc_id, actor=user)
-        # Return minimal required info; prefer streaming bytes in production
         return {"kyc_id": kyc_id, "kyc_data": data}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except CryptoBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+def _safe_filename(name: Optional[str]) -> str:
+    name = os.path.basename(name or "") or "kyc-document"
+    return "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
+
+
 @router.post("/decision")
 def kyc_decision(req: KYCDecisionRequest, db: Session = Depends(get_db), user=Depends(get_current_user)):
     # Authorize reviewer role
@@ -188,6 +253,37 @@ def kyc_grant(req: GrantAccessRequest, db: Session = Depends(get_db), user=Depen
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+class GrantBatchRequest(BaseModel):
+    grantee_address: str
+    grantee_pubkey_pem: str
+    kyc_ids: Optional[List[int]] = None  # default: every record in statuses
+    statuses: List[str] = [kyc_service.STATE_KYC_APPROVED]
+
+
+@router.post("/grant/batch", status_code=status.HTTP_202_ACCEPTED)
+def kyc_grant_batch(req: GrantBatchRequest, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    """Grant a new grantee many records at once; poll GET /grant/batch/{job_id} for progress."""
+    if user.get("role") not in ("admin", "verifier"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    try:
+        return GRANT_JOBS.start(
+            db, req.grantee_address, req.grantee_pubkey_pem,
+            kyc_ids=req.kyc_ids, statuses=req.statuses, actor=user,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/grant/batch/{job_id}")
+def kyc_grant_batch_progress(job_id: str, user=Depends(get_current_user)):
+    if user.get("role") not in ("admin", "verifier"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    job = GRANT_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Grant job not found")
+    return job
+
+
 @router.get("/key/{kyc_id}")
 def kyc_get_encrypted_key(kyc_id: int, grantee_address: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
     # Only return encrypted symmetric key if caller is authorized (backend policy)
@@ -234,17 +330,98 @@ def kyc_attestation(kyc_id: int, db: Session = Depends(get_db), user=Depends(get
     rec = db.query(KYCRecord).filter(KYCRecord.id == kyc_id).first()
     if not rec:
         raise HTTPException(status_code=404, detail="KYC record not found")
-    try:
-        cid, timestamp, issuer, meta = blockchain_service.contract_instance.functions.getLatestAttestation(
-            blockchain_service.w3.keccak(text=str(rec.phone_number))
-        ).call()
+    ensure_attestation_table(db.get_bind())
+    # batch mode (the default): the record's own leaf row holds root, proof and anchoring status
+    rows = (
+        db.query(Attestation)
+        .filter(Attestation.ipfs_cid == rec.ipfs_cid, Attestation.event_name.is_(None))
+        .order_by(Attestation.id.desc())
+        .all()
+    )
+    leaf = next((a for a in rows if (a.meta or {}).get("leaf")), None)
+    if leaf is not None:
+        meta = leaf.meta
         return {
             "kyc_id": rec.id,
             "subject": rec.phone_number,
-            "cid": cid,
-            "timestamp": timestamp,
-            "issuer": issuer,
-            "meta": meta,
+            "cid": leaf.ipfs_cid,
+            "mode": "batch",
+            "attestation_id": leaf.id,
+            "status": meta.get("status"),
+            "leaf": meta.get("leaf"),
+            "merkle_root": meta.get("merkle_root"),
+            "leaf_index": meta.get("leaf_index"),
+            "proof": meta.get("proof"),
+            "tx_hash": leaf.tx_hash,
+            "block_number": meta.get("block_number"),
+            "issuer": leaf.issuer,
         }
+    # direct mode: indexed copy of the KycAnchored log (chain_indexer); live eth_call only when not indexed yet
+    att = latest_attestation(db, blockchain_service.subject_hash_hex(rec.phone_number))
+    if att is not None:
+        return {
+            "kyc_id": rec.id,
+            "subject": rec.phone_number,
+            "cid": att.ipfs_cid,
+            "timestamp": (att.meta or {}).get("timestamp"),
+            "issuer": att.issuer,
+            "meta": (att.meta or {}).get("onchain_meta", ""),
+        }
+    try:
+        latest = blockchain_service.get_latest_attestation(rec.phone_number)
+        return {"kyc_id": rec.id, "subject": rec.phone_number, **latest}
+    except blockchain_service.ChainUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception:
         raise HTTPException(status_code=500, detail="Blockchain attestation error")
+
+
+class AttestationVerifyRequest(BaseModel):
+    # either a stored attestation ...
+    attestation_id: Optional[int] = None
+    # ... or an explicit (subject_hash, cid, proof, root) from a third party
+    subject_hash: Optional[str] = None
+    cid: Optional[str] = None
+    proof: Optional[List[str]] = None
+    root: Optional[str] = None
+
+
+@router.post("/attestation/verify")
+def kyc_attestation_verify(req: AttestationVerifyRequest, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    """
+    Check Merkle inclusion of a KYC attestation and whether its root is anchored on-chain.
+    anchored_onchain is null when the chain is unreachable.
+    """
+    if user.get("role") not in ("admin", "verifier"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    if req.attestation_id is not None:
+        att = db.query(Attestation).filter(Attestation.id == req.attestation_id).first()
+        if not att:
+            raise HTTPException(status_code=404, detail="Attestation not found")
+        result = verify_attestation_row(att)
+    else:
+        if not (req.subject_hash and req.cid and req.root and req.proof is not None):
+            raise HTTPException(status_code=400, detail="attestation_id or subject_hash, cid, proof and root are required")
+        try:
+            leaf = to_hex(leaf_hash(req.subject_hash, req.cid))
+            included = verify_proof(leaf, req.proof, req.root)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        result = {"subject_hash": req.subject_hash, "cid": req.cid, "leaf": leaf,
+                  "root": req.root, "proof": req.proof, "included": included}
+
+    result["anchored_onchain"] = None
+    if result["included"]:
+        try:
+            result["anchored_onchain"] = blockchain_service.is_kyc_root_anchored(to_bytes32(result["root"]))
+        except Exception as e:
+            logger.warning("On-chain root check failed: %s", e)
+    return result
+
+
+@router.get("/attestation-batches/stats")
+def kyc_batch_stats(user=Depends(get_current_user)):
+    if user.get("role") not in ("admin", "verifier"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return KYC_ANCHORER.stats()
@@ -7,9 +7,10 @@ Behavior:
    wraps AES key with server RSA public key (if provided), and stores only the
    IPFS CID + wrapped key + iv + key_meta in the user's profile JSON.
  - KYC flow (/kyc/submit) remains delegated to kyc_service (which already encrypts).
- - Blockchain anchoring is attempted but non-blocking (failure -> pending state).
+ - Blockchain anchoring is queued in anchor_jobs and retried with backoff (failure -> pending state).
 """
 
+import asyncio
 import datetime
 import json
 import os
@@ -24,10 +25,13 @@ from fastapi import (
     Depends,
     Request,
     Query,
-    BackgroundTasks,
+    Header,
 )
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect as sa_inspect
 from sqlalchemy.orm import sessionmaker, Session
 
 # Services (existing)
@@ -45,14 +49,30 @@ from app.models.response_models import (
 from app.services.blockchain_service import register_tourist_on_chain
 from app.services.id_service import generate_otp, verify_otp as svc_verify_otp
 from app.services.kyc_service import submit_kyc, decide_kyc
-from app.services.digital_id_service import issue_digital_id
+from app.services.digital_id_service import issue_digital_id, digital_id_chain_payload
+from app.services import itinerary_service
+from app.services.anchor_queue import ANCHOR_JOBS, OPEN_STATUSES as ANCHOR_OPEN_STATUSES
+from app.services.cache_service import TTLCache
+from app.services.user_cache import USER_CACHE, get_user, get_user_snapshot
+from app.services.idempotency_service import IDEMPOTENCY, request_fingerprint
+from app.utils.request_body import (
+    read_json_body,
+    decode_json_body,
+    apply_aliases,
+    REGISTER_ALIASES,
+    SOS_ALIASES,
+)
 
 # Encryption & IPFS services (must exist)
 from app.services import crypto_service
+from app.services.crypto_worker import CRYPTO, CryptoBusyError
+from app.services.data_key_cache import DATA_KEYS, KEK_METHOD, PROFILE_KEY_MODE
+from app.services.key_registry import KEYS, SERVER_PUBLIC
 from app.services import ipfs_service
 
 # Shared models
 from app.models.tourist_models import Base, User, Itinerary
+from app.auth import require_role
 
 logger = logging.getLogger(__name__)
 
@@ -68,9 +88,69 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base.metadata.create_all(bind=engine)
 
 
-def _anchor_user_on_chain(user_id: int, payload_for_chain: Dict[str, Any]):
+def _ensure_indexes(*models):
+    """
+    create_all() skips tables that already exist, so indexes added to a model later
+    never reach an existing DB file. Create any missing ones (no-op when present).
+    """
+    for model in models:
+        for idx in model.__table__.indexes:
+            try:
+                idx.create(bind=engine, checkfirst=True)
+            except Exception:
+                logger.exception("Failed to ensure index %s", idx.name)
+
+
+_ensure_indexes(User, Itinerary)
+
+# Device profile responses for gateways, keyed by ("did", did) and ("device", device_id).
+# Invalidated after any commit that writes a User (old and new did / device_id), like USER_CACHE.
+DEVICE_PROFILE_CACHE = TTLCache(
+    "device_profile",
+    ttl_seconds=float(os.getenv("DEVICE_PROFILE_CACHE_TTL", "30")),
+    max_entries=int(os.getenv("DEVICE_PROFILE_CACHE_MAX", "10000")),
+)
+
+_DEVICE_PROFILE_DIRTY_KEY = "_device_profile_dirty_keys"
+
+
+def _device_profile_keys(u: User):
+    """Cache keys for both the current and the pre-flush did / device_id of u."""
+    state = sa_inspect(u)
+    for attr, kind in (("did", "did"), ("device_id", "device")):
+        # current value (loaded if expired, as user_cache does for phone_number) + pre-flush one
+        for value in (getattr(u, attr), *state.attrs[attr].history.deleted):
+            if value:
+                yield (kind, value)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_device_profile_keys(session, flush_context):
+    keys = session.info.setdefault(_DEVICE_PROFILE_DIRTY_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            keys.update(_device_profile_keys(obj))
+    if keys:
+        DEVICE_PROFILE_CACHE.invalidate(*keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_device_profiles(session):
+    keys = session.info.pop(_DEVICE_PROFILE_DIRTY_KEY, None)
+    if keys:
+        DEVICE_PROFILE_CACHE.invalidate(*keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_device_profile_keys(session):
+    session.info.pop(_DEVICE_PROFILE_DIRTY_KEY, None)
+
+
+def _anchor_user_on_chain(user_id: int, payload_for_chain: Dict[str, Any]) -> Optional[str]:
     """
-    Background worker: attempt to send register_tourist_on_chain and persist tx hash or mark pending.
+    ANCHOR_JOBS handler: submit register_tourist_on_chain and persist the tx hash, or mark pending
+    and re-raise so the queue retries with backoff.
+    The tx is not waited on; _on_user_anchor_receipt records the outcome once it is mined.
     Creates its own DB session.
     """
     db = SessionLocal()
@@ -78,7 +158,7 @@ def _anchor_user_on_chain(user_id: int, payload_for_chain: Dict[str, Any]):
         try:
             tx_hash = register_tourist_on_chain(payload_for_chain)
         except Exception as e:
-            logger.exception("Blockchain anchoring failed for user_id=%s", user_id)
+            logger.warning("Blockchain anchoring failed for user_id=%s: %s", user_id, e)
             # persist pending state
             u = db.query(User).get(user_id)
             if u:
@@ -87,24 +167,141 @@ def _anchor_user_on_chain(user_id: int, payload_for_chain: Dict[str, Any]):
                 u.receipt = {"onchain_error": str(e)}
                 db.add(u)
                 db.commit()
-            return
+            raise
 
-        # on success, update user
+        # on submission, update user (receipt details follow once mined)
         u = db.query(User).get(user_id)
         if u:
             u.did = tx_hash
             u.state = "registered_onchain"
-            # optionally store a minimal receipt-like object
             u.receipt = {
                 "txHash": tx_hash,
-                "anchored_at": datetime.datetime.utcnow().isoformat(),
+                "submitted_at": datetime.datetime.utcnow().isoformat(),
+                "confirmed": False,
             }
             db.add(u)
             db.commit()
+        return tx_hash
+    finally:
+        db.close()
+
+
+def _on_user_anchor_receipt(user_id: int, tx_hash: str, receipt: Optional[Dict[str, Any]], error: Optional[str]):
+    """ANCHOR_JOBS receipt callback: write the mined receipt (or the failure) back to the user row."""
+    db = SessionLocal()
+    try:
+        u = db.query(User).get(user_id)
+        if not u or u.did != tx_hash:
+            return  # re-anchored or re-issued since; this receipt is stale
+        if error:
+            u.state = "registered_pending_onchain"
+            u.receipt = {"txHash": tx_hash, "onchain_error": error}
+        else:
+            u.receipt = {
+                **(u.receipt or {}),
+                **receipt,
+                "anchored_at": datetime.datetime.utcnow().isoformat(),
+                "confirmed": True,
+            }
+        db.add(u)
+        db.commit()
     except Exception:
-        logger.exception(
-            "Error while persisting on-chain result for user_id=%s", user_id
-        )
+        db.rollback()
+        logger.exception("Failed to record anchor receipt for user_id=%s", user_id)
+    finally:
+        db.close()
+
+
+ANCHOR_KIND_REGISTER = "register_tourist"
+ANCHOR_JOBS.register(ANCHOR_KIND_REGISTER, _anchor_user_on_chain, on_receipt=_on_user_anchor_receipt)
+
+
+def _issue_did_on_chain(user_id: int, payload_for_chain: Dict[str, Any]) -> str:
+    """
+    ANCHOR_JOBS handler for an issued short digital ID: submit the registration and remember
+    the tx in user.receipt. The short ID itself (user.did) never changes.
+    """
+    tx_hash = register_tourist_on_chain(payload_for_chain)
+    db = SessionLocal()
+    try:
+        u = db.get(User, user_id)
+        if u:
+            u.receipt = {
+                **(u.receipt or {}),
+                "txHash": tx_hash,
+                "submitted_at": datetime.datetime.utcnow().isoformat(),
+                "confirmed": False,
+            }
+            db.commit()
+    finally:
+        db.close()
+    return tx_hash
+
+
+def _on_did_receipt(user_id: int, tx_hash: str, receipt: Optional[Dict[str, Any]], error: Optional[str]):
+    """ANCHOR_JOBS receipt callback for _issue_did_on_chain."""
+    db = SessionLocal()
+    try:
+        u = db.get(User, user_id)
+        if not u or (u.receipt or {}).get("txHash") != tx_hash:
+            return
+        if error:
+            u.receipt = {**u.receipt, "onchain_pending": receipt is None, "onchain_error": error}
+        else:
+            merged = {
+                **u.receipt,
+                **receipt,
+                "anchored_at": datetime.datetime.utcnow().isoformat(),
+                "confirmed": True,
+                "onchain_pending": False,
+            }
+            merged.pop("onchain_error", None)
+            u.receipt = merged
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to record DID receipt for user_id=%s", user_id)
+    finally:
+        db.close()
+
+
+ANCHOR_KIND_ISSUE_DID = "issue_digital_id"
+ANCHOR_JOBS.register(ANCHOR_KIND_ISSUE_DID, _issue_did_on_chain, on_receipt=_on_did_receipt)
+
+
+def requeue_pending_anchors() -> int:
+    """
+    Queue an anchoring job for users stuck in registered_pending_onchain without an open one,
+    using the payload persisted at registration (the user's last job, or receipt.anchor_payload
+    when queueing failed). Users whose last job is dead (reverted / out of attempts) are left
+    alone: re-sending would revert again. Users with no persisted payload (registered before
+    anchoring was queued) cannot be re-anchored faithfully and are only reported.
+    Returns the number of jobs created.
+    """
+    db = SessionLocal()
+    try:
+        created = dead = unknown = 0
+        for u in db.query(User).filter(User.state == "registered_pending_onchain").all():
+            job = ANCHOR_JOBS.latest_job(db, ANCHOR_KIND_REGISTER, u.id)
+            if job is not None and job.status in ANCHOR_OPEN_STATUSES:
+                continue
+            if job is not None and job.status == "dead":
+                dead += 1
+                continue
+            payload = job.payload if job is not None else (u.receipt or {}).get("anchor_payload")
+            if not payload:
+                unknown += 1
+                continue
+            ANCHOR_JOBS.enqueue(db, ANCHOR_KIND_REGISTER, u.id, payload)
+            created += 1
+        if created:
+            logger.info("Queued on-chain anchoring for %d pending users", created)
+        if dead or unknown:
+            logger.warning(
+                "%d pending users have a dead anchor job and %d have no stored anchor payload; "
+                "not re-queued (see GET /tourists/anchor-queue)", dead, unknown,
+            )
+        return created
     finally:
         db.close()
 
@@ -138,6 +335,19 @@ def _first_non_empty(*vals):
     return None
 
 
+def _idempotent_replay(stored, response_model=None) -> JSONResponse:
+    """
+    Response for a replayed Idempotency-Key: the stored status + body of the first request.
+    A JSONResponse skips the route's response_model, so a successful body is run through it here.
+    """
+    status_code, body = stored
+    if response_model is not None and status_code < 400:
+        body = jsonable_encoder(response_model(**body))
+    return JSONResponse(
+        status_code=status_code, content=body, headers={"Idempotent-Replayed": "true"}
+    )
+
+
 def _extract_emergency_phone(payload):
     ep = _first_non_empty(
         payload.get("emergencyPhone"),
@@ -162,33 +372,33 @@ def _extract_emergency_phone(payload):
     return None
 
 
-def _wrap_sym_key_for_storage(sym_key_bytes: bytes) -> (str, str):
+async def _wrap_sym_key_for_storage(sym_key_bytes: bytes) -> (str, str):
     """
-    Wrap the AES symmetric key for storage. Prefer server RSA public key (SERVER_PUBLIC_KEY_PATH or SERVER_PUBLIC_KEY_PEM),
-    fallback to base64 (DEV ONLY). Returns (encrypted_key_b64, key_meta_json_str).
+    Wrap the AES symmetric key for storage with the server RSA public key (SERVER_PUBLIC_KEY_PATH
+    or SERVER_PUBLIC_KEY_PEM). Returns (encrypted_key_b64, key_meta_json_str).
+    Only when no server key is configured at all is the key stored base64 (DEV ONLY); a busy or
+    failing crypto pool / RSA wrap raises (503) rather than storing a plaintext key.
     """
-    # prefer path -> crypto_service knows how to load
+    if KEYS.get(SERVER_PUBLIC) is None:
+        # DEV fallback - DO NOT use in production
+        logger.warning("SERVER public key not configured — storing sym key base64 (DEV only)")
+        return base64.b64encode(sym_key_bytes).decode("utf-8"), json.dumps({"method": "base64-dev"})
     try:
-        enc = crypto_service.encrypt_sym_key_with_rsa(sym_key_bytes)
+        if PROFILE_KEY_MODE == "kek":
+            # AES key wrap under the cached KEK (data_key_cache); RSA only when the KEK rolls over
+            enc, meta = DATA_KEYS.wrap(sym_key_bytes)
+            return base64.b64encode(enc).decode("utf-8"), json.dumps(meta)
+        # RSA runs in the crypto worker pool
+        enc, key_version = await CRYPTO.run("wrap_server_key", sym_key_bytes)
         return base64.b64encode(enc).decode("utf-8"), json.dumps(
-            {"method": "rsa-server-pem"}
+            {"method": "rsa-server-pem", "key_version": key_version}
         )
-    except Exception:
-        # log and fall back
-        logger.exception(
-            "Failed to wrap symmetric key with server public key (fall back to base64-dev)"
-        )
-    # DEV fallback - DO NOT use in production
-    logger.warning(
-        "SERVER public key not configured or wrapping failed — storing sym key base64 (DEV only)"
-    )
-    return base64.b64encode(sym_key_bytes).decode("utf-8"), json.dumps(
-        {"method": "base64-dev"}
-    )
-
-
-from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP
+    except CryptoBusyError:
+        raise  # 503 (see main.py)
+    except Exception as e:
+        logger.exception("Failed to wrap symmetric key with server public key")
+        raise HTTPException(status_code=503, detail="Profile key wrapping unavailable",
+                            headers={"Retry-After": "1"}) from e
 
 
 def rewrap_key_for_grantee(
@@ -205,15 +415,19 @@ def rewrap_key_for_grantee(
     # 1) Unwrap the stored key (server must be able to)
     method = key_meta.get("method")
     if method == "rsa-server-pem":
-        # server must have PRIVATE_KEY_PEM in env to decrypt
-        server_priv_pem = os.getenv("SERVER_PRIVATE_KEY_PEM")
-        if not server_priv_pem:
-            raise RuntimeError("SERVER_PRIVATE_KEY_PEM required to rewrap for grantee")
-        # decode stored and decrypt
+        # server private key (SERVER_PRIVATE_KEY_PATH / _PEM) of the version that wrapped it
+        # unwrap + grantee wrap are one crypto worker job (the key never leaves the worker)
         wrapped_bytes = base64.b64decode(stored_encrypted_key_b64)
-        server_priv = RSA.import_key(server_priv_pem.encode("utf-8"))
-        dec_cipher = PKCS1_OAEP.new(server_priv)
-        sym_key = dec_cipher.decrypt(wrapped_bytes)
+        enc_for_grantee = CRYPTO.call(
+            "rewrap_server_key_for_pem", wrapped_bytes, key_meta.get("key_version"), grantee_pubkey_pem
+        )
+        return {
+            "encrypted_for_grantee_b64": base64.b64encode(enc_for_grantee).decode("utf-8"),
+            "grantee_meta": {"method": "rsa-grantee-pem"},
+        }
+    elif method == KEK_METHOD:
+        # AES-KW under a cached KEK; the KEK itself is RSA-unwrapped once per kek_id
+        sym_key = DATA_KEYS.unwrap(base64.b64decode(stored_encrypted_key_b64), key_meta)
     elif method == "kms":
         # If wrapped with KMS, call crypto_service.kms_unwrap to get plaintext (must be implemented)
         sym_key = crypto_service.kms_unwrap(stored_encrypted_key_b64, key_meta)
@@ -224,9 +438,8 @@ def rewrap_key_for_grantee(
         raise RuntimeError(f"Unknown key wrap method: {method}")
 
     # 2) Wrap sym_key with grantee's public key
-    gr_pub = RSA.import_key(grantee_pubkey_pem.encode("utf-8"))
-    wrap_cipher = PKCS1_OAEP.new(gr_pub)
-    enc_for_grantee = wrap_cipher.encrypt(sym_key)
+    # (SHA-1 OAEP, as grantee clients have always been given; parsed key cached per PEM)
+    enc_for_grantee = CRYPTO.call("wrap_for_pem", grantee_pubkey_pem, sym_key, crypto_service.OAEP_SHA1)
     return {
         "encrypted_for_grantee_b64": base64.b64encode(enc_for_grantee).decode("utf-8"),
         "grantee_meta": {"method": "rsa-grantee-pem"},
@@ -302,8 +515,8 @@ class TouristRegisterRequest(BaseModel):
 @router.post("/register", response_model=TouristResponse)
 async def register_tourist_flexible(
     request: Request,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
     """
     Flexible register endpoint:
@@ -312,41 +525,44 @@ async def register_tourist_flexible(
       - Encrypts profile (AES-GCM), uploads encrypted bytes to IPFS,
       - Wraps AES key (server RSA PEM or base64 dev),
       - Stores only ipfs pointer + wrapped key + iv in DB.profile,
-      - Attempts blockchain anchoring (non-blocking; failure marks pending).
+      - Queues blockchain anchoring (non-blocking; retried until it lands, pending meanwhile).
+    Retries carrying the same Idempotency-Key get the first response back
+    without re-encrypting, re-uploading or re-anchoring.
     """
-    body_raw = await request.body()
     try:
-        payload = await request.json()
-    except Exception:
-        try:
-            payload = json.loads(
-                body_raw.decode("utf-8") if isinstance(body_raw, bytes) else body_raw
-            )
-        except Exception:
-            raise HTTPException(status_code=422, detail="Invalid JSON payload")
+        body_raw, payload = await read_json_body(request)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid JSON payload")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=422, detail="Invalid JSON payload")
 
-    # accept multiple key name variants
-    phone_number = _first_non_empty(
-        payload.get("phone_number"), payload.get("phone"), payload.get("mobile")
-    )
-    full_name = _first_non_empty(
-        payload.get("full_name"), payload.get("fullName"), payload.get("name")
-    )
-    kyc_id = _first_non_empty(
-        payload.get("kyc_id"), payload.get("kycId"), payload.get("kyc")
-    )
-    visit_start = _first_non_empty(
-        payload.get("visitStart"),
-        payload.get("visit_start"),
-        payload.get("visit_start_date"),
-        payload.get("visitStartDate"),
-    )
-    visit_end = _first_non_empty(
-        payload.get("visitEnd"),
-        payload.get("visit_end"),
-        payload.get("visit_end_date"),
-        payload.get("visitEndDate"),
+    if not idempotency_key:
+        return await _register_from_payload(payload, db)
+
+    replay = await run_in_threadpool(
+        IDEMPOTENCY.begin, db, "register", idempotency_key, request_fingerprint(body_raw)
     )
+    if replay is not None:
+        return _idempotent_replay(replay, TouristResponse)
+    try:
+        result = await _register_from_payload(payload, db)
+    except Exception:
+        await run_in_threadpool(IDEMPOTENCY.abort, db, "register", idempotency_key)
+        raise
+    await run_in_threadpool(IDEMPOTENCY.complete, db, "register", idempotency_key, result)
+    return result
+
+
+async def _register_from_payload(
+    payload: Dict[str, Any], db: Session
+) -> Dict[str, Any]:
+    # accept multiple key name variants (alias table compiled once in request_body)
+    fields = apply_aliases(payload, REGISTER_ALIASES)
+    phone_number = fields.get("phone_number")
+    full_name = fields.get("full_name")
+    kyc_id = fields.get("kyc_id")
+    visit_start = fields.get("visit_start")
+    visit_end = fields.get("visit_end")
     emergency_phone = _extract_emergency_phone(payload)
     itinerary_raw = payload.get("itinerary")
 
@@ -372,7 +588,7 @@ async def register_tourist_flexible(
     logger.info("validated itinerary count=%d for phone=%s", len(itinerary), phone_norm)
 
     # fetch or create user
-    user = db.query(User).filter(User.phone_number == phone_norm).first()
+    user = get_user(db, phone_norm)
     if not user:
         user = User(
             phone_number=phone_norm,
@@ -400,19 +616,18 @@ async def register_tourist_flexible(
         profile_plain["itinerary"] = itinerary
 
     # small safety: prevent accidental huge profiles
-    sample_profile_bytes = json.dumps(profile_plain, ensure_ascii=False).encode(
-        "utf-8"
-    )
-    if len(sample_profile_bytes) > MAX_PROFILE_BYTES:
+    plaintext = json.dumps(profile_plain, ensure_ascii=False).encode("utf-8")
+    if len(plaintext) > MAX_PROFILE_BYTES:
         raise HTTPException(status_code=400, detail="Profile too large")
 
     # Encrypt profile_plain using AES-GCM and upload to IPFS
     try:
-        plaintext = json.dumps(profile_plain, ensure_ascii=False).encode("utf-8")
         sym_key = crypto_service.generate_aes_key()  # bytes
-        nonce, ciphertext = crypto_service.aes_encrypt(
-            plaintext, sym_key
-        )  # nonce bytes, ciphertext bytes (with tag)
+        # AES-GCM and the RSA key wrap run concurrently in the crypto worker pool, off the event loop
+        (nonce, ciphertext), (encrypted_key_b64, key_meta) = await asyncio.gather(
+            CRYPTO.run("aes_gcm_encrypt", sym_key, plaintext),  # nonce bytes, ciphertext bytes (with tag)
+            _wrap_sym_key_for_storage(sym_key),
+        )
         blob = nonce + ciphertext  # store nonce (12 bytes) + ciphertext
 
         # upload to IPFS
@@ -420,8 +635,6 @@ async def register_tourist_flexible(
             blob, filename=f"profile-{phone_norm}.enc"
         )
 
-        # wrap sym key for storage
-        encrypted_key_b64, key_meta = _wrap_sym_key_for_storage(sym_key)
         iv_b64 = base64.b64encode(nonce).decode("utf-8")
 
         # store pointer in DB.profile (do not store plaintext)
@@ -433,6 +646,8 @@ async def register_tourist_flexible(
             if isinstance(key_meta, str)
             else key_meta,
         }
+    except (CryptoBusyError, HTTPException):
+        raise  # 503 (see main.py / _wrap_sym_key_for_storage)
     except Exception:
         logger.exception("Failed to encrypt & store tourist profile for %s", phone_norm)
         raise HTTPException(
@@ -444,43 +659,20 @@ async def register_tourist_flexible(
     db.commit()
     db.refresh(user)
 
-    # --- persist itinerary items into itineraries table (plaintext copy for quick query/analytics)
-    # Only store if itinerary list is not empty
+    # --- sync itinerary items into itineraries table (plaintext copy for quick query/analytics)
+    # diff-based: only removed items are deleted and only new items are inserted
     if itinerary:
-        logger.info("validated itinerary count=%d for phone=%s", len(itinerary), phone_norm)
-        # clear any existing itinerary rows for this user (optional)
         try:
-            db.query(Itinerary).filter(Itinerary.user_id == user.id).delete(
-                synchronize_session=False
+            stats = itinerary_service.sync_itinerary(
+                db, user.id, itinerary, fallback_date=visit_start
             )
-        except Exception as e:
-            logger.exception(
-                "Error deleting existing itinerary rows (may not exist yet): %s", e
-            )
-
-        for item in itinerary:
-            # item is {"date": "YYYY-MM-DD", "location": "...", "activity": "..."}
-            # Parse date safely into DateTime
-            try:
-                date_str = str(item.get("date", "")).split("T")[0]
-                dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-            except Exception:
-                # fallback: use visitStart as date if parsing fails
-                try:
-                    dt = datetime.datetime.strptime(
-                        str(visit_start).split("T")[0], "%Y-%m-%d"
-                    )
-                except Exception:
-                    dt = datetime.datetime.utcnow()
-
-            loc = item.get("location", "")[:256]
-            act = item.get("activity") or None
-            row = Itinerary(user_id=user.id, date=dt, location=loc, activity=act)
-            db.add(row)
-        db.commit()
-        db.refresh(user)
+            db.commit()
+            logger.info("itinerary sync for phone=%s: %s", phone_norm, stats)
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to sync itinerary rows for phone=%s", phone_norm)
 
-    # schedule background on-chain anchoring (non-blocking)
+    # queue on-chain anchoring (durable, retried with backoff; see anchor_queue)
     chain_payload = {
         "full_name": user.full_name or "",
         "kyc_id": user.kyc_id or "",
@@ -492,13 +684,15 @@ async def register_tourist_flexible(
         "phone": user.phone_number,
     }
     try:
-        background_tasks.add_task(_anchor_user_on_chain, user.id, chain_payload)
+        ANCHOR_JOBS.enqueue(db, ANCHOR_KIND_REGISTER, user.id, chain_payload)
     except Exception:
         logger.exception(
-            "Failed to schedule background anchoring task for user_id=%s", user.id
+            "Failed to queue on-chain anchoring job for user_id=%s", user.id
         )
-        # do not fail the request — we'll mark pending state
+        # do not fail the request — we'll mark pending state; the payload is kept so
+        # requeue_pending_anchors can queue exactly this registration later
         user.state = "registered_pending_onchain"
+        user.receipt = {**(user.receipt or {}), "anchor_payload": chain_payload}
         db.add(user)
         db.commit()
         db.refresh(user)
@@ -531,7 +725,7 @@ async def verify_otp_route(req: OTPVerifyRequest, db: Session = Depends(get_db))
         raise HTTPException(status_code=400, detail="Invalid or expired OTP")
 
     phone_norm = normalize_phone(req.phone_number)
-    user = db.query(User).filter(User.phone_number == phone_norm).first()
+    user = get_user_snapshot(db, phone_norm)
     if not user:
         user = User(
             phone_number=phone_norm,
@@ -550,10 +744,32 @@ async def verify_otp_route(req: OTPVerifyRequest, db: Session = Depends(get_db))
 
 
 @router.post("/kyc/submit", response_model=RegistrationStatus)
-async def kyc_submit(req: KYCSubmitRequest, db: Session = Depends(get_db)):
+def kyc_submit(
+    req: KYCSubmitRequest,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    if idempotency_key:
+        replay = IDEMPOTENCY.begin(
+            db, "tourists_kyc_submit", idempotency_key, request_fingerprint(req.dict())
+        )
+        if replay is not None:
+            return _idempotent_replay(replay, RegistrationStatus)
+    try:
+        result = _kyc_submit(req, db)
+    except Exception:
+        if idempotency_key:
+            IDEMPOTENCY.abort(db, "tourists_kyc_submit", idempotency_key)
+        raise
+    if idempotency_key:
+        IDEMPOTENCY.complete(db, "tourists_kyc_submit", idempotency_key, result)
+    return result
+
+
+def _kyc_submit(req: KYCSubmitRequest, db: Session) -> Dict[str, Any]:
     try:
         phone_norm = normalize_phone(req.phone_number)
-        user = db.query(User).filter(User.phone_number == phone_norm).first()
+        user = get_user(db, phone_norm)
         if not user:
             raise ValueError("User not found - verify OTP first")
 
@@ -573,6 +789,8 @@ async def kyc_submit(req: KYCSubmitRequest, db: Session = Depends(get_db)):
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except CryptoBusyError:
+        raise  # 503 (see main.py)
     except Exception:
         logger.exception("KYC submit error for %s", req.phone_number)
         raise HTTPException(status_code=500, detail="KYC submit error")
@@ -582,7 +800,7 @@ async def kyc_submit(req: KYCSubmitRequest, db: Session = Depends(get_db)):
 async def kyc_approve(req: KYCDecisionRequest, db: Session = Depends(get_db)):
     try:
         phone_norm = normalize_phone(req.phone_number)
-        user = db.query(User).filter(User.phone_number == phone_norm).first()
+        user = get_user(db, phone_norm)
         if not user:
             raise ValueError("User not found")
 
@@ -645,7 +863,7 @@ async def issue_did_v2(payload: Dict[str, str], db: Session = Depends(get_db)):
         if not phone_norm:
             raise HTTPException(status_code=400, detail="Invalid phone_number")
 
-        user = db.query(User).filter(User.phone_number == phone_norm).first()
+        user = get_user(db, phone_norm)
         if not user:
             user = User(phone_number=phone_norm, state="unregistered", created_at=datetime.datetime.utcnow())
             db.add(user)
@@ -657,25 +875,28 @@ async def issue_did_v2(payload: Dict[str, str], db: Session = Depends(get_db)):
             if existing and existing.id != user.id:
                 raise HTTPException(status_code=400, detail="Device already bound to another user")
 
-        # Strict blockchain ID issuance
-        try:
-            digital_id = issue_digital_id(phone_norm)
-        except Exception:
-            raise HTTPException(status_code=500, detail="Blockchain issuance failed")
+        # short ID is derived locally; the chain registration is queued and
+        # user.receipt is filled in when it is mined (onchain_pending until then)
+        digital_id = issue_digital_id(phone_norm)
 
         user.did = digital_id
         user.state = "registered"
         user.device_id = device_id
         user.device_type = device_type
+        # merge: anchor_payload etc. from registration must survive
+        receipt = {**(user.receipt or {}), "short_id": digital_id, "onchain_pending": True, "confirmed": False}
+        receipt.pop("onchain_error", None)
+        user.receipt = receipt
 
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        # commits the user update and the job together
+        ANCHOR_JOBS.enqueue(db, ANCHOR_KIND_ISSUE_DID, user.id, digital_id_chain_payload(phone_norm))
 
         return {
             "phone_number": phone_norm,
             "state": user.state,
-            "digital_id": digital_id
+            "digital_id": digital_id,
+            "onchain_pending": True,
         }
 
     except HTTPException:
@@ -703,7 +924,7 @@ async def bind_device(req: DeviceBindRequest, db: Session = Depends(get_db)):
     user: Optional[User] = None
     if req.phone_number:
         phone_norm = normalize_phone(req.phone_number)
-        user = db.query(User).filter(User.phone_number == phone_norm).first()
+        user = get_user(db, phone_norm)
     else:
         user = db.query(User).filter(User.did == req.digital_id).first()
 
@@ -751,6 +972,11 @@ async def device_profile(
     if not did and not device_id:
         raise HTTPException(status_code=400, detail="Provide digital_id or device_id")
 
+    cache_key = ("did", did) if did else ("device", device_id)
+    cached = DEVICE_PROFILE_CACHE.get(cache_key)
+    if cached is not None:
+        return DeviceProfileResponse(**cached)
+
     q = db.query(User)
     if did:
         user = q.filter(User.did == did).first()
@@ -768,19 +994,47 @@ async def device_profile(
     }
     is_registered = user.state in registered_states
 
-    return DeviceProfileResponse(
-        digital_id=user.did or "",
-        is_registered=is_registered,
-        full_name=user.full_name,
-        phone_number=user.phone_number,
-        state=user.state,
-    )
+    profile = {
+        "digital_id": user.did or "",
+        "is_registered": is_registered,
+        "full_name": user.full_name,
+        "phone_number": user.phone_number,
+        "state": user.state,
+    }
+    # cache under both lookup keys so a gateway using either hits next time
+    if user.did:
+        DEVICE_PROFILE_CACHE.set(("did", user.did), profile)
+    if user.device_id:
+        DEVICE_PROFILE_CACHE.set(("device", user.device_id), profile)
+
+    return DeviceProfileResponse(**profile)
+
+
+@router.get("/device/cache-stats")
+async def device_profile_cache_stats():
+    """Hit rate and size of the gateway device profile cache."""
+    return DEVICE_PROFILE_CACHE.stats()
+
+
+@router.get("/anchor-queue", dependencies=[Depends(require_role("admin"))])
+async def anchor_queue_stats():
+    """Backlog, age and retry state of the on-chain anchoring queue."""
+    return ANCHOR_JOBS.stats()
+
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """Hit/miss counters for the in-process lookup caches."""
+    return {
+        "user_by_phone": USER_CACHE.stats(),
+        "device_profile": DEVICE_PROFILE_CACHE.stats(),
+    }
 
 
 @router.get("/status/{phone}", response_model=RegistrationStatus)
 async def status(phone: str, db: Session = Depends(get_db)):
     phone_norm = normalize_phone(phone)
-    user = db.query(User).filter(User.phone_number == phone_norm).first()
+    user = get_user_snapshot(db, phone_norm)  # polled by apps: served from cache when fresh
     if not user:
         raise HTTPException(status_code=404, detail="Not found")
     return {
@@ -790,6 +1044,19 @@ async def status(phone: str, db: Session = Depends(get_db)):
     }
 
 
+@router.get("/{phone}/itinerary")
+async def get_itinerary(phone: str, db: Session = Depends(get_db)):
+    """Return the stored itinerary for a tourist, ordered by date."""
+    phone_norm = normalize_phone(phone)
+    user = get_user_snapshot(db, phone_norm)
+    if not user:
+        raise HTTPException(status_code=404, detail="Not found")
+    return {
+        "phone_number": phone_norm,
+        "itinerary": itinerary_service.list_itinerary(db, user.id),
+    }
+
+
 # ----------------------
 # Alerts & Locations
 # ----------------------
@@ -824,7 +1091,7 @@ class AttachReceiptRequest(BaseModel):
 @alerts_router.post("/locations/update", response_model=BasicMessage)
 async def update_location(payload: LocationUpdateRequest, db: Session = Depends(get_db)):
     phone = normalize_phone(payload.phone_number)
-    user = db.query(User).filter(User.phone_number == phone).first()
+    user = get_user(db, phone)
     if not user:
         user = User(phone_number=phone, state="unregistered")
         db.add(user)
@@ -853,13 +1120,10 @@ async def update_location(payload: LocationUpdateRequest, db: Session = Depends(
     return {"message": "Location updated"}
 
 
-import traceback
-
 alerts_logger = logging.getLogger("alerts_minimal")
-alerts_logger.setLevel(logging.DEBUG)
+alerts_logger.setLevel(os.getenv("ALERTS_LOG_LEVEL", "INFO"))
 if not alerts_logger.handlers:
     ch = logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
     ch.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
     alerts_logger.addHandler(ch)
 
@@ -872,45 +1136,65 @@ class SOSRequestSimple(BaseModel):
     timestamp: Optional[str] = None
 
 
+def _to_float(v):
+    try:
+        return float(v)
+    except Exception:
+        return None
+
+
 @alerts_router.post("/sos")
-async def send_sos_no_db(request: Request):
+async def send_sos_no_db(
+    request: Request,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     """
-    Minimal SOS handler: no DB. Logs and prints everything and returns a simple JSON response.
+    Minimal SOS handler: alerts are kept in memory (the DB only backs Idempotency-Key replays).
+    Parses the body once and returns a simple JSON response.
     Stores the parsed payload into the in-memory ALERTS list so dashboard can read it.
+    Set ALERTS_LOG_LEVEL=DEBUG to log raw bodies (off the hot path by default).
+    A retried SOS with the same Idempotency-Key is answered from the first response
+    and is not appended to ALERTS again.
     """
-    try:
-        print(">>> Received SOS request (raw) <<<")
-        alerts_logger.info("Received SOS request (raw)")
+    raw_bytes = await request.body()
+    if not idempotency_key:
+        return _handle_sos(raw_bytes)
+    # the idempotency store is sync SQLAlchemy: keep it off the event loop
+    return await run_in_threadpool(_handle_sos_idempotent, db, idempotency_key, raw_bytes)
 
-        # show headers
-        headers = dict(request.headers)
-        print("Headers:", headers)
-        alerts_logger.debug("Headers: %s", json.dumps(headers))
 
-        # raw body text
-        raw_bytes = await request.body()
-        try:
-            raw_text = raw_bytes.decode("utf-8")
-        except Exception:
-            raw_text = str(raw_bytes)
-        print("Raw body:", raw_text)
-        alerts_logger.debug("Raw body: %s", raw_text)
+def _handle_sos_idempotent(db: Session, idempotency_key: str, raw_bytes: bytes):
+    replay = IDEMPOTENCY.begin(db, "sos", idempotency_key, request_fingerprint(raw_bytes))
+    if replay is not None:
+        return _idempotent_replay(replay)
+    try:
+        result = _handle_sos(raw_bytes)
+    except Exception:
+        IDEMPOTENCY.abort(db, "sos", idempotency_key)
+        raise
+    IDEMPOTENCY.complete(db, "sos", idempotency_key, result)
+    return result
+
 
-        # parse JSON payload
+def _handle_sos(raw_bytes: bytes) -> Dict[str, Any]:
+    try:
         try:
-            payload = await request.json()
-        except Exception:
-            try:
-                payload = json.loads(raw_text)
-            except Exception:
-                payload = {"_raw": raw_text}
+            payload = decode_json_body(raw_bytes)
+        except ValueError:
+            payload = {"_raw": raw_bytes.decode("utf-8", errors="replace")}
+        if alerts_logger.isEnabledFor(logging.DEBUG):
+            alerts_logger.debug("SOS raw body: %r", raw_bytes)
 
         # ensure a consistent structure
         if not isinstance(payload, dict):
             payload = {"_raw": payload}
 
+        # canonical field names (phone/mobile -> phone_number, latitude -> lat, ...)
+        payload.update(apply_aliases(payload, SOS_ALIASES))
+
         # fill timestamp if missing
-        if "timestamp" not in payload or not payload.get("timestamp"):
+        if not payload.get("timestamp"):
             payload["timestamp"] = datetime.datetime.utcnow().isoformat() + "Z"
 
         # normalize phone (optional)
@@ -918,40 +1202,34 @@ async def send_sos_no_db(request: Request):
             payload["phone_number"] = normalize_phone(payload["phone_number"])
 
         # convert lat/lng to floats if possible
-        def _to_float(v):
-            try:
-                return float(v)
-            except Exception:
-                return None
-
         payload["lat"] = _to_float(payload.get("lat"))
         payload["lng"] = _to_float(payload.get("lng"))
 
-        # log parsed payload
-        print("Parsed payload:", json.dumps(payload, indent=2))
-        alerts_logger.info("Parsed payload: %s", json.dumps(payload))
-
         # append to in-memory ALERTS list
         try:
             alert_item = {
                 "phone_number": payload.get("phone_number"),
                 "lat": payload.get("lat"),
                 "lng": payload.get("lng"),
-                "note": payload.get("note", "")[:1000],
+                "note": str(payload.get("note") or "")[:1000],
                 "timestamp": payload.get("timestamp"),
                 "raw": payload,
             }
             ALERTS.append(alert_item)
             if len(ALERTS) > 200:
                 del ALERTS[0 : len(ALERTS) - 200]
-            alerts_logger.info("Appended alert; alerts_count=%d", len(ALERTS))
         except Exception:
             alerts_logger.exception("Failed to append to ALERTS")
 
+        alerts_logger.info(
+            "SOS received phone=%s lat=%s lng=%s alerts_count=%d",
+            payload.get("phone_number"),
+            payload.get("lat"),
+            payload.get("lng"),
+            len(ALERTS),
+        )
         return {"message": "SOS received (no-db)", "payload": payload}
     except Exception as e:
-        print("Exception in send_sos_no_db:", e)
-        traceback.print_exc()
         alerts_logger.exception("Exception in send_sos_no_db: %s", e)
         raise HTTPException(
             status_code=500, detail="Internal server error (sos debug)"
@@ -976,7 +1254,7 @@ async def attach_receipt(
     payload: AttachReceiptRequest, db: Session = Depends(get_db)
 ):
     phone = normalize_phone(payload.phone_number)
-    user = db.query(User).filter(User.phone_number == phone).first()
+    user = get_user(db, phone)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
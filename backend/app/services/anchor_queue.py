@@ -0,0 +1,394 @@
+# app/services/anchor_queue.py
+"""
+Durable queue for on-chain anchoring jobs.
+
+Registration used to hand _anchor_user_on_chain to FastAPI BackgroundTasks: a failed send left
+the user in registered_pending_onchain forever, and a restart lost the task altogether. Jobs now
+live in the `anchor_jobs` table and one daemon thread drains them:
+
+    queued --claim--> submitting --sent--> submitted --receipt ok--> done
+       ^                  |                    |
+       +---- backoff -----+---- timeout -------+          revert / too many attempts -> dead
+
+ - a send error or a receipt timeout reschedules the job with exponential backoff and jitter
+   (ANCHOR_RETRY_BASE_SECONDS doubling up to ANCHOR_RETRY_MAX_SECONDS); a revert is final,
+   except one that used >= 95% of its gas (out of gas: the estimate is dropped and redone);
+ - nothing is attempted while CHAIN is not ready, so an outage does not burn attempts. When the
+   node comes back, every queued job is made due at once and drained in batches of
+   ANCHOR_QUEUE_BATCH_SIZE, sent by ANCHOR_QUEUE_WORKERS threads, with at most
+   ANCHOR_QUEUE_MAX_IN_FLIGHT jobs waiting for a receipt;
+ - claiming is a conditional UPDATE, so several workers can share one table;
+ - jobs left `submitting`/`submitted` by a previous process are picked up again (the receipt of
+   a submitted tx is re-tracked; a job that died mid-send is re-queued, i.e. at-least-once).
+
+Handlers are registered per kind by the module owning the side effects:
+
+    ANCHOR_JOBS.register("register_tourist", handler, on_receipt=cb)
+    # handler(subject_id, payload) -> tx_hash; cb(subject_id, tx_hash, receipt, error)
+
+The receipt callback is looked up by job.kind when the receipt arrives, so it also runs for
+receipts re-tracked after a restart.
+"""
+
+from __future__ import annotations
+
+import datetime
+import functools
+import json
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.models.tourist_models import AnchorJob
+from app.services import blockchain_service
+from app.services.chain_read_cache import is_revert_error
+from app.services.receipt_tracker import RECEIPTS
+
+logger = logging.getLogger(__name__)
+
+ANCHOR_QUEUE_POLL_SECONDS = float(os.getenv("ANCHOR_QUEUE_POLL_SECONDS", "2"))
+ANCHOR_QUEUE_BATCH_SIZE = int(os.getenv("ANCHOR_QUEUE_BATCH_SIZE", "50"))
+ANCHOR_QUEUE_WORKERS = int(os.getenv("ANCHOR_QUEUE_WORKERS", "4"))
+ANCHOR_QUEUE_MAX_IN_FLIGHT = int(os.getenv("ANCHOR_QUEUE_MAX_IN_FLIGHT", "200"))
+ANCHOR_RETRY_BASE_SECONDS = float(os.getenv("ANCHOR_RETRY_BASE_SECONDS", "5"))
+ANCHOR_RETRY_MAX_SECONDS = float(os.getenv("ANCHOR_RETRY_MAX_SECONDS", "600"))
+ANCHOR_MAX_ATTEMPTS = int(os.getenv("ANCHOR_MAX_ATTEMPTS", "50"))  # 0 = retry forever
+
+OPEN_STATUSES = ("queued", "submitting", "submitted")
+
+AnchorHandler = Callable[[int, Dict[str, Any]], str]
+AnchorReceiptHandler = Callable[[int, str, Optional[Dict[str, Any]], Optional[str]], None]
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay before retry number `attempts` (1-based): capped exponential with 50-100% jitter."""
+    delay = min(ANCHOR_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), ANCHOR_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class AnchorQueue:
+    def __init__(
+        self,
+        batch_size: int = ANCHOR_QUEUE_BATCH_SIZE,
+        workers: int = ANCHOR_QUEUE_WORKERS,
+        max_in_flight: int = ANCHOR_QUEUE_MAX_IN_FLIGHT,
+    ):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self._handlers: Dict[str, AnchorHandler] = {}
+        self._receipt_handlers: Dict[str, AnchorReceiptHandler] = {}
+        self._bind = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._tracked: set = set()  # job ids whose receipt this process is waiting for
+        self._chain_was_ready = False
+        self.submitted = 0
+        self.confirmed = 0
+        self.retried = 0
+        self.dead = 0
+
+    # ----- setup -----
+    def register(self, kind: str, handler: AnchorHandler, on_receipt: Optional[AnchorReceiptHandler] = None) -> None:
+        self._handlers[kind] = handler
+        if on_receipt is not None:
+            self._receipt_handlers[kind] = on_receipt
+
+    def start(self, bind) -> None:
+        """Drain jobs of this engine in a background thread (idempotent)."""
+        AnchorJob.__table__.create(bind=bind, checkfirst=True)
+        for idx in AnchorJob.__table__.indexes:
+            idx.create(bind=bind, checkfirst=True)
+        self._bind = bind
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="anchor-queue", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def kick(self) -> None:
+        self._wake.set()
+
+    # ----- producer side -----
+    def enqueue(self, db: Session, kind: str, subject_id: int, payload: Dict[str, Any]) -> AnchorJob:
+        """
+        Persist a job (committing db) and wake the drainer. A still-queued job for the same
+        subject is updated in place instead of queueing a second anchor.
+        """
+        if kind not in self._handlers:
+            raise ValueError("No anchor handler registered for %r" % kind)
+        payload = json.loads(json.dumps(payload, default=str))  # dates etc. -> JSON-safe
+        job = (
+            db.query(AnchorJob)
+            .filter(AnchorJob.kind == kind, AnchorJob.subject_id == subject_id, AnchorJob.status == "queued")
+            .first()
+        )
+        if job is None:
+            job = AnchorJob(kind=kind, subject_id=subject_id, status="queued", attempts=0)
+            db.add(job)
+        job.payload = payload
+        job.next_attempt_at = _utcnow()
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        self._wake.set()
+        return job
+
+    def latest_job(self, db: Session, kind: str, subject_id: int) -> Optional[AnchorJob]:
+        return (
+            db.query(AnchorJob)
+            .filter(AnchorJob.kind == kind, AnchorJob.subject_id == subject_id)
+            .order_by(AnchorJob.id.desc())
+            .first()
+        )
+
+    def has_open_job(self, db: Session, kind: str, subject_id: int) -> bool:
+        return db.query(AnchorJob.id).filter(
+            AnchorJob.kind == kind, AnchorJob.subject_id == subject_id, AnchorJob.status.in_(OPEN_STATUSES)
+        ).first() is not None
+
+    # ----- drainer -----
+    def _run(self) -> None:
+        self._recover()
+        while not self._stop.is_set():
+            try:
+                self.drain_once()
+            except Exception:
+                logger.exception("Anchor queue drain failed")
+            self._wake.wait(ANCHOR_QUEUE_POLL_SECONDS)
+            self._wake.clear()
+
+    def _recover(self) -> None:
+        """Jobs a previous process claimed but never sent go back to the queue."""
+        db = Session(bind=self._bind)
+        try:
+            n = db.execute(
+                update(AnchorJob)
+                .where(AnchorJob.status == "submitting")
+                .values(status="queued", next_attempt_at=_utcnow())
+            ).rowcount
+            db.commit()
+            if n:
+                logger.warning("Re-queued %d anchor jobs interrupted mid-send", n)
+        finally:
+            db.close()
+
+    def drain_once(self) -> int:
+        """Submit due jobs while the chain is ready. Returns the number of jobs sent."""
+        if blockchain_service.CHAIN.state != "ready":
+            self._chain_was_ready = False
+            return 0
+        bind = self._bind
+        if not self._chain_was_ready:
+            self._on_chain_ready(bind)
+            self._chain_was_ready = True
+
+        sent = 0
+        while not self._stop.is_set():
+            db = Session(bind=bind)
+            try:
+                in_flight = db.query(func.count(AnchorJob.id)).filter(AnchorJob.status == "submitted").scalar()
+                limit = min(self.batch_size, self.max_in_flight - in_flight)
+                if limit <= 0:
+                    break
+                ids = [
+                    r[0] for r in db.query(AnchorJob.id)
+                    .filter(AnchorJob.status == "queued", AnchorJob.next_attempt_at <= _utcnow())
+                    .order_by(AnchorJob.next_attempt_at, AnchorJob.id)
+                    .limit(limit)
+                    .all()
+                ]
+            finally:
+                db.close()
+            if not ids:
+                break
+            sent += sum(self._executor().map(self._submit_one, ids))
+            if len(ids) < limit or blockchain_service.CHAIN.state != "ready":
+                break
+        return sent
+
+    def _on_chain_ready(self, bind) -> None:
+        """Node (back) up: make every queued job due and re-track receipts of submitted ones."""
+        db = Session(bind=bind)
+        try:
+            n = db.execute(
+                update(AnchorJob).where(AnchorJob.status == "queued").values(next_attempt_at=_utcnow())
+            ).rowcount
+            db.commit()
+            orphans = (
+                db.query(AnchorJob.id, AnchorJob.tx_hash)
+                .filter(AnchorJob.status == "submitted")
+                .all()
+            )
+        finally:
+            db.close()
+        if n:
+            logger.info("Chain ready: draining %d queued anchor jobs", n)
+        w3 = blockchain_service.CHAIN.require().w3
+        for job_id, tx_hash in orphans:
+            if job_id in self._tracked or not tx_hash:
+                continue
+            self._tracked.add(job_id)
+            RECEIPTS.track(w3, tx_hash, functools.partial(self._on_receipt, job_id))
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="anchor-send")
+        return self._pool
+
+    def _submit_one(self, job_id: int) -> int:
+        db = Session(bind=self._bind)
+        try:
+            claimed = db.execute(
+                update(AnchorJob)
+                .where(AnchorJob.id == job_id, AnchorJob.status == "queued")
+                .values(status="submitting", attempts=AnchorJob.attempts + 1)
+            ).rowcount
+            db.commit()
+            if not claimed:
+                return 0  # another worker got it
+            job = db.get(AnchorJob, job_id)
+            handler = self._handlers.get(job.kind)
+            if handler is None:
+                self._finish(job, "dead", "no handler for kind %r" % job.kind)
+                db.commit()
+                return 0
+            try:
+                tx_hash = handler(job.subject_id, job.payload or {})
+            except Exception as e:
+                self._retry_or_die(job, e, final=is_revert_error(e))
+                db.commit()
+                return 0
+            job.status = "submitted"
+            job.tx_hash = tx_hash
+            job.last_error = None
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self.submitted += 1
+        self._tracked.add(job_id)
+        blockchain_service.on_tx_receipt(tx_hash, functools.partial(self._on_receipt, job_id))
+        return 1
+
+    def _on_receipt(self, job_id: int, tx_hash: str, receipt: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+        self._tracked.discard(job_id)
+        callback = None
+        db = Session(bind=self._bind)
+        try:
+            job = db.get(AnchorJob, job_id)
+            if job is None or job.tx_hash != tx_hash or job.status != "submitted":
+                return
+            kind, subject_id = job.kind, job.subject_id
+            if error is None:
+                self._finish(job, "done", None)
+                self.confirmed += 1
+            else:
+                # mined but reverted is final unless it ran out of gas (re-estimated on resend);
+                # not mined in time (dropped, node reset) is retried
+                final = receipt is not None and not blockchain_service.reverted_out_of_gas(tx_hash, receipt)
+                self._retry_or_die(job, error, final=final)
+            db.commit()
+            callback = self._receipt_handlers.get(kind)
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to record anchor job receipt job_id=%s", job_id)
+        finally:
+            db.close()
+        self._wake.set()  # in-flight slot freed
+        if callback is not None:
+            try:
+                callback(subject_id, tx_hash, receipt, error)
+            except Exception:
+                logger.exception("Anchor receipt callback failed for %s #%s", kind, subject_id)
+
+    def _retry_or_die(self, job: AnchorJob, error: Any, final: bool = False) -> None:
+        if final or (ANCHOR_MAX_ATTEMPTS and job.attempts >= ANCHOR_MAX_ATTEMPTS):
+            self._finish(job, "dead", str(error))
+            logger.error("Anchor job %s (%s #%s) gave up after %d attempts: %s",
+                         job.id, job.kind, job.subject_id, job.attempts, error)
+            return
+        delay = backoff_seconds(job.attempts)
+        job.status = "queued"
+        job.tx_hash = None
+        job.last_error = str(error)
+        job.next_attempt_at = _utcnow() + datetime.timedelta(seconds=delay)
+        self.retried += 1
+        logger.warning("Anchor job %s (%s #%s) attempt %d failed, retry in %.0fs: %s",
+                       job.id, job.kind, job.subject_id, job.attempts, delay, error)
+
+    def _finish(self, job: AnchorJob, status: str, error: Optional[str]) -> None:
+        job.status = status
+        job.last_error = error
+        if status == "dead":
+            self.dead += 1
+
+    # ----- admin -----
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "chain_state": blockchain_service.CHAIN.state,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "max_in_flight": self.max_in_flight,
+            "submitted": self.submitted,
+            "confirmed": self.confirmed,
+            "retried": self.retried,
+            "dead": self.dead,
+        }
+        if self._bind is None:
+            return out
+        db = Session(bind=self._bind)
+        try:
+            now = _utcnow()
+            by_status = dict(
+                db.query(AnchorJob.status, func.count(AnchorJob.id)).group_by(AnchorJob.status).all()
+            )
+            oldest_open = (
+                db.query(func.min(AnchorJob.created_at)).filter(AnchorJob.status.in_(OPEN_STATUSES)).scalar()
+            )
+            due = (
+                db.query(func.count(AnchorJob.id))
+                .filter(AnchorJob.status == "queued", AnchorJob.next_attempt_at <= now)
+                .scalar()
+            )
+            next_retry = (
+                db.query(func.min(AnchorJob.next_attempt_at))
+                .filter(AnchorJob.status == "queued", AnchorJob.next_attempt_at > now)
+                .scalar()
+            )
+        finally:
+            db.close()
+        out.update(
+            backlog=sum(by_status.get(s, 0) for s in OPEN_STATUSES),
+            by_status=by_status,
+            due_now=due,
+            oldest_open_age_seconds=round((now - oldest_open).total_seconds(), 1) if oldest_open else 0.0,
+            next_retry_in_seconds=round((next_retry - now).total_seconds(), 1) if next_retry else None,
+        )
+        return out
+
+
+ANCHOR_JOBS = AnchorQueue()
@@ -1,14 +1,35 @@
 # app/services/blockchain_service.py
+"""
+Web3 access to the TouristRegistry contract.
+
+The node connection is lazy: nothing touches the network at import time. CHAIN (a ChainClient)
+connects in a background thread started from the app's startup hook (or on first use), then keeps
+probing the node so a restart/outage shows up as a "degraded" state instead of a hung request.
+Chain-dependent calls go through CHAIN.require(), which returns a ChainHandle when the node is
+ready and raises ChainUnavailableError immediately when it is not. Contract view calls are served
+through CHAIN_READS (chain_read_cache), keyed by (function, args, block).
+
+`blockchain_service.w3`, `.contract_instance`, `.SENDER_ADDRESS` and `.account` are still
+available as module attributes for existing callers; they resolve through CHAIN.require().
+"""
 import os
 import json
 import time
+import functools
 import logging
+import threading
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List, Tuple
 
 from web3 import Web3
 from web3.exceptions import ContractLogicError
 
+from app.services.chain_read_cache import CHAIN_READS
+from app.services.gas_strategy import GAS, used_gas_limit
+from app.services.nonce_manager import NONCES, is_nonce_error
+from app.services.receipt_tracker import RECEIPTS, ReceiptCallback
+
 logger = logging.getLogger(__name__)
 logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
@@ -17,32 +38,12 @@ logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 GANACHE_URL = os.getenv("GANACHE_URL", "http://ganache:8545")
 PRIVATE_KEY = os.getenv("PRIVATE_KEY")  # optional: when present we sign txs locally
 
-w3 = Web3(Web3.HTTPProvider(GANACHE_URL))
-
-# wait for chain readiness (short loop)
-for i in range(10):
-    try:
-        if w3.is_connected():
-            logger.info("Connected to blockchain at %s", GANACHE_URL)
-            break
-    except Exception:
-        pass
-    logger.info("Waiting for blockchain... attempt %d", i + 1)
-    time.sleep(1)
-else:
-    raise RuntimeError("Cannot connect to blockchain at %s" % GANACHE_URL)
-
-# account setup
-if PRIVATE_KEY:
-    account = w3.eth.account.from_key(PRIVATE_KEY)
-    SENDER_ADDRESS = account.address
-else:
-    # use first funded unlocked account from provider (Ganache)
-    funded = [a for a in w3.eth.accounts if w3.eth.get_balance(a) > 0]
-    if not funded:
-        raise RuntimeError("No funded accounts available on the node")
-    SENDER_ADDRESS = funded[0]
-    account = None
+CHAIN_RPC_TIMEOUT_SECONDS = float(os.getenv("CHAIN_RPC_TIMEOUT_SECONDS", "5"))
+# interval between health probes once connected (and between reconnect attempts when down)
+CHAIN_PROBE_INTERVAL_SECONDS = float(os.getenv("CHAIN_PROBE_INTERVAL_SECONDS", "15"))
+CHAIN_RETRY_MAX_SECONDS = float(os.getenv("CHAIN_RETRY_MAX_SECONDS", "60"))
+# how long a caller waits for the *first* connection attempt that is still in progress
+CHAIN_CONNECT_WAIT_SECONDS = float(os.getenv("CHAIN_CONNECT_WAIT_SECONDS", "2"))
 
 # Load contract ABI & address (Truffle build format)
 # try several likely paths (service located at app/services)
@@ -54,56 +55,237 @@ possible_paths = [
     Path(os.getenv("CONTRACT_ABI_PATH", "")) if os.getenv("CONTRACT_ABI_PATH") else None,
 ]
 
-contract_data = None
-for p in [pp for pp in possible_paths if pp]:
-    try:
-        p = Path(p)
-        if p.exists():
-            with open(p, "r") as f:
-                raw = f.read().strip()
-                if raw:
-                    contract_data = json.loads(raw)
-                    logger.info("Loaded contract JSON from %s", p)
-                    break
-    except Exception:
-        logger.exception("Failed to load contract JSON from %s", p)
 
-if not contract_data:
-    logger.warning("Contract JSON not found in build artifact; relying on env-provided ABI if present")
-    # try raw ABI in env
-    abi_env = os.getenv("CONTRACT_ABI_JSON")
-    if abi_env:
+class ChainUnavailableError(RuntimeError):
+    """The blockchain node (or contract configuration) is not usable right now."""
+
+
+def load_contract_data() -> Tuple[list, str]:
+    """Return (abi, address) from the build artifact / env. Raises RuntimeError when missing."""
+    contract_data = None
+    for p in [pp for pp in possible_paths if pp]:
         try:
-            contract_data = {"abi": json.loads(abi_env)}
-            logger.info("Loaded contract ABI from CONTRACT_ABI_JSON env")
+            p = Path(p)
+            if p.exists():
+                with open(p, "r") as f:
+                    raw = f.read().strip()
+                    if raw:
+                        contract_data = json.loads(raw)
+                        logger.info("Loaded contract JSON from %s", p)
+                        break
         except Exception:
-            logger.exception("Failed to parse CONTRACT_ABI_JSON")
-
-if not contract_data:
-    raise RuntimeError("Contract ABI JSON not found. Provide build artifact or set CONTRACT_ABI_PATH/CONTRACT_ABI_JSON")
+            logger.exception("Failed to load contract JSON from %s", p)
+
+    if not contract_data:
+        logger.warning("Contract JSON not found in build artifact; relying on env-provided ABI if present")
+        # try raw ABI in env
+        abi_env = os.getenv("CONTRACT_ABI_JSON")
+        if abi_env:
+            try:
+                contract_data = {"abi": json.loads(abi_env)}
+                logger.info("Loaded contract ABI from CONTRACT_ABI_JSON env")
+            except Exception:
+                logger.exception("Failed to parse CONTRACT_ABI_JSON")
+
+    if not contract_data:
+        raise RuntimeError("Contract ABI JSON not found. Provide build artifact or set CONTRACT_ABI_PATH/CONTRACT_ABI_JSON")
+
+    contract_abi = contract_data.get("abi")
+    networks = contract_data.get("networks", {}) or {}
+
+    if not contract_abi:
+        raise RuntimeError("Contract ABI missing in contract JSON")
+
+    contract_address = None
+    # try networks block (Truffle)
+    if networks:
+        for netid, info in networks.items():
+            addr = info.get("address")
+            if addr:
+                contract_address = addr
+                break
+
+    # allow override via env
+    contract_address = os.getenv("TOURIST_REGISTRY_ADDRESS", contract_address)
+    if not contract_address:
+        raise RuntimeError("Contract address not found in build artifact or TOURIST_REGISTRY_ADDRESS not set")
+    return contract_abi, contract_address
+
+
+@dataclass(frozen=True)
+class ChainHandle:
+    """Everything a chain call needs, captured from one successful connection."""
+    w3: Web3
+    contract: Any
+    sender_address: str
+    account: Any = None  # LocalAccount when PRIVATE_KEY is set, else None (node-unlocked sender)
+
+
+class ChainClient:
+    """
+    Lazily connected Web3 client with background connect/health probing.
 
-contract_abi = contract_data.get("abi")
-networks = contract_data.get("networks", {}) or {}
+    state: "idle" (not started) -> "connecting" -> "ready" <-> "degraded"
+    """
 
-if not contract_abi:
-    raise RuntimeError("Contract ABI missing in contract JSON")
+    def __init__(
+        self,
+        url: str = GANACHE_URL,
+        private_key: Optional[str] = PRIVATE_KEY,
+        probe_interval: float = CHAIN_PROBE_INTERVAL_SECONDS,
+    ):
+        self.url = url
+        self.private_key = private_key
+        self.probe_interval = probe_interval
+        self.state = "idle"
+        self.last_error: Optional[str] = None
+        self.connected_at: Optional[float] = None
+        self.last_probe_at: Optional[float] = None
+        self.last_block: Optional[int] = None
+        self._handle: Optional[ChainHandle] = None
+        self._lock = threading.Lock()
+        self._first_attempt = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- lifecycle -----
+    def start(self) -> None:
+        """Start the background connect/probe thread (idempotent, never blocks)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self.state == "idle":
+                self.state = "connecting"
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="chain-client", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def configure(self, w3: Web3, contract: Any, sender_address: str, account: Any = None) -> None:
+        """Install an already connected handle (tests, benchmarks, scripts). No probing thread."""
+        NONCES.reset()
+        CHAIN_READS.clear()
+        GAS.clear()
+        with self._lock:
+            self._handle = ChainHandle(w3, contract, sender_address, account)
+            self.state = "ready"
+            self.last_error = None
+            self.connected_at = time.time()
+        self._first_attempt.set()
+
+    # ----- access -----
+    def require(self) -> ChainHandle:
+        """Return the live handle or raise ChainUnavailableError without waiting on the network."""
+        handle = self._handle
+        if handle is not None and self.state == "ready":
+            return handle
+        if self.state == "idle":
+            self.start()
+        if not self._first_attempt.is_set():
+            self._first_attempt.wait(CHAIN_CONNECT_WAIT_SECONDS)
+            handle = self._handle
+            if handle is not None and self.state == "ready":
+                return handle
+        raise ChainUnavailableError(
+            "Blockchain unavailable (%s): %s" % (self.state, self.last_error or "not connected yet")
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "url": self.url,
+            "last_error": self.last_error,
+            "connected_at": self.connected_at,
+            "last_probe_at": self.last_probe_at,
+            "last_block": self.last_block,
+            "sender": self._handle.sender_address if self._handle else None,
+            "nonces": NONCES.stats(),
+            "receipts": RECEIPTS.stats(),
+            "reads": CHAIN_READS.stats(),
+            "gas": GAS.stats(),
+        }
 
-contract_address = None
-# try networks block (Truffle)
-if networks:
-    for netid, info in networks.items():
-        addr = info.get("address")
-        if addr:
-            contract_address = addr
-            break
+    # ----- background work -----
+    def _connect(self) -> ChainHandle:
+        w3 = Web3(Web3.HTTPProvider(self.url, request_kwargs={"timeout": CHAIN_RPC_TIMEOUT_SECONDS}))
+        if not w3.is_connected():
+            raise ChainUnavailableError("Cannot connect to blockchain at %s" % self.url)
 
-# allow override via env
-contract_address = os.getenv("TOURIST_REGISTRY_ADDRESS", contract_address)
-if not contract_address:
-    raise RuntimeError("Contract address not found in build artifact or TOURIST_REGISTRY_ADDRESS not set")
+        # account setup
+        if self.private_key:
+            account = w3.eth.account.from_key(self.private_key)
+            sender = account.address
+        else:
+            # use first funded unlocked account from provider (Ganache)
+            funded = [a for a in w3.eth.accounts if w3.eth.get_balance(a) > 0]
+            if not funded:
+                raise RuntimeError("No funded accounts available on the node")
+            sender = funded[0]
+            account = None
+
+        contract_abi, contract_address = load_contract_data()
+        logger.info("Using contract at %s", contract_address)
+        contract = w3.eth.contract(address=Web3.to_checksum_address(contract_address), abi=contract_abi)
+        self.last_block = w3.eth.block_number
+        return ChainHandle(w3, contract, sender, account)
+
+    def _probe(self, handle: ChainHandle) -> None:
+        self.last_block = handle.w3.eth.block_number
+        CHAIN_READS.note_block(self.last_block)
+        GAS.refresh_fees(handle.w3)
+        self.last_probe_at = time.time()
+        NONCES.reconcile(handle.w3, handle.sender_address)
+
+    def _run(self) -> None:
+        delay = 1.0
+        while not self._stop.is_set():
+            handle = self._handle
+            try:
+                if handle is None:
+                    handle = self._connect()
+                    with self._lock:
+                        self._handle = handle
+                        self.connected_at = time.time()
+                    logger.info("Connected to blockchain at %s (sender=%s)", self.url, handle.sender_address)
+                else:
+                    self._probe(handle)
+                if self.state != "ready":
+                    logger.info("Blockchain client ready")
+                self.state = "ready"
+                self.last_error = None
+                delay = 1.0
+                wait = self.probe_interval
+            except Exception as e:
+                self.last_error = str(e) or e.__class__.__name__
+                if self.state != "degraded":
+                    logger.warning("Blockchain unavailable at %s: %s", self.url, self.last_error)
+                self.state = "degraded"
+                wait = delay
+                delay = min(delay * 2, CHAIN_RETRY_MAX_SECONDS)
+            finally:
+                self.last_probe_at = time.time()
+                self._first_attempt.set()
+            self._stop.wait(wait)
+
+
+CHAIN = ChainClient()
+
+_HANDLE_ATTRS = {
+    "w3": "w3",
+    "contract_instance": "contract",
+    "SENDER_ADDRESS": "sender_address",
+    "account": "account",
+}
+
+
+def __getattr__(name: str):
+    # legacy module attributes (blockchain_service.w3 etc.) resolve lazily through CHAIN
+    if name in _HANDLE_ATTRS:
+        return getattr(CHAIN.require(), _HANDLE_ATTRS[name])
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-logger.info("Using contract at %s", contract_address)
-contract_instance = w3.eth.contract(address=Web3.to_checksum_address(contract_address), abi=contract_abi)
 
 # ===== Helpers =====
 def _normalize_date_field(v: Any) -> str:
@@ -119,38 +301,104 @@ def _normalize_date_field(v: Any) -> str:
         s = s.split(" ", 1)[0]
     return s
 
-def _ensure_sender_nonce() -> int:
-    return w3.eth.get_transaction_count(SENDER_ADDRESS)
+def _send_signed_or_unlocked(chain: ChainHandle, tx_dict: Dict[str, Any]):
+    w3 = chain.w3
+    if chain.account:  # sign locally
+        signed = w3.eth.account.sign_transaction(tx_dict, private_key=chain.account.key)
+        raw = getattr(signed, "raw_transaction", None) or getattr(signed, "rawTransaction", None)
+        if raw is None:
+            logger.error("Signed transaction object missing raw bytes: attrs=%s", dir(signed))
+            raise RuntimeError("Signed transaction has no raw bytes")
+        return w3.eth.send_raw_transaction(raw)
+    return w3.eth.send_transaction(tx_dict)
 
-def _build_and_send_tx(tx_dict: Dict[str, Any]) -> str:
+
+def _send_with_nonce(chain: ChainHandle, tx_dict: Dict[str, Any]):
     """
-    Signs (if PRIVATE_KEY) or sends a transaction and returns receipt tx hash hex.
-    DEV HELP: if local Ganache has automine disabled, call evm_mine to force mining.
+    Stamp a locally allocated nonce on tx_dict and send it. On a nonce error the manager
+    resyncs from the node and the send is retried once with a fresh nonce.
     """
-    try:
-        if account:  # sign locally
-            signed = w3.eth.account.sign_transaction(tx_dict, private_key=PRIVATE_KEY)
-            raw = getattr(signed, "raw_transaction", None) or getattr(signed, "rawTransaction", None)
-            if raw is None:
-                logger.error("Signed transaction object missing raw bytes: attrs=%s", dir(signed))
-                raise RuntimeError("Signed transaction has no raw bytes")
-            tx_hash = w3.eth.send_raw_transaction(raw)
-        else:
-            tx_hash = w3.eth.send_transaction(tx_dict)
-
-        # ==== DEV: force a mine on local nodes so wait_for_transaction_receipt returns promptly ====
+    sender = chain.sender_address
+    for attempt in range(2):
+        nonce = NONCES.allocate(chain.w3, sender)
+        tx = dict(tx_dict, nonce=nonce)
         try:
-            # safe: only available on local dev nodes like Ganache / Hardhat
-            w3.provider.make_request("evm_mine", [])
-        except Exception:
-            # ignore if method not available (public/test networks)
-            logger.debug("evm_mine not available or failed; continuing to wait for receipt")
+            tx_hash = _send_signed_or_unlocked(chain, tx)
+        except Exception as e:
+            NONCES.release(sender, nonce, e)
+            if attempt == 0 and is_nonce_error(e):
+                continue
+            raise
+        NONCES.confirm(sender, nonce)
+        return tx_hash
+
 
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        return receipt.transactionHash.hex()
+def _build_and_send_tx(chain: ChainHandle, tx_dict: Dict[str, Any]) -> str:
+    """
+    Signs (if PRIVATE_KEY) or sends a transaction and returns the tx hash hex as soon as the
+    node accepts it. Confirmation is tracked by RECEIPTS (batched polling, which also issues
+    evm_mine on local dev nodes); see on_tx_receipt().
+    The nonce comes from the local NonceManager (no get_transaction_count per tx).
+    """
+    try:
+        tx_hash = _send_with_nonce(chain, tx_dict)
     except Exception as e:
         logger.exception("Failed to build/send tx: %s", e)
         raise
+    tx_hash_hex = Web3.to_hex(tx_hash)
+    RECEIPTS.track(chain.w3, tx_hash_hex, _advance_read_head)
+    return tx_hash_hex
+
+
+def _transact(chain: ChainHandle, fn: Any) -> str:
+    """
+    Send a contract call with a cached gas estimate and the cached fee parameters
+    (gas_strategy) and return its tx hash hex.
+    """
+    gas, gas_key = GAS.gas_limit(chain, fn)
+    tx = fn.build_transaction({"from": chain.sender_address, "gas": gas, **GAS.fee_params(chain.w3)})
+    tx_hash = _build_and_send_tx(chain, tx)
+    on_tx_receipt(tx_hash, functools.partial(_observe_gas, gas_key, gas))
+    return tx_hash
+
+
+def _observe_gas(gas_key, gas_limit: int, tx_hash: str, receipt: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+    if receipt is not None:
+        GAS.observe(gas_key, gas_limit, receipt.get("gasUsed"))
+
+
+def _advance_read_head(tx_hash: str, receipt: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+    # reads issued after our own write is mined must not be served from the older block
+    if receipt is not None:
+        CHAIN_READS.note_own_write(receipt.get("blockNumber"))
+
+
+def reverted_out_of_gas(tx_hash: str, receipt: Optional[Dict[str, Any]]) -> bool:
+    """
+    Whether a failed receipt used (almost) all of its gas limit. Such a tx ran out of gas
+    rather than hitting a require(); GAS has dropped the estimate, so a resend can succeed.
+    """
+    if receipt is None or receipt.get("status") != 0:
+        return False
+    try:
+        gas_limit = CHAIN.require().w3.eth.get_transaction(tx_hash)["gas"]
+    except Exception as e:
+        logger.warning("Cannot read gas limit of %s: %s", tx_hash, e)
+        return False
+    return used_gas_limit(int(gas_limit), receipt.get("gasUsed"))
+
+
+def on_tx_receipt(tx_hash: str, callback: ReceiptCallback) -> bool:
+    """
+    Run callback(tx_hash, receipt, error) when a tx sent by this module is mined, reverts or
+    times out. Register it after persisting the hash; an already resolved tx fires at once.
+    """
+    return RECEIPTS.add_callback(tx_hash, callback)
+
+
+def subject_hash_hex(subject_id: str) -> str:
+    """'0x'-prefixed keccak of the subject identifier, as stored in attestations.subject_hash."""
+    return Web3.to_hex(_subject_to_bytes32(subject_id))
 
 
 def _subject_to_bytes32(subject_id: str) -> bytes:
@@ -158,7 +406,7 @@ def _subject_to_bytes32(subject_id: str) -> bytes:
     Convert subject identifier to keccak bytes32 as contract expects.
     Accepts DID, phone, or any string — caller should avoid sending raw PII if possible.
     """
-    return w3.keccak(text=str(subject_id))
+    return Web3.keccak(text=str(subject_id))
 
 def _pack_attestation_return(raw_tuple: Tuple) -> Dict[str, Any]:
     """
@@ -171,13 +419,29 @@ def _pack_attestation_return(raw_tuple: Tuple) -> Dict[str, Any]:
     meta = raw_tuple[3] if len(raw_tuple) > 3 else ""
     return {"cid": cid, "timestamp": timestamp, "issuer": issuer, "meta": meta}
 
+def _pack_tourist_return(result: Tuple) -> Dict[str, Any]:
+    if not result or not result[0]:
+        return {"error": "No tourist found for this address"}
+    emergency_contacts_raw = result[4] if result[4] else "[]"
+    try:
+        emergency_contacts = json.loads(emergency_contacts_raw)
+    except Exception:
+        emergency_contacts = [emergency_contacts_raw]
+    return {
+        "full_name": result[0],
+        "kyc_id": result[1],
+        "visit_start": result[2],
+        "visit_end": result[3],
+        "emergency_contacts": emergency_contacts
+    }
+
 # ===== Public functions =====
 
 def register_tourist_on_chain(data: dict) -> str:
     """
     Register a tourist on-chain via the contract's registerTourist method.
     Accepts flexible keys and normalizes them.
-    Returns transaction hash hex string.
+    Returns transaction hash hex string once the node accepted the tx (see on_tx_receipt).
     """
     full_name = data.get("full_name") or data.get("fullName") or ""
     kyc_id = data.get("kyc_id") or data.get("kycId") or ""
@@ -199,21 +463,17 @@ def register_tourist_on_chain(data: dict) -> str:
     else:
         emergency_json = json.dumps([emergency]) if emergency else json.dumps([])
 
-    tx = contract_instance.functions.registerTourist(
+    chain = CHAIN.require()
+    fn = chain.contract.functions.registerTourist(
         full_name,
         kyc_id,
         visit_start_str,
         visit_end_str,
         emergency_json
-    ).build_transaction({
-        "from": SENDER_ADDRESS,
-        "nonce": _ensure_sender_nonce(),
-        "gas": 500_000,
-        "gasPrice": w3.to_wei("20", "gwei"),
-    })
+    )
 
     try:
-        tx_hash = _build_and_send_tx(tx)
+        tx_hash = _transact(chain, fn)
         logger.info("register_tourist_on_chain tx_hash=%s", tx_hash)
         return tx_hash
     except ContractLogicError as e:
@@ -227,7 +487,7 @@ def register_kyc_attestation_on_chain(subject_id: str, ipfs_cid: str, metadata:
     """
     Anchor a privacy-preserving attestation on-chain.
     Uses keccak(subject_id) -> bytes32, calls contract.anchorKyc(subjectHash, cid, meta)
-    Returns tx hash or None on failure.
+    Returns tx hash (submitted, not yet mined) or None on failure.
     """
     if not subject_id or not ipfs_cid:
         raise ValueError("subject_id and ipfs_cid are required")
@@ -235,6 +495,13 @@ def register_kyc_attestation_on_chain(subject_id: str, ipfs_cid: str, metadata:
     subject_hash_bytes = _subject_to_bytes32(subject_id)
     meta_json = json.dumps(metadata or {}) if metadata else ""
 
+    try:
+        chain = CHAIN.require()
+    except ChainUnavailableError as e:
+        logger.warning("Skipping KYC anchor, %s", e)
+        return None
+    contract_instance = chain.contract
+
     # try to call anchorKyc(subjectHash, cid, meta)
     fn = None
     try:
@@ -250,15 +517,8 @@ def register_kyc_attestation_on_chain(subject_id: str, ipfs_cid: str, metadata:
         logger.info("Contract does not expose an attestation function; skipping on-chain attestation")
         return None
 
-    tx = fn.build_transaction({
-        "from": SENDER_ADDRESS,
-        "nonce": _ensure_sender_nonce(),
-        "gas": 500_000,
-        "gasPrice": w3.to_wei("20", "gwei"),
-    })
-
     try:
-        tx_hash = _build_and_send_tx(tx)
+        tx_hash = _transact(chain, fn)
         logger.info("register_kyc_attestation_on_chain tx_hash=%s subject_hash=%s cid=%s",
                     tx_hash, subject_hash_bytes.hex(), ipfs_cid)
         return tx_hash
@@ -266,6 +526,42 @@ def register_kyc_attestation_on_chain(subject_id: str, ipfs_cid: str, metadata:
         logger.exception("Failed to anchor KYC on-chain")
         return None
 
+def anchor_kyc_root(root: bytes, leaf_count: int, metadata: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Anchor a Merkle root covering leaf_count KYC attestations (see kyc_batch_anchor).
+    Uses anchorKycRoot(root, leafCount, meta) when the deployed contract has it; older
+    deployments get anchorKyc(root, "merkle-root", meta) so the root is still on-chain.
+    Returns tx hash (submitted, not yet mined). Raises on failure so the batch stays queued.
+    """
+    chain = CHAIN.require()
+    meta_json = json.dumps({**(metadata or {}), "leaf_count": int(leaf_count)})
+    fns = chain.contract.functions
+    if _has_function(chain.contract, "anchorKycRoot"):
+        fn = fns.anchorKycRoot(root, int(leaf_count), meta_json)
+    else:
+        fn = fns.anchorKyc(root, MERKLE_ROOT_CID, meta_json)
+
+    tx_hash = _transact(chain, fn)
+    logger.info("anchor_kyc_root tx_hash=%s root=%s leaves=%d", tx_hash, root.hex(), leaf_count)
+    return tx_hash
+
+
+def is_kyc_root_anchored(root: bytes) -> bool:
+    """True when root was anchored by anchor_kyc_root (either contract flavour)."""
+    chain = CHAIN.require()
+    if _has_function(chain.contract, "getKycRoot"):
+        timestamp = CHAIN_READS.call(chain, "getKycRoot", bytes(root))[0]
+        return int(timestamp) > 0
+    return int(CHAIN_READS.call(chain, "attestationCount", bytes(root))) > 0
+
+
+MERKLE_ROOT_CID = "merkle-root"  # cid marker for roots anchored through anchorKyc
+
+
+def _has_function(contract: Any, name: str) -> bool:
+    return any(e.get("type") == "function" and e.get("name") == name for e in contract.abi)
+
+
 def get_tourist(tourist_address: str) -> dict:
     """
     Fetch tourist by wallet address using contract.getTourist(address).
@@ -273,21 +569,8 @@ def get_tourist(tourist_address: str) -> dict:
     """
     try:
         addr = Web3.to_checksum_address(tourist_address)
-        result = contract_instance.functions.getTourist(addr).call()
-        if not result or not result[0]:
-            return {"error": "No tourist found for this address"}
-        emergency_contacts_raw = result[4] if result[4] else "[]"
-        try:
-            emergency_contacts = json.loads(emergency_contacts_raw)
-        except Exception:
-            emergency_contacts = [emergency_contacts_raw]
-        return {
-            "full_name": result[0],
-            "kyc_id": result[1],
-            "visit_start": result[2],
-            "visit_end": result[3],
-            "emergency_contacts": emergency_contacts
-        }
+        result = CHAIN_READS.call(CHAIN.require(), "getTourist", addr)
+        return _pack_tourist_return(result)
     except Exception as e:
         logger.exception("get_tourist failed: %s", e)
         return {"error": str(e)}
@@ -299,7 +582,7 @@ def attestation_count(subject_id: str) -> int:
     """
     try:
         subj = _subject_to_bytes32(subject_id)
-        cnt = contract_instance.functions.attestationCount(subj).call()
+        cnt = CHAIN_READS.call(CHAIN.require(), "attestationCount", subj)
         return int(cnt)
     except Exception:
         logger.exception("attestation_count failed for %s", subject_id)
@@ -312,7 +595,7 @@ def get_attestation_by_index(subject_id: str, index: int) -> Dict[str, Any]:
     """
     try:
         subj = _subject_to_bytes32(subject_id)
-        raw = contract_instance.functions.getAttestationByIndex(subj, int(index)).call()
+        raw = CHAIN_READS.call(CHAIN.require(), "getAttestationByIndex", subj, int(index))
         return _pack_attestation_return(raw)
     except ContractLogicError as e:
         logger.error("Contract logic error while fetching attestation: %s", e)
@@ -328,7 +611,7 @@ def get_latest_attestation(subject_id: str) -> Dict[str, Any]:
     """
     try:
         subj = _subject_to_bytes32(subject_id)
-        raw = contract_instance.functions.getLatestAttestation(subj).call()
+        raw = CHAIN_READS.call(CHAIN.require(), "getLatestAttestation", subj)
         return _pack_attestation_return(raw)
     except ContractLogicError as e:
         logger.error("Contract logic error while fetching latest attestation: %s", e)
@@ -336,3 +619,36 @@ def get_latest_attestation(subject_id: str) -> Dict[str, Any]:
     except Exception:
         logger.exception("get_latest_attestation failed for %s", subject_id)
         raise
+
+def get_latest_attestations(subject_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Latest attestation for many subjects in one multi-call (one JSON-RPC batch over HTTP).
+    Returns {subject_id: {cid, timestamp, issuer, meta}}, or {"error": ...} for subjects whose
+    call reverted (no attestation, missing role).
+    """
+    chain = CHAIN.require()
+    raws = CHAIN_READS.call_many(
+        chain, "getLatestAttestation", [(_subject_to_bytes32(s),) for s in subject_ids], return_exceptions=True
+    )
+    return {
+        s: {"error": str(raw)} if isinstance(raw, Exception) else _pack_attestation_return(raw)
+        for s, raw in zip(subject_ids, raws)
+    }
+
+
+def attestation_counts(subject_ids: List[str]) -> Dict[str, int]:
+    """attestation_count() for many subjects in one multi-call."""
+    chain = CHAIN.require()
+    counts = CHAIN_READS.call_many(chain, "attestationCount", [(_subject_to_bytes32(s),) for s in subject_ids])
+    return {s: int(c) for s, c in zip(subject_ids, counts)}
+
+
+def get_tourists(tourist_addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+    """get_tourist() for many wallet addresses in one multi-call."""
+    chain = CHAIN.require()
+    addrs = [Web3.to_checksum_address(a) for a in tourist_addresses]
+    raws = CHAIN_READS.call_many(chain, "getTourist", [(a,) for a in addrs], return_exceptions=True)
+    return {
+        a: {"error": str(raw)} if isinstance(raw, Exception) else _pack_tourist_return(raw)
+        for a, raw in zip(tourist_addresses, raws)
+    }
@@ -0,0 +1,283 @@
+# app/services/chain_indexer.py
+"""
+Incremental indexer for TouristRegistry events.
+
+Follows KycAnchored and TouristRegistered logs from a checkpointed block in batched
+eth_getLogs ranges and materializes them into the `attestations` table, so attestation
+reads are local indexed queries instead of an eth_call per request.
+
+ - progress lives in chain_checkpoints (one row per indexer name) and is committed together
+   with the rows of each range, so a restart resumes where it stopped;
+ - only blocks at least CHAIN_INDEXER_CONFIRMATIONS deep are indexed (0 on dev chains);
+ - the checkpoint keeps the hashes of the last few processed range ends. If the stored hash of
+   the checkpoint block no longer matches the node (reorg, or a dev chain that was reset), the
+   indexer rewinds to the newest block that still matches, drops the rows it indexed above it
+   and re-reads from there;
+ - a KycAnchored log for a tx the backend already recorded (kyc_service direct mode) fills in
+   that row instead of inserting a duplicate. Root anchors of Merkle batches are skipped; their
+   leaves already have rows (kyc_batch_anchor).
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+from web3 import Web3
+
+from app.models.tourist_models import Attestation, ChainCheckpoint
+from app.services import blockchain_service
+from app.services.kyc_batch_anchor import ensure_attestation_table
+
+logger = logging.getLogger(__name__)
+
+CHAIN_INDEXER_ENABLED = os.getenv("CHAIN_INDEXER_ENABLED", "true").lower() in ("1", "true", "yes")
+CHAIN_INDEXER_POLL_SECONDS = float(os.getenv("CHAIN_INDEXER_POLL_SECONDS", "5"))
+CHAIN_INDEXER_BATCH_BLOCKS = int(os.getenv("CHAIN_INDEXER_BATCH_BLOCKS", "2000"))
+CHAIN_INDEXER_START_BLOCK = int(os.getenv("CHAIN_INDEXER_START_BLOCK", "0"))
+# None -> 0 on dev chains (Ganache/Hardhat ids), 12 elsewhere
+_CONFIRMATIONS_ENV = os.getenv("CHAIN_INDEXER_CONFIRMATIONS")
+DEV_CHAIN_IDS = {1337, 31337, 5777, 131277322940537}
+RECENT_BLOCKS_KEPT = 64
+
+INDEXED_EVENTS = ("KycAnchored", "TouristRegistered")
+INDEXER_SOURCE = "indexer"
+
+
+class ChainIndexer:
+    def __init__(self, name: str = "tourist_registry"):
+        self.name = name
+        self.batch_blocks = CHAIN_INDEXER_BATCH_BLOCKS
+        self._bind = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.logs_indexed = 0
+        self.reorgs = 0
+        self.last_error: Optional[str] = None
+        self.head: Optional[int] = None
+
+    # ----- lifecycle -----
+    def start(self, bind) -> None:
+        """Index in a background thread against this engine (no-op when disabled)."""
+        if not CHAIN_INDEXER_ENABLED:
+            return
+        ensure_attestation_table(bind)
+        ChainCheckpoint.__table__.create(bind=bind, checkfirst=True)
+        self._bind = bind
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="chain-indexer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.sync_once()
+                self.last_error = None
+            except blockchain_service.ChainUnavailableError as e:
+                self.last_error = str(e)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Chain indexer pass failed")
+            self._stop.wait(CHAIN_INDEXER_POLL_SECONDS)
+
+    # ----- indexing -----
+    def _confirmations(self, w3: Web3) -> int:
+        if _CONFIRMATIONS_ENV is not None:
+            return int(_CONFIRMATIONS_ENV)
+        return 0 if int(w3.eth.chain_id) in DEV_CHAIN_IDS else 12
+
+    def sync_once(self, bind=None) -> Dict[str, Any]:
+        """Index up to the confirmed head. Returns {"from", "to", "logs", "rewound_to"}."""
+        bind = bind or self._bind
+        chain = blockchain_service.CHAIN.require()
+        w3, contract = chain.w3, chain.contract
+        head = int(w3.eth.block_number)
+        self.head = head
+        target = head - self._confirmations(w3)
+
+        db = Session(bind=bind)
+        try:
+            cp = db.get(ChainCheckpoint, self.name)
+            if cp is None:
+                cp = ChainCheckpoint(name=self.name, block_number=CHAIN_INDEXER_START_BLOCK - 1, recent_blocks=[])
+                db.add(cp)
+                db.commit()
+
+            rewound_to = self._check_reorg(db, w3, cp, head)
+            first = start = cp.block_number + 1
+            total = 0
+            topics = {e: self._topic(contract, e) for e in INDEXED_EVENTS}
+            while start <= target:
+                end = min(start + self.batch_blocks - 1, target)
+                logs = w3.eth.get_logs({
+                    "address": contract.address,
+                    "fromBlock": start,
+                    "toBlock": end,
+                    "topics": [list(topics.values())],
+                })
+                for log in logs:
+                    self._apply(db, contract, topics, log)
+                end_hash = Web3.to_hex(w3.eth.get_block(end)["hash"])
+                recent = list(cp.recent_blocks or []) + [[end, end_hash]]
+                cp.block_number = end
+                cp.block_hash = end_hash
+                cp.recent_blocks = recent[-RECENT_BLOCKS_KEPT:]
+                db.commit()
+                total += len(logs)
+                self.logs_indexed += len(logs)
+                start = end + 1
+            return {"from": first, "to": target, "logs": total, "rewound_to": rewound_to}
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _topic(contract, event_name: str) -> str:
+        abi = next(e for e in contract.abi if e.get("type") == "event" and e.get("name") == event_name)
+        sig = "%s(%s)" % (event_name, ",".join(i["type"] for i in abi["inputs"]))
+        return Web3.to_hex(Web3.keccak(text=sig))
+
+    def _check_reorg(self, db: Session, w3: Web3, cp: ChainCheckpoint, head: int) -> Optional[int]:
+        """Rewind the checkpoint when its recorded block hash no longer matches the node."""
+        if cp.block_hash is None or cp.block_number < 0:
+            return None
+        if cp.block_number <= head and self._hash_at(w3, cp.block_number) == cp.block_hash:
+            return None
+
+        ancestor = CHAIN_INDEXER_START_BLOCK - 1
+        kept: List[list] = []
+        for number, block_hash in reversed(cp.recent_blocks or []):
+            if number <= head and self._hash_at(w3, number) == block_hash:
+                ancestor = number
+                kept = [b for b in cp.recent_blocks if b[0] <= number]
+                break
+        logger.warning("Chain reorg/reset detected at block %d; rewinding indexer to %d", cp.block_number, ancestor)
+        self._drop_above(db, ancestor)
+        cp.block_number = ancestor
+        cp.block_hash = kept[-1][1] if kept else None
+        cp.recent_blocks = kept
+        db.commit()
+        self.reorgs += 1
+        return ancestor
+
+    @staticmethod
+    def _hash_at(w3: Web3, number: int) -> Optional[str]:
+        try:
+            return Web3.to_hex(w3.eth.get_block(number)["hash"])
+        except Exception:
+            return None
+
+    def _drop_above(self, db: Session, block_number: int) -> None:
+        rows = db.query(Attestation).filter(Attestation.block_number > block_number).all()
+        for r in rows:
+            if (r.meta or {}).get("source") == INDEXER_SOURCE:
+                db.delete(r)
+            else:  # backend-created row: keep it, forget the orphaned log position
+                r.event_name = r.block_number = r.block_hash = r.log_index = None
+
+    def _apply(self, db: Session, contract, topics: Dict[str, str], log) -> None:
+        if Web3.to_hex(log["topics"][0]) == topics["KycAnchored"]:
+            ev = contract.events.KycAnchored().process_log(log)
+            args = ev["args"]
+            if args["cid"] == blockchain_service.MERKLE_ROOT_CID:
+                return  # batch root: leaves already have rows
+            subject_hash = Web3.to_hex(args["subjectHash"])
+            fields = {
+                "subject_hash": subject_hash,
+                "ipfs_cid": args["cid"],
+                "issuer": args["issuer"],
+                "attestation_index": int(args["attestationId"]),
+            }
+            meta = {"timestamp": int(args["timestamp"]), "onchain_meta": args["meta"]}
+            event_name = "KycAnchored"
+        else:
+            ev = contract.events.TouristRegistered().process_log(log)
+            args = ev["args"]
+            # no PII in this table: key the row by keccak(kycId) like KYC attestations
+            fields = {
+                "subject_hash": blockchain_service.subject_hash_hex(args["kycId"]) if args["kycId"] else
+                Web3.to_hex(Web3.keccak(hexstr=args["touristAddress"])),
+                "ipfs_cid": "",
+                "issuer": args["touristAddress"],
+            }
+            meta = {"tourist_address": args["touristAddress"]}
+            event_name = "TouristRegistered"
+
+        tx_hash = Web3.to_hex(log["transactionHash"])
+        position = {
+            "event_name": event_name,
+            "block_number": int(log["blockNumber"]),
+            "block_hash": Web3.to_hex(log["blockHash"]),
+            "log_index": int(log["logIndex"]),
+        }
+
+        row = (
+            db.query(Attestation)
+            .filter(Attestation.tx_hash == tx_hash, Attestation.log_index == position["log_index"])
+            .first()
+        )
+        if row is None and event_name == "KycAnchored":
+            # row written by kyc_service when it sent the tx (not yet linked to its log)
+            row = (
+                db.query(Attestation)
+                .filter(
+                    Attestation.tx_hash == tx_hash,
+                    Attestation.subject_hash == fields["subject_hash"],
+                    Attestation.log_index.is_(None),
+                )
+                .first()
+            )
+        if row is None:
+            row = Attestation(tx_hash=tx_hash, meta={"source": INDEXER_SOURCE}, created_at=datetime.datetime.utcnow())
+            db.add(row)
+        for k, v in {**fields, **position}.items():
+            setattr(row, k, v)
+        row.meta = {**(row.meta or {}), **meta}
+
+    def stats(self) -> Dict[str, Any]:
+        cp = None
+        if self._bind is not None:
+            db = Session(bind=self._bind)
+            try:
+                cp = db.get(ChainCheckpoint, self.name)
+                cp = cp.block_number if cp else None
+            finally:
+                db.close()
+        return {
+            "enabled": CHAIN_INDEXER_ENABLED,
+            "checkpoint_block": cp,
+            "head": self.head,
+            "lag_blocks": (self.head - cp) if (self.head is not None and cp is not None) else None,
+            "logs_indexed": self.logs_indexed,
+            "reorgs": self.reorgs,
+            "last_error": self.last_error,
+        }
+
+
+def latest_attestation(db: Session, subject_hash: str) -> Optional[Attestation]:
+    """Newest indexed KycAnchored attestation for a subject hash ('0x..'), or None."""
+    return (
+        db.query(Attestation)
+        .filter(
+            Attestation.subject_hash == subject_hash,
+            Attestation.event_name == "KycAnchored",
+        )
+        .order_by(Attestation.block_number.desc(), Attestation.log_index.desc())
+        .first()
+    )
+
+
+CHAIN_INDEXER = ChainIndexer()
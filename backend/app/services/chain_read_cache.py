@@ -0,0 +1,249 @@
+# app/services/chain_read_cache.py
+"""
+Read-through cache for TouristRegistry view calls.
+
+Entries are keyed by (function, args, block):
+
+ - mode "block" (default): every call is pinned to the current head block, which is itself
+   re-read from the node at most every CHAIN_READ_HEAD_TTL_SECONDS. A new block means new keys,
+   so nothing is served from a block older than the head we know about; old entries age out.
+ - mode "ttl": calls go to "latest" and an entry is reused for CHAIN_READ_CACHE_TTL_SECONDS,
+   no matter how many blocks were mined meanwhile (cheapest, bounded staleness).
+
+note_block() advances the head (node probes, receipts). note_own_write() is called when one of
+blockchain_service's own transactions is mined: in block mode it moves the head to that block,
+in ttl mode it drops the cached values, so a read right after a confirmed write never returns
+the pre-write value. Blocks mined by others do not invalidate ttl entries.
+
+call_many() resolves many argument tuples of one function at once: hits come from the cache,
+misses go out as a single JSON-RPC batch of eth_call over HTTP (one call each otherwise).
+Reverts are never cached.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import requests
+from eth_utils.abi import collapse_if_tuple
+from web3.exceptions import ContractLogicError
+
+from app.services.cache_service import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CHAIN_READ_CACHE_MODE = os.getenv("CHAIN_READ_CACHE_MODE", "block").lower()  # "block" | "ttl"
+CHAIN_READ_CACHE_TTL_SECONDS = float(os.getenv("CHAIN_READ_CACHE_TTL_SECONDS", "30"))
+CHAIN_READ_CACHE_MAX = int(os.getenv("CHAIN_READ_CACHE_MAX", "20000"))
+CHAIN_READ_HEAD_TTL_SECONDS = float(os.getenv("CHAIN_READ_HEAD_TTL_SECONDS", "1"))
+
+_MISSING = object()
+
+
+def _freeze(v: Any) -> Any:
+    """web3 returns lists for tuple outputs; keep cached values immutable."""
+    if isinstance(v, list):
+        return tuple(_freeze(x) for x in v)
+    return v
+
+
+def _output_types(fn_abi: Dict[str, Any]) -> List[str]:
+    return [collapse_if_tuple(o) for o in fn_abi.get("outputs", [])]
+
+
+def is_revert_error(e: Exception) -> bool:
+    # web3 raises ContractLogicError; eth-tester raises its own TransactionFailed
+    return isinstance(e, ContractLogicError) or "revert" in str(e).lower()
+
+
+def _is_revert_rpc_error(error: Dict[str, Any]) -> bool:
+    # geth answers a revert with code 3; other nodes only say so in the message
+    return error.get("code") == 3 or "revert" in str(error.get("message", "")).lower()
+
+
+class ChainReadCache:
+    def __init__(
+        self,
+        mode: str = CHAIN_READ_CACHE_MODE,
+        ttl_seconds: float = CHAIN_READ_CACHE_TTL_SECONDS,
+        head_ttl_seconds: float = CHAIN_READ_HEAD_TTL_SECONDS,
+        max_entries: int = CHAIN_READ_CACHE_MAX,
+    ):
+        if mode not in ("block", "ttl"):
+            raise ValueError("CHAIN_READ_CACHE_MODE must be 'block' or 'ttl', got %r" % mode)
+        self.mode = mode
+        self.head_ttl_seconds = head_ttl_seconds
+        self._cache = TTLCache("chain_reads", ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self._lock = threading.Lock()
+        self._head: Optional[int] = None
+        self._head_at = 0.0
+        self._http = requests.Session()
+        self._fn_stats: Dict[str, Dict[str, int]] = {}
+
+    # ----- head tracking -----
+    def head(self, w3: Any) -> Optional[int]:
+        """Block the next reads are pinned to (None in ttl mode)."""
+        if self.mode != "block":
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if self._head is not None and now - self._head_at < self.head_ttl_seconds:
+                return self._head
+        number = int(w3.eth.block_number)
+        self.note_block(number)
+        return max(number, self._head or 0)
+
+    def note_block(self, number: Optional[int]) -> None:
+        """Record that `number` exists (node probe); never moves the head back."""
+        if number is None:
+            return
+        with self._lock:
+            if self._head is None or number >= self._head:
+                self._head = int(number)
+                self._head_at = time.monotonic()
+
+    def note_own_write(self, number: Optional[int]) -> None:
+        """One of our transactions was mined in block `number`: later reads must see its effect."""
+        if self.mode == "ttl":
+            self._cache.clear()  # ttl keys carry no block: drop pre-write values
+        self.note_block(number)
+
+    # ----- reads -----
+    def call(self, chain: Any, fn_name: str, *args: Any) -> Any:
+        """contract.functions.<fn_name>(*args).call(), served from the cache when possible."""
+        return self.call_many(chain, fn_name, [args])[0]
+
+    def call_many(self, chain: Any, fn_name: str, args_list: Sequence[Sequence[Any]],
+                  return_exceptions: bool = False) -> List[Any]:
+        """
+        Resolve fn_name for every args tuple, in order. Cache misses are fetched together.
+        A revert raises (or is returned in place when return_exceptions=True).
+        """
+        args_list = [tuple(a) for a in args_list]
+        block = self.head(chain.w3)
+        stats = self._stats_for(fn_name)
+        results: List[Any] = [_MISSING] * len(args_list)
+        missing: Dict[Hashable, List[int]] = {}
+        for i, args in enumerate(args_list):
+            key = (chain.contract.address, fn_name, args, block)
+            value = self._cache.get(key, _MISSING)
+            if value is _MISSING:
+                missing.setdefault(key, []).append(i)
+            else:
+                results[i] = value
+        stats["hits"] += len(args_list) - sum(len(v) for v in missing.values())
+        stats["misses"] += sum(len(v) for v in missing.values())
+
+        if missing:
+            keys = list(missing)
+            fetched = self._fetch(chain, fn_name, [k[2] for k in keys], block, stats)
+            for key, value in zip(keys, fetched):
+                if not isinstance(value, Exception):
+                    self._cache.set(key, value)
+                for i in missing[key]:
+                    results[i] = value
+
+        if not return_exceptions:
+            for value in results:
+                if isinstance(value, Exception):
+                    raise value
+        return results
+
+    def _fetch(self, chain: Any, fn_name: str, args_list: List[Tuple], block: Optional[int],
+               stats: Dict[str, int]) -> List[Any]:
+        w3, contract = chain.w3, chain.contract
+        block_id = block if block is not None else "latest"
+        tx = {"from": chain.sender_address}
+        uri = getattr(w3.provider, "endpoint_uri", None)
+        if len(args_list) > 1 and uri and str(uri).startswith("http"):
+            return self._fetch_batch(str(uri), chain, fn_name, args_list, block_id, stats)
+
+        out: List[Any] = []
+        for args in args_list:
+            stats["rpc_calls"] += 1
+            try:
+                out.append(_freeze(contract.functions[fn_name](*args).call(tx, block_identifier=block_id)))
+            except Exception as e:
+                if not is_revert_error(e):
+                    raise  # node trouble: fail the whole read, don't hammer a dead node per item
+                stats["errors"] += 1
+                out.append(e)
+        return out
+
+    def _fetch_batch(self, uri: str, chain: Any, fn_name: str, args_list: List[Tuple], block_id: Any,
+                     stats: Dict[str, int]) -> List[Any]:
+        w3, contract = chain.w3, chain.contract
+        fn_abi = contract.get_function_by_name(fn_name).abi
+        types = _output_types(fn_abi)
+        block_param = hex(block_id) if isinstance(block_id, int) else block_id
+        payload = [
+            {
+                "jsonrpc": "2.0",
+                "id": i,
+                "method": "eth_call",
+                "params": [{"from": chain.sender_address, "to": contract.address,
+                            "data": contract.encodeABI(fn_name=fn_name, args=list(args))}, block_param],
+            }
+            for i, args in enumerate(args_list)
+        ]
+        resp = self._http.post(uri, json=payload, timeout=10)
+        stats["rpc_calls"] += 1
+        stats["batched_calls"] += len(payload)
+        resp.raise_for_status()
+        body = resp.json()
+        if not isinstance(body, list):
+            # the node rejected the batch as a whole (e.g. batching disabled): one error object
+            raise ValueError((body or {}).get("error") if isinstance(body, dict) else body)
+        by_id = {item.get("id"): item for item in body if isinstance(item, dict)}
+
+        out: List[Any] = []
+        for i in range(len(args_list)):
+            item = by_id.get(i) or {}
+            error = item.get("error")
+            if error is not None or "result" not in item:
+                if not isinstance(error, dict) or not _is_revert_rpc_error(error):
+                    # node trouble, as in _fetch: fail the whole read
+                    raise ValueError(error or "eth_call %d missing from batch response" % i)
+                stats["errors"] += 1
+                out.append(ContractLogicError(str(error.get("message", "execution reverted"))))
+                continue
+            decoded = w3.codec.decode(types, bytes.fromhex(item["result"][2:]))
+            out.append(_freeze(decoded[0] if len(types) == 1 else list(decoded)))
+        return out
+
+    # ----- maintenance / metrics -----
+    def clear(self) -> None:
+        self._cache.clear()
+        with self._lock:
+            self._head = None
+            self._head_at = 0.0
+
+    def _stats_for(self, fn_name: str) -> Dict[str, int]:
+        with self._lock:
+            s = self._fn_stats.get(fn_name)
+            if s is None:
+                s = self._fn_stats[fn_name] = {"hits": 0, "misses": 0, "rpc_calls": 0, "batched_calls": 0, "errors": 0}
+            return s
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_fn = {name: dict(s) for name, s in self._fn_stats.items()}
+            head = self._head
+        for s in per_fn.values():
+            total = s["hits"] + s["misses"]
+            s["hit_rate"] = round(s["hits"] / total, 4) if total else 0.0
+        cache = self._cache.stats()
+        return {
+            "mode": self.mode,
+            "head_block": head,
+            "ttl_seconds": cache["ttl_seconds"],
+            "entries": cache["entries"],
+            "functions": per_fn,
+        }
+
+
+CHAIN_READS = ChainReadCache()
@@ -1,93 +1,219 @@
 import os
 import base64
+import hashlib
 import logging
+import secrets
 from typing import Optional, Tuple
 
-from Crypto.Cipher import AES, PKCS1_OAEP
-from Crypto.PublicKey import RSA
-from Crypto.Random import get_random_bytes
+from app.services.cache_service import TTLCache
+from app.services.key_registry import KEYS, SERVER_PRIVATE, SERVER_PUBLIC, LoadedKey
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # pragma: no cover - pycryptodome-only install
+    AESGCM = None
+
+try:
+    from Crypto.Cipher import AES, PKCS1_OAEP
+    from Crypto.Hash import SHA1, SHA256
+except ImportError:  # pragma: no cover - cryptography-only install
+    AES = None
 
 logger = logging.getLogger(__name__)
 
+# ----- backend selection -----
+# One facade for every AES-GCM and RSA-OAEP operation (registration, KYC, grantee rewrap,
+# decrypt_profile.py). Both libraries produce the same bytes, so the backend is a speed choice:
+# "auto" takes the first available in order of measured speed (benchmarks/bench_crypto_backends.py;
+# OpenSSL via cryptography is ~10-20x faster for AES-GCM and RSA), or force one per primitive.
+CRYPTO_AES_BACKEND = os.getenv("CRYPTO_AES_BACKEND", "auto")
+CRYPTO_RSA_BACKEND = os.getenv("CRYPTO_RSA_BACKEND", "auto")
+
+CRYPTOGRAPHY = "cryptography"
+PYCRYPTODOME = "pycryptodome"
+_FASTEST_FIRST = {"aes": (CRYPTOGRAPHY, PYCRYPTODOME), "rsa": (CRYPTOGRAPHY, PYCRYPTODOME)}
+
+
+def _available(backend: str) -> bool:
+    return (AESGCM if backend == CRYPTOGRAPHY else AES) is not None
+
+
+def _pick_backend(primitive: str, requested: str) -> str:
+    if requested != "auto":
+        if requested not in _FASTEST_FIRST[primitive]:
+            raise RuntimeError("Unknown %s crypto backend %r" % (primitive, requested))
+        if not _available(requested):
+            raise RuntimeError("%s crypto backend %r is not installed" % (primitive, requested))
+        return requested
+    for backend in _FASTEST_FIRST[primitive]:
+        if _available(backend):
+            return backend
+    raise RuntimeError("Neither cryptography nor pycryptodome is installed")
+
+
+AES_BACKEND = _pick_backend("aes", CRYPTO_AES_BACKEND)
+RSA_BACKEND = _pick_backend("rsa", CRYPTO_RSA_BACKEND)
+logger.info("Crypto backends: AES-GCM=%s RSA-OAEP=%s", AES_BACKEND, RSA_BACKEND)
+
+
+def backend_info() -> dict:
+    return {"aes_gcm": AES_BACKEND, "rsa_oaep": RSA_BACKEND}
+
+
+# ----- AES-GCM -----
+GCM_NONCE_BYTES = 12
+GCM_TAG_BYTES = 16
+
 
 def generate_aes_key(length: int = 32) -> bytes:
     """Return random AES key (default 256-bit)."""
-    return get_random_bytes(length)
+    return secrets.token_bytes(length)
+
+def aes_gcm_encrypt(key: bytes, plaintext: bytes, nonce: Optional[bytes] = None,
+                    aad: Optional[bytes] = None, backend: Optional[str] = None) -> Tuple[bytes, bytes]:
+    """
+    AES-GCM encrypt. Returns (nonce, ciphertext || 16-byte tag); a random 12-byte nonce
+    is generated when none is given.
+    """
+    nonce = nonce if nonce is not None else secrets.token_bytes(GCM_NONCE_BYTES)
+    if (backend or AES_BACKEND) == CRYPTOGRAPHY:
+        return nonce, AESGCM(key).encrypt(nonce, plaintext, aad)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    if aad:
+        cipher.update(aad)
+    ct, tag = cipher.encrypt_and_digest(plaintext)
+    return nonce, ct + tag
+
+def aes_gcm_decrypt(key: bytes, nonce: bytes, ciphertext_with_tag: bytes,
+                    aad: Optional[bytes] = None, backend: Optional[str] = None) -> bytes:
+    """Reverse aes_gcm_encrypt. Raises ValueError when authentication fails."""
+    if (backend or AES_BACKEND) == CRYPTOGRAPHY:
+        try:
+            return AESGCM(key).decrypt(nonce, ciphertext_with_tag, aad)
+        except InvalidTag:
+            raise ValueError("AES-GCM authentication failed") from None
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    if aad:
+        cipher.update(aad)
+    ct, tag = ciphertext_with_tag[:-GCM_TAG_BYTES], ciphertext_with_tag[-GCM_TAG_BYTES:]
+    try:
+        return cipher.decrypt_and_verify(ct, tag)
+    except ValueError:
+        raise ValueError("AES-GCM authentication failed") from None
 
 def aes_encrypt(plaintext: bytes, key: bytes) -> Tuple[bytes, bytes]:
     """
     AES-GCM encrypt.
     Returns (nonce, ciphertext_with_tag).
     """
-    # 12 byte nonce standard for GCM
-    nonce = get_random_bytes(12)
-    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-    ct, tag = cipher.encrypt_and_digest(plaintext)
     # store ciphertext + tag together (client expects "ciphertext bytes (with tag)")
-    return nonce, ct + tag
+    return aes_gcm_encrypt(key, plaintext)
 
 def aes_decrypt(nonce: bytes, ciphertext_with_tag: bytes, key: bytes) -> bytes:
-    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-    # split tag (last 16 bytes)
-    ct, tag = ciphertext_with_tag[:-16], ciphertext_with_tag[-16:]
-    return cipher.decrypt_and_verify(ct, tag)
+    return aes_gcm_decrypt(key, nonce, ciphertext_with_tag)
 
-# app/services/crypto_service.py
 
+# ----- RSA-OAEP -----
+# Stored wraps use two OAEP variants; the key_meta method says which:
+OAEP_SHA1 = "sha1"  # PyCryptodome PKCS1_OAEP default: rsa-server-pem, rsa-grantee-pem
+OAEP_SHA256 = "sha256"  # SHA-256 + MGF1-SHA-256: rsa-pem-env (kyc_service)
+OAEP_HASH_BY_METHOD = {
+    "rsa-server-pem": OAEP_SHA1,
+    "rsa-grantee-pem": OAEP_SHA1,
+    "rsa-pem-env": OAEP_SHA256,
+}
+
+# caller-supplied public keys (grantees) arrive as PEM strings, usually the same few
+PEM_KEY_CACHE = TTLCache("rsa_pem_keys", ttl_seconds=3600, max_entries=1024)
+
+
+def _oaep(oaep_hash: str):
+    algo = hashes.SHA256() if oaep_hash == OAEP_SHA256 else hashes.SHA1()
+    return padding.OAEP(mgf=padding.MGF1(algorithm=algo), algorithm=algo, label=None)
+
+def _pycryptodome_oaep(key: LoadedKey, oaep_hash: str):
+    return PKCS1_OAEP.new(key.pycryptodome(), hashAlgo=SHA256 if oaep_hash == OAEP_SHA256 else SHA1)
+
+def public_key_from_pem(pem) -> LoadedKey:
+    """Parsed RSA public key for a PEM (str or bytes), cached by PEM hash."""
+    pem = pem.encode("utf-8") if isinstance(pem, str) else pem
+    return PEM_KEY_CACHE.get_or_load(
+        hashlib.sha256(pem).hexdigest(), lambda: LoadedKey("pem", pem, False, "pem")
+    )
+
+def private_key_from_pem(pem) -> LoadedKey:
+    pem = pem.encode("utf-8") if isinstance(pem, str) else pem
+    return LoadedKey("pem", pem, True, "pem")
+
+def rsa_oaep_encrypt(key: LoadedKey, data: bytes, oaep_hash: str = OAEP_SHA1,
+                     backend: Optional[str] = None) -> bytes:
+    if (backend or RSA_BACKEND) == CRYPTOGRAPHY:
+        return key.cryptography().encrypt(data, _oaep(oaep_hash))
+    return _pycryptodome_oaep(key, oaep_hash).encrypt(data)
+
+def rsa_oaep_decrypt(key: LoadedKey, data: bytes, oaep_hash: str = OAEP_SHA1,
+                     backend: Optional[str] = None) -> bytes:
+    if (backend or RSA_BACKEND) == CRYPTOGRAPHY:
+        return key.cryptography().decrypt(data, _oaep(oaep_hash))
+    return _pycryptodome_oaep(key, oaep_hash).decrypt(data)
 
-logger = logging.getLogger(__name__)
 
 def _load_server_public_pem() -> Optional[bytes]:
     """
-    Try, in order:
-      1) SERVER_PUBLIC_KEY_PATH -> read PEM file from filesystem
-      2) SERVER_PUBLIC_KEY_PEM  -> PEM contents stored in env var
-    Return bytes or None.
+    Server public key PEM from SERVER_PUBLIC_KEY_PATH, else SERVER_PUBLIC_KEY_PEM.
+    Served by the key registry (read once, reloaded when the source changes).
     """
-    path = os.getenv("SERVER_PUBLIC_KEY_PATH")
-    if path:
-        try:
-            with open(path, "rb") as fh:
-                data = fh.read()
-                logger.info("Loaded server public key from path: %s", path)
-                return data
-        except Exception as e:
-            logger.exception("Failed to read SERVER_PUBLIC_KEY_PATH=%s: %s", path, e)
-
-    # fallback: inline PEM content (may be broken if newlines lost)
-    inline = os.getenv("SERVER_PUBLIC_KEY_PEM")
-    if inline:
-        # if it's a single-line with literal \n sequences, convert them
-        if "\\n" in inline and not inline.startswith("-----"):
-            inline = inline.replace("\\n", "\n")
-        try:
-            return inline.encode("utf-8")
-        except Exception:
-            logger.exception("Failed to encode SERVER_PUBLIC_KEY_PEM")
-    return None
+    entry = KEYS.get(SERVER_PUBLIC)
+    return entry.pem if entry else None
 
-def encrypt_sym_key_with_rsa(sym_key_bytes: bytes) -> bytes:
+def wrap_sym_key_with_server_key(sym_key_bytes: bytes, oaep_hash: str = OAEP_SHA1) -> Tuple[bytes, str]:
     """
-    Encrypt (wrap) the symmetric AES key using server RSA public key.
-    Reads key from SERVER_PUBLIC_KEY_PATH or SERVER_PUBLIC_KEY_PEM.
-    Returns encrypted bytes.
+    RSA-OAEP wrap the symmetric key with the server public key.
+    Returns (wrapped bytes, key version) so callers can record key_version in key_meta.
     Raises RuntimeError if no valid key.
     """
-    server_pub = _load_server_public_pem()
-    if not server_pub:
-        raise RuntimeError("Server public key not found (SERVER_PUBLIC_KEY_PATH or SERVER_PUBLIC_KEY_PEM)")
-
     try:
-        pub = RSA.import_key(server_pub)
-    except Exception as e:
-        logger.exception("RSA.import_key failed for server public key")
-        raise RuntimeError(f"Failed to import server public key: {e}") from e
+        entry = KEYS.require(SERVER_PUBLIC)
+    except RuntimeError:
+        raise RuntimeError("Server public key not found (SERVER_PUBLIC_KEY_PATH or SERVER_PUBLIC_KEY_PEM)")
 
-    cipher = PKCS1_OAEP.new(pub)
     try:
-        enc = cipher.encrypt(sym_key_bytes)
-        return enc
+        return rsa_oaep_encrypt(entry, sym_key_bytes, oaep_hash), entry.version
     except Exception as e:
         logger.exception("RSA encryption failed")
         raise RuntimeError(f"Failed to encrypt symmetric key with RSA: {e}") from e
 
+def encrypt_sym_key_with_rsa(sym_key_bytes: bytes) -> bytes:
+    """
+    Encrypt (wrap) the symmetric AES key using server RSA public key.
+    Reads key from SERVER_PUBLIC_KEY_PATH or SERVER_PUBLIC_KEY_PEM (via the key registry).
+    Returns encrypted bytes.
+    Raises RuntimeError if no valid key.
+    """
+    return wrap_sym_key_with_server_key(sym_key_bytes)[0]
+
+def decrypt_sym_key_with_rsa(wrapped: bytes, key_version: Optional[str] = None,
+                             oaep_hash: str = OAEP_SHA1) -> bytes:
+    """
+    Unwrap a key produced by encrypt_sym_key_with_rsa with the server private key
+    (SERVER_PRIVATE_KEY_PATH or SERVER_PRIVATE_KEY_PEM, or the _PREVIOUS_ one during a
+    rotation) matching key_version when given.
+    """
+    if key_version is None:
+        # recorded before key versions: current key, then the previous one during a rotation
+        entries = KEYS.candidates(SERVER_PRIVATE)
+        for entry in entries[:-1]:
+            try:
+                return rsa_oaep_decrypt(entry, wrapped, oaep_hash)
+            except ValueError:
+                continue
+        entry = entries[-1] if entries else None
+    else:
+        entry = KEYS.by_version(SERVER_PRIVATE, key_version)
+    if entry is None:
+        raise RuntimeError("Server private key %s not available (SERVER_PRIVATE_KEY_PATH or SERVER_PRIVATE_KEY_PEM)"
+                           % (key_version or ""))
+    return rsa_oaep_decrypt(entry, wrapped, oaep_hash)
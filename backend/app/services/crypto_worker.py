@@ -0,0 +1,360 @@
+# app/services/crypto_worker.py
+"""
+Process pool for CPU-bound crypto (RSA-OAEP wrap/unwrap, AES-GCM over profiles and KYC blobs).
+
+On the request thread these hold the GIL for hundreds of microseconds each (RSA unwrap) and
+stall every other request of the worker process; in a pool they run on other cores.
+
+    nonce, ct = await CRYPTO.run("aes_gcm_encrypt", key, plaintext)   # async routes
+    enc = CRYPTO.call("encrypt_blob_bytes", plaintext)                # sync code (threadpool)
+
+Jobs name an entry of OPS (module-level functions, importable in the child) rather than
+pickling callables. A dispatcher thread takes jobs off a bounded queue and sends them to the
+pool in batches: at most one batch per worker is in flight, and while all workers are busy the
+queue keeps filling, so a burst goes out as a few large batches (one IPC round trip each)
+instead of one round trip per job; an idle pool gets each job immediately. A batch is capped at
+CRYPTO_BATCH_MAX jobs and CRYPTO_BATCH_MAX_BYTES of payload.
+
+When the queue stays full for CRYPTO_QUEUE_TIMEOUT_SECONDS, submit raises CryptoBusyError
+(503); run() never waits for room (it is on the event loop) and raises at once. Both
+call() and run() also raise it when a job has no result after CRYPTO_CALL_TIMEOUT_SECONDS (a
+hung or overloaded pool must not pin request threads forever). stop() fails every job still
+queued. CRYPTO_WORKERS=0 runs every op inline (call(): on the calling thread, run(): on the event
+loop's default executor, never on the loop itself); the default leaves one core
+to the API (inline on single-core hosts, where a pool cannot help).
+
+Children load keys the same way this process does (SERVER_*_KEY_PATH / _PEM,
+KYC_MASTER_KEY_BASE64), re-checking their sources like the parent's key registry.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services import crypto_service
+
+logger = logging.getLogger(__name__)
+
+CRYPTO_WORKERS = int(os.getenv("CRYPTO_WORKERS", str(max(0, min(4, (os.cpu_count() or 1) - 1)))))
+CRYPTO_QUEUE_MAX = int(os.getenv("CRYPTO_QUEUE_MAX", "2000"))
+CRYPTO_QUEUE_TIMEOUT_SECONDS = float(os.getenv("CRYPTO_QUEUE_TIMEOUT_SECONDS", "5"))
+CRYPTO_CALL_TIMEOUT_SECONDS = float(os.getenv("CRYPTO_CALL_TIMEOUT_SECONDS", "30"))
+CRYPTO_BATCH_MAX = int(os.getenv("CRYPTO_BATCH_MAX", "64"))
+CRYPTO_BATCH_MAX_BYTES = int(os.getenv("CRYPTO_BATCH_MAX_BYTES", str(1024 * 1024)))
+CRYPTO_MP_START = os.getenv("CRYPTO_MP_START", "spawn")  # no fork: the API process runs threads
+
+
+class CryptoBusyError(RuntimeError):
+    pass
+
+
+# ----- ops (run in the child) -----
+def _wrap_for_pem(pem: bytes, data: bytes, oaep_hash: str = crypto_service.OAEP_SHA1) -> bytes:
+    return crypto_service.rsa_oaep_encrypt(crypto_service.public_key_from_pem(pem), data, oaep_hash)
+
+
+def _rewrap_server_key_for_pem(wrapped: bytes, key_version: Optional[str], pem: bytes) -> bytes:
+    """Unwrap with the server private key and wrap for a grantee in one round trip."""
+    sym_key = crypto_service.decrypt_sym_key_with_rsa(wrapped, key_version)
+    return _wrap_for_pem(pem, sym_key)
+
+
+def _rewrap_kyc_key_for_pem(encrypted_key: str, key_meta: Any, pem: bytes) -> bytes:
+    """Unwrap a stored KYC record key (any envelope) and wrap it for a grantee."""
+    from app.utils.kyc_utils import unwrap_record_key
+
+    return _wrap_for_pem(pem, unwrap_record_key(encrypted_key, key_meta))
+
+
+def _encrypt_blob_bytes(plaintext: bytes) -> Dict[str, Any]:
+    from app.utils.kyc_utils import encrypt_blob_bytes
+
+    return encrypt_blob_bytes(plaintext)
+
+
+def _decrypt_blob_bytes(ciphertext: bytes, iv: bytes, encrypted_key: str, key_meta: Any = None) -> bytes:
+    from app.utils.kyc_utils import decrypt_blob_bytes
+
+    return decrypt_blob_bytes(ciphertext, iv, encrypted_key, key_meta)
+
+
+OPS: Dict[str, Callable[..., Any]] = {
+    "aes_gcm_encrypt": crypto_service.aes_gcm_encrypt,
+    "aes_gcm_decrypt": crypto_service.aes_gcm_decrypt,
+    "wrap_server_key": crypto_service.wrap_sym_key_with_server_key,
+    "unwrap_server_key": crypto_service.decrypt_sym_key_with_rsa,
+    "wrap_for_pem": _wrap_for_pem,
+    "rewrap_server_key_for_pem": _rewrap_server_key_for_pem,
+    "rewrap_kyc_key_for_pem": _rewrap_kyc_key_for_pem,
+    "encrypt_blob_bytes": _encrypt_blob_bytes,
+    "decrypt_blob_bytes": _decrypt_blob_bytes,
+}
+
+Job = Tuple[str, tuple, dict]
+
+
+def _run_batch(jobs: List[Job]) -> List[Tuple[bool, Any]]:
+    out: List[Tuple[bool, Any]] = []
+    for op, args, kwargs in jobs:
+        try:
+            out.append((True, OPS[op](*args, **kwargs)))
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError("%s: %s" % (type(e).__name__, e))
+            out.append((False, e))
+    return out
+
+
+def _payload_size(args: tuple) -> int:
+    return sum(len(a) for a in args if isinstance(a, (bytes, bytearray, memoryview, str)))
+
+
+class _Pending:
+    __slots__ = ("op", "args", "kwargs", "size", "future", "queued_at")
+
+    def __init__(self, op: str, args: tuple, kwargs: dict):
+        self.op = op
+        # memoryviews do not pickle; the child needs its own copy anyway
+        self.args = tuple(bytes(a) if isinstance(a, memoryview) else a for a in args)
+        self.kwargs = kwargs
+        self.size = _payload_size(self.args)
+        self.future: Future = Future()
+        self.queued_at = time.monotonic()
+
+
+class CryptoWorker:
+    def __init__(
+        self,
+        workers: int = CRYPTO_WORKERS,
+        queue_max: int = CRYPTO_QUEUE_MAX,
+        batch_max: int = CRYPTO_BATCH_MAX,
+        batch_max_bytes: int = CRYPTO_BATCH_MAX_BYTES,
+    ):
+        self.workers = workers
+        self.batch_max = batch_max
+        self.batch_max_bytes = batch_max_bytes
+        self._queue: "queue.Queue[_Pending]" = queue.Queue(maxsize=queue_max)
+        self._carry: Optional[_Pending] = None  # job that did not fit the previous batch
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.Semaphore(max(1, workers))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.inline = 0
+        self.batches = 0
+        self.batched_jobs = 0
+        self.pool_restarts = 0
+
+    # ----- lifecycle -----
+    def start(self) -> None:
+        if self.workers <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pool = self._new_pool()
+            self._thread = threading.Thread(target=self._dispatch_loop, name="crypto-worker", daemon=True)
+            self._thread.start()
+        logger.info("Crypto worker pool started (%d processes)", self.workers)
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5)
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        # nothing will dispatch the jobs still queued: fail them instead of leaving callers waiting
+        pending: List[_Pending] = []
+        if self._carry is not None:
+            pending.append(self._carry)
+            self._carry = None
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if pending:
+            logger.warning("Crypto worker stopped with %d queued jobs; failing them", len(pending))
+            self._fail(pending, RuntimeError("Crypto worker stopped"))
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(CRYPTO_MP_START))
+
+    # ----- API -----
+    def submit(self, op: str, *args: Any, **kwargs: Any) -> Future:
+        """Queue op(*args, **kwargs); raises CryptoBusyError when the queue stays full."""
+        if op not in OPS:
+            raise ValueError("Unknown crypto op %r" % op)
+        if self.workers <= 0:
+            fut: Future = Future()
+            self.inline += 1
+            try:
+                fut.set_result(OPS[op](*args, **kwargs))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        return self._enqueue(op, args, kwargs, CRYPTO_QUEUE_TIMEOUT_SECONDS)
+
+    def _enqueue(self, op: str, args: tuple, kwargs: dict, wait: Optional[float]) -> Future:
+        """Put a job on the dispatcher queue; wait=None never blocks (full queue: CryptoBusyError at once)."""
+        if self._thread is None:
+            self.start()
+        job = _Pending(op, args, kwargs)
+        try:
+            if wait is None:
+                self._queue.put_nowait(job)
+            else:
+                self._queue.put(job, timeout=wait)
+        except queue.Full:
+            self.rejected += 1
+            raise CryptoBusyError("Crypto worker queue full (%d jobs)" % self._queue.maxsize) from None
+        self.submitted += 1
+        return job.future
+
+    def call(self, op: str, *args: Any, timeout: Optional[float] = CRYPTO_CALL_TIMEOUT_SECONDS, **kwargs: Any) -> Any:
+        """Blocking form for sync code (FastAPI threadpool, services)."""
+        fut = self.submit(op, *args, **kwargs)
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise self._timed_out(op, timeout) from None
+
+    async def run(self, op: str, *args: Any, timeout: Optional[float] = CRYPTO_CALL_TIMEOUT_SECONDS,
+                  **kwargs: Any) -> Any:
+        """
+        Awaitable form for async routes; nothing blocks the event loop: a full queue raises
+        CryptoBusyError at once (no waiting for room), and inline mode runs the op on the default
+        executor instead of the loop thread.
+        """
+        if op not in OPS:
+            raise ValueError("Unknown crypto op %r" % op)
+        if self.workers <= 0:
+            self.inline += 1
+            fut = asyncio.get_running_loop().run_in_executor(None, functools.partial(OPS[op], *args, **kwargs))
+        else:
+            fut = asyncio.wrap_future(self._enqueue(op, args, kwargs, None))
+        try:
+            # shield: a timeout must not cancel the job future the dispatcher completes later
+            return await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(op, timeout) from None
+
+    def _timed_out(self, op: str, timeout: Optional[float]) -> CryptoBusyError:
+        self.timeouts += 1
+        return CryptoBusyError("Crypto op %s got no result within %ss" % (op, timeout))
+
+    # ----- dispatcher -----
+    def _take(self, batch: List[_Pending], size: int, block: bool) -> int:
+        """Move queued jobs into batch until it is full; returns the new payload size."""
+        while len(batch) < self.batch_max:
+            if self._carry is not None:
+                job, self._carry = self._carry, None
+            else:
+                try:
+                    job = self._queue.get(timeout=0.5) if block and not batch else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch and size + job.size > self.batch_max_bytes:
+                self._carry = job
+                break
+            batch.append(job)
+            size += job.size
+        return size
+
+    def _dispatch_loop(self) -> None:
+        while not self._stop.is_set():
+            batch: List[_Pending] = []
+            size = self._take(batch, 0, block=True)
+            if not batch:
+                continue
+            # wait for a free worker; jobs arriving meanwhile join this batch
+            while not self._slots.acquire(timeout=0.5):
+                if self._stop.is_set():
+                    self._fail(batch, RuntimeError("Crypto worker stopped"))
+                    return
+            self._take(batch, size, block=False)
+            self._send(batch)
+
+    def _send(self, batch: List[_Pending]) -> None:
+        self.batches += 1
+        self.batched_jobs += len(batch)
+        try:
+            fut = self._pool.submit(_run_batch, [(j.op, j.args, j.kwargs) for j in batch])
+        except Exception as e:
+            self._slots.release()
+            self._on_pool_error(batch, e)
+            return
+        fut.add_done_callback(lambda f, batch=batch: self._complete(batch, f))
+
+    def _complete(self, batch: List[_Pending], fut: Future) -> None:
+        self._slots.release()
+        try:
+            results = fut.result()
+        except Exception as e:
+            self._on_pool_error(batch, e)
+            return
+        for job, (ok, value) in zip(batch, results):
+            if ok:
+                self.completed += 1
+                job.future.set_result(value)
+            else:
+                self.failed += 1
+                job.future.set_exception(value)
+
+    def _on_pool_error(self, batch: List[_Pending], error: Exception) -> None:
+        logger.error("Crypto worker batch of %d failed: %s", len(batch), error)
+        self._fail(batch, RuntimeError("Crypto worker failed: %s" % error))
+        if isinstance(error, BrokenProcessPool) and not self._stop.is_set():
+            with self._lock:
+                old, self._pool = self._pool, self._new_pool()
+                self.pool_restarts += 1
+            if old is not None:
+                old.shutdown(wait=False, cancel_futures=True)
+
+    def _fail(self, batch: List[_Pending], error: Exception) -> None:
+        for job in batch:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(error)
+
+    # ----- metrics -----
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "pool" if self.workers > 0 else "inline",
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "queue_max": self._queue.maxsize,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "inline": self.inline,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_jobs / self.batches, 2) if self.batches else None,
+            "pool_restarts": self.pool_restarts,
+        }
+
+
+CRYPTO = CryptoWorker()
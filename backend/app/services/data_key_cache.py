@@ -0,0 +1,141 @@
+# app/services/data_key_cache.py
+"""
+Data-key caching for tourist profile encryption (PROFILE_KEY_MODE=kek).
+
+In the default mode ("rsa") every registration RSA-OAEP wraps its fresh AES data key with the
+server public key. In "kek" mode a key-encryption key (KEK) is RSA-wrapped once and reused
+for KEK_MAX_AGE_SECONDS or KEK_MAX_MESSAGES wraps, whichever comes first; each profile's data
+key is AES key wrapped (RFC 3394) under it, a few microseconds instead of an RSA operation.
+This is the data-key caching scheme of KMS envelope encryption.
+
+Every record stays self-contained: its key_meta carries the RSA-wrapped KEK and its id
+
+    {"method": "kek-aes-kw", "alg": "A256KW", "kek_id": "...", "kek_wrapped_b64": "...",
+     "key_version": "<server key version>"}
+
+so decrypting needs only the server private key. Unwrapped KEKs are cached by kek_id, so
+records written in the same window share one RSA unwrap. rsa-server-pem records are not
+affected.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from cryptography.hazmat.primitives.keywrap import InvalidUnwrap, aes_key_unwrap, aes_key_wrap
+
+from app.services import crypto_service
+from app.services.cache_service import TTLCache
+from app.services.key_registry import KEYS, SERVER_PUBLIC
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KEY_MODE = os.getenv("PROFILE_KEY_MODE", "rsa").lower()  # "rsa" | "kek"
+KEK_MAX_AGE_SECONDS = float(os.getenv("KEK_MAX_AGE_SECONDS", "300"))
+KEK_MAX_MESSAGES = int(os.getenv("KEK_MAX_MESSAGES", "10000"))
+
+KEK_METHOD = "kek-aes-kw"
+
+
+def kek_id_for(wrapped_kek: bytes) -> str:
+    return hashlib.sha256(wrapped_kek).hexdigest()[:16]
+
+
+def unwrap_with_kek(kek: bytes, wrapped: bytes) -> bytes:
+    """AES key unwrap a data key; raises ValueError if the envelope fails its integrity check."""
+    try:
+        return aes_key_unwrap(kek, wrapped)
+    except InvalidUnwrap:
+        raise ValueError("Data key unwrap failed (wrong KEK or tampered envelope)") from None
+
+
+class _Kek:
+    __slots__ = ("key", "wrapped", "key_version", "kek_id", "created_at", "uses")
+
+    def __init__(self, key: bytes, wrapped: bytes, key_version: str):
+        self.key = key
+        self.wrapped = wrapped
+        self.key_version = key_version
+        self.kek_id = kek_id_for(wrapped)
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+
+class DataKeyCache:
+    def __init__(self, max_age_seconds: float = KEK_MAX_AGE_SECONDS, max_messages: int = KEK_MAX_MESSAGES):
+        self.max_age_seconds = max_age_seconds
+        self.max_messages = max_messages
+        self._current: Optional[_Kek] = None
+        self._lock = threading.Lock()
+        # KEKs unwrapped for reads, by kek_id
+        self._unwrapped = TTLCache("profile_keks", ttl_seconds=3600, max_entries=256)
+        self.keks_created = 0
+        self.wraps = 0
+
+    def _kek(self) -> _Kek:
+        """
+        The current KEK, replaced once it is too old, has wrapped max_messages keys, or is
+        wrapped with a server key that has since been rotated.
+        """
+        kek = self._current
+        server = KEYS.get(SERVER_PUBLIC)
+        if (
+            kek is None
+            or kek.uses >= self.max_messages
+            or time.monotonic() - kek.created_at >= self.max_age_seconds
+            or (server is not None and server.version != kek.key_version)
+        ):
+            key = crypto_service.generate_aes_key()
+            wrapped, key_version = crypto_service.wrap_sym_key_with_server_key(key)
+            kek = _Kek(key, wrapped, key_version)
+            self._current = kek
+            self._unwrapped.set(kek.kek_id, key)
+            self.keks_created += 1
+            logger.info("New profile KEK %s (server key %s)", kek.kek_id, key_version)
+        kek.uses += 1
+        return kek
+
+    def wrap(self, data_key: bytes) -> Tuple[bytes, Dict[str, Any]]:
+        """(wrapped data key, key_meta) under the current KEK."""
+        with self._lock:
+            kek = self._kek()
+            self.wraps += 1
+        return aes_key_wrap(kek.key, data_key), {
+            "method": KEK_METHOD,
+            "alg": "A256KW",
+            "kek_id": kek.kek_id,
+            "kek_wrapped_b64": base64.b64encode(kek.wrapped).decode("utf-8"),
+            "key_version": kek.key_version,
+        }
+
+    def unwrap(self, wrapped: bytes, key_meta: Dict[str, Any]) -> bytes:
+        """Data key of a kek-aes-kw record; the KEK is RSA-unwrapped once per kek_id."""
+        wrapped_kek = base64.b64decode(key_meta["kek_wrapped_b64"])
+        kek_id = kek_id_for(wrapped_kek)
+        if key_meta.get("kek_id") != kek_id:
+            raise ValueError("key_meta kek_id does not match its wrapped KEK")
+        kek = self._unwrapped.get_or_load(
+            kek_id, lambda: crypto_service.decrypt_sym_key_with_rsa(wrapped_kek, key_meta.get("key_version"))
+        )
+        return unwrap_with_kek(kek, wrapped)
+
+    def stats(self) -> Dict[str, Any]:
+        kek = self._current
+        return {
+            "mode": PROFILE_KEY_MODE,
+            "kek_id": kek.kek_id if kek else None,
+            "kek_uses": kek.uses if kek else 0,
+            "keks_created": self.keks_created,
+            "wraps": self.wraps,
+            "unwrap_cache_hits": self._unwrapped.hits,
+            "unwrap_cache_misses": self._unwrapped.misses,
+        }
+
+
+DATA_KEYS = DataKeyCache()
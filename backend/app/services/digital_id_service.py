@@ -3,57 +3,67 @@
 from __future__ import annotations
 
 import datetime
-import logging
 import hashlib
+import hmac
+import logging
+import os
 import base58
 from typing import Any, Dict
 
-from app.services.blockchain_service import register_tourist_on_chain
+from app.services.blockchain_service import subject_hash_hex
 
 logger = logging.getLogger(__name__)
 
+# keys the short ID derivation; without it anyone could map phone numbers to IDs offline
+DIGITAL_ID_SECRET = os.getenv("DIGITAL_ID_SECRET", "")
+# explicit opt-in to unkeyed (publicly derivable) IDs for local development
+DIGITAL_ID_ALLOW_UNKEYED_DEV = os.getenv("DIGITAL_ID_ALLOW_UNKEYED_DEV", "false").lower() in ("1", "true", "yes")
+
+
+def require_secret() -> str:
+    """DIGITAL_ID_SECRET; RuntimeError when unset unless DIGITAL_ID_ALLOW_UNKEYED_DEV is on."""
+    if DIGITAL_ID_SECRET:
+        return DIGITAL_ID_SECRET
+    if not DIGITAL_ID_ALLOW_UNKEYED_DEV:
+        raise RuntimeError(
+            "DIGITAL_ID_SECRET is not set: short digital IDs would be derivable from phone numbers "
+            "(set DIGITAL_ID_ALLOW_UNKEYED_DEV=true to allow this in local development)"
+        )
+    return ""
+
+
+if not DIGITAL_ID_SECRET and DIGITAL_ID_ALLOW_UNKEYED_DEV:
+    logger.warning("DIGITAL_ID_SECRET not set; short digital IDs are derivable from phone numbers (DEV only)")
 
-def _shorten_tx_hash(tx_hash: str) -> str:
+
+def derive_short_id(subject_id: str) -> str:
     """
-    Convert long Ethereum tx_hash -> short Base58 code (12 chars).
-    Example:
-        0xabc123... -> "7Xc3ZdFhG5Q1"
+    Deterministic short Base58 ID (12 chars) for a subject, e.g. "7Xc3ZdFhG5Q1".
+    HMAC-SHA256 over the subject hash (keccak, as anchored on-chain), so it is known before
+    any transaction is sent and re-issuing for the same subject returns the same ID.
     """
-    clean_hash = tx_hash.lower().replace("0x", "")
-    digest = hashlib.sha256(clean_hash.encode()).digest()
-    short_b58 = base58.b58encode(digest)[:12].decode("utf-8")
-    return short_b58
+    digest = hmac.new(require_secret().encode(), subject_hash_hex(subject_id).encode(), hashlib.sha256).digest()
+    return base58.b58encode(digest)[:12].decode("utf-8")
 
 
 def issue_digital_id(phone: str) -> str:
     """
-    Issue a blockchain-backed short digital ID for a user.
+    Issue the short digital ID for a user without touching the chain.
 
-    Flow:
-      1. Build a minimal payload.
-      2. Register on blockchain via register_tourist_on_chain().
-      3. Convert tx hash -> short Base58 ID.
-      4. If blockchain fails, raise exception (no fallback).
+    The on-chain registration is separate: queue digital_id_chain_payload(phone) on the anchor
+    queue (tourists.ANCHOR_KIND_ISSUE_DID) and the User row is updated when it is mined.
     """
     if not phone:
         raise ValueError("phone is required for ID issuance")
+    short_id = derive_short_id(str(phone))
+    logger.info("Digital ID issued for %s: %s (on-chain registration pending)", phone, short_id)
+    return short_id
+
 
-    payload: Dict[str, Any] = {
+def digital_id_chain_payload(phone: str) -> Dict[str, Any]:
+    """Minimal register_tourist_on_chain payload for an issued ID."""
+    return {
         "phone": str(phone),
         "issued_at": datetime.datetime.utcnow().isoformat(),
         "purpose": "digital_id_issuance",
     }
-
-    try:
-        tx_hash = register_tourist_on_chain(payload)
-        if not tx_hash:
-            raise RuntimeError("Blockchain did not return a tx hash")
-
-        short_id = _shorten_tx_hash(tx_hash)
-        logger.info("✅ Blockchain ID issued for %s: %s (tx=%s)", phone, short_id, tx_hash)
-        return short_id
-
-    except Exception as e:
-        logger.exception("❌ Blockchain ID issuance failed for %s: %s", phone, e)
-        # Explicitly signal failure to caller (route)
-        raise RuntimeError("Blockchain issuance failed") from e
@@ -0,0 +1,166 @@
+# app/services/gas_strategy.py
+"""
+Gas limits and fee parameters for contract transactions.
+
+Gas: estimated once per (function signature, calldata size class) with eth_estimateGas and
+cached. A tx gets
+
+    (estimate + extra_bytes * GAS_PER_EXTRA_BYTE) * GAS_LIMIT_MARGIN
+
+where extra_bytes is how much longer its calldata is than the payload that was estimated:
+string arguments are stored on-chain, so cost grows with length inside a size class. A receipt
+that used (almost) all of its limit drops the cached entry, so the next tx re-estimates.
+
+Fees: read from the node at most every GAS_PRICE_REFRESH_SECONDS (ChainClient also refreshes
+them from its probe thread, so sends normally never wait on it). EIP-1559 nodes get
+maxFeePerGas = 2 * baseFee + tip, legacy nodes gasPrice = eth_gasPrice * GAS_PRICE_MULTIPLIER.
+GAS_PRICE_GWEI pins a fixed legacy price; GAS_PRICE_MAX_GWEI caps whatever the node suggests.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+GAS_LIMIT_MARGIN = float(os.getenv("GAS_LIMIT_MARGIN", "1.2"))
+GAS_PER_EXTRA_BYTE = int(os.getenv("GAS_PER_EXTRA_BYTE", "700"))  # ~20k gas per stored 32-byte word
+GAS_SIZE_CLASS_BYTES = int(os.getenv("GAS_SIZE_CLASS_BYTES", "256"))
+GAS_LIMIT_FALLBACK = int(os.getenv("GAS_LIMIT_FALLBACK", "500000"))  # when estimation is unavailable
+GAS_PRICE_REFRESH_SECONDS = float(os.getenv("GAS_PRICE_REFRESH_SECONDS", "15"))
+GAS_PRICE_MULTIPLIER = float(os.getenv("GAS_PRICE_MULTIPLIER", "1.1"))
+GAS_PRICE_GWEI = os.getenv("GAS_PRICE_GWEI")  # fixed legacy gasPrice override
+GAS_PRICE_MAX_GWEI = float(os.getenv("GAS_PRICE_MAX_GWEI", "500"))
+GAS_PRIORITY_FEE_GWEI = float(os.getenv("GAS_PRIORITY_FEE_GWEI", "1"))  # when the node has no suggestion
+
+GasKey = Tuple[str, int]
+
+NEAR_LIMIT_RATIO = 0.95  # gasUsed / gas limit at which a tx counts as (nearly) out of gas
+
+
+def used_gas_limit(gas_limit: Optional[int], gas_used: Optional[int]) -> bool:
+    """True when a tx used (almost) all of its gas: a revert is then most likely out-of-gas."""
+    return gas_limit is not None and gas_used is not None and gas_used >= NEAR_LIMIT_RATIO * gas_limit
+
+
+def _signature(fn: Any) -> str:
+    abi = fn.abi
+    return "%s(%s)" % (abi["name"], ",".join(i["type"] for i in abi.get("inputs", [])))
+
+
+class GasStrategy:
+    def __init__(self, margin: float = GAS_LIMIT_MARGIN, size_class_bytes: int = GAS_SIZE_CLASS_BYTES):
+        self.margin = margin
+        self.size_class_bytes = size_class_bytes
+        self._estimates: Dict[GasKey, Tuple[int, int]] = {}  # key -> (gas, calldata length)
+        self._fees: Optional[Dict[str, int]] = None
+        self._fees_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.estimates = 0
+        self.fallbacks = 0
+        self.fee_refreshes = 0
+        self.near_limit_receipts = 0
+
+    # ----- gas limit -----
+    def gas_limit(self, chain: Any, fn: Any) -> Tuple[int, GasKey]:
+        """Gas limit for this contract call and the cache key it came from (for observe())."""
+        data_len = (len(chain.contract.encodeABI(fn_name=fn.fn_name, args=list(fn.args))) - 2) // 2
+        key = (_signature(fn), data_len // self.size_class_bytes)
+        with self._lock:
+            cached = self._estimates.get(key)
+        if cached is not None:
+            self.hits += 1
+            base_gas, base_len = cached
+        else:
+            try:
+                base_gas = int(fn.estimate_gas({"from": chain.sender_address}))
+                self.estimates += 1
+            except Exception as e:
+                if "revert" in str(e).lower():
+                    raise  # would revert on-chain as well: don't pay for it
+                self.fallbacks += 1
+                logger.warning("estimate_gas failed for %s, using %d: %s", key[0], GAS_LIMIT_FALLBACK, e)
+                return GAS_LIMIT_FALLBACK, key
+            base_len = data_len
+            with self._lock:
+                self._estimates[key] = (base_gas, base_len)
+        extra = max(0, data_len - base_len) * GAS_PER_EXTRA_BYTE
+        return int((base_gas + extra) * self.margin), key
+
+    def observe(self, key: GasKey, gas_limit: int, gas_used: Optional[int]) -> None:
+        """Receipt feedback: a tx that used >= 95% of its limit invalidates the estimate."""
+        if not used_gas_limit(gas_limit, gas_used):
+            return
+        self.near_limit_receipts += 1
+        with self._lock:
+            self._estimates.pop(key, None)
+        logger.warning("Tx for %s used %d of %d gas; re-estimating next time", key[0], gas_used, gas_limit)
+
+    # ----- fees -----
+    def fee_params(self, w3: Web3) -> Dict[str, int]:
+        """gasPrice or maxFeePerGas/maxPriorityFeePerGas for build_transaction (cached)."""
+        with self._lock:
+            fees = self._fees
+            fresh = fees is not None and time.monotonic() - self._fees_at < GAS_PRICE_REFRESH_SECONDS
+        if fresh:
+            return dict(fees)
+        try:
+            return self.refresh_fees(w3)
+        except Exception as e:
+            if fees is not None:
+                logger.warning("Fee refresh failed, reusing last fees: %s", e)
+                return dict(fees)
+            raise
+
+    def refresh_fees(self, w3: Web3) -> Dict[str, int]:
+        cap = Web3.to_wei(GAS_PRICE_MAX_GWEI, "gwei")
+        if GAS_PRICE_GWEI:
+            fees = {"gasPrice": Web3.to_wei(GAS_PRICE_GWEI, "gwei")}
+        else:
+            base_fee = w3.eth.get_block("latest").get("baseFeePerGas")
+            if base_fee is not None:
+                try:
+                    tip = int(w3.eth.max_priority_fee)
+                except Exception:
+                    tip = Web3.to_wei(GAS_PRIORITY_FEE_GWEI, "gwei")
+                tip = min(tip, cap)
+                fees = {"maxFeePerGas": min(2 * int(base_fee) + tip, cap), "maxPriorityFeePerGas": tip}
+            else:
+                fees = {"gasPrice": min(int(int(w3.eth.gas_price) * GAS_PRICE_MULTIPLIER), cap)}
+        with self._lock:
+            self._fees = fees
+            self._fees_at = time.monotonic()
+        self.fee_refreshes += 1
+        return dict(fees)
+
+    # ----- metrics -----
+    def clear(self) -> None:
+        with self._lock:
+            self._estimates.clear()
+            self._fees = None
+            self._fees_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            estimates = {"%s/%d" % k: v[0] for k, v in self._estimates.items()}
+            fees = dict(self._fees) if self._fees else None
+        return {
+            "margin": self.margin,
+            "cached_estimates": estimates,
+            "hits": self.hits,
+            "estimate_calls": self.estimates,
+            "fallbacks": self.fallbacks,
+            "near_limit_receipts": self.near_limit_receipts,
+            "fees": fees,
+            "fee_refreshes": self.fee_refreshes,
+        }
+
+
+GAS = GasStrategy()
@@ -0,0 +1,244 @@
+# app/services/idempotency_service.py
+"""
+Idempotency-Key support for retried POSTs (register, SOS, KYC submit).
+
+Mobile clients on flaky networks resend the same request; without this each retry
+re-encrypts, re-uploads to IPFS and schedules another chain anchor.
+
+Flow used by the routes:
+    replay = IDEMPOTENCY.begin(db, scope, key, request_hash)
+    if replay is not None:
+        return replay            # cached (status_code, body) from the first request
+    try:
+        result = ...             # do the work
+    except Exception:
+        IDEMPOTENCY.abort(db, scope, key)
+        raise
+    IDEMPOTENCY.complete(db, scope, key, result)
+
+Records are persisted in the `idempotency_keys` table (so replays survive restarts and
+work across workers) and mirrored in a bounded in-memory LRU. Entries older than the
+replay window are pruned; the table is also capped at max_entries rows.
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.tourist_models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# an in-flight marker older than this is treated as abandoned (worker crashed mid-request)
+IDEMPOTENCY_INFLIGHT_TIMEOUT_SECONDS = int(os.getenv("IDEMPOTENCY_INFLIGHT_TIMEOUT_SECONDS", "300"))
+MAX_KEY_LENGTH = 255
+
+StoredResponse = Tuple[int, Any]  # (status_code, json body)
+
+
+class IdempotencyConflict(ValueError):
+    """Same Idempotency-Key reused with a different request body."""
+
+
+class IdempotencyInFlight(RuntimeError):
+    """The first request carrying this key is still being processed."""
+
+
+def request_fingerprint(body: Any) -> str:
+    """sha256 hex of the raw body bytes (or of a canonical JSON dump for parsed payloads)."""
+    if not isinstance(body, (bytes, bytearray, memoryview)):
+        body = json.dumps(body, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(body).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        window_seconds: int = IDEMPOTENCY_WINDOW_SECONDS,
+        max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+        prune_every: int = 100,
+    ):
+        self.window = datetime.timedelta(seconds=window_seconds)
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        # (scope, key) -> (request_hash, created_at, status_code, body) for completed requests
+        self._recent: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready_binds = set()
+        self._completed_since_prune = 0
+        self.replays = 0
+
+    # ----- internals -----
+    def _ensure_table(self, db: Session) -> None:
+        bind = db.get_bind()
+        if id(bind) in self._ready_binds:
+            return
+        IdempotencyRecord.__table__.create(bind=bind, checkfirst=True)
+        self._ready_binds.add(id(bind))
+
+    def _remember(self, scope, key, request_hash, created_at, status_code, body) -> None:
+        with self._lock:
+            self._recent[(scope, key)] = (request_hash, created_at, status_code, body)
+            self._recent.move_to_end((scope, key))
+            while len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+
+    def _forget(self, scope, key) -> None:
+        with self._lock:
+            self._recent.pop((scope, key), None)
+
+    def _check_replay(self, request_hash, stored_hash, status_code, body) -> StoredResponse:
+        if stored_hash != request_hash:
+            raise IdempotencyConflict("Idempotency-Key was already used with a different request body")
+        self.replays += 1
+        return status_code, body
+
+    # ----- public API -----
+    def begin(self, db: Session, scope: str, key: str, request_hash: str) -> Optional[StoredResponse]:
+        """
+        Claim (scope, key) for this request.
+        Returns the stored (status_code, body) when this is a replay of a completed request,
+        None when the caller should do the work. Raises IdempotencyConflict / IdempotencyInFlight.
+        """
+        if len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyConflict("Idempotency-Key too long")
+        now = datetime.datetime.utcnow()
+
+        with self._lock:
+            hit = self._recent.get((scope, key))
+        if hit is not None:
+            stored_hash, created_at, status_code, body = hit
+            if now - created_at <= self.window:
+                return self._check_replay(request_hash, stored_hash, status_code, body)
+            self._forget(scope, key)
+
+        self._ensure_table(db)
+        for _ in range(2):
+            rec = IdempotencyRecord(scope=scope, key=key, request_hash=request_hash, created_at=now)
+            db.add(rec)
+            try:
+                db.commit()
+                return None  # claimed: caller does the work
+            except IntegrityError:
+                db.rollback()
+
+            existing = (
+                db.query(IdempotencyRecord)
+                .filter(IdempotencyRecord.scope == scope, IdempotencyRecord.key == key)
+                .first()
+            )
+            if existing is None:
+                continue  # deleted concurrently (abort / prune); try to claim again
+            age = now - (existing.created_at or now)
+            if existing.status_code is not None and age <= self.window:
+                self._remember(scope, key, existing.request_hash, existing.created_at,
+                               existing.status_code, existing.response)
+                return self._check_replay(request_hash, existing.request_hash,
+                                          existing.status_code, existing.response)
+            if existing.status_code is None and age.total_seconds() < IDEMPOTENCY_INFLIGHT_TIMEOUT_SECONDS:
+                if existing.request_hash != request_hash:
+                    raise IdempotencyConflict("Idempotency-Key was already used with a different request body")
+                raise IdempotencyInFlight("A request with this Idempotency-Key is still in progress")
+            # expired or abandoned: drop it and claim afresh
+            db.delete(existing)
+            db.commit()
+        raise IdempotencyInFlight("A request with this Idempotency-Key is still in progress")
+
+    def complete(self, db: Session, scope: str, key: str, body: Any, status_code: int = 200) -> None:
+        """
+        Persist the response for (scope, key) so later replays get it back. If that fails the
+        claim is released (as abort), so a retry redoes the work instead of getting
+        IdempotencyInFlight until IDEMPOTENCY_INFLIGHT_TIMEOUT_SECONDS.
+        """
+        try:
+            rec = (
+                db.query(IdempotencyRecord)
+                .filter(IdempotencyRecord.scope == scope, IdempotencyRecord.key == key)
+                .first()
+            )
+            if rec is None:
+                return
+            rec.status_code = status_code
+            rec.response = body
+            db.add(rec)
+            db.commit()
+            self._remember(scope, key, rec.request_hash, rec.created_at, status_code, body)
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to store idempotent response scope=%s; releasing the key", scope)
+            self.abort(db, scope, key)
+            return
+
+        self._completed_since_prune += 1
+        if self._completed_since_prune >= self.prune_every:
+            self._completed_since_prune = 0
+            self.prune(db)
+
+    def abort(self, db: Session, scope: str, key: str) -> None:
+        """Release the claim after a failed request so the client can retry."""
+        try:
+            db.rollback()
+            db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.scope == scope,
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code.is_(None),
+            ).delete(synchronize_session="fetch")
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to release idempotency key scope=%s", scope)
+        self._forget(scope, key)
+
+    def prune(self, db: Session) -> int:
+        """Delete rows older than the window and cap the table at max_entries. Returns rows deleted."""
+        try:
+            cutoff = datetime.datetime.utcnow() - self.window
+            deleted = (
+                db.query(IdempotencyRecord)
+                .filter(IdempotencyRecord.created_at < cutoff)
+                .delete(synchronize_session="fetch")
+            )
+            overflow = db.query(IdempotencyRecord.id).count() - self.max_entries
+            if overflow > 0:
+                oldest = (
+                    db.query(IdempotencyRecord.id)
+                    .order_by(IdempotencyRecord.created_at)
+                    .limit(overflow)
+                    .subquery()
+                )
+                deleted += (
+                    db.query(IdempotencyRecord)
+                    .filter(IdempotencyRecord.id.in_(oldest.select()))
+                    .delete(synchronize_session="fetch")
+                )
+            db.commit()
+            return deleted
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to prune idempotency keys")
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cached = len(self._recent)
+        return {
+            "cached_entries": cached,
+            "replays": self.replays,
+            "window_seconds": int(self.window.total_seconds()),
+            "max_entries": self.max_entries,
+        }
+
+
+IDEMPOTENCY = IdempotencyStore()
@@ -0,0 +1,164 @@
+# app/services/itinerary_service.py
+"""
+Itinerary repository.
+
+Keeps the plaintext itinerary copy in the `itineraries` table in sync with
+what the app sends, without rewriting the whole list on every edit:
+ - dates are parsed once per distinct string (cached parser),
+ - new rows go in with a single bulk INSERT,
+ - updates are diff-based: unchanged items are left alone, only removed
+   items are deleted and only new items are inserted.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.tourist_models import Itinerary
+
+logger = logging.getLogger(__name__)
+
+MAX_LOCATION_LEN = 256
+
+# (date, location, activity) -> identity of an itinerary item for diffing
+ItemKey = Tuple[datetime.datetime, str, Optional[str]]
+
+
+@lru_cache(maxsize=1024)
+def parse_itinerary_date(value: str) -> Optional[datetime.datetime]:
+    """
+    Parse a date-like string ("YYYY-MM-DD", ISO datetime, ...) to a midnight datetime.
+    Returns None if the value cannot be parsed. Results are cached, so a list of
+    items sharing the same day (or repeated edits of the same trip) parses each string once.
+    """
+    if not value:
+        return None
+    s = str(value).strip().split("T", 1)[0].split(" ", 1)[0]
+    try:
+        d = datetime.date.fromisoformat(s)
+    except ValueError:
+        try:
+            d = datetime.datetime.strptime(s, "%Y-%m-%d").date()
+        except ValueError:
+            return None
+    return datetime.datetime(d.year, d.month, d.day)
+
+
+def _row_values(
+    items: Iterable[Dict[str, Any]], fallback_date: Optional[datetime.datetime]
+) -> List[Dict[str, Any]]:
+    """Convert validated itinerary items to column dicts (date parsed, fields trimmed)."""
+    fallback = fallback_date or datetime.datetime.utcnow()
+    out = []
+    for item in items:
+        dt = parse_itinerary_date(str(item.get("date", ""))) or fallback
+        out.append(
+            {
+                "date": dt,
+                "location": str(item.get("location", ""))[:MAX_LOCATION_LEN],
+                "activity": item.get("activity") or None,
+            }
+        )
+    return out
+
+
+def _key(values: Dict[str, Any]) -> ItemKey:
+    return (values["date"], values["location"], values["activity"])
+
+
+def bulk_insert(db: Session, user_id: int, rows: List[Dict[str, Any]]) -> int:
+    """Insert many itinerary rows for a user in one executemany INSERT. Does not commit."""
+    if not rows:
+        return 0
+    now = datetime.datetime.utcnow()
+    db.execute(
+        Itinerary.__table__.insert(),
+        [{**r, "user_id": user_id, "created_at": now} for r in rows],
+    )
+    return len(rows)
+
+
+def sync_itinerary(
+    db: Session,
+    user_id: int,
+    items: List[Dict[str, Any]],
+    fallback_date: Any = None,
+) -> Dict[str, int]:
+    """
+    Diff-based update of a user's itinerary rows.
+
+    - items: validated itinerary list ({"date", "location", "activity"} strings)
+    - fallback_date: used when an item's date cannot be parsed (e.g. visitStart)
+
+    Items already stored (same date/location/activity) are left untouched, stored rows
+    that no longer appear are deleted by id, and only genuinely new items are inserted.
+    Duplicated items are matched by multiplicity. Does not commit.
+    Returns counts {"kept", "inserted", "deleted"}.
+    """
+    fallback = (
+        fallback_date
+        if isinstance(fallback_date, datetime.datetime)
+        else parse_itinerary_date(str(fallback_date)) if fallback_date else None
+    )
+    wanted = _row_values(items, fallback)
+
+    existing = (
+        db.query(Itinerary.id, Itinerary.date, Itinerary.location, Itinerary.activity)
+        .filter(Itinerary.user_id == user_id)
+        .all()
+    )
+
+    remaining = Counter(_key(v) for v in wanted)
+    stale_ids = []
+    for row in existing:
+        k = (row.date, row.location, row.activity)
+        if remaining.get(k, 0) > 0:
+            remaining[k] -= 1
+        else:
+            stale_ids.append(row.id)
+
+    to_insert = []
+    for v in wanted:
+        k = _key(v)
+        if remaining.get(k, 0) > 0:
+            remaining[k] -= 1
+            to_insert.append(v)
+
+    if stale_ids:
+        db.query(Itinerary).filter(Itinerary.id.in_(stale_ids)).delete(
+            synchronize_session=False
+        )
+    inserted = bulk_insert(db, user_id, to_insert)
+
+    stats = {
+        "kept": len(existing) - len(stale_ids),
+        "inserted": inserted,
+        "deleted": len(stale_ids),
+    }
+    logger.debug("itinerary sync user_id=%s %s", user_id, stats)
+    return stats
+
+
+def list_itinerary(db: Session, user_id: int) -> List[Dict[str, Any]]:
+    """Return a user's itinerary ordered by date (served by the (user_id, date) index)."""
+    rows = (
+        db.query(Itinerary.id, Itinerary.date, Itinerary.location, Itinerary.activity)
+        .filter(Itinerary.user_id == user_id)
+        .order_by(Itinerary.date, Itinerary.id)
+        .all()
+    )
+    return [
+        {
+            "id": r.id,
+            "date": r.date.strftime("%Y-%m-%d") if r.date else None,
+            "location": r.location,
+            "activity": r.activity or "",
+        }
+        for r in rows
+    ]
@@ -0,0 +1,221 @@
+# app/services/key_registry.py
+"""
+Parsed, versioned RSA key material.
+
+Wrapping a 32-byte data key with RSA-OAEP takes well under a millisecond; reading and parsing
+the PEM (RSA.import_key / load_pem_*_key) used to cost more than that on every call. KEYS
+parses each configured key once and hands out the parsed objects:
+
+    entry = KEYS.require(SERVER_PUBLIC)
+    entry.pycryptodome()   # Crypto.PublicKey.RSA key (parsed on first use, then cached)
+    entry.cryptography()   # cryptography key object (parsed at load)
+    entry.version          # "kid": first 16 hex chars of sha256(DER SubjectPublicKeyInfo)
+
+Sources per key: a file (<NAME>_PATH env) or inline PEM (<NAME>_PEM env, literal "\\n"
+accepted). At most every KEY_RELOAD_CHECK_SECONDS the source is re-checked (file mtime/size,
+env value) and the key reparsed when it changed; rotate() installs a new PEM directly.
+Versions seen by this process stay loaded, so by_version() can still find the private key for
+data wrapped before a rotation. A private key has the version of its public half, so the
+key_version recorded in key_meta at wrap time names the key that unwraps it.
+
+During a rotation the outgoing private key is configured as SERVER_PRIVATE_KEY_PREVIOUS_PATH
+(or _PEM): by_version(SERVER_PRIVATE, ...) finds it in every process, also after a restart,
+until the rotation engine has rewrapped everything wrapped under it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+
+logger = logging.getLogger(__name__)
+
+KEY_RELOAD_CHECK_SECONDS = float(os.getenv("KEY_RELOAD_CHECK_SECONDS", "5"))
+
+SERVER_PUBLIC = "server_public"
+SERVER_PRIVATE = "server_private"
+SERVER_PRIVATE_PREVIOUS = "server_private_previous"
+
+
+def key_version(public_key: Any) -> str:
+    der = public_key.public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(der).hexdigest()[:16]
+
+
+class LoadedKey:
+    def __init__(self, name: str, pem: bytes, private: bool, source: str):
+        self.name = name
+        self.pem = pem
+        self.private = private
+        self.source = source
+        self.loaded_at = time.time()
+        if private:
+            self._crypto = serialization.load_pem_private_key(pem, password=None)
+            self.version = key_version(self._crypto.public_key())
+        else:
+            self._crypto = serialization.load_pem_public_key(pem)
+            self.version = key_version(self._crypto)
+        self._pycryptodome = None
+
+    def cryptography(self) -> Any:
+        return self._crypto
+
+    def pycryptodome(self) -> Any:
+        if self._pycryptodome is None:
+            from Crypto.PublicKey import RSA
+
+            self._pycryptodome = RSA.import_key(self.pem)
+        return self._pycryptodome
+
+
+class KeyRegistry:
+    def __init__(self, check_seconds: float = KEY_RELOAD_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._specs: Dict[str, Tuple[str, str, bool]] = {}  # name -> (path env, pem env, private)
+        self._current: Dict[str, Optional[LoadedKey]] = {}
+        self._versions: Dict[str, Dict[str, LoadedKey]] = {}
+        self._stamps: Dict[str, Any] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._pinned: Dict[str, bool] = {}  # rotate()d keys ignore their env/file source
+        self._previous: Dict[str, List[str]] = {}  # name -> names of keys it is rotating away from
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def register(self, name: str, path_env: str, pem_env: str, private: bool = False,
+                 previous_of: Optional[str] = None) -> None:
+        """previous_of: name is the outgoing key of that one (searched by by_version / candidates)."""
+        self._specs[name] = (path_env, pem_env, private)
+        if previous_of:
+            self._previous.setdefault(previous_of, []).append(name)
+
+    # ----- access -----
+    def get(self, name: str) -> Optional[LoadedKey]:
+        """Current key for name, or None when it is not configured (or fails to parse)."""
+        now = time.monotonic()
+        if now - self._checked_at.get(name, float("-inf")) < self.check_seconds:
+            return self._current.get(name)
+        with self._lock:
+            if now - self._checked_at.get(name, float("-inf")) >= self.check_seconds:
+                self._refresh(name)
+                self._checked_at[name] = now
+            return self._current.get(name)
+
+    def require(self, name: str) -> LoadedKey:
+        entry = self.get(name)
+        if entry is None:
+            path_env, pem_env, _ = self._specs[name]
+            raise RuntimeError("Key %r not configured (%s or %s)" % (name, path_env, pem_env))
+        return entry
+
+    def by_version(self, name: str, version: Optional[str]) -> Optional[LoadedKey]:
+        """Key with this version (current or seen earlier); the current key when version is None."""
+        current = self.get(name)
+        if not version or (current is not None and current.version == version):
+            return current
+        entry = self._versions.get(name, {}).get(version)
+        if entry is None:
+            for prev in self._previous.get(name, ()):
+                candidate = self.get(prev)
+                if candidate is not None and candidate.version == version:
+                    return candidate
+        return entry
+
+    def candidates(self, name: str) -> List[LoadedKey]:
+        """Current key first, then the configured previous keys (for data with no key_version)."""
+        out: List[LoadedKey] = []
+        for n in [name] + self._previous.get(name, []):
+            entry = self.get(n)
+            if entry is not None and all(e.version != entry.version for e in out):
+                out.append(entry)
+        return out
+
+    # ----- reload / rotation -----
+    def rotate(self, name: str, pem: bytes) -> LoadedKey:
+        """Install a new PEM for name now (keeps older versions for by_version())."""
+        _, _, private = self._specs[name]
+        entry = LoadedKey(name, pem, private, "rotated")
+        with self._lock:
+            self._install(name, entry)
+            self._pinned[name] = True
+            self._checked_at[name] = time.monotonic()
+        logger.info("Key %s rotated to version %s", name, entry.version)
+        return entry
+
+    def reload(self, name: Optional[str] = None) -> None:
+        """Forget pins and re-read sources on the next access."""
+        for n in [name] if name else list(self._specs):
+            self._pinned.pop(n, None)
+            self._stamps.pop(n, None)
+            self._checked_at.pop(n, None)
+
+    def _refresh(self, name: str) -> None:
+        if self._pinned.get(name):
+            return
+        path_env, pem_env, private = self._specs[name]
+        path = os.getenv(path_env)
+        inline = os.getenv(pem_env)
+        stamp: Any = None
+        if path:
+            try:
+                st = os.stat(path)
+                stamp = ("path", path, st.st_mtime_ns, st.st_size)
+            except OSError as e:
+                logger.error("Cannot stat %s=%s: %s", path_env, path, e)
+        if stamp is None and inline:
+            stamp = ("env", inline)
+        if stamp == self._stamps.get(name):
+            return
+        self._stamps[name] = stamp
+        if stamp is None:
+            self._current[name] = None
+            return
+        try:
+            if stamp[0] == "path":
+                with open(path, "rb") as fh:
+                    pem = fh.read()
+                source = "path:%s" % path
+            else:
+                if "\\n" in inline and not inline.startswith("-----"):
+                    inline = inline.replace("\\n", "\n")
+                pem = inline.encode("utf-8")
+                source = "env:%s" % pem_env
+            entry = LoadedKey(name, pem, private, source)
+        except Exception:
+            logger.exception("Failed to load key %s from %s", name, stamp[0])
+            self._current[name] = None
+            return
+        self._install(name, entry)
+        logger.info("Loaded key %s version %s from %s", name, entry.version, entry.source)
+
+    def _install(self, name: str, entry: LoadedKey) -> None:
+        self._current[name] = entry
+        self._versions.setdefault(name, {})[entry.version] = entry
+        self.loads += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loads": self.loads,
+            "keys": {
+                name: {
+                    "version": e.version if e else None,
+                    "source": e.source if e else None,
+                    "known_versions": sorted(self._versions.get(name, {})),
+                }
+                for name, e in self._current.items()
+            },
+        }
+
+
+KEYS = KeyRegistry()
+KEYS.register(SERVER_PUBLIC, "SERVER_PUBLIC_KEY_PATH", "SERVER_PUBLIC_KEY_PEM")
+KEYS.register(SERVER_PRIVATE, "SERVER_PRIVATE_KEY_PATH", "SERVER_PRIVATE_KEY_PEM", private=True)
+KEYS.register(SERVER_PRIVATE_PREVIOUS, "SERVER_PRIVATE_KEY_PREVIOUS_PATH", "SERVER_PRIVATE_KEY_PREVIOUS_PEM",
+              private=True, previous_of=SERVER_PRIVATE)
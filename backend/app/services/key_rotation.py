@@ -0,0 +1,593 @@
+# app/services/key_rotation.py
+"""
+Key rotation: rewrap stored data keys under the current server RSA key / KYC master key.
+
+Blobs on IPFS are never re-encrypted; only the wrapped data key next to each record changes
+(users.profile encrypted_key_b64 / key_meta, kyc_records.encrypted_key / key_meta). Rotating
+on a live database:
+
+ 1. deploy the new key as the current one and keep the old one as "previous":
+      SERVER_PUBLIC_KEY_PATH / SERVER_PRIVATE_KEY_PATH           -> new pair
+      SERVER_PRIVATE_KEY_PREVIOUS_PATH                           -> old private key
+      KYC_MASTER_KEY_BASE64 / KYC_MASTER_KEY_PREVIOUS_BASE64     -> new / old master key
+    New records are wrapped with the new keys; crypto_service, kyc_utils and the grantee
+    rewrap accept records of both (key_version / mk_id in key_meta say which).
+ 2. POST /admin/key-rotation {"target": "profiles"} and {"target": "kyc"}: a background job
+    walks the table in id order, KEY_ROTATION_CHUNK rows at a time, rewrapping rows that are
+    not yet under the current keys, at most max_per_second rewraps per second. Rows that fail
+    are remembered (failed_ids) and retried once the walk reaches the end of the table.
+ 3. only when both jobs ended "done" (failed == 0), drop the *_PREVIOUS_* settings; GET
+    /admin/keys reports this as previous_keys_droppable. A job that ends "done_with_errors"
+    still has records under the previous keys (ids in failed_ids): fix the cause, then run
+    another job (it only rewraps what is left) before dropping anything.
+
+Jobs live in `key_rotation_jobs` with their cursor (highest row id handled) and counters, so
+a job survives restarts: the process holding its lease (owner + heartbeat) continues it, or
+any process once the lease is older than KEY_ROTATION_LEASE_SECONDS. Throttle sleeps are
+sliced and refresh the heartbeat, so a slow max_per_second never lets the lease lapse. A row is written with a
+conditional UPDATE (its wrapped key / profile unchanged since it was read), so a record
+replaced meanwhile (re-registration) keeps its new value, which uses the current keys anyway.
+
+What is rewrapped per record:
+  rsa-server-pem  data key RSA-OAEP (SHA-1) under the new server key
+  kek-aes-kw      only the RSA-wrapped KEK (once per KEK per job); the AES-KW data key stays
+  rsa-pem-env     data key RSA-OAEP (SHA-256) under the new server key
+  aes-kw / dev    data key AES-KW under the new master key (legacy XOR envelopes included)
+base64-dev and KMS records are left alone (counted as skipped).
+"""
+
+from __future__ import annotations
+
+import base64
+import datetime
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Text, cast, func, inspect, or_, select, text, update
+from sqlalchemy.orm import Session
+
+from app.models.kyc_model import KYCRecord
+from app.models.tourist_models import KeyRotationJob, User
+from app.services import crypto_service
+from app.services.data_key_cache import KEK_METHOD, kek_id_for
+from app.services.key_registry import KEYS, SERVER_PRIVATE, SERVER_PRIVATE_PREVIOUS, SERVER_PUBLIC
+from app.utils import key_envelope
+from app.utils.kyc_utils import KYC_USE_KMS, unwrap_record_key
+
+logger = logging.getLogger(__name__)
+
+KEY_ROTATION_CHUNK = int(os.getenv("KEY_ROTATION_CHUNK", "200"))
+KEY_ROTATION_MAX_PER_SECOND = float(os.getenv("KEY_ROTATION_MAX_PER_SECOND", "200"))  # 0 = unthrottled
+KEY_ROTATION_POLL_SECONDS = float(os.getenv("KEY_ROTATION_POLL_SECONDS", "2"))
+KEY_ROTATION_LEASE_SECONDS = float(os.getenv("KEY_ROTATION_LEASE_SECONDS", "60"))
+KEY_ROTATION_MAX_FAILED_IDS = int(os.getenv("KEY_ROTATION_MAX_FAILED_IDS", "10000"))  # kept per job
+
+OPEN_STATUSES = ("running", "paused")
+TARGETS = ("profiles", "kyc")
+
+# per-row outcomes
+REWRAPPED, CURRENT, SKIPPED, FAILED = "rewrapped", "current", "skipped", "failed"
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("utf-8")
+
+
+def _meta_dict(meta: Any) -> Dict[str, Any]:
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except ValueError:
+            return {}
+    return dict(meta) if isinstance(meta, dict) else {}
+
+
+def current_keys() -> Dict[str, Optional[str]]:
+    """Versions new wraps use: what a finished rotation leaves every record under."""
+    server = KEYS.get(SERVER_PUBLIC)
+    try:
+        master_id = key_envelope.master_key_id(key_envelope.master_key())
+    except RuntimeError:
+        master_id = None
+    return {"server_key_version": server.version if server else None, "master_key_id": master_id}
+
+
+def keys_status() -> Dict[str, Any]:
+    """
+    Current and previous keys as this process sees them (what rotation jobs rewrap from / to).
+    The previous keys must stay configured until a rotation job for every target has ended
+    "done" with failed == 0 under the current keys (previous_keys_droppable).
+    """
+    for name in (SERVER_PUBLIC, SERVER_PRIVATE, SERVER_PRIVATE_PREVIOUS):
+        KEYS.get(name)  # load before reporting
+    previous = key_envelope.previous_master_key()
+    rotated = KEY_ROTATION.rotated_targets()
+    return {
+        **current_keys(),
+        "previous_server_key_versions": [k.version for k in KEYS.candidates(SERVER_PRIVATE)[1:]],
+        "previous_master_key_id": key_envelope.master_key_id(previous) if previous else None,
+        "rotated_targets": rotated,
+        "previous_keys_droppable": bool(rotated) and all(rotated.values()),
+        "note": "keep SERVER_PRIVATE_KEY_PREVIOUS_* and KYC_MASTER_KEY_PREVIOUS_BASE64 until every target "
+                "has a rotation job that ended done with failed == 0",
+        "registry": KEYS.stats(),
+    }
+
+
+# ----- per-record rewrap -----
+class _Rewrapper:
+    """Rewraps records under the current keys; remembers rewrapped KEKs for the whole job."""
+
+    def __init__(self):
+        self.server = KEYS.get(SERVER_PUBLIC)
+        self.master_id = current_keys()["master_key_id"]
+        self._keks: Dict[str, Dict[str, str]] = {}  # old kek_id -> new kek fields
+
+    def _server(self) -> Any:
+        if self.server is None:
+            raise RuntimeError("Server public key not configured (SERVER_PUBLIC_KEY_PATH or SERVER_PUBLIC_KEY_PEM)")
+        return self.server
+
+    def _rsa_rewrap(self, wrapped_b64: str, meta: Dict[str, Any], oaep_hash: str) -> Tuple[str, Dict[str, Any]]:
+        server = self._server()
+        sym = crypto_service.decrypt_sym_key_with_rsa(base64.b64decode(wrapped_b64), meta.get("key_version"), oaep_hash)
+        wrapped = crypto_service.rsa_oaep_encrypt(server, sym, oaep_hash)
+        return _b64(wrapped), dict(meta, key_version=server.version)
+
+    def profile(self, profile: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        meta = _meta_dict(profile.get("key_meta"))
+        method = meta.get("method")
+        if method not in ("rsa-server-pem", KEK_METHOD):
+            return SKIPPED, None
+        if self.server is not None and meta.get("key_version") == self.server.version:
+            return CURRENT, None
+        if method == "rsa-server-pem":
+            enc, meta = self._rsa_rewrap(profile["encrypted_key_b64"], meta, crypto_service.OAEP_SHA1)
+            return REWRAPPED, dict(profile, encrypted_key_b64=enc, key_meta=meta)
+        # KEK envelope: the data key stays wrapped by the same KEK, the KEK gets the new RSA wrap
+        fields = self._keks.get(meta.get("kek_id"))
+        if fields is None:
+            wrapped_kek, new_meta = self._rsa_rewrap(meta["kek_wrapped_b64"], meta, crypto_service.OAEP_SHA1)
+            fields = {
+                "kek_wrapped_b64": wrapped_kek,
+                "kek_id": kek_id_for(base64.b64decode(wrapped_kek)),
+                "key_version": new_meta["key_version"],
+            }
+            self._keks[meta.get("kek_id")] = fields
+        return REWRAPPED, dict(profile, key_meta=dict(meta, **fields))
+
+    def kyc(self, encrypted_key: str, key_meta: Any) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+        meta = _meta_dict(key_meta)
+        method = meta.get("method")
+        if method in crypto_service.OAEP_HASH_BY_METHOD:
+            if self.server is not None and meta.get("key_version") == self.server.version:
+                return CURRENT, None, None
+            enc, meta = self._rsa_rewrap(encrypted_key, meta, crypto_service.OAEP_HASH_BY_METHOD[method])
+            return REWRAPPED, enc, meta
+        if method in ("base64-dev", "kms") or KYC_USE_KMS:
+            return SKIPPED, None, None
+        if (key_envelope.envelope_mode(meta or None, base64.b64decode(encrypted_key)) == key_envelope.ENVELOPE_MODE
+                and meta.get("mk_id") == self.master_id):
+            return CURRENT, None, None
+        data_key = unwrap_record_key(encrypted_key, key_meta)
+        enc = _b64(key_envelope.wrap_data_key(data_key))
+        meta.pop("note", None)  # legacy XOR marker
+        # other fields (stream format, chunk size, sealed manifest) belong to the blob and stay
+        return REWRAPPED, enc, dict(meta, **key_envelope.key_meta())
+
+
+# ----- targets: one chunk each -----
+# A chunk is the rows after after_id (the walk) or exactly the rows in ids (the retry of failed
+# rows). Returns (last id, outcome counts, [(row id, error)]).
+ChunkResult = Tuple[int, Dict[str, int], List[Tuple[int, str]]]
+
+
+def _profiles_chunk(bind, after_id: int, limit: int, rw: _Rewrapper, ids: Optional[List[int]] = None) -> ChunkResult:
+    counts = {REWRAPPED: 0, CURRENT: 0, SKIPPED: 0, FAILED: 0}
+    errors: List[Tuple[int, str]] = []
+    where = User.id.in_(ids) if ids is not None else User.id > after_id
+    with Session(bind=bind) as db:
+        rows = db.execute(
+            select(User.id, cast(User.profile, Text)).where(where).order_by(User.id).limit(limit)
+        ).all()
+    if not rows:
+        return after_id, counts, errors
+    updates = []
+    for user_id, raw in rows:
+        try:
+            profile = json.loads(raw) if raw else None
+            outcome, new = rw.profile(profile) if isinstance(profile, dict) and profile.get("encrypted_key_b64") \
+                else (SKIPPED, None)
+        except Exception as e:
+            outcome, new = FAILED, None
+            errors.append((user_id, "user %s: %s" % (user_id, e)))
+        if outcome == REWRAPPED:
+            updates.append((user_id, raw, new))
+        else:
+            counts[outcome] += 1
+    if updates:
+        with Session(bind=bind) as db:
+            for user_id, raw, new in updates:
+                res = db.execute(
+                    update(User)
+                    .where(User.id == user_id, cast(User.profile, Text) == raw)
+                    .values(profile=new, updated_at=User.updated_at)
+                    .execution_options(synchronize_session=False)
+                )
+                counts[REWRAPPED if res.rowcount == 1 else SKIPPED] += 1
+            db.commit()
+    return rows[-1][0], counts, errors
+
+
+def _kyc_chunk(bind, after_id: int, limit: int, rw: _Rewrapper, ids: Optional[List[int]] = None) -> ChunkResult:
+    counts = {REWRAPPED: 0, CURRENT: 0, SKIPPED: 0, FAILED: 0}
+    errors: List[Tuple[int, str]] = []
+    where = KYCRecord.id.in_(ids) if ids is not None else KYCRecord.id > after_id
+    with Session(bind=bind) as db:
+        rows = db.execute(
+            select(KYCRecord.id, KYCRecord.encrypted_key, KYCRecord.key_meta)
+            .where(where).order_by(KYCRecord.id).limit(limit)
+        ).all()
+    if not rows:
+        return after_id, counts, errors
+    updates = []
+    for rec_id, encrypted_key, key_meta in rows:
+        try:
+            outcome, enc, meta = rw.kyc(encrypted_key, key_meta)
+        except Exception as e:
+            outcome = FAILED
+            errors.append((rec_id, "kyc %s: %s" % (rec_id, e)))
+        if outcome == REWRAPPED:
+            updates.append((rec_id, encrypted_key, enc, meta))
+        else:
+            counts[outcome] += 1
+    if updates:
+        with Session(bind=bind) as db:
+            for rec_id, old, enc, meta in updates:
+                res = db.execute(
+                    update(KYCRecord)
+                    .where(KYCRecord.id == rec_id, KYCRecord.encrypted_key == old)
+                    .values(encrypted_key=enc, key_meta=meta)
+                    .execution_options(synchronize_session=False)
+                )
+                counts[REWRAPPED if res.rowcount == 1 else SKIPPED] += 1
+            db.commit()
+    return rows[-1][0], counts, errors
+
+
+_CHUNK_HANDLERS: Dict[str, Callable[..., ChunkResult]] = {
+    "profiles": _profiles_chunk,
+    "kyc": _kyc_chunk,
+}
+_ROW_MODELS = {"profiles": User, "kyc": KYCRecord}
+
+
+def _ensure_job_table(bind) -> None:
+    """Create key_rotation_jobs, adding columns introduced after an existing table was created."""
+    table = KeyRotationJob.__table__
+    table.create(bind=bind, checkfirst=True)
+    existing = {c["name"] for c in inspect(bind).get_columns(table.name)}
+    with bind.begin() as conn:
+        for col in table.columns:
+            if col.name not in existing:
+                conn.execute(text("ALTER TABLE %s ADD COLUMN %s %s" % (
+                    table.name, col.name, col.type.compile(dialect=bind.dialect))))
+
+
+# ----- engine -----
+class KeyRotation:
+    def __init__(self, chunk: int = KEY_ROTATION_CHUNK, max_per_second: float = KEY_ROTATION_MAX_PER_SECOND):
+        self.chunk = chunk
+        self.max_per_second = max_per_second
+        self.owner = "%s:%d" % (socket.gethostname(), os.getpid())
+        self._bind = None
+        self._targets: Dict[str, Any] = {}
+        self._rewrappers: Dict[int, _Rewrapper] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- setup -----
+    def start(self, bind, targets: Dict[str, Any]) -> None:
+        """Keep jobs in bind's key_rotation_jobs; targets maps "profiles" / "kyc" to their engines."""
+        _ensure_job_table(bind)
+        self._bind = bind
+        self._targets = dict(targets)
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="key-rotation", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    # ----- admin API -----
+    def create(self, target: str, max_per_second: Optional[float] = None) -> Dict[str, Any]:
+        """New job for target; ValueError if the target is unknown or already has an open job."""
+        if target not in self._targets:
+            raise ValueError("Unknown rotation target %r (expected one of %s)" % (target, ", ".join(TARGETS)))
+        keys = current_keys()
+        if target == "profiles" and not keys["server_key_version"]:
+            raise ValueError("Server public key not configured")
+        with Session(bind=self._bind) as db:
+            if db.query(KeyRotationJob).filter(KeyRotationJob.target == target,
+                                               KeyRotationJob.status.in_(OPEN_STATUSES)).first():
+                raise ValueError("A %s rotation job is already open" % target)
+            model = _ROW_MODELS[target]
+            with Session(bind=self._targets[target]) as tdb:
+                total = tdb.query(func.count(model.id)).scalar()
+            job = KeyRotationJob(
+                target=target, status="running", cursor=0, total=total, target_keys=keys,
+                max_per_second=self.max_per_second if max_per_second is None else max_per_second,
+            )
+            db.add(job)
+            db.commit()
+            out = self._progress(job)
+        logger.info("Key rotation job %s for %s created (%d rows, keys %s)", out["id"], target, total, keys)
+        self._wake.set()
+        return out
+
+    def set_status(self, job_id: int, status: str) -> Dict[str, Any]:
+        """Pause ("paused") or resume ("running") an open job; ValueError otherwise."""
+        with Session(bind=self._bind) as db:
+            job = db.get(KeyRotationJob, job_id)
+            if job is None:
+                raise LookupError("Key rotation job %d not found" % job_id)
+            if job.status not in OPEN_STATUSES:
+                raise ValueError("Job %d is %s" % (job_id, job.status))
+            job.status = status
+            if status == "running":
+                job.owner = None  # whoever polls next picks it up
+            db.commit()
+            out = self._progress(job)
+        self._wake.set()
+        return out
+
+    def rotated_targets(self) -> Dict[str, bool]:
+        """Per target: whether a job under the current keys ended "done" (nothing left under old keys)."""
+        if self._bind is None:
+            return {}
+        keys = current_keys()
+        with Session(bind=self._bind) as db:
+            done = {
+                j.target for j in db.query(KeyRotationJob).filter(KeyRotationJob.status == "done",
+                                                                  KeyRotationJob.failed == 0)
+                if j.target_keys == keys
+            }
+        return {target: target in done for target in self._targets}
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with Session(bind=self._bind) as db:
+            job = db.get(KeyRotationJob, job_id)
+            return self._progress(job) if job else None
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with Session(bind=self._bind) as db:
+            jobs = db.query(KeyRotationJob).order_by(KeyRotationJob.id.desc()).limit(limit).all()
+            return [self._progress(j) for j in jobs]
+
+    @staticmethod
+    def _progress(job: KeyRotationJob) -> Dict[str, Any]:
+        active = job.active_seconds or 0.0
+        total = job.total or 0
+        scan_rate = job.scanned / active if active else None
+        return {
+            "id": job.id,
+            "target": job.target,
+            "status": job.status,
+            "cursor": job.cursor,
+            "total": total,
+            "scanned": job.scanned,
+            "rewrapped": job.rewrapped,
+            "current": job.current,
+            "skipped": job.skipped,
+            "failed": job.failed,
+            "failed_ids": job.failed_ids or [],
+            "percent": round(100.0 * min(job.scanned, total) / total, 1) if total else 100.0,
+            "rewraps_per_second": round(job.rewrapped / active, 1) if active else None,
+            "rows_per_second": round(scan_rate, 1) if scan_rate else None,
+            "eta_seconds": round(max(total - job.scanned, 0) / scan_rate, 1) if scan_rate else None,
+            "active_seconds": round(active, 2),
+            "max_per_second": job.max_per_second,
+            "target_keys": job.target_keys,
+            "owner": job.owner,
+            "last_error": job.last_error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+
+    # ----- worker -----
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job_id = self._claim()
+                if job_id is not None:
+                    self._work(job_id)
+                    continue
+            except Exception:
+                logger.exception("Key rotation loop failed")
+            self._wake.wait(KEY_ROTATION_POLL_SECONDS)
+            self._wake.clear()
+
+    def _claim(self) -> Optional[int]:
+        """Take the lease of a running job that nobody (alive) is working on."""
+        stale = _utcnow() - datetime.timedelta(seconds=KEY_ROTATION_LEASE_SECONDS)
+        with Session(bind=self._bind) as db:
+            candidates = db.query(KeyRotationJob.id).filter(
+                KeyRotationJob.status == "running",
+                KeyRotationJob.target.in_(list(self._targets)),
+                or_(KeyRotationJob.owner.is_(None), KeyRotationJob.owner == self.owner,
+                    KeyRotationJob.heartbeat_at < stale),
+            ).order_by(KeyRotationJob.id).all()
+            for (job_id,) in candidates:
+                res = db.execute(
+                    update(KeyRotationJob)
+                    .where(
+                        KeyRotationJob.id == job_id,
+                        KeyRotationJob.status == "running",
+                        or_(KeyRotationJob.owner.is_(None), KeyRotationJob.owner == self.owner,
+                            KeyRotationJob.heartbeat_at < stale),
+                    )
+                    .values(owner=self.owner, heartbeat_at=_utcnow())
+                )
+                db.commit()
+                if res.rowcount == 1:
+                    return job_id
+        return None
+
+    def _running(self, job_id: int) -> Optional[Tuple[str, int, Optional[float], List[int]]]:
+        """(target, cursor, max_per_second, failed_ids) while the job is running under our lease."""
+        with Session(bind=self._bind) as db:
+            job = db.get(KeyRotationJob, job_id)
+            if job is None or job.status != "running" or job.owner != self.owner:
+                return None
+            return job.target, job.cursor, job.max_per_second, list(job.failed_ids or [])
+
+    def _work(self, job_id: int) -> None:
+        rw = self._rewrappers.setdefault(job_id, _Rewrapper())
+        while not self._stop.is_set():
+            state = self._running(job_id)
+            if state is None:
+                return
+            target, cursor, max_rate, _ = state
+            t0 = time.monotonic()
+            try:
+                last_id, counts, errors = _CHUNK_HANDLERS[target](self._targets[target], cursor, self.chunk, rw)
+            except Exception as e:
+                logger.exception("Key rotation job %d chunk after id %d failed", job_id, cursor)
+                self._finish(job_id, "failed", str(e))
+                return
+            if not self._throttle(job_id, max_rate, counts[REWRAPPED], t0):
+                return
+            scanned = sum(counts.values())
+            if not self._record(job_id, counts, errors, time.monotonic() - t0, cursor=last_id):
+                return
+            if scanned == 0:
+                self._retry_failed(job_id, rw)
+                return
+
+    def _retry_failed(self, job_id: int, rw: _Rewrapper) -> None:
+        """End of the table: retry the rows that failed once, then finish (done only if none is left)."""
+        state = self._running(job_id)
+        if state is None:
+            return
+        target, _, max_rate, failed_ids = state
+        for i in range(0, len(failed_ids), self.chunk):
+            if self._stop.is_set() or self._running(job_id) is None:
+                return  # paused / stopped: the next run reaches the end again and retries what is left
+            part = failed_ids[i:i + self.chunk]
+            t0 = time.monotonic()
+            try:
+                _, counts, errors = _CHUNK_HANDLERS[target](self._targets[target], 0, len(part), rw, ids=part)
+            except Exception as e:
+                logger.exception("Key rotation job %d retry of failed rows failed", job_id)
+                self._finish(job_id, "failed", str(e))
+                return
+            counts[SKIPPED] += len(part) - sum(counts.values())  # deleted meanwhile: nothing left to rewrap
+            if not self._throttle(job_id, max_rate, counts[REWRAPPED], t0):
+                return
+            if not self._record(job_id, counts, errors, time.monotonic() - t0, retried=part):
+                return
+        with Session(bind=self._bind) as db:
+            job = db.get(KeyRotationJob, job_id)
+            failed = job.failed if job is not None else 0
+        if failed:
+            self._finish(job_id, "done_with_errors",
+                         "%d rows are still under the previous keys (failed_ids); keep the previous keys "
+                         "configured and run another job" % failed)
+        else:
+            self._finish(job_id, "done")
+
+    def _throttle(self, job_id: int, max_rate: Optional[float], rewrapped: int, t0: float) -> bool:
+        """
+        Hold rewraps to max_rate per second (they are the work that competes with live traffic).
+        Sleeps in slices of a quarter lease and renews the heartbeat after each, so a long
+        sleep never lets another process take the job over; False once the lease is lost.
+        """
+        if not max_rate or not rewrapped:
+            return True
+        deadline = t0 + rewrapped / max_rate
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._stop.wait(min(remaining, KEY_ROTATION_LEASE_SECONDS / 4))
+            if not self._heartbeat(job_id):
+                return False
+        return True
+
+    def _heartbeat(self, job_id: int) -> bool:
+        with Session(bind=self._bind) as db:
+            res = db.execute(
+                update(KeyRotationJob)
+                .where(KeyRotationJob.id == job_id, KeyRotationJob.owner == self.owner)
+                .values(heartbeat_at=_utcnow())
+            )
+            db.commit()
+            return res.rowcount == 1
+
+    def _record(self, job_id: int, counts: Dict[str, int], errors: List[Tuple[int, str]], elapsed: float,
+                cursor: Optional[int] = None, retried: Sequence[int] = ()) -> bool:
+        """
+        Add a chunk's outcome to the job. cursor: the walk moved there (rows count as scanned);
+        retried: failed rows tried again (already counted; the ones that failed again stay in
+        failed_ids). False if the job is gone or its lease was lost meanwhile.
+        """
+        with Session(bind=self._bind) as db:
+            job = db.get(KeyRotationJob, job_id)
+            if job is None or job.owner != self.owner:
+                return False  # deleted, or lease lost (we stalled past KEY_ROTATION_LEASE_SECONDS)
+            if cursor is not None:
+                job.cursor = cursor
+                job.scanned += sum(counts.values())
+            job.rewrapped += counts[REWRAPPED]
+            job.current += counts[CURRENT]
+            job.skipped += counts[SKIPPED]
+            job.failed += counts[FAILED] - len(retried)
+            retried_set = set(retried)
+            failed_ids = [i for i in (job.failed_ids or []) if i not in retried_set]
+            for row_id, _ in errors:
+                if row_id not in failed_ids and len(failed_ids) < KEY_ROTATION_MAX_FAILED_IDS:
+                    failed_ids.append(row_id)
+            job.failed_ids = failed_ids
+            job.active_seconds = (job.active_seconds or 0.0) + elapsed
+            job.heartbeat_at = _utcnow()
+            if errors:
+                job.last_error = errors[-1][1]
+                logger.warning("Key rotation job %d: %d rows failed, e.g. %s", job_id, len(errors), errors[0][1])
+            db.commit()
+        return True
+
+    def _finish(self, job_id: int, status: str, error: Optional[str] = None) -> None:
+        self._rewrappers.pop(job_id, None)
+        with Session(bind=self._bind) as db:
+            job = db.get(KeyRotationJob, job_id)
+            if job is None:
+                return
+            job.status = status
+            job.finished_at = _utcnow()
+            job.owner = None
+            if error:
+                job.last_error = error
+            db.commit()
+            out = self._progress(job)
+        log = logger.warning if status != "done" else logger.info
+        log("Key rotation job %d (%s) %s: %d rewrapped, %d current, %d skipped, %d failed, %s/s",
+            job_id, out["target"], status, out["rewrapped"], out["current"], out["skipped"],
+            out["failed"], out["rewraps_per_second"])
+
+
+KEY_ROTATION = KeyRotation()
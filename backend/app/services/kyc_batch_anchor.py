@@ -0,0 +1,297 @@
+# app/services/kyc_batch_anchor.py
+"""
+Merkle-batched anchoring of KYC attestations.
+
+Instead of one anchorKyc transaction per submission, submit_kyc enqueues a leaf
+(keccak(abi.encode(subjectHash, cid))) as an `attestations` row with tx_hash NULL. A
+background flusher collects the queued rows of a window (KYC_BATCH_WINDOW_SECONDS, or
+earlier once KYC_BATCH_MAX_LEAVES are waiting), builds a Merkle tree, anchors only the root
+in one transaction and stores each row's inclusion proof in attestations.meta:
+
+    {"status": "pending" | "confirmed" | "failed", "leaf": "0x..", "merkle_root": "0x..",
+     "leaf_index": 3, "proof": ["0x..", ...], "batch_size": 17, ...submission meta}
+
+The queue is the table itself, so leaves survive restarts and a batch whose send fails (node
+down) is simply retried on the next window. A batch whose tx times out without a receipt is
+not rebuilt: unless its root is already on-chain it goes back to the queue as "resend" with
+the same root and proofs, so the leaves never end up under two anchored roots.
+"""
+
+from __future__ import annotations
+
+import datetime
+import functools
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from app.models.tourist_models import Attestation
+from app.services import blockchain_service
+from app.utils.merkle import MerkleTree, leaf_hash, to_bytes32, to_hex, verify_proof
+
+logger = logging.getLogger(__name__)
+
+KYC_ANCHOR_MODE = os.getenv("KYC_ANCHOR_MODE", "batch").lower()  # "batch" | "direct"
+KYC_BATCH_WINDOW_SECONDS = float(os.getenv("KYC_BATCH_WINDOW_SECONDS", "30"))
+KYC_BATCH_MAX_LEAVES = int(os.getenv("KYC_BATCH_MAX_LEAVES", "256"))
+
+_READY_BINDS: set = set()
+
+
+def _unsent(status: str):
+    """Filter for rows without a tx whose meta.status is `status` (evaluated in SQL, before any LIMIT)."""
+    return Attestation.tx_hash.is_(None), Attestation.meta["status"].as_string() == status
+
+
+def ensure_attestation_table(bind) -> None:
+    """
+    Create `attestations` if missing. create_all() never alters an existing table, so
+    columns/indexes added to the model later are added here as well.
+    """
+    if id(bind) in _READY_BINDS:
+        return
+    table = Attestation.__table__
+    table.create(bind=bind, checkfirst=True)
+    existing = {c["name"] for c in inspect(bind).get_columns(table.name)}
+    with bind.begin() as conn:
+        for col in table.columns:
+            if col.name not in existing:
+                conn.execute(text('ALTER TABLE %s ADD COLUMN %s %s' % (
+                    table.name, col.name, col.type.compile(dialect=bind.dialect))))
+    for idx in table.indexes:
+        idx.create(bind=bind, checkfirst=True)
+    _READY_BINDS.add(id(bind))
+
+
+class KycBatchAnchorer:
+    def __init__(self, window_seconds: float = KYC_BATCH_WINDOW_SECONDS, max_leaves: int = KYC_BATCH_MAX_LEAVES):
+        self.window_seconds = window_seconds
+        self.max_leaves = max_leaves
+        self._binds: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.batches_sent = 0
+        self.leaves_anchored = 0
+        self.send_failures = 0
+
+    # ----- producer side -----
+    def enqueue(self, db: Session, subject_id: str, cid: str, meta: Optional[Dict[str, Any]] = None) -> Attestation:
+        """Queue one (subject, cid) leaf. Returns the persisted (not yet anchored) row."""
+        bind = db.get_bind()
+        ensure_attestation_table(bind)
+        subject_hash = blockchain_service.subject_hash_hex(subject_id)
+        att = Attestation(
+            subject_hash=subject_hash,
+            ipfs_cid=cid,
+            tx_hash=None,
+            meta={**(meta or {}), "status": "queued", "leaf": to_hex(leaf_hash(subject_hash, cid))},
+        )
+        db.add(att)
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        db.refresh(att)
+
+        self.watch(bind)
+        if self._queued_count(bind) >= self.max_leaves:
+            self._wake.set()
+        return att
+
+    def watch(self, bind) -> None:
+        """Flush queued rows of this engine every window (also picks up leaves left by a restart)."""
+        ensure_attestation_table(bind)
+        with self._lock:
+            self._binds[id(bind)] = bind
+        self._ensure_thread()
+
+    def _queued_count(self, bind) -> int:
+        db = Session(bind=bind)
+        try:
+            return db.query(Attestation.id).filter(*_unsent("queued")).count()
+        finally:
+            db.close()
+
+    # ----- flusher -----
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="kyc-batch-anchor", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.window_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("KYC batch flush failed")
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Anchor everything queued right now (in batches of max_leaves). Returns batch summaries."""
+        with self._lock:
+            binds = list(self._binds.values())
+        out = []
+        with self._flush_lock:
+            for bind in binds:
+                while True:
+                    summary = self._flush_one(bind)
+                    if summary is None:
+                        break
+                    out.append(summary)
+                    if summary["leaf_count"] < self.max_leaves and not summary.get("resend"):
+                        break
+        return out
+
+    def _flush_one(self, bind) -> Optional[Dict[str, Any]]:
+        db = Session(bind=bind)
+        try:
+            resend = db.query(Attestation).filter(*_unsent("resend")).order_by(Attestation.id).first()
+            if resend is not None:
+                return self._resend_root(db, bind, resend.meta["merkle_root"])
+            rows = (
+                db.query(Attestation)
+                .filter(*_unsent("queued"))
+                .order_by(Attestation.id)
+                .limit(self.max_leaves)
+                .all()
+            )
+            if not rows:
+                return None
+
+            tree = MerkleTree([to_bytes32(r.meta["leaf"]) for r in rows])
+            root_hex = to_hex(tree.root)
+            for i, r in enumerate(rows):
+                r.meta = {
+                    **r.meta,
+                    "merkle_root": root_hex,
+                    "leaf_index": i,
+                    "proof": [to_hex(p) for p in tree.proof(i)],
+                    "batch_size": len(rows),
+                }
+            return self._send_root(db, bind, rows, root_hex, {"first_id": rows[0].id})
+        finally:
+            db.close()
+
+    def _resend_root(self, db: Session, bind, root_hex: str) -> Optional[Dict[str, Any]]:
+        """
+        Send an already built root again (its tx timed out). The leaves keep their root and
+        proofs: if the first tx is mined after all, the contract rejects the second one
+        ("Root already anchored") and either way exactly one anchor of that root exists.
+        """
+        rows = (
+            db.query(Attestation)
+            .filter(*_unsent("resend"), Attestation.meta["merkle_root"].as_string() == root_hex)
+            .order_by(Attestation.id)
+            .all()
+        )
+        return self._send_root(db, bind, rows, root_hex, {"first_id": rows[0].id, "resend": True})
+
+    def _send_root(self, db: Session, bind, rows: List[Attestation], root_hex: str,
+                   metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Anchor root_hex for rows (meta already holds their proofs) and mark them pending."""
+        try:
+            try:
+                tx_hash = blockchain_service.anchor_kyc_root(
+                    to_bytes32(root_hex), len(rows),
+                    {"batched_at": datetime.datetime.utcnow().isoformat(), **metadata},
+                )
+            except Exception as e:
+                db.rollback()
+                self.send_failures += 1
+                logger.warning("KYC root anchor deferred (%d leaves): %s", len(rows), e)
+                return None
+
+            issuer = blockchain_service.CHAIN.status().get("sender")
+            for r in rows:
+                r.tx_hash = tx_hash
+                r.issuer = issuer
+                r.meta = {**r.meta, "status": "pending"}
+            db.commit()
+            ids = [r.id for r in rows]
+        except Exception:
+            db.rollback()
+            raise
+
+        self.batches_sent += 1
+        self.leaves_anchored += len(ids)
+        logger.info("Anchored KYC root %s for %d leaves tx=%s", root_hex, len(ids), tx_hash)
+        blockchain_service.on_tx_receipt(tx_hash, functools.partial(self._on_receipt, bind, ids, root_hex))
+        return {"root": root_hex, "leaf_count": len(ids), "tx_hash": tx_hash, "resend": bool(metadata.get("resend"))}
+
+    @staticmethod
+    def _root_anchored(root_hex: str) -> Optional[bool]:
+        """Whether the contract holds root_hex (None when the node cannot be asked)."""
+        try:
+            return blockchain_service.is_kyc_root_anchored(to_bytes32(root_hex))
+        except Exception as e:
+            logger.warning("Cannot check KYC root %s on-chain: %s", root_hex, e)
+            return None
+
+    def _on_receipt(self, bind, ids: List[int], root_hex: str, tx_hash: str, receipt: Optional[Dict[str, Any]],
+                    error: Optional[str]) -> None:
+        # a timed-out or reverted tx may still leave the root on-chain (the first send mined late)
+        anchored = self._root_anchored(root_hex) if (receipt is None or error) else None
+        db = Session(bind=bind)
+        try:
+            for r in db.query(Attestation).filter(Attestation.id.in_(ids)).all():
+                meta = dict(r.meta or {})
+                if anchored:
+                    meta.update(status="confirmed", note="root found on-chain after: %s" % error)
+                elif receipt is None:
+                    # never mined (dropped / timed out): send the same root again; a new root
+                    # over these leaves could end up anchored next to this one
+                    r.tx_hash = None
+                    meta.update(status="resend", last_error=error)
+                elif error:
+                    meta.update(status="failed", error=error)
+                else:
+                    meta.update(status="confirmed", block_number=receipt.get("blockNumber"))
+                r.meta = meta
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to write back KYC batch receipt %s", tx_hash)
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": KYC_ANCHOR_MODE,
+            "window_seconds": self.window_seconds,
+            "max_leaves": self.max_leaves,
+            "batches_sent": self.batches_sent,
+            "leaves_anchored": self.leaves_anchored,
+            "send_failures": self.send_failures,
+        }
+
+
+def verify_attestation_row(att: Attestation) -> Dict[str, Any]:
+    """Recompute the leaf of a stored attestation and check its proof against the stored root."""
+    meta = att.meta or {}
+    leaf = to_hex(leaf_hash(att.subject_hash, att.ipfs_cid))
+    root = meta.get("merkle_root")
+    proof = meta.get("proof") or []
+    return {
+        "attestation_id": att.id,
+        "subject_hash": att.subject_hash,
+        "cid": att.ipfs_cid,
+        "leaf": leaf,
+        "root": root,
+        "proof": proof,
+        "status": meta.get("status"),
+        "tx_hash": att.tx_hash,
+        "included": bool(root) and leaf == meta.get("leaf") and verify_proof(leaf, proof, root),
+    }
+
+
+KYC_ANCHORER = KycBatchAnchorer()
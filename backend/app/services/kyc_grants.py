@@ -0,0 +1,202 @@
+# app/services/kyc_grants.py
+"""
+KYC access grants: a grantee (police station, responder unit) gets each record's data key
+wrapped with its RSA public key (KYCAccessGrant.encrypted_key_for_grantee, SHA-1 OAEP like
+every rsa-grantee-pem wrap).
+
+    grant_access(db, kyc_id, address, pem)            one record (POST /kyc/grant)
+    GRANT_JOBS.start(db, address, pem, ...)           many records in the background
+                                                      (POST /kyc/grant/batch, progress via GET)
+
+A batch works through the selected records in chunks of KYC_GRANT_CHUNK: every key of a chunk
+is submitted to the crypto worker pool at once (unwrapped with the cached server / master key,
+wrapped with the grantee key, parsed once per PEM), and the chunk's grant rows go in with one
+bulk insert and commit. Records the grantee already holds a grant for are skipped, so
+re-running a batch after a failure only does the missing ones.
+
+Job progress lives in memory in the process running the job (last KYC_GRANT_JOBS_KEPT jobs).
+"""
+
+from __future__ import annotations
+
+import base64
+import datetime
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.models.kyc_model import KYCRecord
+from app.models.tourist_models import KYCAccessGrant
+from app.services import crypto_service
+from app.services.crypto_worker import CRYPTO
+
+logger = logging.getLogger(__name__)
+
+KYC_GRANT_CHUNK = int(os.getenv("KYC_GRANT_CHUNK", "500"))
+KYC_GRANT_JOBS_KEPT = int(os.getenv("KYC_GRANT_JOBS_KEPT", "100"))
+KYC_GRANT_MAX_ERRORS = 20  # per job, kept for the progress report
+
+GRANTEE_META = {"method": "rsa-grantee-pem"}
+
+_READY_BINDS: set = set()
+
+
+def ensure_grant_table(bind) -> None:
+    if id(bind) in _READY_BINDS:
+        return
+    KYCAccessGrant.__table__.create(bind=bind, checkfirst=True)
+    _READY_BINDS.add(id(bind))
+
+
+def _grantee_pem(grantee_pubkey_pem) -> bytes:
+    """PEM bytes once they parse as an RSA public key (ValueError otherwise); the key stays cached."""
+    pem = grantee_pubkey_pem.encode("utf-8") if isinstance(grantee_pubkey_pem, str) else grantee_pubkey_pem
+    try:
+        crypto_service.public_key_from_pem(pem)
+    except Exception:
+        raise ValueError("Invalid grantee public key PEM") from None
+    return pem
+
+
+def _actor_name(actor: Optional[Dict[str, Any]]) -> Optional[str]:
+    return actor.get("sub") if actor else None
+
+
+def _grant_chunk(db: Session, records: Sequence[KYCRecord], grantee_address: str, pem: bytes,
+                 created_by: Optional[str]) -> Dict[str, Any]:
+    """Rewrap the keys of records for the grantee and bulk insert the grants (one commit)."""
+    already = {
+        row[0]
+        for row in db.query(KYCAccessGrant.kyc_id).filter(
+            KYCAccessGrant.grantee_address == grantee_address,
+            KYCAccessGrant.kyc_id.in_([r.id for r in records]),
+        )
+    }
+    todo = [r for r in records if r.id not in already]
+    futures = [CRYPTO.submit("rewrap_kyc_key_for_pem", r.encrypted_key, r.key_meta, pem) for r in todo]
+    now = datetime.datetime.utcnow()
+    rows: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    for rec, fut in zip(todo, futures):
+        try:
+            wrapped = fut.result()
+        except Exception as e:
+            logger.warning("Grant rewrap failed for kyc_id=%s: %s", rec.id, e)
+            errors.append({"kyc_id": rec.id, "error": str(e)})
+            continue
+        rows.append({
+            "kyc_id": rec.id,
+            "grantee_address": grantee_address,
+            "encrypted_key_for_grantee": base64.b64encode(wrapped).decode("utf-8"),
+            "grantee_pubkey_meta": GRANTEE_META,
+            "created_at": now,
+            "created_by": created_by,
+        })
+    if rows:
+        db.bulk_insert_mappings(KYCAccessGrant, rows)
+        db.commit()
+    return {"granted": len(rows), "skipped": len(already), "failed": len(errors), "errors": errors}
+
+
+def grant_access(db: Session, kyc_id: int, grantee_address: str, grantee_pubkey_pem: str,
+                 actor: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Grant one record; ValueError if it does not exist or its key cannot be rewrapped."""
+    pem = _grantee_pem(grantee_pubkey_pem)
+    rec = db.query(KYCRecord).filter(KYCRecord.id == kyc_id).first()
+    if not rec:
+        raise ValueError("KYC record not found")
+    ensure_grant_table(db.get_bind())
+    out = _grant_chunk(db, [rec], grantee_address, pem, _actor_name(actor))
+    if out["failed"]:
+        raise ValueError("Cannot rewrap key of KYC record %d: %s" % (kyc_id, out["errors"][0]["error"]))
+    return out
+
+
+class GrantBatchJobs:
+    def __init__(self, chunk: int = KYC_GRANT_CHUNK, kept: int = KYC_GRANT_JOBS_KEPT):
+        self.chunk = chunk
+        self.kept = kept
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def start(self, db: Session, grantee_address: str, grantee_pubkey_pem: str,
+              kyc_ids: Optional[Sequence[int]] = None, statuses: Optional[Sequence[str]] = None,
+              actor: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Select the records (kyc_ids, else every record in statuses) and grant them in a
+        background thread. Returns the job's progress dict; ValueError on a bad PEM.
+        """
+        pem = _grantee_pem(grantee_pubkey_pem)
+        q = db.query(KYCRecord.id)
+        if kyc_ids:
+            q = q.filter(KYCRecord.id.in_(list(kyc_ids)))
+        elif statuses:
+            q = q.filter(KYCRecord.status.in_(list(statuses)))
+        ids = [row[0] for row in q.order_by(KYCRecord.id)]
+        bind = db.get_bind()
+        ensure_grant_table(bind)
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "grantee_address": grantee_address,
+            "status": "running",
+            "total": len(ids),
+            "processed": 0,
+            "granted": 0,
+            "skipped": 0,
+            "failed": 0,
+            "errors": [],
+            "created_by": _actor_name(actor),
+            "started_at": datetime.datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "elapsed_seconds": 0.0,
+        }
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            while len(self._jobs) > self.kept:
+                self._jobs.pop(next(iter(self._jobs)))
+        threading.Thread(
+            target=self._run, args=(job, bind, ids, pem), name="kyc-grant-%s" % job["job_id"][:8], daemon=True
+        ).start()
+        return dict(job)
+
+    def _run(self, job: Dict[str, Any], bind, ids: List[int], pem: bytes) -> None:
+        t0 = time.monotonic()
+        db = sessionmaker(bind=bind, autocommit=False, autoflush=False)()
+        try:
+            for i in range(0, len(ids), self.chunk):
+                records = db.query(KYCRecord).filter(KYCRecord.id.in_(ids[i:i + self.chunk])).all()
+                out = _grant_chunk(db, records, job["grantee_address"], pem, job["created_by"])
+                db.expunge_all()
+                with self._lock:
+                    job["processed"] = min(len(ids), i + self.chunk)
+                    for k in ("granted", "skipped", "failed"):
+                        job[k] += out[k]
+                    job["errors"] = (job["errors"] + out["errors"])[:KYC_GRANT_MAX_ERRORS]
+                    job["elapsed_seconds"] = round(time.monotonic() - t0, 3)
+            job["status"] = "completed"
+        except Exception as e:
+            logger.exception("KYC grant batch %s failed", job["job_id"])
+            db.rollback()
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            db.close()
+            with self._lock:
+                job["finished_at"] = datetime.datetime.utcnow().isoformat()
+                job["elapsed_seconds"] = round(time.monotonic() - t0, 3)
+        logger.info("KYC grant batch %s for %s: %s, %d granted, %d skipped, %d failed in %.1fs",
+                    job["job_id"], job["grantee_address"], job["status"],
+                    job["granted"], job["skipped"], job["failed"], job["elapsed_seconds"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job, errors=list(job["errors"])) if job else None
+
+
+GRANT_JOBS = GrantBatchJobs()
@@ -12,18 +12,29 @@ Responsibilities:
 """
 
 from __future__ import annotations
-from typing import Dict, Optional, Any
+from typing import Dict, Iterator, Optional, Any, Tuple
 from datetime import datetime
 import json
 import base64
 import os
 import logging
+import functools
+import itertools
 
 from sqlalchemy.orm import Session
 
 from app.models.kyc_model import KYCRecord
-from app.utils.kyc_utils import encrypt_blob, upload_to_ipfs_bytes, download_from_ipfs, decrypt_blob
-from app.services import blockchain_service
+from app.models.tourist_models import Attestation
+from app.services.kyc_batch_anchor import KYC_ANCHOR_MODE, KYC_ANCHORER, ensure_attestation_table
+from app.utils.kyc_utils import (
+    upload_to_ipfs_bytes, download_from_ipfs, download_stream_from_ipfs,
+    new_wrapped_data_key, unwrap_stored_key, upload_stream_to_ipfs,
+)
+from app.utils import stream_crypto
+from app.services import blockchain_service, crypto_service
+from app.services.crypto_worker import CRYPTO, CryptoBusyError
+from app.services.key_registry import KEYS, SERVER_PUBLIC
+from app.services.kyc_grants import grant_access  # noqa: F401  (POST /kyc/grant)
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +46,9 @@ STATE_KYC_APPROVED = "KYC_APPROVED"
 STATE_KYC_REJECTED = "KYC_REJECTED"
 STATE_DIGITAL_ID_ISSUED = "DIGITAL_ID_ISSUED"
 
+# plaintext bytes per AES-GCM chunk for streamed file uploads (see stream_crypto)
+KYC_STREAM_CHUNK_BYTES = int(os.getenv("KYC_STREAM_CHUNK_BYTES", str(1024 * 1024)))
+
 
 # ----- Small helpers -----
 def _normalize_phone(phone: str) -> str:
@@ -55,7 +69,7 @@ def _wrap_key_for_storage(raw_sym_key: bytes) -> Dict[str, str]:
     """
     Wrap the raw symmetric key for storage.
     Preferred: use KMS (AWS/GCP/Azure) configured via env.
-    Fallback: use SERVER_PUBLIC_KEY_PEM environment variable (RSA PEM).
+    Fallback: the server RSA public key (SERVER_PUBLIC_KEY_PATH or SERVER_PUBLIC_KEY_PEM).
     Last-resort (DEV ONLY): store base64 of the symmetric key with method 'base64-dev'.
     Returns: { "encrypted_key_b64": str, "key_meta": json-string-or-dict }
     """
@@ -67,22 +81,16 @@ def _wrap_key_for_storage(raw_sym_key: bytes) -> Dict[str, str]:
         logger.warning("KMS_PROVIDER is set to %s but KMS wrapping is not implemented in this code. Configure KMS integration.", kms_provider)
         # fallthrough to RSA env fallback
 
-    server_pub_pem = os.getenv("SERVER_PUBLIC_KEY_PEM")
-    if server_pub_pem:
+    server_pub = KEYS.get(SERVER_PUBLIC)  # parsed once, reloaded on change
+    if server_pub is not None:
         try:
-            # load and encrypt with RSA public key
-            from cryptography.hazmat.primitives import serialization
-            from cryptography.hazmat.primitives.asymmetric import padding
-            from cryptography.hazmat.primitives import hashes
-
-            pub = serialization.load_pem_public_key(server_pub_pem.encode("utf-8"))
-            enc = pub.encrypt(
-                raw_sym_key,
-                padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None),
-            )
-            return {"encrypted_key_b64": _b64(enc), "key_meta": json.dumps({"method": "rsa-pem-env"})}
+            enc = crypto_service.rsa_oaep_encrypt(server_pub, raw_sym_key, crypto_service.OAEP_SHA256)
+            return {
+                "encrypted_key_b64": _b64(enc),
+                "key_meta": json.dumps({"method": "rsa-pem-env", "key_version": server_pub.version}),
+            }
         except Exception as e:
-            logger.exception("Failed to wrap symmetric key with SERVER_PUBLIC_KEY_PEM: %s", e)
+            logger.exception("Failed to wrap symmetric key with the server public key: %s", e)
             # fallthrough to dev fallback
 
     # DEV fallback - DO NOT use in production
@@ -134,12 +142,70 @@ def _sanitize_kyc_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     return k
 
 
+def _record_attestation(db: Session, subject_identifier: str, cid: str, tx_hash: str, meta: Dict[str, Any]) -> None:
+    """
+    Persist a pending `attestations` row for a submitted anchor tx; block data is written
+    back by _on_attestation_receipt once the receipt tracker sees it mined.
+    """
+    try:
+        bind = db.get_bind()
+        ensure_attestation_table(bind)
+        att = Attestation(
+            subject_hash=blockchain_service.subject_hash_hex(subject_identifier),
+            ipfs_cid=cid,
+            tx_hash=tx_hash,
+            issuer=blockchain_service.CHAIN.status().get("sender"),
+            meta={**meta, "status": "pending"},
+        )
+        db.add(att)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to record attestation for tx %s", tx_hash)
+        return
+    blockchain_service.on_tx_receipt(tx_hash, functools.partial(_on_attestation_receipt, bind, att.id))
+
+
+def _on_attestation_receipt(bind, attestation_id: int, tx_hash: str, receipt: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+    db = Session(bind=bind)
+    try:
+        att = db.get(Attestation, attestation_id)
+        if att is None:
+            return
+        meta = dict(att.meta or {})
+        if error:
+            meta.update(status="failed", error=error)
+        else:
+            meta.update(status="confirmed", block_number=receipt.get("blockNumber"), gas_used=receipt.get("gasUsed"))
+        att.meta = meta
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to write back receipt for attestation %s", attestation_id)
+    finally:
+        db.close()
+
+
+_MANIFEST_AAD = b"kyc-file-manifest"  # AAD of the encrypted filename/meta of an uploaded file
+
+
+def _key_meta_dict(key_meta: Any) -> Dict[str, Any]:
+    if isinstance(key_meta, str):
+        try:
+            key_meta = json.loads(key_meta)
+        except ValueError:
+            return {}
+    return key_meta if isinstance(key_meta, dict) else {}
+
+
 # ----- Public API -----
 def submit_kyc(db: Session, phone: str, kyc_payload: Dict[str, Any], actor: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Accept KYC details after OTP verification.
     - actor: the authenticated caller (optional)
-    Returns dict with { phone, state, kyc_id, ipfs_cid, tx_hash }.
+    Returns dict with { phone, state, kyc_id, ipfs_cid, tx_hash, attestation_id }.
+    In batch anchor mode tx_hash is None: the attestation is queued and its Merkle root
+    anchored later (see kyc_batch_anchor).
     """
     phone_norm = _normalize_phone(phone)
     if not phone_norm:
@@ -149,44 +215,99 @@ def submit_kyc(db: Session, phone: str, kyc_payload: Dict[str, Any], actor: Opti
     kyc = _sanitize_kyc_payload(kyc_payload)
     plaintext = json.dumps(kyc, ensure_ascii=False).encode("utf-8")
 
-    # Encrypt using utility (expected: ciphertext_b64, encrypted_key (wrapped or None), iv_b64, key_meta)
-    enc = encrypt_blob(plaintext)
+    # Encrypt using utility (expected: ciphertext bytes, encrypted_key (wrapped or None), iv bytes, key_meta),
+    # in the crypto worker pool
+    enc = CRYPTO.call("encrypt_blob_bytes", plaintext)
 
     # sanity checks
-    if "ciphertext_b64" not in enc:
-        logger.error("encrypt_blob did not return ciphertext_b64")
+    if not enc.get("ciphertext"):
+        logger.error("encrypt_blob_bytes did not return ciphertext")
         raise Exception("Encryption error")
 
-    ciphertext_bytes = base64.b64decode(enc["ciphertext_b64"])
-
-    # Upload encrypted blob to IPFS
+    # Upload encrypted blob to IPFS (raw bytes, no base64 round trip)
     try:
-        cid = upload_to_ipfs_bytes(ciphertext_bytes)
+        cid = upload_to_ipfs_bytes(enc["ciphertext"])
     except Exception as e:
         logger.exception("IPFS upload failed: %s", e)
         raise Exception("Failed to upload encrypted blob") from e
 
-    # Determine encrypted_key to persist. Prefer what encrypt_blob returned (already wrapped).
+    # Determine encrypted_key to persist. Prefer what encrypt_blob_bytes returned (already wrapped).
     if enc.get("encrypted_key"):
         encrypted_key_b64 = enc["encrypted_key"]
         key_meta = enc.get("key_meta", "{}")
     else:
-        # If encrypt_blob exposed a raw symmetric key (raw_sym_key), wrap it now
+        # If encrypt_blob_bytes exposed a raw symmetric key (raw_sym_key), wrap it now
         raw_sym = enc.get("raw_sym_key")
         if not raw_sym:
-            logger.error("encrypt_blob returned no encrypted_key and no raw_sym_key; refusing to store unwrapped key")
+            logger.error("encrypt_blob_bytes returned no encrypted_key and no raw_sym_key; refusing to store unwrapped key")
             raise Exception("Internal encryption configuration error")
         wrapped = _wrap_key_for_storage(raw_sym)
         encrypted_key_b64 = wrapped["encrypted_key_b64"]
         key_meta = wrapped.get("key_meta", "{}")
 
-    iv_b64 = enc.get("iv_b64")
+    iv_b64 = _b64(enc["iv"])
+    return _anchor_and_persist(db, phone_norm, kyc.get("kyc_id") or phone_norm, cid, encrypted_key_b64, key_meta, iv_b64, actor)
+
+
+def submit_kyc_file(
+    db: Session,
+    phone: str,
+    fileobj,
+    size: int,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+    meta: Optional[str] = None,
+    actor: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Accept a KYC document upload (binary file, exactly `size` bytes readable from fileobj).
+    The file is encrypted in KYC_STREAM_CHUNK_BYTES chunks (stream_crypto) while it is streamed
+    into the IPFS upload, so memory stays at a few chunks whatever the file size.
+    Filename, content type and meta are encrypted with the same data key into key_meta["manifest"].
+    Returns the same dict as submit_kyc.
+    """
+    phone_norm = _normalize_phone(phone)
+    if not phone_norm:
+        raise ValueError("phone is required")
+
+    data_key, encrypted_key_b64, key_meta = new_wrapped_data_key()
+    manifest = json.dumps({"filename": filename, "content_type": content_type, "meta": meta or ""}).encode("utf-8")
+    nonce, sealed = crypto_service.aes_gcm_encrypt(data_key, manifest, aad=_MANIFEST_AAD)
+    key_meta = {
+        **key_meta,
+        "format": stream_crypto.FORMAT,
+        "chunk_size": KYC_STREAM_CHUNK_BYTES,
+        "size": size,
+        "manifest": _b64(nonce + sealed),
+    }
+
+    try:
+        cid = upload_stream_to_ipfs(
+            stream_crypto.encrypt_stream(data_key, fileobj, KYC_STREAM_CHUNK_BYTES),
+            stream_crypto.encrypted_size(size, KYC_STREAM_CHUNK_BYTES),
+        )
+    except Exception as e:
+        logger.exception("IPFS upload failed: %s", e)
+        raise Exception("Failed to upload encrypted blob") from e
+
+    return _anchor_and_persist(db, phone_norm, phone_norm, cid, encrypted_key_b64, key_meta, None, actor)
 
+
+def _anchor_and_persist(
+    db: Session,
+    phone_norm: str,
+    subject_identifier: str,
+    cid: str,
+    encrypted_key_b64: str,
+    key_meta: Any,
+    iv_b64: Optional[str],
+    actor: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
     # Anchor to blockchain — only anchor subject hash and CID; do NOT put PII on-chain.
     tx_hash = None
+    attestation_id = None
     try:
         # blockchain_service.subject_hash should exist and perform consistent hashing
-        subject_identifier = kyc.get("kyc_id") or phone_norm
         try:
             subj_hash = blockchain_service.subject_hash(subject_identifier)
         except AttributeError:
@@ -194,8 +315,13 @@ def submit_kyc(db: Session, phone: str, kyc_payload: Dict[str, Any], actor: Opti
             subj_hash = subject_identifier
         minimal_meta = {"submitted_at": datetime.utcnow().isoformat()}
         # attempt to register on chain (not required)
-        if hasattr(blockchain_service, "register_kyc_attestation_on_chain"):
+        if KYC_ANCHOR_MODE == "batch":
+            # queued as a Merkle leaf; the root is anchored per window (tx_hash follows later)
+            attestation_id = KYC_ANCHORER.enqueue(db, subj_hash, cid, minimal_meta).id
+        elif hasattr(blockchain_service, "register_kyc_attestation_on_chain"):
             tx_hash = blockchain_service.register_kyc_attestation_on_chain(subject_id=subj_hash, ipfs_cid=cid, metadata=minimal_meta)
+            if tx_hash:
+                _record_attestation(db, subj_hash, cid, tx_hash, minimal_meta)
     except Exception:
         logger.exception("Blockchain anchoring failed — continuing without tx_hash")
 
@@ -225,6 +351,7 @@ def submit_kyc(db: Session, phone: str, kyc_payload: Dict[str, Any], actor: Opti
         "kyc_id": rec.id,
         "ipfs_cid": cid,
         "tx_hash": tx_hash,
+        "attestation_id": attestation_id,
     }
 
 
@@ -262,9 +389,9 @@ def decide_kyc(db: Session, kyc_id: int, approved: bool, reviewer: str, reason:
     return rec.status
 
 
-def get_kyc(db: Session, kyc_id: int, actor: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+def _readable_record(db: Session, kyc_id: int, actor: Optional[Dict[str, Any]]) -> KYCRecord:
     """
-    Return decrypted KYC payload. Only allowed for:
+    The record, if actor may read it:
      - actor.role in ('verifier','admin'), OR
      - actor is the owner (actor contains phone or sub matching the record)
     """
@@ -283,6 +410,23 @@ def get_kyc(db: Session, kyc_id: int, actor: Optional[Dict[str, Any]] = None) ->
 
     if not allowed:
         raise ValueError("Forbidden: insufficient privileges")
+    return rec
+
+
+def is_kyc_file(db: Session, kyc_id: int) -> bool:
+    """Whether the record is a submit_kyc_file upload (read it with open_kyc_file)."""
+    rec = db.query(KYCRecord).filter(KYCRecord.id == kyc_id).first()
+    return rec is not None and _key_meta_dict(rec.key_meta).get("format") == stream_crypto.FORMAT
+
+
+def get_kyc(db: Session, kyc_id: int, actor: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Return the decrypted KYC payload of a submit_kyc record (see _readable_record for who may).
+    File uploads are not loaded into memory here: stream them with open_kyc_file.
+    """
+    rec = _readable_record(db, kyc_id, actor)
+    if _key_meta_dict(rec.key_meta).get("format") == stream_crypto.FORMAT:
+        raise ValueError("KYC record %d is a file upload; use open_kyc_file" % kyc_id)
 
     # Download encrypted blob from IPFS
     try:
@@ -291,24 +435,61 @@ def get_kyc(db: Session, kyc_id: int, actor: Optional[Dict[str, Any]] = None) ->
         logger.exception("Failed to download encrypted blob from IPFS")
         raise Exception("Failed to retrieve KYC blob")
 
-    ciphertext_b64 = base64.b64encode(ciphertext_bytes).decode("utf-8")
-    iv = rec.iv
-    encrypted_key = rec.encrypted_key
-
-    # decrypt_blob util should unwrap the encrypted_key (via KMS or server key) and AES-decrypt
+    # decrypt_blob_bytes unwraps the encrypted_key (via KMS or server key) and AES-decrypts the
+    # downloaded bytes as they are
     try:
-        plaintext_bytes = decrypt_blob(ciphertext_b64, iv, encrypted_key)
+        plaintext_bytes = CRYPTO.call(
+            "decrypt_blob_bytes", ciphertext_bytes, _unb64(rec.iv), rec.encrypted_key, rec.key_meta
+        )
+    except CryptoBusyError:
+        raise
     except Exception:
         logger.exception("Decryption failed for KYC blob")
         raise Exception("Failed to decrypt KYC blob")
 
-    # try to parse JSON, otherwise return raw base64
+    # try to parse JSON (straight from bytes), otherwise return raw base64
     try:
-        return json.loads(plaintext_bytes.decode("utf-8"))
+        return json.loads(plaintext_bytes)
     except Exception:
         return {"content_bytes_b64": _b64(plaintext_bytes)}
 
 
+def open_kyc_file(db: Session, kyc_id: int, actor: Optional[Dict[str, Any]] = None
+                  ) -> Tuple[Dict[str, Any], Iterator[bytes]]:
+    """
+    A submit_kyc_file record as (manifest {filename, content_type, meta, size}, plaintext chunks).
+    The blob is streamed from IPFS and opened one KYS1 chunk at a time in the crypto worker
+    pool, so memory stays at a few chunks whatever the file size. The first chunk is decrypted
+    before returning: a missing blob, a wrong key or a tampered header fails here, not halfway
+    through a response. Later tampering or truncation raises ValueError from the iterator.
+    """
+    rec = _readable_record(db, kyc_id, actor)
+    key_meta = _key_meta_dict(rec.key_meta)
+    if key_meta.get("format") != stream_crypto.FORMAT:
+        raise ValueError("KYC record %d is not a file upload" % kyc_id)
+    try:
+        data_key = unwrap_stored_key(rec.encrypted_key, key_meta)
+        sealed = _unb64(key_meta["manifest"])
+        manifest = json.loads(crypto_service.aes_gcm_decrypt(data_key, sealed[:12], sealed[12:], aad=_MANIFEST_AAD))
+    except Exception:
+        logger.exception("Decryption failed for KYC file %s", rec.id)
+        raise Exception("Failed to decrypt KYC blob")
+    chunk_bytes = int(key_meta.get("chunk_size") or KYC_STREAM_CHUNK_BYTES)
+    plain = stream_crypto.decrypt_stream(
+        data_key,
+        download_stream_from_ipfs(rec.ipfs_cid, chunk_bytes),
+        functools.partial(CRYPTO.call, "aes_gcm_decrypt"),
+    )
+    try:
+        first = next(plain)
+    except CryptoBusyError:
+        raise
+    except Exception:
+        logger.exception("Failed to stream KYC file %s", rec.id)
+        raise Exception("Failed to retrieve KYC blob")
+    return {**manifest, "size": key_meta.get("size")}, itertools.chain([first], plain)
+
+
 def get_state(db: Session, kyc_id: int) -> str:
     """Return current KYC state."""
     rec = db.query(KYCRecord).filter(KYCRecord.id == kyc_id).first()
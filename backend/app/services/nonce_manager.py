@@ -0,0 +1,174 @@
+# app/services/nonce_manager.py
+"""
+Locally tracked transaction nonces for the backend's sender account.
+
+Without this every transaction asked the node for get_transaction_count(sender) first: one
+extra RPC per tx, and concurrent background anchors read the same value and collided
+("nonce too low" / "replacement transaction underpriced").
+
+NonceManager seeds itself once from the node's *pending* count, then hands nonces out under
+a lock. Callers report the outcome of each send:
+    nonce = NONCES.allocate(w3, sender)
+    try:
+        send(...)
+    except Exception as e:
+        NONCES.release(sender, nonce, e)   # failed before the node accepted it
+        raise
+    NONCES.confirm(sender, nonce)
+
+A released nonce leaves a gap that would stall every later tx, so it is handed out again
+before the counter moves on. Nonce errors from the node ("nonce too low", "already known")
+trigger a resync from the pending count.
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_NONCE_ERROR_MARKERS = (
+    "nonce too low",
+    "nonce too high",
+    "invalid nonce",
+    "invalid transaction nonce",
+    "already known",
+    "known transaction",
+    "replacement transaction underpriced",
+    "the tx doesn't have the correct nonce",
+)
+
+
+def is_nonce_error(exc: BaseException) -> bool:
+    msg = str(exc).lower()
+    return any(m in msg for m in _NONCE_ERROR_MARKERS)
+
+
+class _SenderState:
+    __slots__ = ("next_nonce", "released", "in_flight")
+
+    def __init__(self, next_nonce: int):
+        self.next_nonce = next_nonce
+        self.released: List[int] = []  # min-heap of nonces to reuse (gaps)
+        self.in_flight: set = set()
+
+
+class NonceManager:
+    def __init__(self):
+        self._senders: Dict[str, _SenderState] = {}
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.resyncs = 0
+        self.gaps_filled = 0
+
+    def _seed(self, w3: Any, sender: str) -> int:
+        """Node's pending count. Called without holding _lock: a slow node must not block other senders."""
+        return int(w3.eth.get_transaction_count(sender, "pending"))
+
+    def _take(self, st: _SenderState) -> int:
+        if st.released:
+            nonce = heapq.heappop(st.released)
+            self.gaps_filled += 1
+        else:
+            nonce = st.next_nonce
+            st.next_nonce += 1
+        st.in_flight.add(nonce)
+        self.allocated += 1
+        return nonce
+
+    def allocate(self, w3: Any, sender: str) -> int:
+        """Return the next nonce for sender. Only the first call per sender costs an RPC."""
+        with self._lock:
+            st = self._senders.get(sender)
+            if st is not None:
+                return self._take(st)
+        seeded = self._seed(w3, sender)
+        with self._lock:
+            st = self._senders.get(sender)
+            if st is None:  # unless a concurrent first call installed its seed meanwhile
+                st = self._senders[sender] = _SenderState(seeded)
+                logger.info("Seeded nonce for %s at %d", sender, st.next_nonce)
+            return self._take(st)
+
+    def confirm(self, sender: str, nonce: int) -> None:
+        """The node accepted the transaction carrying this nonce."""
+        with self._lock:
+            st = self._senders.get(sender)
+            if st is not None:
+                st.in_flight.discard(nonce)
+
+    def release(self, sender: str, nonce: int, error: Optional[BaseException] = None) -> None:
+        """
+        The send failed. Nonce errors mean our counter is off: drop local state so the next
+        allocate() re-seeds from the node. Otherwise the nonce was never consumed and is
+        queued for reuse so later transactions do not wait behind a gap.
+        """
+        with self._lock:
+            st = self._senders.get(sender)
+            if st is None:
+                return
+            st.in_flight.discard(nonce)
+            if error is not None and is_nonce_error(error):
+                logger.warning("Nonce error for %s at %d (%s); resyncing", sender, nonce, error)
+                del self._senders[sender]
+                self.resyncs += 1
+                return
+            if nonce == st.next_nonce - 1:
+                st.next_nonce -= 1  # top of the range: just rewind
+            else:
+                heapq.heappush(st.released, nonce)
+
+    def resync(self, w3: Any, sender: str) -> int:
+        """Re-read the pending count from the node (e.g. after an external tx from the same key)."""
+        seeded = self._seed(w3, sender)
+        with self._lock:
+            st = _SenderState(seeded)
+            self._senders[sender] = st
+            self.resyncs += 1
+            return st.next_nonce
+
+    def reconcile(self, w3: Any, sender: str) -> None:
+        """
+        Gap check while idle: with nothing in flight, the node's pending count must equal our
+        next nonce. A mismatch means a tx was dropped or sent from elsewhere; adopt the node's view.
+        """
+        with self._lock:
+            st = self._senders.get(sender)
+            if st is None or st.in_flight or st.released:
+                return
+            local_next = st.next_nonce
+        node_next = self._seed(w3, sender)
+        with self._lock:
+            # only if nothing was allocated, released or resynced while the node was asked
+            if self._senders.get(sender) is not st or st.in_flight or st.released or st.next_nonce != local_next:
+                return
+            if node_next != local_next:
+                logger.warning("Nonce drift for %s: local=%d node=%d; resyncing", sender, local_next, node_next)
+                self._senders[sender] = _SenderState(node_next)
+                self.resyncs += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._senders.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "allocated": self.allocated,
+                "resyncs": self.resyncs,
+                "gaps_filled": self.gaps_filled,
+                "senders": {
+                    s: {
+                        "next_nonce": st.next_nonce,
+                        "in_flight": len(st.in_flight),
+                        "gaps": len(st.released),
+                    }
+                    for s, st in self._senders.items()
+                },
+            }
+
+
+NONCES = NonceManager()
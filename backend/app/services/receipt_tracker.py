@@ -0,0 +1,266 @@
+# app/services/receipt_tracker.py
+"""
+Submit-now, confirm-later tracking of transaction receipts.
+
+blockchain_service sends a transaction and hands its hash to RECEIPTS.track(); the caller
+returns immediately. One daemon thread polls every pending hash per cycle: over HTTP the
+lookups go out as a single JSON-RPC batch (one round trip for N receipts), other providers
+(eth-tester, IPC) fall back to one call per hash. When a receipt shows up, or the hash times
+out, the callbacks registered for it run on the poller thread:
+
+    on_receipt(tx_hash, receipt_or_None, error_or_None)
+
+receipt is a plain dict (txHash, blockNumber, blockHash, status, gasUsed). Callbacks should
+be short (a DB update); exceptions are logged and swallowed.
+
+Callers usually persist the tx hash first and only then call add_callback(), so a fast
+receipt cannot race the row it updates. Recently resolved hashes are remembered, and a
+callback added after resolution runs immediately.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_POLL_INTERVAL_SECONDS = float(os.getenv("RECEIPT_POLL_INTERVAL_SECONDS", "1"))
+RECEIPT_TIMEOUT_SECONDS = float(os.getenv("RECEIPT_TIMEOUT_SECONDS", "600"))
+RECEIPT_BATCH_SIZE = int(os.getenv("RECEIPT_BATCH_SIZE", "100"))
+RECEIPT_RESOLVED_MEMORY = int(os.getenv("RECEIPT_RESOLVED_MEMORY", "10000"))
+# ask local dev nodes (Ganache/Hardhat) to mine once per poll cycle while txs are pending
+CHAIN_FORCE_MINE = os.getenv("CHAIN_FORCE_MINE", "true").lower() in ("1", "true", "yes")
+
+ReceiptCallback = Callable[[str, Optional[Dict[str, Any]], Optional[str]], None]
+
+
+def _hex(v: Any) -> Optional[str]:
+    if v is None:
+        return None
+    if isinstance(v, (bytes, bytearray)):
+        return "0x" + bytes(v).hex()
+    s = v.hex() if hasattr(v, "hex") and not isinstance(v, str) else str(v)
+    return s if s.startswith("0x") else "0x" + s
+
+
+def _int(v: Any) -> Optional[int]:
+    if v is None:
+        return None
+    if isinstance(v, str):
+        return int(v, 16) if v.startswith("0x") else int(v)
+    return int(v)
+
+
+def normalize_receipt(r: Any) -> Dict[str, Any]:
+    """Receipt from web3 (AttributeDict) or raw JSON-RPC (hex strings) -> plain dict."""
+    get = r.get if hasattr(r, "get") else (lambda k, d=None: getattr(r, k, d))
+    return {
+        "txHash": _hex(get("transactionHash")),
+        "blockNumber": _int(get("blockNumber")),
+        "blockHash": _hex(get("blockHash")),
+        "status": _int(get("status")),
+        "gasUsed": _int(get("gasUsed")),
+    }
+
+
+@dataclass
+class _Pending:
+    w3: Any
+    callbacks: List[ReceiptCallback] = field(default_factory=list)
+    submitted_at: float = field(default_factory=time.monotonic)
+
+
+class ReceiptTracker:
+    def __init__(
+        self,
+        poll_interval: float = RECEIPT_POLL_INTERVAL_SECONDS,
+        timeout: float = RECEIPT_TIMEOUT_SECONDS,
+        batch_size: int = RECEIPT_BATCH_SIZE,
+        force_mine: bool = CHAIN_FORCE_MINE,
+    ):
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.force_mine = force_mine
+        self._pending: Dict[str, _Pending] = {}
+        self._resolved: "OrderedDict[str, tuple]" = OrderedDict()  # tx_hash -> (receipt, error)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._http = requests.Session()
+        self.confirmed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.polls = 0
+        self.rpc_round_trips = 0
+
+    # ----- public API -----
+    def track(self, w3: Any, tx_hash: str, on_receipt: Optional[ReceiptCallback] = None) -> None:
+        """Start tracking tx_hash (hex). Never blocks on the node."""
+        with self._lock:
+            entry = self._pending.get(tx_hash)
+            if entry is None:
+                entry = self._pending[tx_hash] = _Pending(w3)
+            if on_receipt is not None:
+                entry.callbacks.append(on_receipt)
+        self._ensure_thread()
+        self._wake.set()
+
+    def add_callback(self, tx_hash: str, on_receipt: ReceiptCallback) -> bool:
+        """
+        Register on_receipt for an already tracked hash. Runs it right away (on the calling
+        thread) when the hash resolved recently. Returns False for unknown hashes.
+        """
+        with self._lock:
+            entry = self._pending.get(tx_hash)
+            if entry is not None:
+                entry.callbacks.append(on_receipt)
+                return True
+            done = self._resolved.get(tx_hash)
+        if done is None:
+            return False
+        self._run_callback(on_receipt, tx_hash, *done)
+        return True
+
+    def wait(self, tx_hash: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until tx_hash resolves (for scripts/tests). Returns the receipt dict or None."""
+        done = threading.Event()
+        box: Dict[str, Any] = {}
+
+        def _cb(_h, receipt, _err):
+            box["receipt"] = receipt
+            done.set()
+
+        if not self.add_callback(tx_hash, _cb):
+            return None
+        done.wait(self.timeout if timeout is None else timeout)
+        return box.get("receipt")
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            oldest = min((p.submitted_at for p in self._pending.values()), default=None)
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "oldest_pending_seconds": round(time.monotonic() - oldest, 1) if oldest else 0.0,
+            "confirmed": self.confirmed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "polls": self.polls,
+            "rpc_round_trips": self.rpc_round_trips,
+        }
+
+    # ----- poller -----
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="receipt-tracker", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            with self._lock:
+                if not self._pending:
+                    continue
+                by_w3: Dict[int, tuple] = {}
+                for h, p in self._pending.items():
+                    by_w3.setdefault(id(p.w3), (p.w3, []))[1].append(h)
+            for w3, hashes in by_w3.values():
+                try:
+                    self._poll(w3, hashes)
+                except Exception:
+                    logger.exception("Receipt poll failed for %d pending txs", len(hashes))
+            self._expire()
+
+    def _poll(self, w3: Any, hashes: List[str]) -> None:
+        self.polls += 1
+        if self.force_mine:
+            try:
+                w3.provider.make_request("evm_mine", [])
+            except Exception:
+                logger.debug("evm_mine not available; disabling forced mining")
+                self.force_mine = False
+        for i in range(0, len(hashes), self.batch_size):
+            chunk = hashes[i:i + self.batch_size]
+            for h, receipt in self._fetch(w3, chunk).items():
+                self._resolve(h, receipt, None)
+
+    def _fetch(self, w3: Any, hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return {tx_hash: receipt} for the hashes that are mined."""
+        uri = getattr(w3.provider, "endpoint_uri", None)
+        if uri and str(uri).startswith("http"):
+            payload = [
+                {"jsonrpc": "2.0", "id": i, "method": "eth_getTransactionReceipt", "params": [h]}
+                for i, h in enumerate(hashes)
+            ]
+            resp = self._http.post(str(uri), json=payload, timeout=10)
+            self.rpc_round_trips += 1
+            resp.raise_for_status()
+            out = {}
+            for item in resp.json():
+                r = item.get("result")
+                if r:
+                    out[hashes[item["id"]]] = normalize_receipt(r)
+            return out
+
+        out = {}
+        for h in hashes:
+            self.rpc_round_trips += 1
+            try:
+                r = w3.eth.get_transaction_receipt(h)
+            except Exception:  # TransactionNotFound while pending
+                continue
+            if r:
+                out[h] = normalize_receipt(r)
+        return out
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            stale = [h for h, p in self._pending.items() if now - p.submitted_at > self.timeout]
+        for h in stale:
+            self._resolve(h, None, "receipt not found after %ds" % int(self.timeout))
+
+    def _resolve(self, tx_hash: str, receipt: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+        if receipt is not None and receipt.get("status") == 0:
+            error = "transaction reverted"
+        with self._lock:
+            entry = self._pending.pop(tx_hash, None)
+            if entry is None:
+                return
+            self._resolved[tx_hash] = (receipt, error)
+            while len(self._resolved) > RECEIPT_RESOLVED_MEMORY:
+                self._resolved.popitem(last=False)
+        if receipt is None:
+            self.timed_out += 1
+        elif error:
+            self.failed += 1
+        else:
+            self.confirmed += 1
+        for cb in entry.callbacks:
+            self._run_callback(cb, tx_hash, receipt, error)
+
+    @staticmethod
+    def _run_callback(cb: ReceiptCallback, tx_hash: str, receipt, error) -> None:
+        try:
+            cb(tx_hash, receipt, error)
+        except Exception:
+            logger.exception("Receipt callback failed for %s", tx_hash)
+
+
+RECEIPTS = ReceiptTracker()
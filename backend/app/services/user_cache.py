@@ -0,0 +1,103 @@
+# app/services/user_cache.py
+"""
+Identity-map cache for phone -> User lookups.
+
+Most tourists/alerts handlers start with
+    db.query(User).filter(User.phone_number == phone_norm).first()
+and clients often hit several of them back to back (verify-otp, kyc/submit, status polling).
+
+ - get_user_snapshot(): read-only view of the user served from a short-TTL cache
+   (no DB round trip on a hit). Use it for handlers that only read state/did.
+ - get_user(): attached ORM instance for handlers that write. Always one query: a
+   snapshot hit could only turn it into a primary-key get(), still a SELECT in a fresh
+   request session, so writers are not cached.
+
+Entries are invalidated after any commit that inserts, updates or deletes a User
+(SQLAlchemy session events), so writers never need to remember to do it.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models.tourist_models import User
+from app.services.cache_service import TTLCache
+
+USER_CACHE = TTLCache(
+    "user_by_phone",
+    ttl_seconds=float(os.getenv("USER_CACHE_TTL", "5")),
+    max_entries=int(os.getenv("USER_CACHE_MAX", "50000")),
+)
+
+_DIRTY_KEY = "_user_cache_dirty_phones"
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    phone_number: str
+    state: str
+    did: Optional[str]
+    full_name: Optional[str]
+    kyc_id: Optional[str]
+    device_id: Optional[str]
+
+    @classmethod
+    def from_user(cls, u: User) -> "UserSnapshot":
+        return cls(
+            id=u.id,
+            phone_number=u.phone_number,
+            state=u.state,
+            did=u.did,
+            full_name=u.full_name,
+            kyc_id=u.kyc_id,
+            device_id=u.device_id,
+        )
+
+
+def get_user(db: Session, phone_norm: str) -> Optional[User]:
+    """Return the attached User for a normalized phone (or None)."""
+    if not phone_norm:
+        return None
+    return db.query(User).filter(User.phone_number == phone_norm).first()
+
+
+def get_user_snapshot(db: Session, phone_norm: str) -> Optional[UserSnapshot]:
+    """Read-only snapshot for a normalized phone; served from cache when fresh."""
+    if not phone_norm:
+        return None
+
+    def _load():
+        u = db.query(User).filter(User.phone_number == phone_norm).first()
+        return UserSnapshot.from_user(u) if u is not None else None
+
+    return USER_CACHE.get_or_load(phone_norm, _load)
+
+
+# ----- invalidation on writes -----
+@event.listens_for(Session, "after_flush")
+def _collect_written_users(session, flush_context):
+    phones = session.info.setdefault(_DIRTY_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User) and obj.phone_number:
+            phones.add(obj.phone_number)
+    if phones:
+        # drop now as well, so nothing re-reads the stale snapshot mid-transaction
+        USER_CACHE.invalidate(*phones)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    phones = session.info.pop(_DIRTY_KEY, None)
+    if phones:
+        USER_CACHE.invalidate(*phones)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dirty_users(session):
+    session.info.pop(_DIRTY_KEY, None)
@@ -0,0 +1,40 @@
+# app/test/conftest.py
+"""
+Shared fixtures. Run from backend/: python -m pytest app/test
+
+Modules read their settings from the environment at import, so test defaults are set here,
+before anything under app/ is imported; nothing touches ./tourists.db.
+"""
+import base64
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, BACKEND)
+
+_TMP = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("TOURIST_DATABASE_URL", "sqlite:///%s" % os.path.join(_TMP, "tourists.db"))
+os.environ.setdefault("KYC_MASTER_KEY_BASE64", base64.b64encode(os.urandom(32)).decode())
+os.environ.setdefault("CRYPTO_WORKERS", "0")
+os.environ.setdefault("DIGITAL_ID_SECRET", "test-digital-id-secret")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A fresh SQLite file per test."""
+    eng = create_engine("sqlite:///%s" % (tmp_path / "test.db"), connect_args={"check_same_thread": False})
+    yield eng
+    eng.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+    yield session
+    session.close()
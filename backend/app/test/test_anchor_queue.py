@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app.models.tourist_models import AnchorJob, User
+from app.routes import tourists
+from app.services import anchor_queue, blockchain_service
+from app.services.anchor_queue import ANCHOR_JOBS
+
+
+@pytest.fixture
+def tdb():
+    AnchorJob.__table__.create(bind=tourists.engine, checkfirst=True)
+    db = tourists.SessionLocal()
+    yield db
+    db.query(AnchorJob).delete()
+    db.query(User).delete()
+    db.commit()
+    db.close()
+
+
+def _pending_user(db, phone, receipt=None):
+    u = User(phone_number=phone, full_name="T", state="registered_pending_onchain", receipt=receipt)
+    db.add(u)
+    db.commit()
+    return u
+
+
+def _jobs(db, user):
+    db.expire_all()
+    return db.query(AnchorJob).filter(AnchorJob.subject_id == user.id).order_by(AnchorJob.id).all()
+
+
+def test_requeue_uses_persisted_payload(tdb):
+    payload = {"full_name": "T", "kyc_id": "K1", "visitStart": "2026-01-01", "visitEnd": "2026-01-09",
+               "ipfs_cid": "QmA", "phone": "911"}
+    u = _pending_user(tdb, "911", receipt={"anchor_payload": payload})
+    assert tourists.requeue_pending_anchors() == 1
+    (job,) = _jobs(tdb, u)
+    assert job.status == "queued" and job.payload == payload
+    assert tourists.requeue_pending_anchors() == 0  # open job: not queued twice
+
+
+def test_requeue_skips_dead_and_unknown(tdb):
+    dead = _pending_user(tdb, "912")
+    tdb.add(AnchorJob(kind=tourists.ANCHOR_KIND_REGISTER, subject_id=dead.id, status="dead",
+                      attempts=1, payload={"phone": "912"}, last_error="transaction reverted"))
+    tdb.commit()
+    legacy = _pending_user(tdb, "913")  # registered before jobs existed: nothing to rebuild from
+    assert tourists.requeue_pending_anchors() == 0
+    assert [j.status for j in _jobs(tdb, dead)] == ["dead"]
+    assert _jobs(tdb, legacy) == []
+
+
+def test_requeue_resends_last_payload_of_finished_job(tdb):
+    u = _pending_user(tdb, "914")
+    tdb.add(AnchorJob(kind=tourists.ANCHOR_KIND_REGISTER, subject_id=u.id, status="done", attempts=1,
+                      payload={"phone": "914", "visitStart": "2026-02-01"}))
+    tdb.commit()
+    assert tourists.requeue_pending_anchors() == 1
+    assert _jobs(tdb, u)[-1].payload == {"phone": "914", "visitStart": "2026-02-01"}
+
+
+class _FakeHandle:
+    class w3:
+        class eth:
+            @staticmethod
+            def get_transaction(tx_hash):
+                return {"gas": 100000}
+
+
+@pytest.mark.parametrize("gas_used, status", [(99000, "queued"), (40000, "dead")])
+def test_out_of_gas_revert_is_retried(tdb, monkeypatch, gas_used, status):
+    monkeypatch.setattr(blockchain_service.CHAIN, "require", lambda: _FakeHandle)
+    monkeypatch.setattr(ANCHOR_JOBS, "_bind", tourists.engine)
+    job = AnchorJob(kind=tourists.ANCHOR_KIND_REGISTER, subject_id=1, status="submitted", attempts=1,
+                    tx_hash="0xabc", payload={})
+    tdb.add(job)
+    tdb.commit()
+    ANCHOR_JOBS._on_receipt(job.id, "0xabc", {"status": 0, "gasUsed": gas_used, "blockNumber": 5},
+                            "transaction reverted")
+    tdb.expire_all()
+    assert tdb.get(AnchorJob, job.id).status == status
+
+
+def test_recovered_receipt_updates_user(tdb, monkeypatch):
+    # a tx submitted by a previous process: only the job row knows about it
+    monkeypatch.setattr(blockchain_service.CHAIN, "require", lambda: _FakeHandle)
+    monkeypatch.setattr(ANCHOR_JOBS, "_bind", tourists.engine)
+    tracked = []
+    monkeypatch.setattr(anchor_queue.RECEIPTS, "track", lambda w3, tx_hash, cb: tracked.append(cb))
+    u = User(phone_number="915", full_name="T", state="registered_onchain", did="0xdef",
+             receipt={"txHash": "0xdef", "confirmed": False})
+    tdb.add(u)
+    tdb.commit()
+    tdb.add(AnchorJob(kind=tourists.ANCHOR_KIND_REGISTER, subject_id=u.id, status="submitted", attempts=1,
+                      tx_hash="0xdef", payload={}))
+    tdb.commit()
+
+    ANCHOR_JOBS._on_chain_ready(tourists.engine)
+    (cb,) = tracked
+    cb("0xdef", {"status": 1, "blockNumber": 7}, None)
+
+    assert [j.status for j in _jobs(tdb, u)] == ["done"]
+    user = tdb.get(User, u.id)
+    assert user.receipt["confirmed"] is True and user.receipt["blockNumber"] == 7
+
+
+def test_issue_did_keeps_anchor_payload(tdb):
+    u = _pending_user(tdb, "916", receipt={"anchor_payload": {"phone": "916"}, "onchain_error": "timeout"})
+    asyncio.run(tourists.issue_did_v2({"phone_number": "916"}, tdb))
+    tdb.expire_all()
+    receipt = tdb.get(User, u.id).receipt
+    assert receipt["anchor_payload"] == {"phone": "916"} and receipt["onchain_pending"] is True
+    assert "onchain_error" not in receipt
+    assert [j.kind for j in _jobs(tdb, u)] == [tourists.ANCHOR_KIND_ISSUE_DID]
@@ -0,0 +1,85 @@
+import pytest
+
+from app.models.tourist_models import Attestation, Base, ChainCheckpoint
+from app.services import chain_indexer
+from app.services.chain_indexer import INDEXER_SOURCE, ChainIndexer
+
+
+def _h(tag):
+    return bytes([tag]) * 32
+
+
+def _hex(tag):
+    return "0x" + _h(tag).hex()
+
+
+class _W3:
+    """eth.get_block(n)["hash"] from a {number: tag} map; unknown blocks raise like a node would."""
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.eth = self
+
+    def get_block(self, number):
+        if number not in self.blocks:
+            raise ValueError("block %d not found" % number)
+        return {"hash": _h(self.blocks[number])}
+
+
+@pytest.fixture
+def tables(engine):
+    Base.metadata.create_all(bind=engine)
+
+
+def _checkpoint(db, number, recent):
+    cp = ChainCheckpoint(name="t", block_number=number, block_hash=recent[-1][1], recent_blocks=recent)
+    db.add(cp)
+    db.commit()
+    return cp
+
+
+def _row(db, block, source=None):
+    row = Attestation(subject_hash="0x%064x" % block, ipfs_cid="Qm%d" % block, tx_hash="0x%x" % block,
+                      event_name="KycAnchored", block_number=block, block_hash=_hex(block), log_index=0,
+                      meta={"source": source} if source else {"status": "confirmed"})
+    db.add(row)
+    db.commit()
+    return row.id
+
+
+def test_no_reorg_keeps_checkpoint(tables, db):
+    cp = _checkpoint(db, 30, [[10, _hex(1)], [20, _hex(2)], [30, _hex(3)]])
+    idx = ChainIndexer("t")
+    assert idx._check_reorg(db, _W3({10: 1, 20: 2, 30: 3}), cp, head=40) is None
+    assert idx.reorgs == 0
+
+
+def test_reorg_rewinds_to_last_matching_block_and_drops_rows(tables, db):
+    cp = _checkpoint(db, 30, [[10, _hex(1)], [20, _hex(2)], [30, _hex(3)]])
+    below = _row(db, 8, INDEXER_SOURCE)
+    orphan = _row(db, 25, INDEXER_SOURCE)
+    own = _row(db, 26)  # written by the backend when it sent the tx
+
+    idx = ChainIndexer("t")
+    # blocks 20 and 30 were replaced; 10 is still canonical
+    assert idx._check_reorg(db, _W3({10: 1, 20: 7, 30: 8}), cp, head=31) == 10
+    db.expire_all()
+    cp = db.get(ChainCheckpoint, "t")
+    assert (cp.block_number, cp.block_hash, cp.recent_blocks) == (10, _hex(1), [[10, _hex(1)]])
+    assert db.get(Attestation, below).block_number == 8
+    assert db.get(Attestation, orphan) is None
+    kept = db.get(Attestation, own)
+    assert kept is not None and (kept.block_number, kept.block_hash, kept.log_index) == (None, None, None)
+    assert idx.reorgs == 1
+
+
+def test_reset_chain_rewinds_to_start(tables, db, monkeypatch):
+    monkeypatch.setattr(chain_indexer, "CHAIN_INDEXER_START_BLOCK", 0)
+    cp = _checkpoint(db, 30, [[20, _hex(2)], [30, _hex(3)]])
+    _row(db, 5, INDEXER_SOURCE)
+    # dev chain restarted: head is below the checkpoint and nothing recorded matches
+    assert ChainIndexer("t")._check_reorg(db, _W3({0: 9, 1: 9}), cp, head=1) == -1
+    db.expire_all()
+    cp = db.get(ChainCheckpoint, "t")
+    assert (cp.block_number, cp.block_hash, cp.recent_blocks) == (-1, None, [])
+    assert db.query(Attestation).count() == 0
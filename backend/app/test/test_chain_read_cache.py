@@ -0,0 +1,152 @@
+import pytest
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+
+from app.services.chain_read_cache import ChainReadCache
+
+_CODEC = Web3().codec
+
+
+class _Call:
+    def __init__(self, contract, fn_name, args):
+        self.contract, self.fn_name, self.args = contract, fn_name, args
+
+    def call(self, tx, block_identifier):
+        self.contract.calls.append((self.fn_name, self.args, block_identifier))
+        if self.args and self.args[0] == "revert":
+            raise ContractLogicError("execution reverted: unknown subject")
+        return "%s@%s" % (self.args[0], block_identifier)
+
+
+class _Contract:
+    """contract.functions[fn](*args).call() answering "<arg>@<block>", reverting for "revert"."""
+
+    address = "0x00000000000000000000000000000000000000aa"
+
+    def __init__(self):
+        self.calls = []
+
+    @property
+    def functions(self):
+        contract = self
+
+        class _Functions:
+            def __getitem__(self, fn_name):
+                return lambda *args: _Call(contract, fn_name, args)
+
+        return _Functions()
+
+    def get_function_by_name(self, fn_name):
+        class _Fn:
+            abi = {"name": fn_name, "outputs": [{"type": "uint256"}]}
+
+        return _Fn
+
+    def encodeABI(self, fn_name, args):
+        return "0x" + "00" * 4
+
+
+class _Chain:
+    sender_address = "0x00000000000000000000000000000000000000bb"
+
+    def __init__(self, endpoint_uri=None):
+        self.contract = _Contract()
+        self.w3 = type("W3", (), {})()
+        self.w3.codec = _CODEC
+        self.w3.provider = type("P", (), {"endpoint_uri": endpoint_uri})()
+        self.w3.eth = type("Eth", (), {"block_number": 10})()
+
+
+class _Resp:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+def _batch_chain(cache, body):
+    chain = _Chain("http://node:8545")
+    cache._http = type("Http", (), {"post": lambda self, uri, json, timeout: _Resp(body)})()
+    return chain
+
+
+def _ok(i, value):
+    return {"jsonrpc": "2.0", "id": i, "result": "0x" + _CODEC.encode(["uint256"], [value]).hex()}
+
+
+def test_batch_revert_is_returned_per_item():
+    cache = ChainReadCache(mode="ttl")
+    chain = _batch_chain(cache, [
+        _ok(0, 7),
+        {"jsonrpc": "2.0", "id": 1, "error": {"code": 3, "message": "execution reverted", "data": "0x"}},
+    ])
+    out = cache.call_many(chain, "count", [("a",), ("b",)], return_exceptions=True)
+    assert out[0] == 7 and isinstance(out[1], ContractLogicError)
+
+
+def test_batch_node_error_fails_the_read():
+    cache = ChainReadCache(mode="ttl")
+    chain = _batch_chain(cache, [
+        _ok(0, 7),
+        {"jsonrpc": "2.0", "id": 1, "error": {"code": -32005, "message": "limit exceeded"}},
+    ])
+    with pytest.raises(ValueError) as e:
+        cache.call_many(chain, "count", [("a",), ("b",)], return_exceptions=True)
+    assert not isinstance(e.value, ContractLogicError)
+
+
+def test_batch_rejected_as_a_whole():
+    cache = ChainReadCache(mode="ttl")
+    chain = _batch_chain(cache, {"jsonrpc": "2.0", "id": None,
+                                 "error": {"code": -32600, "message": "batch requests disabled"}})
+    with pytest.raises(ValueError, match="batch requests disabled"):
+        cache.call_many(chain, "count", [("a",), ("b",)])
+
+
+def test_block_mode_pins_reads_to_the_head():
+    cache = ChainReadCache(mode="block", head_ttl_seconds=3600)
+    chain = _Chain()
+    assert cache.call(chain, "count", "a") == "a@10"
+    assert cache.call(chain, "count", "a") == "a@10"
+    assert len(chain.contract.calls) == 1
+
+    cache.note_block(12)  # new head: new keys, the value at block 10 is not served any more
+    assert cache.call(chain, "count", "a") == "a@12"
+    cache.note_block(11)  # never moves back
+    assert cache.call(chain, "count", "a") == "a@12"
+    assert [c[2] for c in chain.contract.calls] == [10, 12]
+
+
+def test_own_write_is_visible_in_both_modes():
+    block = ChainReadCache(mode="block", head_ttl_seconds=3600)
+    chain = _Chain()
+    block.call(chain, "count", "a")
+    block.note_own_write(15)
+    assert block.call(chain, "count", "a") == "a@15"
+
+    ttl = ChainReadCache(mode="ttl", ttl_seconds=3600)
+    chain = _Chain()
+    assert ttl.call(chain, "count", "a") == "a@latest"
+    ttl.note_block(99)  # blocks by others do not invalidate ttl entries
+    ttl.call(chain, "count", "a")
+    assert len(chain.contract.calls) == 1
+    ttl.note_own_write(100)
+    ttl.call(chain, "count", "a")
+    assert len(chain.contract.calls) == 2
+
+
+def test_reverts_are_not_cached():
+    cache = ChainReadCache(mode="block", head_ttl_seconds=3600)
+    chain = _Chain()
+    out = cache.call_many(chain, "count", [("a",), ("revert",), ("a",)], return_exceptions=True)
+    assert out[0] == out[2] == "a@10" and isinstance(out[1], ContractLogicError)
+    with pytest.raises(ContractLogicError):
+        cache.call(chain, "count", "revert")
+    cache.call(chain, "count", "a")
+    # "a" once (duplicates share one fetch), "revert" on every read
+    assert [c[1][0] for c in chain.contract.calls] == ["a", "revert", "revert"]
+    assert cache.stats()["functions"]["count"]["errors"] == 2
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from app.services.crypto_worker import OPS, CryptoBusyError, CryptoWorker, _Pending
+
+
+def test_stop_fails_queued_jobs():
+    worker = CryptoWorker(workers=1)
+    jobs = [_Pending("aes_gcm_encrypt", (b"k" * 32, b"x"), {}) for _ in range(3)]
+    worker._carry = jobs[0]
+    for job in jobs[1:]:
+        worker._queue.put(job)
+
+    worker.stop()
+
+    assert worker._queue.empty() and worker._carry is None
+    for job in jobs:
+        with pytest.raises(RuntimeError, match="stopped"):
+            job.future.result(timeout=0)
+
+
+def test_call_times_out_as_busy(monkeypatch):
+    worker = CryptoWorker(workers=1)
+    monkeypatch.setattr(worker, "submit", lambda op, *a, **kw: Future())  # never completes
+    with pytest.raises(CryptoBusyError):
+        worker.call("aes_gcm_encrypt", b"k" * 32, b"x", timeout=0.05)
+    with pytest.raises(CryptoBusyError):
+        asyncio.run(worker.run("aes_gcm_encrypt", b"k" * 32, b"x", timeout=0.05))
+    assert worker.stats()["timeouts"] == 2
+
+
+def test_inline_call_returns_result():
+    worker = CryptoWorker(workers=0)
+    assert worker.call("aes_gcm_decrypt", b"k" * 32, *worker.call("aes_gcm_encrypt", b"k" * 32, b"hello")) == b"hello"
+
+
+def test_run_never_blocks_on_a_full_queue(monkeypatch):
+    worker = CryptoWorker(workers=1, queue_max=1)
+    monkeypatch.setattr(worker, "start", lambda: None)  # no dispatcher: the queue stays full
+    worker._thread = object()
+    worker._queue.put(_Pending("aes_gcm_encrypt", (b"k" * 32, b"x"), {}))
+    t0 = time.monotonic()
+    with pytest.raises(CryptoBusyError):
+        asyncio.run(worker.run("aes_gcm_encrypt", b"k" * 32, b"x"))
+    assert time.monotonic() - t0 < 1
+    assert worker.rejected == 1
+
+
+def test_inline_run_is_off_the_event_loop():
+    worker = CryptoWorker(workers=0)
+    seen = {}
+
+    async def main():
+        seen["loop"] = threading.get_ident()
+        return await worker.run("aes_gcm_encrypt", b"k" * 32, b"x")
+
+    original = OPS["aes_gcm_encrypt"]
+
+    def spy(*args, **kwargs):
+        seen["op"] = threading.get_ident()
+        return original(*args, **kwargs)
+
+    OPS["aes_gcm_encrypt"] = spy
+    try:
+        nonce, ct = asyncio.run(main())
+    finally:
+        OPS["aes_gcm_encrypt"] = original
+    assert seen["op"] != seen["loop"]
+    assert worker.call("aes_gcm_decrypt", b"k" * 32, nonce, ct) == b"x"
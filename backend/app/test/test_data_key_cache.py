@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.services.data_key_cache import KEK_METHOD, DataKeyCache
+from app.services.key_registry import KEYS, SERVER_PRIVATE, SERVER_PUBLIC
+
+
+def _pair():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    priv = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption())
+    pub = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return pub, priv
+
+
+@pytest.fixture(scope="module")
+def pairs():
+    return _pair(), _pair()
+
+
+@pytest.fixture
+def server_key(pairs):
+    """Install pair 0 as the server key; call the returned function to rotate to pair 1."""
+    (pub, priv), (new_pub, new_priv) = pairs
+    KEYS.rotate(SERVER_PUBLIC, pub)
+    KEYS.rotate(SERVER_PRIVATE, priv)
+
+    def rotate():
+        return KEYS.rotate(SERVER_PUBLIC, new_pub).version, KEYS.rotate(SERVER_PRIVATE, new_priv).version
+
+    yield rotate
+    KEYS.reload()
+
+
+def test_kek_is_reused_and_records_unwrap_elsewhere(server_key):
+    cache = DataKeyCache(max_age_seconds=3600, max_messages=100)
+    data_keys = [os.urandom(32) for _ in range(3)]
+    records = [cache.wrap(k) for k in data_keys]
+    assert cache.keks_created == 1
+    assert len({meta["kek_id"] for _, meta in records}) == 1
+    assert records[0][1]["method"] == KEK_METHOD
+
+    reader = DataKeyCache()  # another process: only the server private key in common
+    assert [reader.unwrap(w, meta) for w, meta in records] == data_keys
+    assert reader.stats()["unwrap_cache_misses"] == 1  # one RSA unwrap for the shared KEK
+
+
+def test_kek_rolls_over_when_server_key_rotates(server_key):
+    cache = DataKeyCache(max_age_seconds=3600, max_messages=100)
+    old_key = os.urandom(32)
+    old_wrapped, old_meta = cache.wrap(old_key)
+
+    new_version, _ = server_key()
+    new_key = os.urandom(32)
+    new_wrapped, new_meta = cache.wrap(new_key)
+    assert cache.keks_created == 2
+    assert new_meta["kek_id"] != old_meta["kek_id"]
+    assert old_meta["key_version"] != new_version == new_meta["key_version"]
+
+    # records under the old KEK still open with the previous private key
+    reader = DataKeyCache()
+    assert reader.unwrap(old_wrapped, old_meta) == old_key
+    assert reader.unwrap(new_wrapped, new_meta) == new_key
+
+
+def test_kek_rolls_over_by_count_and_age(server_key):
+    cache = DataKeyCache(max_age_seconds=3600, max_messages=2)
+    ids = [cache.wrap(os.urandom(32))[1]["kek_id"] for _ in range(3)]
+    assert ids[0] == ids[1] != ids[2]
+
+    cache = DataKeyCache(max_age_seconds=0.05, max_messages=100)
+    first = cache.wrap(os.urandom(32))[1]["kek_id"]
+    time.sleep(0.06)
+    assert cache.wrap(os.urandom(32))[1]["kek_id"] != first
+
+
+def test_mismatched_kek_id_is_rejected(server_key):
+    cache = DataKeyCache(max_age_seconds=3600, max_messages=1)
+    wrapped, meta = cache.wrap(os.urandom(32))
+    _, other = cache.wrap(os.urandom(32))  # next KEK
+    with pytest.raises(ValueError, match="kek_id"):
+        cache.unwrap(wrapped, {**meta, "kek_wrapped_b64": other["kek_wrapped_b64"]})
@@ -0,0 +1,83 @@
+import base64
+import json
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.keywrap import aes_key_wrap
+
+import decrypt_profile
+from app.services import crypto_service, data_key_cache
+
+
+def _private_pem():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption())
+
+
+@pytest.fixture(scope="module")
+def keys(tmp_path_factory):
+    """(current, previous) as (path, LoadedKey)."""
+    out = []
+    for name in ("current", "previous"):
+        path = tmp_path_factory.mktemp("keys") / ("%s.pem" % name)
+        path.write_bytes(_private_pem())
+        out.append((str(path), crypto_service.private_key_from_pem(path.read_bytes())))
+    return out
+
+
+def _wrap(key, data):
+    pub = crypto_service.public_key_from_pem(key.cryptography().public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+    return crypto_service.rsa_oaep_encrypt(pub, data, crypto_service.OAEP_SHA1)
+
+
+def _profile(key, data_key, key_version="auto"):
+    wrapped = _wrap(key, data_key)
+    meta = {"method": "rsa-server-pem"}
+    if key_version is not None:
+        meta["key_version"] = key.version if key_version == "auto" else key_version
+    return {"encrypted_key_b64": base64.b64encode(wrapped).decode(), "key_meta": meta}
+
+
+def test_picks_key_by_version(keys):
+    (cur_path, cur), (prev_path, prev) = keys
+    privs = decrypt_profile.load_private_keys([cur_path, prev_path])
+    data_key = crypto_service.generate_aes_key()
+    assert decrypt_profile.unwrap_profile_key(privs, _profile(prev, data_key)) == data_key
+    assert decrypt_profile.unwrap_profile_key(privs, _profile(cur, data_key)) == data_key
+
+
+def test_records_without_version_try_every_key(keys):
+    (cur_path, cur), (prev_path, prev) = keys
+    privs = decrypt_profile.load_private_keys([cur_path, prev_path])
+    data_key = crypto_service.generate_aes_key()
+    assert decrypt_profile.unwrap_profile_key(privs, _profile(prev, data_key, key_version=None)) == data_key
+
+
+def test_missing_key_version_is_reported(keys):
+    (cur_path, _), (_, prev) = keys
+    with pytest.raises(ValueError, match=prev.version):
+        decrypt_profile.unwrap_profile_key(decrypt_profile.load_private_keys(cur_path),
+                                           _profile(prev, crypto_service.generate_aes_key()))
+
+
+def test_kek_profile_and_blob(keys):
+    (cur_path, _), (prev_path, prev) = keys
+    kek, data_key = crypto_service.generate_aes_key(), crypto_service.generate_aes_key()
+    nonce, ct = crypto_service.aes_gcm_encrypt(data_key, json.dumps({"name": "x"}).encode())
+    profile = {
+        "encrypted_key_b64": base64.b64encode(aes_key_wrap(kek, data_key)).decode(),
+        "iv_b64": base64.b64encode(nonce).decode(),
+        "key_meta": {
+            "method": data_key_cache.KEK_METHOD,
+            "kek_id": "k1",
+            "key_version": prev.version,
+            "kek_wrapped_b64": base64.b64encode(_wrap(prev, kek)).decode(),
+        },
+    }
+    cache = {}
+    sym = decrypt_profile.unwrap_profile_key(decrypt_profile.load_private_keys([cur_path, prev_path]), profile, cache)
+    assert cache == {"k1": kek}
+    assert decrypt_profile.decrypt_profile_blob(sym, profile, nonce + ct) == {"name": "x"}
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from app.models.tourist_models import User
+from app.routes import tourists
+from app.routes.tourists import DEVICE_PROFILE_CACHE
+
+
+@pytest.fixture
+def tdb():
+    DEVICE_PROFILE_CACHE.clear()
+    db = tourists.SessionLocal()
+    yield db
+    db.query(User).delete()
+    db.commit()
+    db.close()
+    DEVICE_PROFILE_CACHE.clear()
+
+
+def _profile(db, **query):
+    return asyncio.run(tourists.device_profile(did=query.get("did"), device_id=query.get("device_id"), db=db))
+
+
+def test_any_user_write_invalidates(tdb):
+    u = User(phone_number="921", full_name="T", state="kyc_submitted", did="did-1", device_id="dev-1")
+    tdb.add(u)
+    tdb.commit()
+    assert _profile(tdb, did="did-1").state == "kyc_submitted"
+    assert DEVICE_PROFILE_CACHE.get(("device", "dev-1")) is not None
+
+    # e.g. a KYC decision, from another session: no explicit invalidation call
+    other = tourists.SessionLocal()
+    other.get(User, u.id).state = "kyc_approved"
+    other.commit()
+    other.close()
+    assert DEVICE_PROFILE_CACHE.get(("did", "did-1")) is None
+    assert DEVICE_PROFILE_CACHE.get(("device", "dev-1")) is None
+    tdb.expire_all()
+    assert _profile(tdb, device_id="dev-1").is_registered is True
+
+
+def test_old_keys_dropped_when_ids_change(tdb):
+    u = User(phone_number="922", state="registered", did="did-old", device_id="dev-old")
+    tdb.add(u)
+    tdb.commit()
+    _profile(tdb, did="did-old")
+    u.did, u.device_id = "did-new", "dev-new"
+    tdb.commit()
+    assert DEVICE_PROFILE_CACHE.get(("did", "did-old")) is None
+    assert DEVICE_PROFILE_CACHE.get(("device", "dev-old")) is None
+
+
+def test_rollback_keeps_entries(tdb):
+    u = User(phone_number="923", state="registered", did="did-2")
+    tdb.add(u)
+    tdb.commit()
+    _profile(tdb, did="did-2")
+    u.full_name = "X"
+    tdb.rollback()
+    # nothing was written: the flush never happened, the entry stays
+    assert DEVICE_PROFILE_CACHE.get(("did", "did-2")) is not None
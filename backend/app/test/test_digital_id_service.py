@@ -0,0 +1,26 @@
+import pytest
+
+from app.services import digital_id_service
+
+
+def test_require_secret_refuses_unkeyed_ids(monkeypatch):
+    monkeypatch.setattr(digital_id_service, "DIGITAL_ID_SECRET", "")
+    monkeypatch.setattr(digital_id_service, "DIGITAL_ID_ALLOW_UNKEYED_DEV", False)
+    with pytest.raises(RuntimeError):
+        digital_id_service.require_secret()
+    with pytest.raises(RuntimeError):
+        digital_id_service.derive_short_id("+911234567890")
+
+
+def test_dev_flag_allows_unkeyed_ids(monkeypatch):
+    monkeypatch.setattr(digital_id_service, "DIGITAL_ID_SECRET", "")
+    monkeypatch.setattr(digital_id_service, "DIGITAL_ID_ALLOW_UNKEYED_DEV", True)
+    assert digital_id_service.require_secret() == ""
+    assert len(digital_id_service.derive_short_id("+911234567890")) == 12
+
+
+def test_secret_keys_the_short_id(monkeypatch):
+    monkeypatch.setattr(digital_id_service, "DIGITAL_ID_SECRET", "a")
+    first = digital_id_service.derive_short_id("+911234567890")
+    monkeypatch.setattr(digital_id_service, "DIGITAL_ID_SECRET", "b")
+    assert digital_id_service.derive_short_id("+911234567890") != first
@@ -0,0 +1,85 @@
+import pytest
+
+from app.services.gas_strategy import GAS_LIMIT_FALLBACK, GAS_PER_EXTRA_BYTE, GasStrategy
+
+
+class _Fn:
+    """contract.functions.registerTourist(cid) bound to its args; estimate grows with calldata."""
+
+    abi = {"name": "registerTourist", "inputs": [{"type": "string"}]}
+    fn_name = "registerTourist"
+
+    def __init__(self, cid, error=None):
+        self.args = (cid,)
+        self.error = error
+        self.estimated = 0
+
+    def estimate_gas(self, tx):
+        self.estimated += 1
+        if self.error:
+            raise self.error
+        return 50000 + 10 * len(self.args[0])
+
+
+class _Contract:
+    @staticmethod
+    def encodeABI(fn_name, args):
+        return "0x" + "ab" * (4 + len(args[0]))  # selector + 1 byte per char
+
+
+class _Chain:
+    contract = _Contract()
+    sender_address = "0xsender"
+
+
+@pytest.fixture
+def gas():
+    return GasStrategy(margin=1.0, size_class_bytes=100)
+
+
+def test_estimate_cached_per_size_class(gas):
+    first = _Fn("a" * 10)   # calldata 14 bytes: class 0
+    limit, key = gas.gas_limit(_Chain, first)
+    assert (limit, key) == (50100, ("registerTourist(string)", 0))
+
+    longer = _Fn("a" * 30)  # same class: no RPC, priced from the cached estimate per extra byte
+    assert gas.gas_limit(_Chain, longer) == (50100 + 20 * GAS_PER_EXTRA_BYTE, key)
+    assert longer.estimated == 0
+
+    shorter = _Fn("a")  # shorter than the estimated payload: never below the estimate
+    assert gas.gas_limit(_Chain, shorter)[0] == 50100
+
+    big = _Fn("a" * 150)  # calldata 154 bytes: class 1, estimated on its own
+    assert gas.gas_limit(_Chain, big) == (51500, ("registerTourist(string)", 1))
+    assert big.estimated == 1
+    assert (gas.estimates, gas.hits) == (2, 2)
+
+
+def test_margin_applies_to_the_limit():
+    assert GasStrategy(margin=1.2, size_class_bytes=100).gas_limit(_Chain, _Fn("a" * 10))[0] == int(50100 * 1.2)
+
+
+def test_near_limit_receipt_invalidates(gas):
+    limit, key = gas.gas_limit(_Chain, _Fn("a" * 10))
+    gas.observe(key, limit, int(limit * 0.9))
+    assert gas.gas_limit(_Chain, _Fn("a" * 10))[0] == limit  # still cached
+    assert gas.estimates == 1
+
+    gas.observe(key, limit, int(limit * 0.96))
+    assert gas.near_limit_receipts == 1
+    again = _Fn("a" * 10)
+    gas.gas_limit(_Chain, again)
+    assert again.estimated == 1 and gas.estimates == 2
+
+    gas.observe(key, limit, None)  # no receipt data: nothing to learn
+    assert gas.near_limit_receipts == 1
+
+
+def test_estimate_failures(gas):
+    with pytest.raises(ValueError):
+        gas.gas_limit(_Chain, _Fn("x", error=ValueError("execution reverted: already registered")))
+
+    down = _Fn("x", error=ConnectionError("node unreachable"))
+    assert gas.gas_limit(_Chain, down)[0] == GAS_LIMIT_FALLBACK
+    assert gas.fallbacks == 1
+    assert gas.stats()["cached_estimates"] == {}  # a fallback is not cached
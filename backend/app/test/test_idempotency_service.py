@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from app.models.response_models import TouristResponse
+from app.models.tourist_models import IdempotencyRecord
+from app.routes.tourists import _idempotent_replay
+from app.services import idempotency_service
+from app.services.idempotency_service import IdempotencyConflict, IdempotencyInFlight, IdempotencyStore
+
+
+@pytest.fixture
+def store():
+    return IdempotencyStore(window_seconds=3600, max_entries=100)
+
+
+def test_first_request_claims_then_replays(store, db):
+    assert store.begin(db, "register", "k1", "h1") is None
+    store.complete(db, "register", "k1", {"ok": True}, status_code=201)
+    assert store.begin(db, "register", "k1", "h1") == (201, {"ok": True})
+    # a fresh store (another worker / after restart) replays from the table
+    assert IdempotencyStore().begin(db, "register", "k1", "h1") == (201, {"ok": True})
+
+
+def test_different_body_conflicts(store, db):
+    store.begin(db, "register", "k1", "h1")
+    with pytest.raises(IdempotencyConflict):
+        store.begin(db, "register", "k1", "h2")
+    store.complete(db, "register", "k1", {"ok": True})
+    with pytest.raises(IdempotencyConflict):
+        store.begin(db, "register", "k1", "h2")
+
+
+def test_in_flight_until_abort(store, db):
+    store.begin(db, "sos", "k1", "h1")
+    with pytest.raises(IdempotencyInFlight):
+        store.begin(db, "sos", "k1", "h1")
+    store.abort(db, "sos", "k1")
+    assert store.begin(db, "sos", "k1", "h1") is None
+
+
+def test_scopes_are_independent(store, db):
+    store.begin(db, "sos", "k1", "h1")
+    assert store.begin(db, "register", "k1", "h1") is None
+
+
+def test_abandoned_claim_is_taken_over(store, db, monkeypatch):
+    store.begin(db, "sos", "k1", "h1")
+    monkeypatch.setattr(idempotency_service, "IDEMPOTENCY_INFLIGHT_TIMEOUT_SECONDS", 0)
+    assert store.begin(db, "sos", "k1", "h1") is None
+
+
+def test_failed_complete_releases_claim(store, db, monkeypatch):
+    store.begin(db, "register", "k1", "h1")
+    real_commit = db.commit
+    calls = []
+
+    def commit_failing_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        real_commit()
+
+    monkeypatch.setattr(db, "commit", commit_failing_once)
+    store.complete(db, "register", "k1", {"ok": True})
+    # not left in flight: the retry is allowed to do the work again
+    assert store.begin(db, "register", "k1", "h1") is None
+
+
+def test_prune_caps_table(db):
+    store = IdempotencyStore(window_seconds=3600, max_entries=3)
+    for i in range(5):
+        store.begin(db, "sos", "k%d" % i, "h")
+        store.complete(db, "sos", "k%d" % i, {"i": i})
+    store.prune(db)
+    assert db.query(IdempotencyRecord).count() == 3
+
+
+def test_replay_goes_through_response_model():
+    stored = (200, {"phone_number": "911", "state": "registered", "digital_id": "0xabc", "profile": {"x": 1}})
+    resp = _idempotent_replay(stored, TouristResponse)
+    assert json.loads(resp.body) == {"phone_number": "911", "state": "registered", "digital_id": "0xabc"}
+    assert resp.headers["Idempotent-Replayed"] == "true"
+    # error bodies are replayed as stored
+    assert json.loads(_idempotent_replay((409, {"detail": "x"}), TouristResponse).body) == {"detail": "x"}
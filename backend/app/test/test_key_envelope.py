@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+from cryptography.hazmat.primitives.keywrap import aes_key_wrap
+
+from app.utils import key_envelope
+from app.utils.key_envelope import LEGACY_XOR_MODE, master_key_id, unwrap_data_key, unwrap_data_keys
+
+_LEGACY_META = {"mode": LEGACY_XOR_MODE, "note": "dev-envelope-xor-not-for-prod"}
+
+
+@pytest.fixture
+def mk(monkeypatch):
+    key = os.urandom(32)
+    monkeypatch.setattr(key_envelope, "_master_key", key)
+    monkeypatch.setattr(key_envelope, "_previous_key", None)
+    monkeypatch.setattr(key_envelope, "KYC_MASTER_KEY_PREVIOUS_BASE64", None)
+    return key
+
+
+@pytest.fixture
+def previous(mk, monkeypatch):
+    key = os.urandom(32)
+    monkeypatch.setattr(key_envelope, "_previous_key", key)
+    return key
+
+
+def test_aes_kw_roundtrip(mk):
+    data_keys = [os.urandom(32) for _ in range(3)]
+    wrapped = key_envelope.wrap_data_keys(data_keys)
+    assert all(len(w) == 40 for w in wrapped)
+    meta = key_envelope.key_meta()
+    assert meta["mk_id"] == master_key_id(mk)
+    assert unwrap_data_keys(wrapped, [meta] * 3) == data_keys
+    assert unwrap_data_keys(wrapped) == data_keys  # no meta: detected by length
+
+
+def test_aes_kw_integrity_check(mk):
+    wrapped = bytearray(key_envelope.wrap_data_key(os.urandom(32)))
+    wrapped[5] ^= 1
+    with pytest.raises(ValueError, match="integrity"):
+        unwrap_data_key(bytes(wrapped), key_envelope.key_meta())
+
+
+def test_legacy_xor(mk):
+    data_key = os.urandom(32)
+    xored = key_envelope._xor(data_key, mk)
+    assert unwrap_data_key(xored, _LEGACY_META) == data_key
+    assert unwrap_data_key(xored, json.dumps(_LEGACY_META)) == data_key  # key_meta stored as JSON text
+    assert unwrap_data_key(xored) == data_key  # 32 bytes, no meta
+
+
+def test_mixed_batch(mk):
+    new_key, old_key = os.urandom(32), os.urandom(32)
+    wrapped = [key_envelope.wrap_data_key(new_key), key_envelope._xor(old_key, mk)]
+    assert unwrap_data_keys(wrapped, [key_envelope.key_meta(), _LEGACY_META]) == [new_key, old_key]
+
+
+def test_previous_master_key(previous, mk):
+    data_key = os.urandom(32)
+    old = aes_key_wrap(previous, data_key)
+    # named by mk_id, or found by the integrity check when the envelope predates mk_id
+    assert unwrap_data_key(old, {"mode": "aes-kw", "mk_id": master_key_id(previous)}) == data_key
+    assert unwrap_data_key(old, {"mode": "aes-kw"}) == data_key
+    # new envelopes still use the current key
+    assert key_envelope.key_meta()["mk_id"] == master_key_id(mk)
+    assert unwrap_data_key(key_envelope.wrap_data_key(data_key), key_envelope.key_meta()) == data_key
+
+
+def test_legacy_xor_uses_previous_key_during_rotation(previous):
+    data_key = os.urandom(32)
+    assert unwrap_data_key(key_envelope._xor(data_key, previous), _LEGACY_META) == data_key
+
+
+def test_unknown_mk_id(mk):
+    wrapped = key_envelope.wrap_data_key(os.urandom(32))
+    with pytest.raises(ValueError, match="not configured"):
+        unwrap_data_key(wrapped, {"mode": "aes-kw", "mk_id": "0" * 16})
@@ -0,0 +1,254 @@
+import base64
+import datetime
+import os
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.keywrap import aes_key_unwrap, aes_key_wrap
+from sqlalchemy.orm import Session
+
+from app.models.kyc_model import Base as KycBase
+from app.models.tourist_models import Base, KeyRotationJob, User
+from app.services import crypto_service, key_rotation
+from app.services.data_key_cache import KEK_METHOD, kek_id_for, unwrap_with_kek
+from app.services.key_registry import KEYS, SERVER_PRIVATE, SERVER_PUBLIC
+from app.services.key_rotation import CURRENT, REWRAPPED, SKIPPED, KeyRotation, _Rewrapper
+from app.utils import key_envelope
+from app.utils.kyc_utils import unwrap_record_key
+
+
+def _pair():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    priv = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption())
+    pub = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return pub, priv
+
+
+@pytest.fixture(scope="module")
+def pairs():
+    return _pair(), _pair()  # old, new
+
+
+@pytest.fixture
+def keys(pairs, monkeypatch):
+    """Rotation in progress: old server key / master key known, new ones current."""
+    (old_pub, old_priv), (new_pub, new_priv) = pairs
+    old = {"public": KEYS.rotate(SERVER_PUBLIC, old_pub), "private": KEYS.rotate(SERVER_PRIVATE, old_priv)}
+    new = {"public": KEYS.rotate(SERVER_PUBLIC, new_pub), "private": KEYS.rotate(SERVER_PRIVATE, new_priv)}
+    old_mk, new_mk = os.urandom(32), os.urandom(32)
+    monkeypatch.setattr(key_envelope, "_master_key", new_mk)
+    monkeypatch.setattr(key_envelope, "_previous_key", old_mk)
+    yield {"old": old, "new": new, "old_mk": old_mk, "new_mk": new_mk}
+    KEYS.reload()
+
+
+def _rsa(key, data, oaep_hash=crypto_service.OAEP_SHA1):
+    return base64.b64encode(crypto_service.rsa_oaep_encrypt(key, data, oaep_hash)).decode()
+
+
+def _rsa_profile(keys, data_key, which="old"):
+    return {"encrypted_key_b64": _rsa(keys[which]["public"], data_key),
+            "key_meta": {"method": "rsa-server-pem", "key_version": keys[which]["public"].version}}
+
+
+def _unwrap_rsa(keys, b64, oaep_hash=crypto_service.OAEP_SHA1):
+    return crypto_service.rsa_oaep_decrypt(keys["new"]["private"], base64.b64decode(b64), oaep_hash)
+
+
+# ----- _Rewrapper -----
+def test_profile_rsa(keys):
+    rw = _Rewrapper()
+    data_key = os.urandom(32)
+    outcome, new = rw.profile(_rsa_profile(keys, data_key))
+    assert outcome == REWRAPPED
+    assert new["key_meta"]["key_version"] == keys["new"]["public"].version
+    assert _unwrap_rsa(keys, new["encrypted_key_b64"]) == data_key
+    assert rw.profile(new) == (CURRENT, None)
+    assert rw.profile({"encrypted_key_b64": "eA==", "key_meta": {"method": "base64-dev"}}) == (SKIPPED, None)
+
+
+def test_profile_kek_rewraps_each_kek_once(keys):
+    rw = _Rewrapper()
+    kek = os.urandom(32)
+    wrapped_kek = _rsa(keys["old"]["public"], kek)
+    meta = {"method": KEK_METHOD, "kek_id": kek_id_for(base64.b64decode(wrapped_kek)),
+            "kek_wrapped_b64": wrapped_kek, "key_version": keys["old"]["public"].version}
+    data_keys = [os.urandom(32), os.urandom(32)]
+    profiles = [{"encrypted_key_b64": base64.b64encode(aes_key_wrap(kek, k)).decode(), "key_meta": meta}
+                for k in data_keys]
+
+    out = [rw.profile(p) for p in profiles]
+    assert [o for o, _ in out] == [REWRAPPED, REWRAPPED]
+    new_meta = out[0][1]["key_meta"]
+    assert out[1][1]["key_meta"] == new_meta  # one RSA rewrap shared by both records
+    assert new_meta["key_version"] == keys["new"]["public"].version
+    assert new_meta["kek_id"] == kek_id_for(base64.b64decode(new_meta["kek_wrapped_b64"]))
+    new_kek = _unwrap_rsa(keys, new_meta["kek_wrapped_b64"])
+    for (_, new), k in zip(out, data_keys):
+        assert unwrap_with_kek(new_kek, base64.b64decode(new["encrypted_key_b64"])) == k
+
+
+def test_kyc_rsa_pem_env(keys):
+    data_key = os.urandom(32)
+    enc = _rsa(keys["old"]["public"], data_key, crypto_service.OAEP_SHA256)
+    outcome, new_enc, meta = _Rewrapper().kyc(enc, {"method": "rsa-pem-env",
+                                                    "key_version": keys["old"]["public"].version})
+    assert outcome == REWRAPPED and meta["key_version"] == keys["new"]["public"].version
+    assert _unwrap_rsa(keys, new_enc, crypto_service.OAEP_SHA256) == data_key
+
+
+def test_kyc_aes_kw_under_previous_master_key(keys):
+    data_key = os.urandom(32)
+    enc = base64.b64encode(aes_key_wrap(keys["old_mk"], data_key)).decode()
+    meta = {"mode": "aes-kw", "alg": "A256KW", "mk_id": key_envelope.master_key_id(keys["old_mk"]), "format": "x"}
+    rw = _Rewrapper()
+    outcome, new_enc, new_meta = rw.kyc(enc, meta)
+    assert outcome == REWRAPPED
+    assert new_meta["mk_id"] == key_envelope.master_key_id(keys["new_mk"]) and new_meta["format"] == "x"
+    assert aes_key_unwrap(keys["new_mk"], base64.b64decode(new_enc)) == data_key
+    assert rw.kyc(new_enc, new_meta) == (CURRENT, None, None)
+
+
+def test_kyc_legacy_xor(keys):
+    data_key = os.urandom(32)
+    xored = key_envelope._xor(data_key, keys["old_mk"])
+    meta = {"mode": "dev", "note": "dev-envelope-xor-not-for-prod"}
+    outcome, new_enc, new_meta = _Rewrapper().kyc(base64.b64encode(xored).decode(), meta)
+    assert outcome == REWRAPPED
+    assert new_meta["mode"] == "aes-kw" and "note" not in new_meta
+    assert unwrap_record_key(new_enc, new_meta) == data_key
+
+
+# ----- jobs -----
+@pytest.fixture
+def rotation(engine, keys):
+    Base.metadata.create_all(bind=engine)
+    KycBase.metadata.create_all(bind=engine)
+    rot = KeyRotation(chunk=2, max_per_second=0)
+    key_rotation._ensure_job_table(engine)
+    rot._bind, rot._targets = engine, {"profiles": engine, "kyc": engine}
+    return rot
+
+
+def _add_users(engine, keys, n):
+    data_keys = {}
+    with Session(bind=engine) as db:
+        for i in range(n):
+            data_keys["p%d" % i] = os.urandom(32)
+            db.add(User(phone_number="p%d" % i, profile=_rsa_profile(keys, data_keys["p%d" % i])))
+        db.commit()
+    return data_keys
+
+
+def _job(engine, job_id):
+    with Session(bind=engine) as db:
+        return db.get(KeyRotationJob, job_id)
+
+
+def test_job_resumes_from_cursor(rotation, engine, keys, monkeypatch):
+    data_keys = _add_users(engine, keys, 5)
+    job_id = rotation.create("profiles")["id"]
+    assert rotation._claim() == job_id
+
+    record = rotation._record
+
+    def stop_after_first_chunk(*args, **kwargs):
+        rotation._stop.set()
+        return record(*args, **kwargs)
+
+    monkeypatch.setattr(rotation, "_record", stop_after_first_chunk)
+    rotation._work(job_id)
+    job = _job(engine, job_id)
+    assert (job.status, job.cursor, job.rewrapped) == ("running", 2, 2)
+
+    # the process died holding the lease; another one takes over once it is stale
+    with Session(bind=engine) as db:
+        db.get(KeyRotationJob, job_id).heartbeat_at = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        db.commit()
+    other = KeyRotation(chunk=2, max_per_second=0)
+    other._bind, other._targets, other.owner = engine, rotation._targets, "other:1"
+    assert other._claim() == job_id
+    other._work(job_id)
+
+    job = _job(engine, job_id)
+    assert (job.status, job.scanned, job.rewrapped, job.current, job.failed) == ("done", 5, 5, 0, 0)
+    with Session(bind=engine) as db:
+        for u in db.query(User):
+            assert u.profile["key_meta"]["key_version"] == keys["new"]["public"].version
+            assert _unwrap_rsa(keys, u.profile["encrypted_key_b64"]) == data_keys[u.phone_number]
+    assert other.rotated_targets()["profiles"] is True
+
+
+def test_failed_rows_end_done_with_errors(rotation, engine, keys):
+    _add_users(engine, keys, 3)
+    with Session(bind=engine) as db:
+        bad = db.query(User).filter(User.phone_number == "p1").one()
+        bad.profile = dict(bad.profile, key_meta={"method": "rsa-server-pem", "key_version": "unknown"})
+        db.commit()
+        bad_id = bad.id
+    job_id = rotation.create("profiles")["id"]
+    assert rotation._claim() == job_id
+    rotation._work(job_id)
+
+    job = rotation.get(job_id)
+    assert (job["status"], job["rewrapped"], job["failed"], job["failed_ids"]) == ("done_with_errors", 2, 1, [bad_id])
+    assert "previous keys" in job["last_error"]
+    assert rotation.rotated_targets()["profiles"] is False
+
+
+def test_failed_rows_are_retried_at_the_end(rotation, engine, keys, monkeypatch):
+    _add_users(engine, keys, 3)
+    profile = _Rewrapper.profile
+    calls = {"n": 0}
+
+    def flaky(self, p):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise RuntimeError("transient")
+        return profile(self, p)
+
+    monkeypatch.setattr(_Rewrapper, "profile", flaky)
+    job_id = rotation.create("profiles")["id"]
+    assert rotation._claim() == job_id
+    rotation._work(job_id)
+
+    job = rotation.get(job_id)
+    assert (job["status"], job["scanned"], job["rewrapped"], job["failed"], job["failed_ids"]) == ("done", 3, 3, 0, [])
+
+
+def test_throttle_renews_lease(rotation, engine, keys, monkeypatch):
+    _add_users(engine, keys, 1)
+    job_id = rotation.create("profiles", max_per_second=10)["id"]
+    assert rotation._claim() == job_id
+    monkeypatch.setattr(key_rotation, "KEY_ROTATION_LEASE_SECONDS", 0.2)
+    beats = []
+    heartbeat = rotation._heartbeat
+    monkeypatch.setattr(rotation, "_heartbeat", lambda jid: beats.append(jid) or heartbeat(jid))
+    assert rotation._throttle(job_id, 10, 3, time.monotonic()) is True  # 0.3 s in 0.05 s slices
+    assert len(beats) >= 5
+
+    with Session(bind=engine) as db:
+        db.get(KeyRotationJob, job_id).owner = "someone-else"
+        db.commit()
+    assert rotation._throttle(job_id, 10, 3, time.monotonic()) is False
+
+
+def test_deleted_job_stops_the_worker(rotation, engine, keys, monkeypatch):
+    _add_users(engine, keys, 3)
+    job_id = rotation.create("profiles")["id"]
+    assert rotation._claim() == job_id
+    chunk = key_rotation._CHUNK_HANDLERS["profiles"]
+
+    def chunk_then_delete(*args, **kwargs):
+        out = chunk(*args, **kwargs)
+        with Session(bind=engine) as db:
+            db.delete(db.get(KeyRotationJob, job_id))
+            db.commit()
+        return out
+
+    monkeypatch.setitem(key_rotation._CHUNK_HANDLERS, "profiles", chunk_then_delete)
+    rotation._work(job_id)  # returns quietly
+    assert rotation.get(job_id) is None
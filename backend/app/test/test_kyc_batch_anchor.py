@@ -0,0 +1,109 @@
+import pytest
+
+from app.models.tourist_models import Attestation
+from app.services import blockchain_service
+from app.services.kyc_batch_anchor import KycBatchAnchorer, verify_attestation_row
+
+
+class _FakeChain:
+    """anchor_kyc_root / getKycRoot of the contract, receipts delivered by the test."""
+
+    def __init__(self):
+        self.sent = []  # (tx_hash, root)
+        self.anchored = set()
+        self.callbacks = {}
+
+    def anchor_kyc_root(self, root, leaf_count, metadata=None):
+        tx_hash = "0x%064x" % (len(self.sent) + 1)
+        self.sent.append((tx_hash, bytes(root)))
+        return tx_hash
+
+    def on_tx_receipt(self, tx_hash, cb):
+        self.callbacks[tx_hash] = cb
+        return True
+
+    def is_kyc_root_anchored(self, root):
+        return bytes(root) in self.anchored
+
+    def deliver(self, tx_hash, receipt, error=None):
+        self.callbacks.pop(tx_hash)(tx_hash, receipt, error)
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    fake = _FakeChain()
+    for name in ("anchor_kyc_root", "on_tx_receipt", "is_kyc_root_anchored"):
+        monkeypatch.setattr(blockchain_service, name, getattr(fake, name))
+    monkeypatch.setattr(blockchain_service.CHAIN, "status", lambda: {"sender": "0xsender"})
+    return fake
+
+
+@pytest.fixture
+def anchorer(engine):
+    a = KycBatchAnchorer(window_seconds=3600, max_leaves=8)
+    a.watch(engine)
+    return a
+
+
+def _statuses(db):
+    db.expire_all()
+    return [a.meta["status"] for a in db.query(Attestation).order_by(Attestation.id)]
+
+
+def test_batch_confirmed(chain, anchorer, db):
+    for i in range(3):
+        anchorer.enqueue(db, "phone-%d" % i, "Qm%d" % i)
+    (batch,) = anchorer.flush()
+    assert batch["leaf_count"] == 3
+    chain.deliver(batch["tx_hash"], {"blockNumber": 7, "status": 1})
+    assert _statuses(db) == ["confirmed"] * 3
+    assert all(verify_attestation_row(a)["included"] for a in db.query(Attestation))
+
+
+def test_timed_out_batch_resends_same_root(chain, anchorer, db):
+    for i in range(3):
+        anchorer.enqueue(db, "phone-%d" % i, "Qm%d" % i)
+    (first,) = anchorer.flush()
+    db.expire_all()
+    proofs = [a.meta["proof"] for a in db.query(Attestation).order_by(Attestation.id)]
+    chain.deliver(first["tx_hash"], None, "receipt not found after 600s")
+    assert _statuses(db) == ["resend"] * 3
+
+    anchorer.enqueue(db, "phone-new", "QmNew")  # not mixed into the resent root
+    resent, later = anchorer.flush()
+    assert resent["root"] == first["root"] and resent["leaf_count"] == 3
+    assert later["leaf_count"] == 1 and later["root"] != first["root"]
+    db.expire_all()
+    assert [a.meta["proof"] for a in db.query(Attestation).order_by(Attestation.id)][:3] == proofs
+
+    # the first tx was mined late after all: the resend reverts, the leaves are still anchored
+    chain.anchored.add(chain.sent[0][1])
+    chain.deliver(resent["tx_hash"], {"blockNumber": 9, "status": 0}, "transaction reverted")
+    assert _statuses(db)[:3] == ["confirmed"] * 3
+
+
+def test_timed_out_batch_already_on_chain_is_confirmed(chain, anchorer, db):
+    anchorer.enqueue(db, "phone-1", "Qm1")
+    (batch,) = anchorer.flush()
+    chain.anchored.add(chain.sent[0][1])
+    chain.deliver(batch["tx_hash"], None, "receipt not found after 600s")
+    assert _statuses(db) == ["confirmed"]
+    assert anchorer.flush() == []
+
+
+def test_reverted_batch_fails(chain, anchorer, db):
+    anchorer.enqueue(db, "phone-1", "Qm1")
+    (batch,) = anchorer.flush()
+    chain.deliver(batch["tx_hash"], {"blockNumber": 3, "status": 0}, "transaction reverted")
+    assert _statuses(db) == ["failed"]
+
+
+def test_unsent_rows_of_other_status_do_not_fill_the_batch(chain, anchorer, db):
+    # max_leaves rows with no tx that are not queued (e.g. written by direct mode) come first
+    for i in range(anchorer.max_leaves):
+        db.add(Attestation(subject_hash="0x%064x" % i, ipfs_cid="QmOld%d" % i, meta={"status": "failed"}))
+    db.commit()
+    for i in range(2):
+        anchorer.enqueue(db, "phone-%d" % i, "Qm%d" % i)
+    (batch,) = anchorer.flush()
+    assert batch["leaf_count"] == 2
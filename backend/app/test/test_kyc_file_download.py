@@ -0,0 +1,84 @@
+import io
+import json
+import os
+
+import pytest
+
+from app.models.kyc_model import Base as KycBase, KYCRecord
+from app.services import crypto_service, kyc_service
+from app.utils import stream_crypto
+from app.utils.kyc_utils import new_wrapped_data_key
+
+VERIFIER = {"role": "verifier"}
+
+
+@pytest.fixture
+def kyc_file(db, monkeypatch):
+    """A submit_kyc_file record (3.5 chunks of 64 bytes) and its IPFS blob."""
+    KycBase.metadata.create_all(bind=db.get_bind())
+    content = os.urandom(64 * 3 + 32)
+    data_key, encrypted_key, key_meta = new_wrapped_data_key()
+    manifest = json.dumps({"filename": "passport.pdf", "content_type": "application/pdf", "meta": ""}).encode()
+    nonce, sealed = crypto_service.aes_gcm_encrypt(data_key, manifest, aad=kyc_service._MANIFEST_AAD)
+    key_meta = {**key_meta, "format": stream_crypto.FORMAT, "chunk_size": 64, "size": len(content),
+                "manifest": kyc_service._b64(nonce + sealed)}
+    blob = b"".join(stream_crypto.encrypt_stream(data_key, io.BytesIO(content), 64))
+    rec = KYCRecord(phone_number="911", ipfs_cid="QmFile", encrypted_key=encrypted_key, key_meta=key_meta)
+    db.add(rec)
+    db.commit()
+    served = {"blob": blob}
+
+    def fake_stream(cid, chunk_size):
+        assert cid == "QmFile"
+        data = served["blob"]
+        for i in range(0, len(data), 50):  # pieces that do not line up with sealed chunks
+            yield data[i:i + 50]
+
+    monkeypatch.setattr(kyc_service, "download_stream_from_ipfs", fake_stream)
+    monkeypatch.setattr(kyc_service, "download_from_ipfs", lambda cid: pytest.fail("blob loaded whole"))
+    return rec.id, content, served
+
+
+def test_file_is_streamed_through_the_crypto_pool(db, kyc_file, monkeypatch):
+    kyc_id, content, _ = kyc_file
+    calls = []
+    call = kyc_service.CRYPTO.call
+    monkeypatch.setattr(kyc_service.CRYPTO, "call", lambda op, *a, **kw: calls.append(op) or call(op, *a, **kw))
+
+    assert kyc_service.is_kyc_file(db, kyc_id)
+    manifest, chunks = kyc_service.open_kyc_file(db, kyc_id, actor=VERIFIER)
+    assert manifest["filename"] == "passport.pdf" and manifest["size"] == len(content)
+    assert b"".join(chunks) == content
+    assert calls == ["aes_gcm_decrypt"] * 4
+
+
+def test_truncated_blob_fails_the_stream(db, kyc_file):
+    kyc_id, _, served = kyc_file
+    served["blob"] = served["blob"][:-100]
+    _, chunks = kyc_service.open_kyc_file(db, kyc_id, actor=VERIFIER)
+    with pytest.raises(ValueError):
+        b"".join(chunks)
+
+
+def test_get_kyc_refuses_file_records(db, kyc_file):
+    with pytest.raises(ValueError):
+        kyc_service.get_kyc(db, kyc_file[0], actor=VERIFIER)
+    with pytest.raises(ValueError):
+        kyc_service.open_kyc_file(db, kyc_file[0], actor={"role": "tourist", "phone": "000"})
+
+
+def test_download_route_streams_the_file(db, kyc_file):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.routes import kyc_routes
+
+    app = FastAPI()
+    app.include_router(kyc_routes.router)
+    app.dependency_overrides[kyc_routes.get_db] = lambda: db
+    app.dependency_overrides[kyc_routes.get_current_user] = lambda: VERIFIER
+    kyc_id, content, _ = kyc_file
+    resp = TestClient(app).get("/kyc/%d/download" % kyc_id)
+    assert resp.status_code == 200 and resp.content == content
+    assert resp.headers["content-type"] == "application/pdf"
+    assert 'filename="passport.pdf"' in resp.headers["content-disposition"]
@@ -0,0 +1,81 @@
+import threading
+
+from app.services.nonce_manager import NonceManager
+
+
+class _Eth:
+    def __init__(self, pending=5, block=None):
+        self.pending = pending
+        self.block = block  # threading.Event the RPC waits on
+        self.calls = 0
+
+    def get_transaction_count(self, sender, block_identifier):
+        self.calls += 1
+        if self.block is not None and sender == "slow":
+            self.block.wait(5)
+        return self.pending
+
+
+class _W3:
+    def __init__(self, eth):
+        self.eth = eth
+
+
+def test_allocates_sequentially_after_one_rpc():
+    w3 = _W3(_Eth(pending=5))
+    nonces = NonceManager()
+    assert [nonces.allocate(w3, "a") for _ in range(3)] == [5, 6, 7]
+    assert w3.eth.calls == 1
+
+
+def test_released_nonce_is_reused_first():
+    w3 = _W3(_Eth(pending=0))
+    nonces = NonceManager()
+    first, second, _ = (nonces.allocate(w3, "a") for _ in range(3))
+    nonces.release("a", first, RuntimeError("connection reset"))
+    assert nonces.allocate(w3, "a") == first
+    nonces.release("a", second, ValueError("nonce too low"))
+    assert nonces.stats()["senders"] == {}  # re-seeded on next allocate
+
+
+def test_slow_seed_does_not_block_other_senders():
+    gate = threading.Event()
+    w3 = _W3(_Eth(pending=1, block=gate))
+    nonces = NonceManager()
+    nonces.allocate(w3, "a")
+    t = threading.Thread(target=nonces.allocate, args=(w3, "slow"))
+    t.start()
+    try:
+        assert nonces.allocate(w3, "a") == 2  # would deadlock behind the slow RPC while holding the lock
+        nonces.confirm("a", 2)
+    finally:
+        gate.set()
+        t.join()
+    assert nonces.stats()["senders"]["slow"]["next_nonce"] == 2
+
+
+def test_reconcile_adopts_node_drift_when_idle():
+    w3 = _W3(_Eth(pending=0))
+    nonces = NonceManager()
+    nonces.confirm("a", nonces.allocate(w3, "a"))
+    w3.eth.pending = 9
+    nonces.reconcile(w3, "a")
+    assert nonces.allocate(w3, "a") == 9
+
+
+def test_reconcile_skips_when_state_changed_during_rpc():
+    w3 = _W3(_Eth(pending=0))
+    nonces = NonceManager()
+    nonces.confirm("a", nonces.allocate(w3, "a"))
+    ask_node = w3.eth.get_transaction_count
+
+    def allocate_meanwhile(sender, block_identifier):
+        # another thread sends while reconcile waits for the node
+        assert nonces.allocate(w3, "a") == 1
+        return ask_node(sender, block_identifier)
+
+    w3.eth.get_transaction_count = allocate_meanwhile
+    w3.eth.pending = 5  # drift, but the answer predates the allocation: must not clobber nonce 1
+    nonces.reconcile(w3, "a")
+    assert nonces.stats()["senders"]["a"] == {"next_nonce": 2, "in_flight": 1, "gaps": 0}
+    assert nonces.resyncs == 0
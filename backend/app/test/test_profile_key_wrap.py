@@ -0,0 +1,34 @@
+import asyncio
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.routes import tourists
+from app.services.crypto_worker import CryptoBusyError
+
+
+def _wrap(key=b"k" * 32):
+    return asyncio.run(tourists._wrap_sym_key_for_storage(key))
+
+
+def test_base64_dev_only_without_a_server_key(monkeypatch):
+    monkeypatch.setattr(tourists.KEYS, "get", lambda name: None)
+    enc, meta = _wrap()
+    assert json.loads(meta) == {"method": "base64-dev"} and base64.b64decode(enc) == b"k" * 32
+
+
+@pytest.mark.parametrize("error", [CryptoBusyError("queue full"), RuntimeError("pool broke")])
+def test_wrap_failures_never_store_a_plaintext_key(monkeypatch, error):
+    monkeypatch.setattr(tourists.KEYS, "get", lambda name: object())
+    monkeypatch.setattr(tourists, "PROFILE_KEY_MODE", "rsa")
+
+    async def failing_run(op, *args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(tourists.CRYPTO, "run", failing_run)
+    with pytest.raises((CryptoBusyError, HTTPException)) as info:
+        _wrap()
+    if isinstance(info.value, HTTPException):
+        assert info.value.status_code == 503
@@ -0,0 +1,82 @@
+import io
+import os
+
+import pytest
+
+from app.services.crypto_service import GCM_TAG_BYTES, aes_gcm_encrypt
+from app.utils import stream_crypto
+from app.utils.stream_crypto import HEADER_BYTES, decrypt_bytes, decrypt_stream, encrypt_stream, encrypted_size
+
+CHUNK = 64
+KEY = os.urandom(32)
+
+
+def _encrypt(data, chunk_size=CHUNK):
+    return list(encrypt_stream(KEY, io.BytesIO(data), chunk_size))  # [header, chunk0, chunk1, ...]
+
+
+def _decrypt(parts, split=7):
+    """decrypt_stream over the blob cut into arbitrary (non chunk-aligned) pieces."""
+    blob = b"".join(parts)
+    pieces = [blob[i:i + split] for i in range(0, len(blob), split)]
+    return b"".join(decrypt_stream(KEY, pieces))
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 3 * CHUNK, 3 * CHUNK + 5])
+def test_roundtrip(size):
+    data = os.urandom(size)
+    parts = _encrypt(data)
+    assert len(b"".join(parts)) == encrypted_size(size, CHUNK)
+    assert _decrypt(parts) == data
+    assert decrypt_bytes(KEY, b"".join(parts)) == data
+
+
+def test_chunk_aligned_input_ends_with_empty_final_chunk():
+    parts = _encrypt(os.urandom(2 * CHUNK))
+    assert [len(p) for p in parts[1:]] == [CHUNK + GCM_TAG_BYTES] * 2 + [GCM_TAG_BYTES]
+
+
+@pytest.mark.parametrize("decrypt", [_decrypt, lambda parts: decrypt_bytes(KEY, b"".join(parts))])
+def test_dropped_final_chunk_is_rejected(decrypt):
+    # the full chunk before it was sealed as "not last", so the stream cannot end there
+    for data in (os.urandom(2 * CHUNK), os.urandom(2 * CHUNK + 10)):
+        with pytest.raises(ValueError):
+            decrypt(_encrypt(data)[:-1])
+
+
+@pytest.mark.parametrize("decrypt", [_decrypt, lambda parts: decrypt_bytes(KEY, b"".join(parts))])
+def test_cut_inside_a_chunk_is_rejected(decrypt):
+    blob = b"".join(_encrypt(os.urandom(3 * CHUNK)))
+    for cut in (HEADER_BYTES + 5, HEADER_BYTES + CHUNK + GCM_TAG_BYTES + 20, len(blob) - 1):
+        with pytest.raises(ValueError):
+            decrypt([blob[:cut]])
+
+
+def test_reordered_chunks_are_rejected():
+    parts = _encrypt(os.urandom(3 * CHUNK + 5))
+    header, c0, c1, *rest = parts
+    with pytest.raises(ValueError):
+        _decrypt([header, c1, c0, *rest])
+
+
+def test_last_flag_is_bound_into_the_nonce():
+    data = os.urandom(CHUNK + 5)
+    header, c0, _ = _encrypt(data)
+    prefix = header[9:]
+    # the same final bytes sealed with the "more chunks follow" flag do not decrypt as the end
+    forged = aes_gcm_encrypt(KEY, data[CHUNK:], nonce=stream_crypto._nonce(prefix, 1, False), aad=header)[1]
+    with pytest.raises(ValueError):
+        _decrypt([header, c0, forged])
+    # and a full chunk sealed as last cannot be followed by more
+    forged0 = aes_gcm_encrypt(KEY, data[:CHUNK], nonce=stream_crypto._nonce(prefix, 0, True), aad=header)[1]
+    with pytest.raises(ValueError):
+        _decrypt([header, forged0])
+
+
+def test_header_is_authenticated():
+    header, *chunks = _encrypt(os.urandom(CHUNK + 5))
+    tampered = header[:-1] + bytes([header[-1] ^ 1])  # nonce prefix
+    with pytest.raises(ValueError):
+        _decrypt([tampered, *chunks])
+    with pytest.raises(ValueError, match="Not a"):
+        _decrypt([b"XXXX" + header[4:], *chunks])
@@ -0,0 +1,149 @@
+# app/utils/key_envelope.py
+"""
+Dev-mode envelope for KYC data keys: AES key wrap (RFC 3394, "A256KW") under the master key
+from KYC_MASTER_KEY_BASE64.
+
+ - the master key is decoded once per process (first use), not on every encrypt/decrypt
+ - wrap_data_keys / unwrap_data_keys take many keys per call (bulk KYC jobs): master key
+   lookup and envelope detection are done per batch, the wrap itself is cryptography's native
+   aes_key_wrap (a few microseconds per key)
+ - a 32-byte data key wraps to 40 bytes; unwrapping checks the RFC 3394 integrity value
+
+Envelopes written before this module XOR the data key with the master key
+(key_meta {"mode": "dev", "note": "dev-envelope-xor-not-for-prod"}, 32 bytes); they are
+still unwrapped, recognised by key_meta or, when none is given, by their length.
+
+Rotation: set the new key in KYC_MASTER_KEY_BASE64 and the old one in
+KYC_MASTER_KEY_PREVIOUS_BASE64. New envelopes use the new key and record its id
+(key_meta "mk_id"); envelopes of either key unwrap until the rotation engine
+(app/services/key_rotation.py) has rewrapped them all. AES-KW envelopes without an mk_id are
+tried against both keys (the RFC 3394 integrity check tells them apart). Legacy XOR envelopes
+have no integrity check and predate key ids, so they were all written under the first master
+key: with a previous key configured they are unwrapped with it.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from cryptography.hazmat.primitives.keywrap import InvalidUnwrap, aes_key_unwrap, aes_key_wrap
+
+KYC_MASTER_KEY_BASE64 = os.getenv("KYC_MASTER_KEY_BASE64")  # dev-only: base64 32 bytes
+KYC_MASTER_KEY_PREVIOUS_BASE64 = os.getenv("KYC_MASTER_KEY_PREVIOUS_BASE64")  # during a rotation
+
+ENVELOPE_MODE = "aes-kw"
+LEGACY_XOR_MODE = "dev"
+
+_master_key: Optional[bytes] = None
+_previous_key: Optional[bytes] = None
+_master_lock = threading.Lock()
+
+
+def _decode_master(value: str, env: str) -> bytes:
+    mk = base64.b64decode(value)
+    if len(mk) < 32:
+        raise RuntimeError("%s must be at least 32 bytes for dev mode" % env)
+    return mk
+
+
+def master_key() -> bytes:
+    """The decoded master key (cached). Raises RuntimeError when missing or shorter than 32 bytes."""
+    global _master_key
+    if _master_key is None:
+        with _master_lock:
+            if _master_key is None:
+                if not KYC_MASTER_KEY_BASE64:
+                    raise RuntimeError("KYC_MASTER_KEY_BASE64 is required in dev mode")
+                _master_key = _decode_master(KYC_MASTER_KEY_BASE64, "KYC_MASTER_KEY_BASE64")
+    return _master_key
+
+
+def previous_master_key() -> Optional[bytes]:
+    """The key being rotated away from (KYC_MASTER_KEY_PREVIOUS_BASE64), or None."""
+    global _previous_key
+    if _previous_key is None and KYC_MASTER_KEY_PREVIOUS_BASE64:
+        with _master_lock:
+            if _previous_key is None:
+                _previous_key = _decode_master(KYC_MASTER_KEY_PREVIOUS_BASE64, "KYC_MASTER_KEY_PREVIOUS_BASE64")
+    return _previous_key
+
+
+def master_key_id(mk: bytes) -> str:
+    return hashlib.sha256(b"kyc-master-key-id:" + mk[:32]).hexdigest()[:16]
+
+
+def key_meta() -> Dict[str, str]:
+    return {"mode": ENVELOPE_MODE, "alg": "A256KW", "mk_id": master_key_id(master_key())}
+
+
+def _meta_dict(meta: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except ValueError:
+            return None
+    return meta if isinstance(meta, dict) else None
+
+
+def envelope_mode(meta: Any, wrapped: bytes) -> str:
+    """ENVELOPE_MODE or LEGACY_XOR_MODE for a stored envelope (key_meta dict/JSON or None)."""
+    meta = _meta_dict(meta)
+    mode = meta.get("mode") if meta else None
+    if mode in (ENVELOPE_MODE, LEGACY_XOR_MODE):
+        return mode
+    return LEGACY_XOR_MODE if len(wrapped) == 32 else ENVELOPE_MODE
+
+
+def wrap_data_keys(data_keys: Sequence[bytes]) -> List[bytes]:
+    """AES-KW wrap every key (16+ bytes, multiple of 8) under the master key."""
+    kek = master_key()[:32]
+    return [aes_key_wrap(kek, bytes(k)) for k in data_keys]
+
+
+def unwrap_data_keys(wrapped: Sequence[bytes], metas: Optional[Sequence[Any]] = None) -> List[bytes]:
+    """
+    Reverse wrap_data_keys; metas (key_meta per item, optional) lets legacy XOR envelopes be
+    mixed into the batch and names the master key (mk_id). Raises ValueError if an AES-KW
+    envelope fails its integrity check under every candidate key.
+    """
+    mk = master_key()
+    previous = previous_master_key()
+    keys = {master_key_id(mk): mk}
+    if previous is not None:
+        keys[master_key_id(previous)] = previous
+    out: List[bytes] = []
+    for idx, w in enumerate(wrapped):
+        w = bytes(w)
+        meta = _meta_dict(metas[idx]) if metas else None
+        if envelope_mode(meta, w) == LEGACY_XOR_MODE:
+            out.append(_xor(w, previous if previous is not None else mk))
+            continue
+        mk_id = meta.get("mk_id") if meta else None
+        if mk_id is not None and mk_id not in keys:
+            raise ValueError("Master key %s of item %d is not configured" % (mk_id, idx))
+        candidates = [keys[mk_id]] if mk_id is not None else list(keys.values())
+        for key in candidates:
+            try:
+                out.append(aes_key_unwrap(key[:32], w))
+                break
+            except InvalidUnwrap:
+                continue
+        else:
+            raise ValueError("AES key unwrap integrity check failed (item %d)" % idx)
+    return out
+
+
+def _xor(data: bytes, mk: bytes) -> bytes:
+    """Legacy dev envelope (its own inverse)."""
+    return (int.from_bytes(data, "big") ^ int.from_bytes(mk[:len(data)], "big")).to_bytes(len(data), "big")
+
+
+def wrap_data_key(data_key: bytes) -> bytes:
+    return wrap_data_keys([data_key])[0]
+
+
+def unwrap_data_key(wrapped: bytes, meta: Any = None) -> bytes:
+    return unwrap_data_keys([wrapped], [meta])[0]
@@ -2,7 +2,7 @@
 """
 Encryption + IPFS helpers.
 
-DEV MODE (default): Use KYC_MASTER_KEY_BASE64 env var to derive a dev envelope.
+DEV MODE (default): data keys are AES-KW wrapped under KYC_MASTER_KEY_BASE64 (see key_envelope).
 PROD MODE: Set KYC_USE_KMS=true and implement KMS calls in kms_* placeholders.
 """
 
@@ -14,87 +14,154 @@ import requests
 import typing
 import logging
 
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from app.services.crypto_service import (
+    OAEP_HASH_BY_METHOD, aes_gcm_decrypt, aes_gcm_encrypt, decrypt_sym_key_with_rsa,
+)
+from app.utils import key_envelope
 
 logger = logging.getLogger(__name__)
 
 KYC_USE_KMS = os.getenv("KYC_USE_KMS", "false").lower() == "true"
-KYC_MASTER_KEY_BASE64 = os.getenv("KYC_MASTER_KEY_BASE64")  # dev-only: base64 32 bytes
 IPFS_API_URL = os.getenv("IPFS_API_URL", "http://127.0.0.1:5001/api/v0")
 IPFS_PIN_SERVICE = os.getenv("IPFS_PIN_SERVICE")  # optional: nft.storage key or pinata key
 
-def _derive_dev_master_key() -> bytes:
-    if not KYC_MASTER_KEY_BASE64:
-        raise RuntimeError("KYC_MASTER_KEY_BASE64 is required in dev mode")
-    return base64.b64decode(KYC_MASTER_KEY_BASE64)
-
-def encrypt_blob(plaintext_bytes: bytes) -> dict:
+def new_wrapped_data_key() -> typing.Tuple[bytes, str, dict]:
     """
-    Encrypt plaintext bytes with a random AES-256-GCM key.
-    Returns dict with:
-      - ciphertext_b64
-      - iv_b64
-      - encrypted_key (base64 envelope)
-      - key_meta (dict)
+    Fresh AES-256 data key and its envelope: (data_key, encrypted_key (base64), key_meta).
     """
-    # 1) generate random data key
     data_key = secrets.token_bytes(32)  # AES-256
-    aesgcm = AESGCM(data_key)
-    iv = secrets.token_bytes(12)
-    ciphertext = aesgcm.encrypt(iv, plaintext_bytes, None)  # ciphertext includes tag
-    ciphertext_b64 = base64.b64encode(ciphertext).decode("utf-8")
-    iv_b64 = base64.b64encode(iv).decode("utf-8")
-
-    # 2) envelope encrypted key
     if KYC_USE_KMS:
         # TODO: integrate KMS SDK to generate an encrypted data key
         # Example placeholder (must be replaced with actual KMS calls):
         # encrypted_key_blob = kms_generate_data_key_and_encrypt(data_key)
         raise NotImplementedError("KMS mode is enabled but no KMS implementation is provided.")
-    else:
-        # DEV: simple insecure envelope: XOR data_key with master key (dev only)
-        mk = _derive_dev_master_key()
-        if len(mk) < len(data_key):
-            raise RuntimeError("Master key must be at least 32 bytes for dev mode")
-        enc = bytes(a ^ b for a, b in zip(data_key, mk[:len(data_key)]))
-        encrypted_key_blob = base64.b64encode(enc).decode("utf-8")
-        key_meta = {"mode": "dev", "note": "dev-envelope-xor-not-for-prod"}
+    # DEV: AES key wrap under the master key
+    encrypted_key_blob = base64.b64encode(key_envelope.wrap_data_key(data_key)).decode("utf-8")
+    return data_key, encrypted_key_blob, key_envelope.key_meta()
+
+def unwrap_stored_key(encrypted_key_blob: str, key_meta: typing.Any = None) -> bytes:
+    """Data key from a stored envelope (key_meta tells AES-KW from legacy XOR; see key_envelope)."""
+    if KYC_USE_KMS:
+        # TODO: call KMS to decrypt encrypted_key_blob -> data_key
+        raise NotImplementedError("KMS decrypt not implemented")
+    return key_envelope.unwrap_data_key(base64.b64decode(encrypted_key_blob), key_meta)
+
+def unwrap_record_key(encrypted_key_blob: str, key_meta: typing.Any = None) -> bytes:
+    """
+    Data key of a stored KYC record whatever wrapped it: the server RSA key (rsa-pem-env, see
+    kyc_service._wrap_key_for_storage), base64-dev, or the envelope above (AES-KW / XOR / KMS).
+    """
+    meta = key_meta
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except ValueError:
+            meta = None
+    method = meta.get("method") if isinstance(meta, dict) else None
+    if method in OAEP_HASH_BY_METHOD:
+        return decrypt_sym_key_with_rsa(base64.b64decode(encrypted_key_blob), meta.get("key_version"),
+                                        OAEP_HASH_BY_METHOD[method])
+    if method == "base64-dev":
+        return base64.b64decode(encrypted_key_blob)
+    return unwrap_stored_key(encrypted_key_blob, key_meta)
 
+def encrypt_blob_bytes(plaintext: typing.Union[bytes, memoryview]) -> dict:
+    """
+    Encrypt plaintext (any bytes-like object, not copied) with a random AES-256-GCM key.
+    Returns dict with:
+      - ciphertext (bytes, tag appended)
+      - iv (bytes)
+      - encrypted_key (base64 envelope)
+      - key_meta (dict)
+    """
+    data_key, encrypted_key_blob, key_meta = new_wrapped_data_key()
+    iv, ciphertext = aes_gcm_encrypt(data_key, plaintext)
+    return {"ciphertext": ciphertext, "iv": iv, "encrypted_key": encrypted_key_blob, "key_meta": key_meta}
+
+def decrypt_blob_bytes(ciphertext: typing.Union[bytes, memoryview], iv: bytes, encrypted_key_blob: str,
+                       key_meta: typing.Any = None) -> bytes:
+    """
+    Reverse encrypt_blob_bytes; ciphertext may be a memoryview (e.g. a slice of a downloaded blob).
+    key_meta (as stored) tells AES-KW from legacy XOR envelopes; without it the length decides.
+    """
+    data_key = unwrap_stored_key(encrypted_key_blob, key_meta)
+    return aes_gcm_decrypt(data_key, iv, ciphertext)
+
+def encrypt_blob(plaintext_bytes: bytes) -> dict:
+    """
+    Base64 form of encrypt_blob_bytes (compatibility wrapper).
+    Returns dict with:
+      - ciphertext_b64
+      - iv_b64
+      - encrypted_key (base64 envelope)
+      - key_meta (dict)
+    """
+    enc = encrypt_blob_bytes(plaintext_bytes)
     return {
-        "ciphertext_b64": ciphertext_b64,
-        "iv_b64": iv_b64,
-        "encrypted_key": encrypted_key_blob,
-        "key_meta": key_meta,
+        "ciphertext_b64": base64.b64encode(enc["ciphertext"]).decode("utf-8"),
+        "iv_b64": base64.b64encode(enc["iv"]).decode("utf-8"),
+        "encrypted_key": enc["encrypted_key"],
+        "key_meta": enc["key_meta"],
     }
 
-def decrypt_blob(ciphertext_b64: str, iv_b64: str, encrypted_key_blob: str) -> bytes:
+def decrypt_blob(ciphertext_b64: str, iv_b64: str, encrypted_key_blob: str, key_meta: typing.Any = None) -> bytes:
     """
-    Reverse encrypt_blob (dev-mode) and return plaintext bytes.
+    Base64 form of decrypt_blob_bytes (compatibility wrapper); returns plaintext bytes.
     """
-    if KYC_USE_KMS:
-        # TODO: call KMS to decrypt encrypted_key_blob -> data_key
-        raise NotImplementedError("KMS decrypt not implemented")
-    else:
-        mk = _derive_dev_master_key()
-        enc = base64.b64decode(encrypted_key_blob)
-        data_key = bytes(a ^ b for a, b in zip(enc, mk[:len(enc)]))
-    ciphertext = base64.b64decode(ciphertext_b64)
-    iv = base64.b64decode(iv_b64)
-    aesgcm = AESGCM(data_key)
-    plaintext = aesgcm.decrypt(iv, ciphertext, None)
-    return plaintext
+    return decrypt_blob_bytes(base64.b64decode(ciphertext_b64), base64.b64decode(iv_b64), encrypted_key_blob, key_meta)
 
 # -------- IPFS helpers --------
-def upload_to_ipfs_bytes(bytes_data: bytes) -> str:
+def upload_to_ipfs_bytes(bytes_data: typing.Union[bytes, memoryview]) -> str:
     """
     Upload bytes to IPFS and return CID.
     Uses NFT.Storage if IPFS_PIN_SERVICE provided; else tries local IPFS daemon.
     """
+    return _upload_multipart({"file": ("kyc_blob.enc", bytes_data)})
+
+
+class MultipartStream:
+    """
+    multipart/form-data body with a single "file" part whose content comes from an iterator of
+    byte chunks. len() is the exact body size, so requests sends it with a Content-Length and
+    iterates it onto the socket without building the body in memory.
+    """
+
+    def __init__(self, chunks: typing.Iterable[bytes], length: int, filename: str = "kyc_blob.enc"):
+        boundary = secrets.token_hex(16)
+        self.content_type = "multipart/form-data; boundary=%s" % boundary
+        self._head = (
+            '--%s\r\nContent-Disposition: form-data; name="file"; filename="%s"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n" % (boundary, filename)
+        ).encode("utf-8")
+        self._tail = ("\r\n--%s--\r\n" % boundary).encode("utf-8")
+        self._chunks = chunks
+        self._length = len(self._head) + length + len(self._tail)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> typing.Iterator[bytes]:
+        yield self._head
+        for chunk in self._chunks:
+            if chunk:
+                yield chunk
+        yield self._tail
+
+
+def upload_stream_to_ipfs(chunks: typing.Iterable[bytes], length: int, filename: str = "kyc_blob.enc") -> str:
+    """
+    Upload an exactly `length`-byte stream (e.g. stream_crypto.encrypt_stream output) to IPFS
+    and return the CID; same backends as upload_to_ipfs_bytes.
+    """
+    return _upload_multipart(body=MultipartStream(chunks, length, filename))
+
+
+def _upload_multipart(files: typing.Optional[dict] = None, body: typing.Optional[MultipartStream] = None) -> str:
+    kwargs = {"files": files} if body is None else {"data": body, "headers": {"Content-Type": body.content_type}}
     if IPFS_PIN_SERVICE:
         # nft.storage upload endpoint
-        headers = {"Authorization": f"Bearer {IPFS_PIN_SERVICE}"}
-        files = {"file": ("kyc_blob.enc", bytes_data)}
-        resp = requests.post("https://api.nft.storage/upload", headers=headers, files=files, timeout=60)
+        headers = {"Authorization": f"Bearer {IPFS_PIN_SERVICE}", **kwargs.pop("headers", {})}
+        resp = requests.post("https://api.nft.storage/upload", headers=headers, timeout=60, **kwargs)
         resp.raise_for_status()
         j = resp.json()
         # nft.storage returns { "ok": true, "value": { "cid": "...", ... } } in some clients or { "value": { "cid": "..." } }
@@ -115,8 +182,7 @@ def upload_to_ipfs_bytes(bytes_data: bytes) -> str:
         return cid
 
     # Local IPFS daemon (/api/v0/add)
-    files = {"file": ("kyc_blob.enc", bytes_data)}
-    resp = requests.post(f"{IPFS_API_URL}/add", files=files, timeout=60)
+    resp = requests.post(f"{IPFS_API_URL}/add", timeout=60, **kwargs)
     resp.raise_for_status()
 
     # Some IPFS daemon responses are JSON objects, some are newline-delimited JSON strings.
@@ -182,3 +248,29 @@ def download_from_ipfs(cid: str) -> bytes:
         resp = requests.post(f"{IPFS_API_URL}/cat?arg={cid}", timeout=60)
         resp.raise_for_status()
         return resp.content
+
+
+def download_stream_from_ipfs(cid: str, chunk_size: int = 1024 * 1024) -> typing.Iterator[bytes]:
+    """
+    download_from_ipfs as a stream: yields the blob in pieces of up to chunk_size bytes as they
+    arrive, so a large blob is never held in memory as a whole.
+    """
+    if IPFS_PIN_SERVICE:
+        urls = [f"https://{cid}.ipfs.dweb.link", f"https://{cid}.ipfs.nftstorage.link", f"https://ipfs.io/ipfs/{cid}"]
+        last_err = None
+        for url in urls:
+            try:
+                resp = requests.get(url, timeout=30, stream=True)
+                resp.raise_for_status()
+                break
+            except Exception as e:
+                last_err = e
+        else:
+            raise RuntimeError(f"Failed to fetch CID {cid} from nft.storage/public gateways: {last_err}")
+    else:
+        resp = requests.post(f"{IPFS_API_URL}/cat", params={"arg": cid}, timeout=60, stream=True)
+        resp.raise_for_status()
+    with resp:
+        for piece in resp.iter_content(chunk_size):
+            if piece:
+                yield piece
@@ -0,0 +1,79 @@
+# app/utils/merkle.py
+"""
+Keccak Merkle trees for batched KYC anchoring.
+
+Compatible with OpenZeppelin's MerkleProof (sorted-pair hashing), so a proof produced here
+verifies on-chain with MerkleProof.verify(proof, root, leaf) as well as with verify_proof().
+
+ - leaf = keccak256(abi.encode(bytes32 subjectHash, string cid))
+ - parent = keccak256(min(a, b) || max(a, b))
+ - an unpaired node at the end of a level is promoted unchanged to the next level
+"""
+
+from typing import List, Sequence, Union
+
+from eth_abi import encode as abi_encode
+from eth_utils import keccak
+
+HexOrBytes = Union[str, bytes]
+
+
+def to_bytes32(v: HexOrBytes) -> bytes:
+    if isinstance(v, str):
+        v = bytes.fromhex(v[2:] if v.startswith("0x") else v)
+    if len(v) != 32:
+        raise ValueError("expected 32 bytes, got %d" % len(v))
+    return bytes(v)
+
+
+def to_hex(b: bytes) -> str:
+    return "0x" + b.hex()
+
+
+def leaf_hash(subject_hash: HexOrBytes, cid: str) -> bytes:
+    """Leaf for one (subject_hash, cid) attestation; same as the Solidity abi.encode form."""
+    return keccak(abi_encode(["bytes32", "string"], [to_bytes32(subject_hash), cid]))
+
+
+def hash_pair(a: bytes, b: bytes) -> bytes:
+    return keccak(a + b if a <= b else b + a)
+
+
+class MerkleTree:
+    def __init__(self, leaves: Sequence[bytes]):
+        if not leaves:
+            raise ValueError("MerkleTree needs at least one leaf")
+        self.levels: List[List[bytes]] = [list(leaves)]
+        level = self.levels[0]
+        while len(level) > 1:
+            nxt = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                nxt.append(level[-1])
+            self.levels.append(nxt)
+            level = nxt
+
+    @property
+    def root(self) -> bytes:
+        return self.levels[-1][0]
+
+    def __len__(self) -> int:
+        return len(self.levels[0])
+
+    def proof(self, index: int) -> List[bytes]:
+        """Sibling hashes from leaf `index` up to the root."""
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        path = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                path.append(level[sibling])
+            index //= 2
+        return path
+
+
+def verify_proof(leaf: HexOrBytes, proof: Sequence[HexOrBytes], root: HexOrBytes) -> bool:
+    node = to_bytes32(leaf)
+    for sibling in proof:
+        node = hash_pair(node, to_bytes32(sibling))
+    return node == to_bytes32(root)
@@ -0,0 +1,96 @@
+# app/utils/request_body.py
+"""
+Single-pass JSON body decoding for the "flexible" endpoints (/tourists/register, /alerts/sos).
+
+ - the body is read once and parsed once (orjson when installed, stdlib json otherwise),
+ - client key variants (phone / mobile / phone_number, fullName / name, ...) are mapped
+   to canonical names through alias tables compiled once at import time.
+"""
+
+import json
+from typing import Any, Dict, Mapping, Sequence, Tuple
+
+try:  # optional fast path
+    import orjson
+
+    JSON_BACKEND = "orjson"
+
+    def _loads(raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+    JSON_BACKEND = "json"
+
+    def _loads(raw: bytes) -> Any:
+        return json.loads(raw)
+
+
+AliasTable = Dict[str, Tuple[str, int]]
+
+
+def compile_aliases(spec: Mapping[str, Sequence[str]]) -> AliasTable:
+    """
+    Turn {canonical: (alias0, alias1, ...)} into {alias: (canonical, priority)}.
+    Lower priority wins when a payload carries several variants of the same field.
+    """
+    table: AliasTable = {}
+    for canonical, aliases in spec.items():
+        for rank, alias in enumerate(aliases):
+            table[alias] = (canonical, rank)
+    return table
+
+
+REGISTER_ALIASES = compile_aliases(
+    {
+        "phone_number": ("phone_number", "phone", "mobile"),
+        "full_name": ("full_name", "fullName", "name"),
+        "kyc_id": ("kyc_id", "kycId", "kyc"),
+        "visit_start": ("visitStart", "visit_start", "visit_start_date", "visitStartDate"),
+        "visit_end": ("visitEnd", "visit_end", "visit_end_date", "visitEndDate"),
+    }
+)
+
+SOS_ALIASES = compile_aliases(
+    {
+        "phone_number": ("phone_number", "phone", "mobile"),
+        "lat": ("lat", "latitude"),
+        "lng": ("lng", "lon", "longitude"),
+    }
+)
+
+
+def decode_json_body(raw: bytes) -> Any:
+    """Parse raw body bytes. Raises ValueError on invalid JSON or empty body."""
+    if not raw:
+        raise ValueError("empty body")
+    # orjson.JSONDecodeError and json.JSONDecodeError are both ValueError subclasses
+    return _loads(raw)
+
+
+async def read_json_body(request) -> Tuple[bytes, Any]:
+    """Read the request body once and decode it. Returns (raw_bytes, payload)."""
+    raw = await request.body()
+    return raw, decode_json_body(raw)
+
+
+def _is_empty(v: Any) -> bool:
+    return v is None or (isinstance(v, str) and v.strip() == "")
+
+
+def apply_aliases(payload: Mapping[str, Any], table: AliasTable) -> Dict[str, Any]:
+    """
+    Return {canonical: value} for every aliased field present in payload, taking the
+    highest-priority non-empty variant (same semantics as _first_non_empty over the aliases).
+    One pass over the payload keys; unknown keys are ignored.
+    """
+    best: Dict[str, Tuple[int, Any]] = {}
+    for key, value in payload.items():
+        hit = table.get(key)
+        if hit is None or _is_empty(value):
+            continue
+        canonical, rank = hit
+        cur = best.get(canonical)
+        if cur is None or rank < cur[0]:
+            best[canonical] = (rank, value)
+    return {k: v for k, (_, v) in best.items()}
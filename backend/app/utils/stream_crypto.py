@@ -0,0 +1,157 @@
+# app/utils/stream_crypto.py
+"""
+Chunked AES-256-GCM for large blobs (KYC file uploads), encrypted and decrypted in constant
+memory.
+
+Layout ("KYS1"):
+
+    header  = b"KYS1" | version (1) | chunk_size (u32 BE) | nonce_prefix (7)     16 bytes
+    chunk i = AES-GCM(key, nonce_i, plaintext[i*chunk_size : (i+1)*chunk_size], aad=header)
+              -> ciphertext || 16-byte tag
+    nonce_i = nonce_prefix (7) | i (u32 BE) | last (1: 0x01 on the final chunk, else 0x00)
+
+Every chunk is full-size except the last, which may be short or empty. Binding the chunk
+index and a last-chunk flag into the nonce (the STREAM construction) makes reordered,
+dropped or truncated chunks fail authentication, and the header (chunk size, prefix) is
+authenticated as AAD of every chunk.
+"""
+
+import secrets
+import struct
+from typing import BinaryIO, Callable, Iterable, Iterator, Union
+
+from app.services.crypto_service import GCM_TAG_BYTES, aes_gcm_decrypt, aes_gcm_encrypt
+
+MAGIC = b"KYS1"
+VERSION = 1
+HEADER_BYTES = 16
+NONCE_PREFIX_BYTES = 7
+FORMAT = "kyc-stream-v1"  # key_meta["format"] for blobs in this layout
+MAX_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def _header(chunk_size: int, prefix: bytes) -> bytes:
+    return MAGIC + struct.pack(">BI", VERSION, chunk_size) + prefix
+
+
+def _parse_header(header: bytes) -> int:
+    if len(header) != HEADER_BYTES or header[:4] != MAGIC:
+        raise ValueError("Not a %s blob" % FORMAT)
+    version, chunk_size = struct.unpack(">BI", header[4:9])
+    if version != VERSION or not 0 < chunk_size <= MAX_CHUNK_BYTES:
+        raise ValueError("Unsupported stream header (version %d, chunk size %d)" % (version, chunk_size))
+    return chunk_size
+
+
+def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    return prefix + struct.pack(">I", index) + (b"\x01" if last else b"\x00")
+
+
+def encrypted_size(plain_size: int, chunk_size: int) -> int:
+    """Exact ciphertext length (header + chunks + tags) for plain_size bytes of input."""
+    chunks = plain_size // chunk_size + 1  # a final (possibly empty) chunk always follows
+    return HEADER_BYTES + plain_size + chunks * GCM_TAG_BYTES
+
+
+def encrypt_stream(key: bytes, src: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    """
+    Yield the header and then one encrypted chunk at a time while reading src (any object with
+    read(n)), so memory stays at a couple of chunks whatever the input size.
+    """
+    if not 0 < chunk_size <= MAX_CHUNK_BYTES:
+        raise ValueError("chunk_size must be 1..%d" % MAX_CHUNK_BYTES)
+    prefix = secrets.token_bytes(NONCE_PREFIX_BYTES)
+    header = _header(chunk_size, prefix)
+    yield header
+    index = 0
+    current = _read_full(src, chunk_size)
+    while True:
+        # only a short (or empty) chunk is final; input ending on a chunk boundary gets an
+        # empty closing chunk
+        last = len(current) < chunk_size
+        nxt = b"" if last else _read_full(src, chunk_size)
+        yield aes_gcm_encrypt(key, current, nonce=_nonce(prefix, index, last), aad=header)[1]
+        if last:
+            return
+        index += 1
+        current = nxt
+
+
+def _read_full(src: BinaryIO, n: int) -> bytes:
+    """read() until n bytes or EOF (file objects and sockets may return short reads)."""
+    buf = src.read(n)
+    if len(buf) == n or not buf:
+        return buf
+    parts = [buf]
+    got = len(buf)
+    while got < n:
+        more = src.read(n - got)
+        if not more:
+            break
+        parts.append(more)
+        got += len(more)
+    return b"".join(parts)
+
+
+def decrypt_stream(key: bytes, chunks: Iterable[bytes],
+                   decrypt: Callable[..., bytes] = aes_gcm_decrypt) -> Iterator[bytes]:
+    """
+    Yield plaintext chunks from the encrypted byte stream (split arbitrarily, e.g. HTTP
+    response chunks). Raises ValueError on tampering, reordering or truncation.
+    decrypt(key, nonce, sealed, aad=...) opens one chunk (e.g. via the crypto worker pool).
+    """
+    buf = bytearray()
+    it = iter(chunks)
+    header = None
+    chunk_size = 0
+    prefix = b""
+    index = 0
+    exhausted = False
+    while True:
+        # a full sealed chunk is never final (the final one is short), so chunk_size + tag
+        # buffered bytes mean "not the last chunk"
+        need = HEADER_BYTES if header is None else chunk_size + GCM_TAG_BYTES
+        while len(buf) < need and not exhausted:
+            try:
+                buf += next(it)
+            except StopIteration:
+                exhausted = True
+        if header is None:
+            header = bytes(buf[:HEADER_BYTES])
+            chunk_size = _parse_header(header)
+            prefix = header[9:]
+            del buf[:HEADER_BYTES]
+            continue
+        if len(buf) >= need:
+            sealed, last = bytes(buf[:chunk_size + GCM_TAG_BYTES]), False
+            del buf[:chunk_size + GCM_TAG_BYTES]
+        else:
+            if len(buf) < GCM_TAG_BYTES:
+                raise ValueError("Truncated %s blob" % FORMAT)
+            sealed, last = bytes(buf), True
+            buf.clear()
+        yield decrypt(key, _nonce(prefix, index, last), sealed, aad=header)
+        if last:
+            return
+        index += 1
+
+
+def decrypt_bytes(key: bytes, blob: Union[bytes, memoryview]) -> bytes:
+    """decrypt_stream for a blob already in memory: chunks are decrypted from memoryview slices."""
+    view = memoryview(blob)
+    header = bytes(view[:HEADER_BYTES])
+    chunk_size = _parse_header(header)
+    prefix = header[9:]
+    sealed_size = chunk_size + GCM_TAG_BYTES
+    parts = []
+    pos, index = HEADER_BYTES, 0
+    while True:
+        rest = len(view) - pos
+        last = rest < sealed_size  # see decrypt_stream: a full sealed chunk is never final
+        if last and rest < GCM_TAG_BYTES:
+            raise ValueError("Truncated %s blob" % FORMAT)
+        end = len(view) if last else pos + sealed_size
+        parts.append(aes_gcm_decrypt(key, _nonce(prefix, index, last), view[pos:end], aad=header))
+        if last:
+            return b"".join(parts)
+        pos, index = end, index + 1
@@ -0,0 +1,108 @@
+# benchmarks/bench_body_decode.py
+"""
+Microbenchmark for the request body decode step of /tourists/register and /alerts/sos.
+
+Compares the old flow (request.json() after request.body(), json.loads fallback and
+_first_non_empty over every alias, plus the SOS pretty-print) against the shared
+single-pass decoder in app/utils/request_body.py.
+
+Run from backend/:
+    python -m benchmarks.bench_body_decode [--number 20000]
+"""
+
+import argparse
+import json
+import timeit
+
+from app.utils import request_body
+from app.utils.request_body import REGISTER_ALIASES, SOS_ALIASES, apply_aliases, decode_json_body
+
+REGISTER_BODY = json.dumps(
+    {
+        "phone": "+91 98765 43210",
+        "fullName": "Asha Verma",
+        "kycId": "AADHAAR-XXXX-1234",
+        "visitStartDate": "2025-09-12",
+        "visit_end": "2025-09-20",
+        "emergencyContacts": [{"type": "phone", "value": "+919812345678"}],
+        "itinerary": [
+            {"date": "2025-09-%02d" % d, "location": "Place %d" % d, "activity": "Sightseeing"}
+            for d in range(12, 21)
+        ],
+    }
+).encode("utf-8")
+
+SOS_BODY = json.dumps(
+    {"phone_number": "+919876543210", "lat": "17.3616", "lng": "78.4747", "note": "help"}
+).encode("utf-8")
+
+
+def _first_non_empty(*vals):
+    for v in vals:
+        if v is not None and (not (isinstance(v, str) and v.strip() == "")):
+            return v
+    return None
+
+
+def old_register(raw: bytes):
+    # request.json() re-parses the cached body; the except-branch parsed it again on failure
+    payload = json.loads(raw)
+    return {
+        "phone_number": _first_non_empty(payload.get("phone_number"), payload.get("phone"), payload.get("mobile")),
+        "full_name": _first_non_empty(payload.get("full_name"), payload.get("fullName"), payload.get("name")),
+        "kyc_id": _first_non_empty(payload.get("kyc_id"), payload.get("kycId"), payload.get("kyc")),
+        "visit_start": _first_non_empty(
+            payload.get("visitStart"), payload.get("visit_start"),
+            payload.get("visit_start_date"), payload.get("visitStartDate"),
+        ),
+        "visit_end": _first_non_empty(
+            payload.get("visitEnd"), payload.get("visit_end"),
+            payload.get("visit_end_date"), payload.get("visitEndDate"),
+        ),
+    }
+
+
+def new_register(raw: bytes):
+    return apply_aliases(decode_json_body(raw), REGISTER_ALIASES)
+
+
+def old_sos(raw: bytes):
+    raw_text = raw.decode("utf-8")
+    payload = json.loads(raw_text)
+    # debug copies the old handler produced on every request
+    json.dumps(payload, indent=2)
+    json.dumps(payload)
+    return payload
+
+
+def new_sos(raw: bytes):
+    payload = decode_json_body(raw)
+    payload.update(apply_aliases(payload, SOS_ALIASES))
+    return payload
+
+
+def _run(label, fn, raw, number):
+    t = min(timeit.repeat(lambda: fn(raw), number=number, repeat=5))
+    per_call_us = t / number * 1e6
+    print(f"{label:<28} {per_call_us:8.2f} us/op")
+    return per_call_us
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--number", type=int, default=20000)
+    args = ap.parse_args()
+
+    print(f"JSON backend: {request_body.JSON_BACKEND}")
+    assert old_register(REGISTER_BODY) == new_register(REGISTER_BODY)
+
+    a = _run("register: old", old_register, REGISTER_BODY, args.number)
+    b = _run("register: single-pass", new_register, REGISTER_BODY, args.number)
+    print(f"{'':<28} x{a / b:.2f}")
+    a = _run("sos: old (with debug dumps)", old_sos, SOS_BODY, args.number)
+    b = _run("sos: single-pass", new_sos, SOS_BODY, args.number)
+    print(f"{'':<28} x{a / b:.2f}")
+
+
+if __name__ == "__main__":
+    main()
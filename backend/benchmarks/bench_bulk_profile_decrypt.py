@@ -0,0 +1,120 @@
+# benchmarks/bench_bulk_profile_decrypt.py
+"""
+Decrypting N tourist profiles with decrypt_profile.py:
+
+  one at a time : get_profile + fetch_ipfs_blob (new connection each) + load_private_keys
+                  (reads and parses the private key) + unwrap_profile_key + AES-GCM, per phone
+                  (the --phone flow in a loop)
+  bulk          : decrypt_profile.bulk_decrypt (pooled concurrent fetches, process pool that
+                  loads the key once), cold and then warm blob cache
+
+Profiles are rsa-server-pem wrapped; blobs are served by a local HTTP gateway that adds
+--latency-ms per request to stand in for a real IPFS gateway.
+
+Run from backend/:
+    python -m benchmarks.bench_bulk_profile_decrypt [--profiles 300] [--latency-ms 20]
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("SERVER_PUBLIC_KEY_PATH", "keys/server_public.pem")
+
+import decrypt_profile  # noqa: E402
+from app.services import crypto_service  # noqa: E402
+
+PRIVKEY = "keys/server_private.pem"
+
+
+def serve(blobs, latency):
+    class Gateway(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            blob = blobs[self.path.rsplit("/", 1)[-1]]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(blob)))
+            self.end_headers()
+            self.wfile.write(blob)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Gateway)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_db(path, n, blobs):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, phone_number TEXT, profile JSON)")
+    for i in range(n):
+        key = crypto_service.generate_aes_key()
+        nonce, ct = crypto_service.aes_gcm_encrypt(key, json.dumps({"i": i, "pad": "x" * 1500}).encode())
+        wrapped, version = crypto_service.wrap_sym_key_with_server_key(key)
+        blobs["Qm%d" % i] = nonce + ct
+        profile = {
+            "ipfs_cid": "Qm%d" % i,
+            "encrypted_key_b64": base64.b64encode(wrapped).decode(),
+            "iv_b64": base64.b64encode(nonce).decode(),
+            "key_meta": {"method": "rsa-server-pem", "key_version": version},
+        }
+        conn.execute("INSERT INTO users VALUES (?, ?, ?)", (i + 1, "p%d" % i, json.dumps(profile)))
+    conn.commit()
+    conn.close()
+
+
+def one_at_a_time(db, phones, gateway):
+    for phone in phones:
+        profile = decrypt_profile.get_profile(db, phone)
+        blob = decrypt_profile.fetch_ipfs_blob(profile["ipfs_cid"], gateway)
+        key = decrypt_profile.unwrap_profile_key(decrypt_profile.load_private_keys(PRIVKEY), profile)
+        decrypt_profile.decrypt_profile_blob(key, profile, blob)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profiles", type=int, default=300)
+    ap.add_argument("--latency-ms", type=float, default=20)
+    ap.add_argument("--fetch-workers", type=int, default=16)
+    ap.add_argument("--decrypt-workers", type=int, default=None)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    db = os.path.join(work, "t.db")
+    blobs = {}
+    make_db(db, args.profiles, blobs)
+    server = serve(blobs, args.latency_ms / 1000)
+    gateway = "http://127.0.0.1:%d/ipfs" % server.server_port
+    phones = ["p%d" % i for i in range(args.profiles)]
+
+    print("%d profiles, gateway latency %.0f ms, cpus %d" % (args.profiles, args.latency_ms, os.cpu_count() or 1))
+    t0 = time.perf_counter()
+    one_at_a_time(db, phones, gateway)
+    print("%-22s %8.2f s" % ("one at a time", time.perf_counter() - t0))
+    cache = os.path.join(work, "cache")
+    for label in ("bulk, cold cache", "bulk, warm cache"):
+        out = io.StringIO()
+        t0 = time.perf_counter()
+        users = decrypt_profile.select_users(db, phones=phones)
+        counts = decrypt_profile.bulk_decrypt(users, PRIVKEY, gateway, out, args.fetch_workers,
+                                              args.decrypt_workers, cache)
+        elapsed = time.perf_counter() - t0
+        assert counts["ok"] == args.profiles, counts
+        print("%-22s %8.2f s" % (label, elapsed))
+    server.shutdown()
+    shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# benchmarks/bench_chain_throughput.py
+"""
+Throughput of the anchoring path: register_tourist_on_chain and
+register_kyc_attestation_on_chain at a configurable concurrency.
+
+By default runs offline against an in-process eth-tester chain (a Ganache stand-in) with
+TouristRegistry deployed from the Truffle artifact; --rpc points it at a real dev node instead
+(Ganache/Hardhat with unlocked, funded accounts). The real service code path is exercised:
+nonce manager, gas strategy, receipt tracker.
+
+For each operation it reports:
+  - throughput (ops/s, from first submit to last receipt)
+  - submit latency: call -> tx hash returned (what an API request waits for)
+  - confirm latency: call -> receipt seen by the receipt tracker
+  - gas used per operation
+
+registerTourist accepts one registration per msg.sender, so every registration is sent from
+its own funded account holding DEFAULT_ADMIN_ROLE (see PerOpSender); attestations all come
+from the deployer.
+
+Run from backend/:
+    python -m benchmarks.bench_chain_throughput [--ops 200] [--concurrency 8] [--rpc URL]
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import rlp
+from eth_account import Account
+from hexbytes import HexBytes
+from web3 import EthereumTesterProvider, Web3
+
+from app.services import blockchain_service
+from app.services.blockchain_service import ChainHandle
+from app.services.receipt_tracker import RECEIPTS
+
+ARTIFACT = Path(__file__).resolve().parents[1] / "app" / "build" / "contracts" / "TouristRegistry.json"
+
+
+SEND_METHODS = ("eth_sendTransaction", "eth_sendRawTransaction")
+
+
+def _sender_nonce(method, params):
+    if method == "eth_sendTransaction":
+        tx = params[0]
+        nonce = tx.get("nonce")
+        if nonce is None:
+            return None, None
+        return tx["from"], int(nonce, 16) if isinstance(nonce, str) else int(nonce)
+    raw = HexBytes(params[0])
+    fields = rlp.decode(raw[1:]) if raw[0] < 0x7F else rlp.decode(raw)  # typed (EIP-2718) vs legacy
+    nonce = fields[1] if raw[0] < 0x7F else fields[0]
+    return Account.recover_transaction(raw), int.from_bytes(nonce, "big")
+
+
+def serialize_provider(w3):
+    """
+    eth-tester is not thread-safe: serialize every request. It also mines each tx on arrival
+    and has no tx pool, so a send whose nonce is ahead of the account (threads racing between
+    nonce allocation and send) is rejected, where a node would hold it until the gap fills.
+    Hold such sends here (up to 5s) to get node-like behaviour. Only applied in-process.
+    """
+    cond = threading.Condition()
+    inner = w3.provider.make_request
+
+    def expected_nonce(sender):
+        result = inner("eth_getTransactionCount", [sender, "latest"])["result"]
+        return int(result, 16) if isinstance(result, str) else int(result)
+
+    def make_request(method, params):
+        with cond:
+            if method in SEND_METHODS:
+                sender, nonce = _sender_nonce(method, params)
+                deadline = time.monotonic() + 5
+                while nonce is not None and nonce > expected_nonce(sender) and time.monotonic() < deadline:
+                    cond.wait(0.05)
+            try:
+                return inner(method, params)
+            finally:
+                cond.notify_all()
+
+    w3.provider.make_request = make_request
+
+
+def deploy(rpc=None):
+    if rpc:
+        w3 = Web3(Web3.HTTPProvider(rpc))
+    else:
+        w3 = Web3(EthereumTesterProvider())
+        serialize_provider(w3)
+    with open(ARTIFACT) as f:
+        art = json.load(f)
+    sender = w3.eth.accounts[0]
+    factory = w3.eth.contract(abi=art["abi"], bytecode=art["bytecode"])
+    receipt = w3.eth.wait_for_transaction_receipt(factory.constructor().transact({"from": sender}))
+    contract = w3.eth.contract(address=receipt.contractAddress, abi=art["abi"])
+    blockchain_service.CHAIN.configure(w3, contract, sender)
+    return w3, contract, sender
+
+
+class PerOpSender:
+    """
+    Stands in for blockchain_service.CHAIN during the registration phase: each worker thread
+    sends from the handle it was given (locally signed, like a PRIVATE_KEY deployment).
+    """
+
+    def __init__(self, real):
+        self._real = real
+        self._local = threading.local()
+
+    def use(self, handle):
+        self._local.handle = handle
+
+    def require(self):
+        return self._local.handle
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+
+def make_registrants(w3, contract, admin, n):
+    """n fresh local accounts, funded and granted DEFAULT_ADMIN_ROLE (setup, not timed)."""
+    role = contract.functions.DEFAULT_ADMIN_ROLE().call()
+    accounts = [Account.create() for _ in range(n)]
+    last = None
+    for acct in accounts:
+        w3.eth.send_transaction({"from": admin, "to": acct.address, "value": Web3.to_wei(1, "ether")})
+        last = contract.functions.grantRole(role, acct.address).transact({"from": admin})
+    if last is not None:
+        w3.eth.wait_for_transaction_receipt(last)
+    blockchain_service.NONCES.reset()  # setup txs bypassed the nonce manager
+    return [ChainHandle(w3, contract, a.address, a) for a in accounts]
+
+
+def pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def drive(label, n, concurrency, op):
+    """Run op(i) -> tx_hash for i < n on `concurrency` threads; wait for all receipts."""
+    done = threading.Event()
+    lock = threading.Lock()
+    results = []  # (submit_s, confirm_s, gas, ok)
+    remaining = [n]
+
+    def on_receipt(t0, submit_s, tx_hash, receipt, error):
+        with lock:
+            results.append((submit_s, time.perf_counter() - t0, (receipt or {}).get("gasUsed"), error is None))
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done.set()
+
+    def one(i):
+        t0 = time.perf_counter()
+        try:
+            tx_hash, error = op(i), "no tx hash"
+        except Exception as e:
+            tx_hash, error = None, str(e)
+        submit_s = time.perf_counter() - t0
+        if not tx_hash:
+            on_receipt(t0, submit_s, None, None, "send failed: %s" % error)
+            return
+        blockchain_service.on_tx_receipt(tx_hash, lambda h, r, e: on_receipt(t0, submit_s, h, r, e))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n)))
+    done.wait(RECEIPTS.timeout)
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r[3]]
+    submit = [r[0] * 1000 for r in results]
+    confirm = [r[1] * 1000 for r in ok]
+    gas = [r[2] for r in ok if r[2]]
+    print("%-12s ops %4d  ok %4d  conc %2d  %7.1f ops/s | submit ms p50 %6.1f p95 %6.1f p99 %6.1f | "
+          "confirm ms p50 %6.1f p95 %6.1f p99 %6.1f | gas/op %8.0f" % (
+              label, n, len(ok), concurrency, len(ok) / elapsed if elapsed else 0.0,
+              pct(submit, 50), pct(submit, 95), pct(submit, 99),
+              pct(confirm, 50), pct(confirm, 95), pct(confirm, 99),
+              statistics.mean(gas) if gas else 0.0))
+    return {"ops": n, "ok": len(ok), "seconds": elapsed}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ops", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    ap.add_argument("--rpc", help="JSON-RPC URL of a dev node (default: in-process eth-tester)")
+    ap.add_argument("--poll", type=float, default=0.05, help="receipt poll interval (s)")
+    ap.add_argument("--skip-register", action="store_true")
+    args = ap.parse_args()
+
+    RECEIPTS.poll_interval = args.poll
+    w3, contract, admin = deploy(args.rpc)
+    print("chain: %s  contract %s" % (args.rpc or "eth-tester (in-process)", contract.address))
+
+    for conc in args.concurrency:
+        drive("attestation", args.ops, conc, lambda i, c=conc: blockchain_service.register_kyc_attestation_on_chain(
+            "bench-subject-%d-%d" % (c, i), "QmBench%06d" % i, {"i": i}))
+
+    if args.skip_register:
+        return
+    real_chain = blockchain_service.CHAIN
+    rotating = PerOpSender(real_chain)
+    try:
+        blockchain_service.CHAIN = rotating
+        for conc in args.concurrency:
+            handles = make_registrants(w3, contract, admin, args.ops)
+
+            def register(i, handles=handles):
+                rotating.use(handles[i])
+                return blockchain_service.register_tourist_on_chain({
+                    "full_name": "Bench Tourist %d" % i,
+                    "kyc_id": "KYC-BENCH-%d" % i,
+                    "visitStart": "2026-01-01",
+                    "visitEnd": "2026-01-10",
+                    "emergencyContacts": [{"name": "x", "phone": "+910000000000"}],
+                })
+
+            drive("registration", args.ops, conc, register)
+    finally:
+        blockchain_service.CHAIN = real_chain
+
+
+if __name__ == "__main__":
+    main()
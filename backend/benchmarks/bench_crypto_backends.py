@@ -0,0 +1,94 @@
+# benchmarks/bench_crypto_backends.py
+"""
+cryptography (OpenSSL) vs PyCryptodome behind app/services/crypto_service.py, per primitive:
+
+  - AES-256-GCM encrypt / decrypt at several payload sizes (us/op and MB/s)
+  - RSA-OAEP wrap / unwrap of a 32-byte data key, SHA-1 (rsa-server-pem, grantee rewrap)
+    and SHA-256 (rsa-pem-env, KYC)
+
+Every cell goes through the facade with an explicit backend=, so it measures what the service
+would do with CRYPTO_AES_BACKEND / CRYPTO_RSA_BACKEND set to that backend. Before timing, each
+primitive is cross-checked: output of one backend must decrypt with the other (stored blobs
+stay readable whichever backend "auto" picks).
+
+Run from backend/:
+    python -m benchmarks.bench_crypto_backends [--sizes 1024 65536 1048576] [--bits 2048]
+"""
+
+import argparse
+import os
+import time
+
+from app.services import crypto_service as cs
+
+BACKENDS = [b for b in (cs.CRYPTOGRAPHY, cs.PYCRYPTODOME) if cs._available(b)]
+
+
+def timeit(fn, min_seconds=0.3):
+    fn()  # warm-up
+    n, elapsed = 0, 0.0
+    t0 = time.perf_counter()
+    while elapsed < min_seconds:
+        fn()
+        n += 1
+        elapsed = time.perf_counter() - t0
+    return elapsed / n
+
+
+def cross_check(priv, pub):
+    key, data = cs.generate_aes_key(), os.urandom(4096)
+    for a in BACKENDS:
+        for b in BACKENDS:
+            nonce, ct = cs.aes_gcm_encrypt(key, data, aad=b"hdr", backend=a)
+            assert cs.aes_gcm_decrypt(key, nonce, ct, aad=b"hdr", backend=b) == data, (a, b)
+            for h in (cs.OAEP_SHA1, cs.OAEP_SHA256):
+                wrapped = cs.rsa_oaep_encrypt(pub, key, h, backend=a)
+                assert cs.rsa_oaep_decrypt(priv, wrapped, h, backend=b) == key, (a, b, h)
+    print("cross-backend round trips OK (%s)" % " <-> ".join(BACKENDS))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[256, 4096, 65536, 1 << 20, 16 << 20])
+    ap.add_argument("--bits", type=int, default=2048)
+    args = ap.parse_args()
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    pem = rsa.generate_private_key(public_exponent=65537, key_size=args.bits).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    priv = cs.private_key_from_pem(pem)
+    pub = cs.public_key_from_pem(priv.cryptography().public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+
+    print("facade selection: %s" % cs.backend_info())
+    cross_check(priv, pub)
+
+    key = cs.generate_aes_key()
+    print("\nAES-256-GCM            " + "".join("%26s" % b for b in BACKENDS))
+    for size in args.sizes:
+        data = os.urandom(size)
+        for op in ("encrypt", "decrypt"):
+            cells = []
+            for b in BACKENDS:
+                if op == "encrypt":
+                    s = timeit(lambda: cs.aes_gcm_encrypt(key, data, backend=b))
+                else:
+                    nonce, ct = cs.aes_gcm_encrypt(key, data, backend=b)
+                    s = timeit(lambda: cs.aes_gcm_decrypt(key, nonce, ct, backend=b))
+                cells.append("%10.1f us %9.1f MB/s" % (s * 1e6, size / s / 1e6))
+            print("%-8s %10d B  %s" % (op, size, "".join("%26s" % c for c in cells)))
+
+    sym = os.urandom(32)
+    print("\nRSA-%d OAEP, 32-byte key " % args.bits + "".join("%14s" % b for b in BACKENDS))
+    for h in (cs.OAEP_SHA1, cs.OAEP_SHA256):
+        wrapped = cs.rsa_oaep_encrypt(pub, sym, h)
+        wrap = [timeit(lambda: cs.rsa_oaep_encrypt(pub, sym, h, backend=b)) for b in BACKENDS]
+        unwrap = [timeit(lambda: cs.rsa_oaep_decrypt(priv, wrapped, h, backend=b)) for b in BACKENDS]
+        print("wrap   %-6s (us/op)        %s" % (h, "".join("%14.1f" % (s * 1e6) for s in wrap)))
+        print("unwrap %-6s (us/op)        %s" % (h, "".join("%14.1f" % (s * 1e6) for s in unwrap)))
+
+
+if __name__ == "__main__":
+    main()
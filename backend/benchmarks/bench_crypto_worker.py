@@ -0,0 +1,92 @@
+# benchmarks/bench_crypto_worker.py
+"""
+Crypto work inline vs through the crypto worker pool (app/services/crypto_worker.py):
+
+  inline        : op called on the caller thread, one after another
+  pool, serial  : CRYPTO.call per job (one IPC round trip each; the latency floor)
+  pool, burst   : all jobs submitted at once, so the dispatcher batches them
+                  (what concurrent registrations / KYC requests look like)
+
+Ops: RSA-2048 OAEP unwrap with the server key (the expensive one), and AES-GCM over
+profile-sized (4 KiB) and KYC-blob-sized (256 KiB) payloads. The pool only wins when the
+host has cores to spare: on a single-core host the burst numbers show the batching overhead,
+not a speed-up.
+
+Run from backend/:
+    python -m benchmarks.bench_crypto_worker [--jobs 400] [--workers 1 2 4]
+"""
+
+import argparse
+import os
+import time
+
+from app.services import crypto_service
+from app.services.crypto_worker import OPS, CryptoWorker
+
+
+def inline(op, args, jobs):
+    fn = OPS[op]
+    for _ in range(jobs):
+        fn(*args)
+
+
+def serial(worker, op, args, jobs):
+    for _ in range(jobs):
+        worker.call(op, *args)
+
+
+def burst(worker, op, args, jobs):
+    futs = [worker.submit(op, *args) for _ in range(jobs)]
+    for f in futs:
+        f.result()
+
+
+def us_per_job(fn, jobs):
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) / jobs * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=400)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = ap.parse_args()
+
+    key = crypto_service.generate_aes_key()
+    wrapped, version = crypto_service.wrap_sym_key_with_server_key(key)
+    cases = [
+        ("rsa unwrap", "unwrap_server_key", (wrapped, version)),
+        ("aes-gcm 4 KiB", "aes_gcm_encrypt", (key, os.urandom(4096))),
+        ("aes-gcm 256 KiB", "aes_gcm_encrypt", (key, os.urandom(256 * 1024))),
+    ]
+    print("cpus %d, %d jobs per case, us per job" % (os.cpu_count() or 1, args.jobs))
+    header = "%-16s %10s" % ("op", "inline")
+    for n in args.workers:
+        header += " %14s %14s" % ("pool%d serial" % n, "pool%d burst" % n)
+    print(header)
+
+    workers = {}
+    for n in args.workers:
+        w = CryptoWorker(workers=n)
+        w.start()
+        w.call("aes_gcm_encrypt", key, b"warm-up")
+        workers[n] = w
+    try:
+        for label, op, op_args in cases:
+            row = "%-16s %10.1f" % (label, us_per_job(lambda: inline(op, op_args, args.jobs), args.jobs))
+            for n, w in workers.items():
+                row += " %14.1f %14.1f" % (
+                    us_per_job(lambda: serial(w, op, op_args, args.jobs), args.jobs),
+                    us_per_job(lambda: burst(w, op, op_args, args.jobs), args.jobs),
+                )
+            print(row)
+        for n, w in workers.items():
+            print("pool%d: %s batches, avg %s jobs" % (n, w.stats()["batches"], w.stats()["avg_batch_size"]))
+    finally:
+        for w in workers.values():
+            w.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_data_key_cache.py
+"""
+Crypto CPU per tourist profile, by PROFILE_KEY_MODE (app/services/data_key_cache.py):
+
+  rsa : fresh data key, AES-GCM over the profile, RSA-OAEP wrap with the server key
+  kek : fresh data key, AES-GCM over the profile, AES key wrap under the cached KEK
+        (one RSA wrap per KEK_MAX_MESSAGES profiles)
+
+plus the read side (unwrap the data key of a stored record): RSA-OAEP unwrap per record vs
+AES key unwrap with the KEK unwrapped once per kek_id.
+
+Run from backend/ with a server key pair configured:
+    SERVER_PUBLIC_KEY_PATH=keys/server_public.pem SERVER_PRIVATE_KEY_PATH=keys/server_private.pem \\
+        python -m benchmarks.bench_data_key_cache [--profiles 2000] [--profile-bytes 2048]
+"""
+
+import argparse
+import os
+import time
+
+from app.services import crypto_service
+from app.services.data_key_cache import DataKeyCache
+
+
+def rsa_encrypt(plaintext):
+    key = crypto_service.generate_aes_key()
+    crypto_service.aes_gcm_encrypt(key, plaintext)
+    return crypto_service.wrap_sym_key_with_server_key(key)
+
+
+def us_per_item(fn, items):
+    t0 = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - t0) / len(items) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profiles", type=int, default=2000)
+    ap.add_argument("--profile-bytes", type=int, default=2048)
+    args = ap.parse_args()
+
+    plaintexts = [os.urandom(args.profile_bytes) for _ in range(args.profiles)]
+    cache = DataKeyCache(max_age_seconds=3600, max_messages=10000)
+
+    def kek_encrypt(plaintext):
+        key = crypto_service.generate_aes_key()
+        crypto_service.aes_gcm_encrypt(key, plaintext)
+        return cache.wrap(key)
+
+    n_rsa = min(len(plaintexts), 500)
+    print("%-14s %14s %14s" % ("us / profile", "encrypt+wrap", "unwrap"))
+    rsa_wrapped = [rsa_encrypt(p) for p in plaintexts[:n_rsa]]
+    print("%-14s %14.1f %14.1f" % (
+        "rsa",
+        us_per_item(rsa_encrypt, plaintexts[:n_rsa]),
+        us_per_item(lambda w: crypto_service.decrypt_sym_key_with_rsa(*w), rsa_wrapped),
+    ))
+    kek_wrapped = [kek_encrypt(p) for p in plaintexts]
+    reader = DataKeyCache()  # cold KEK cache, as in another process
+    print("%-14s %14.1f %14.1f" % (
+        "kek",
+        us_per_item(kek_encrypt, plaintexts),
+        us_per_item(lambda w: reader.unwrap(*w), kek_wrapped),
+    ))
+    print("KEKs created: %d, reader KEK unwraps: %d" % (cache.keks_created, reader.stats()["unwrap_cache_misses"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_key_registry.py
+"""
+Per-call PEM parsing vs the key registry (app/services/key_registry.py) for small-payload
+key wrapping: wrap one 32-byte AES key with the server RSA key, as every registration and
+KYC submission does.
+
+  parse-per-call  : read PEM file + RSA.import_key / load_pem_*_key + OAEP   (old code path)
+  registry        : crypto_service / KEYS entry, parsed once                  (current)
+
+A fresh RSA key pair is written to a temp dir and used through SERVER_PUBLIC_KEY_PATH /
+SERVER_PRIVATE_KEY_PATH.
+
+Run from backend/:
+    python -m benchmarks.bench_key_registry [--n 500] [--bits 2048]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from Crypto.Cipher import PKCS1_OAEP
+from Crypto.PublicKey import RSA
+
+OAEP_SHA256 = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+
+def write_keys(bits):
+    d = tempfile.mkdtemp()
+    priv = rsa.generate_private_key(public_exponent=65537, key_size=bits)
+    pub_path, priv_path = os.path.join(d, "pub.pem"), os.path.join(d, "priv.pem")
+    with open(pub_path, "wb") as f:
+        f.write(priv.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+    with open(priv_path, "wb") as f:
+        f.write(priv.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                   serialization.NoEncryption()))
+    return pub_path, priv_path
+
+
+def timeit(fn, n):
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=500)
+    ap.add_argument("--bits", type=int, default=2048)
+    args = ap.parse_args()
+
+    pub_path, priv_path = write_keys(args.bits)
+    os.environ["SERVER_PUBLIC_KEY_PATH"] = pub_path
+    os.environ["SERVER_PRIVATE_KEY_PATH"] = priv_path
+    from app.services import crypto_service
+    from app.services.key_registry import KEYS, SERVER_PUBLIC
+
+    key = os.urandom(32)
+    wrapped = crypto_service.encrypt_sym_key_with_rsa(key)
+
+    def old_wrap_pycryptodome():
+        with open(pub_path, "rb") as fh:
+            PKCS1_OAEP.new(RSA.import_key(fh.read())).encrypt(key)
+
+    def old_wrap_cryptography():
+        with open(pub_path, "rb") as fh:
+            serialization.load_pem_public_key(fh.read()).encrypt(key, OAEP_SHA256)
+
+    def old_unwrap():
+        with open(priv_path, "rb") as fh:
+            PKCS1_OAEP.new(RSA.import_key(fh.read())).decrypt(wrapped)
+
+    rows = [
+        ("wrap   pycryptodome (tourists)",
+         old_wrap_pycryptodome, lambda: crypto_service.encrypt_sym_key_with_rsa(key)),
+        ("wrap   cryptography (kyc)",
+         old_wrap_cryptography, lambda: KEYS.require(SERVER_PUBLIC).cryptography().encrypt(key, OAEP_SHA256)),
+        ("unwrap pycryptodome (rewrap)",
+         old_unwrap, lambda: crypto_service.decrypt_sym_key_with_rsa(wrapped)),
+    ]
+    print("RSA-%d, %d calls each, microseconds per call" % (args.bits, args.n))
+    print("%-32s %16s %12s %8s" % ("", "parse-per-call", "registry", "speedup"))
+    for label, old, new in rows:
+        t_old, t_new = timeit(old, args.n), timeit(new, args.n)
+        print("%-32s %16.1f %12.1f %7.1fx" % (label, t_old, t_new, t_old / t_new))
+    print("registry loads:", KEYS.stats()["loads"])
+
+
+if __name__ == "__main__":
+    main()
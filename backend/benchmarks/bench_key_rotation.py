@@ -0,0 +1,150 @@
+# benchmarks/bench_key_rotation.py
+"""
+Moving N stored records from the old keys to the new ones (app/services/key_rotation.py):
+
+  re-encrypt : what rotation costs without envelopes: decrypt each KYC blob with its data key
+               and encrypt it again under a fresh key (IPFS download / upload not counted)
+  rewrap kyc : the rotation engine's KYC chunks: AES-KW data keys unwrapped with the previous
+               master key and wrapped with the new one, blobs untouched
+  rewrap rsa : the engine's profile chunks for rsa-server-pem records (RSA-OAEP unwrap with
+               the previous server key, wrap with the new one)
+  rewrap kek : the same for kek-aes-kw records (one RSA rewrap per KEK)
+
+Key pairs and master keys are generated on the fly; records go to fresh SQLite files.
+
+Run from backend/:
+    python -m benchmarks.bench_key_rotation [--records 2000] [--blob-kib 512] [--chunk 200]
+"""
+
+import argparse
+import base64
+import os
+import tempfile
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+_KEYS = tempfile.mkdtemp()
+
+
+def _write_pair(tag):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    priv, pub = os.path.join(_KEYS, tag + "_private.pem"), os.path.join(_KEYS, tag + "_public.pem")
+    with open(priv, "wb") as fh:
+        fh.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                   serialization.NoEncryption()))
+    with open(pub, "wb") as fh:
+        fh.write(key.public_key().public_bytes(serialization.Encoding.PEM,
+                                               serialization.PublicFormat.SubjectPublicKeyInfo))
+    return priv, pub
+
+
+_old_priv, _old_pub = _write_pair("old")
+_new_priv, _new_pub = _write_pair("new")
+os.environ.update(
+    SERVER_PUBLIC_KEY_PATH=_new_pub,
+    SERVER_PRIVATE_KEY_PATH=_new_priv,
+    SERVER_PRIVATE_KEY_PREVIOUS_PATH=_old_priv,
+    KYC_MASTER_KEY_BASE64=base64.b64encode(os.urandom(32)).decode(),
+    KYC_MASTER_KEY_PREVIOUS_BASE64=base64.b64encode(os.urandom(32)).decode(),
+)
+
+from cryptography.hazmat.primitives.keywrap import aes_key_wrap  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.models import kyc_model, tourist_models  # noqa: E402
+from app.services import crypto_service, key_rotation  # noqa: E402
+from app.services.data_key_cache import KEK_METHOD, kek_id_for  # noqa: E402
+from app.utils import key_envelope, kyc_utils  # noqa: E402
+
+
+def _engine(name, base):
+    engine = create_engine("sqlite:///%s" % os.path.join(tempfile.mkdtemp(), name))
+    base.metadata.create_all(engine)
+    return engine
+
+
+def kyc_db(records):
+    """Records wrapped under the previous master key."""
+    engine = _engine("kyc.db", kyc_model.Base)
+    old = key_envelope.previous_master_key()
+    meta = {"mode": key_envelope.ENVELOPE_MODE, "alg": "A256KW", "mk_id": key_envelope.master_key_id(old)}
+    with Session(bind=engine) as db:
+        for i in range(records):
+            enc = base64.b64encode(aes_key_wrap(old[:32], os.urandom(32))).decode()
+            db.add(kyc_model.KYCRecord(phone_number="p%d" % i, ipfs_cid="Q", encrypted_key=enc, key_meta=meta))
+        db.commit()
+    return engine
+
+
+def profiles_db(records, method):
+    """Profiles wrapped with the previous server key (rsa-server-pem, or kek-aes-kw sharing 1 KEK)."""
+    engine = _engine("profiles.db", tourist_models.Base)
+    with open(_old_pub, "rb") as fh:
+        old = crypto_service.public_key_from_pem(fh.read())
+    version = old.version
+    kek = os.urandom(32)
+    wrapped_kek = crypto_service.rsa_oaep_encrypt(old, kek)
+    with Session(bind=engine) as db:
+        for i in range(records):
+            if method == KEK_METHOD:
+                enc = aes_key_wrap(kek, os.urandom(32))
+                meta = {"method": KEK_METHOD, "alg": "A256KW", "kek_id": kek_id_for(wrapped_kek),
+                        "kek_wrapped_b64": base64.b64encode(wrapped_kek).decode(), "key_version": version}
+            else:
+                enc = crypto_service.rsa_oaep_encrypt(old, os.urandom(32))
+                meta = {"method": "rsa-server-pem", "key_version": version}
+            db.add(tourist_models.User(phone_number="p%d" % i, profile={
+                "ipfs_cid": "Q", "encrypted_key_b64": base64.b64encode(enc).decode(), "iv_b64": "", "key_meta": meta,
+            }))
+        db.commit()
+    return engine
+
+
+def rotate(engine, handler, chunk):
+    """Run a target's chunk handler over the whole table; returns (seconds, counts)."""
+    rw = key_rotation._Rewrapper()
+    totals = {}
+    cursor = 0
+    t0 = time.perf_counter()
+    while True:
+        cursor, counts, _ = handler(engine, cursor, chunk, rw)
+        if not sum(counts.values()):
+            return time.perf_counter() - t0, totals
+        for k, v in counts.items():
+            totals[k] = totals.get(k, 0) + v
+
+
+def reencrypt(records, blob_kib):
+    blob = os.urandom(blob_kib * 1024)
+    out = kyc_utils.encrypt_blob_bytes(blob)
+    t0 = time.perf_counter()
+    for _ in range(records):
+        plain = kyc_utils.decrypt_blob_bytes(out["ciphertext"], out["iv"], out["encrypted_key"], out["key_meta"])
+        kyc_utils.encrypt_blob_bytes(plain)
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=2000)
+    ap.add_argument("--blob-kib", type=int, default=512)
+    ap.add_argument("--chunk", type=int, default=200)
+    args = ap.parse_args()
+    n = args.records
+
+    def report(label, elapsed, counts=None):
+        if counts is not None:
+            assert counts.get(key_rotation.REWRAPPED) == n, counts
+        print("%-11s %8.2f s  %9.0f records/s" % (label, elapsed, n / elapsed))
+
+    report("re-encrypt", reencrypt(n, args.blob_kib))
+    report("rewrap kyc", *rotate(kyc_db(n), key_rotation._kyc_chunk, args.chunk))
+    report("rewrap rsa", *rotate(profiles_db(n, "rsa-server-pem"), key_rotation._profiles_chunk, args.chunk))
+    report("rewrap kek", *rotate(profiles_db(n, KEK_METHOD), key_rotation._profiles_chunk, args.chunk))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_kyc_bytes_path.py
+"""
+CPU and allocation per KYC operation, base64 path vs bytes-native path (app/utils/kyc_utils.py):
+
+  submit   : plaintext -> bytes handed to the IPFS upload
+             base64 : encrypt_blob (ciphertext_b64) + b64decode       (old submit_kyc)
+             bytes  : encrypt_blob_bytes                              (current)
+  download : downloaded blob -> plaintext
+             base64 : b64encode + decrypt_blob (decodes again)        (old get_kyc)
+             bytes  : decrypt_blob_bytes on the downloaded bytes      (current)
+
+Reported per operation: wall time (us) and tracemalloc peak above the inputs (KB).
+
+Run from backend/:
+    python -m benchmarks.bench_kyc_bytes_path [--sizes 1024 65536 1048576 5242880]
+"""
+
+import argparse
+import base64
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("KYC_MASTER_KEY_BASE64", base64.b64encode(os.urandom(32)).decode())
+
+from app.utils.kyc_utils import decrypt_blob, decrypt_blob_bytes, encrypt_blob, encrypt_blob_bytes  # noqa: E402
+
+
+def submit_b64(plaintext):
+    enc = encrypt_blob(plaintext)
+    return base64.b64decode(enc["ciphertext_b64"]), enc
+
+
+def submit_bytes(plaintext):
+    enc = encrypt_blob_bytes(plaintext)
+    return enc["ciphertext"], enc
+
+
+def download_b64(blob, enc):
+    iv_b64 = base64.b64encode(enc["iv"]).decode()
+    return decrypt_blob(base64.b64encode(blob).decode("utf-8"), iv_b64, enc["encrypted_key"], enc["key_meta"])
+
+
+def download_bytes(blob, enc):
+    return decrypt_blob_bytes(blob, enc["iv"], enc["encrypted_key"], enc["key_meta"])
+
+
+def per_op(fn, *args, min_seconds=0.3):
+    fn(*args)
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n, t0 = 0, time.perf_counter()
+    while time.perf_counter() - t0 < min_seconds:
+        fn(*args)
+        n += 1
+    return (time.perf_counter() - t0) / n * 1e6, peak / 1024
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1024, 65536, 1 << 20, 5 << 20])
+    args = ap.parse_args()
+
+    print("%-9s %10s  %24s  %24s" % ("op", "bytes", "base64 (us / peak KB)", "bytes (us / peak KB)"))
+    for size in args.sizes:
+        plaintext = os.urandom(size)
+        blob, enc = submit_bytes(plaintext)
+        enc = dict(enc)
+        assert download_b64(blob, enc) == download_bytes(blob, enc) == plaintext
+        for op, old, new, fn_args in (
+            ("submit", submit_b64, submit_bytes, (plaintext,)),
+            ("download", download_b64, download_bytes, (blob, enc)),
+        ):
+            cells = ["%12.1f / %9.1f" % per_op(fn, *fn_args) for fn in (old, new)]
+            print("%-9s %10d  %24s  %24s" % (op, size, cells[0], cells[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bench_kyc_grant_batch.py
+"""
+Granting one grantee access to N KYC records:
+
+  per call : what N calls of a one-record grant cost before kyc_grants: grantee PEM
+             re-imported (pycryptodome) per record, key unwrapped, rewrapped, one
+             INSERT + COMMIT per grant row
+  batch    : kyc_grants chunk path: grantee key parsed once, rewraps submitted to the
+             crypto worker together, one bulk insert + commit per chunk
+
+Records use the dev envelope (AES-KW under KYC_MASTER_KEY_BASE64); both paths write to a
+fresh SQLite file.
+
+Run from backend/:
+    python -m benchmarks.bench_kyc_grant_batch [--records 2000] [--chunk 500]
+"""
+
+import argparse
+import base64
+import os
+import tempfile
+import time
+
+os.environ.setdefault("KYC_MASTER_KEY_BASE64", base64.b64encode(os.urandom(32)).decode())
+
+from Crypto.Cipher import PKCS1_OAEP  # noqa: E402
+from Crypto.PublicKey import RSA  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.models import kyc_model  # noqa: E402
+from app.models.tourist_models import KYCAccessGrant  # noqa: E402
+from app.services import kyc_grants  # noqa: E402
+from app.utils import kyc_utils  # noqa: E402
+
+
+def make_db(records):
+    path = os.path.join(tempfile.mkdtemp(), "grants.db")
+    engine = create_engine("sqlite:///%s" % path)
+    kyc_model.Base.metadata.create_all(engine)
+    kyc_grants.ensure_grant_table(engine)
+    db = sessionmaker(bind=engine)()
+    for i in range(records):
+        _, enc, meta = kyc_utils.new_wrapped_data_key()
+        db.add(kyc_model.KYCRecord(phone_number="p%d" % i, ipfs_cid="Q", encrypted_key=enc, key_meta=meta))
+    db.commit()
+    return db
+
+
+def per_call(db, pem):
+    for rec in db.query(kyc_model.KYCRecord).all():
+        sym = kyc_utils.unwrap_stored_key(rec.encrypted_key, rec.key_meta)
+        wrapped = PKCS1_OAEP.new(RSA.import_key(pem)).encrypt(sym)
+        db.add(KYCAccessGrant(kyc_id=rec.id, grantee_address="g", created_by="bench",
+                              encrypted_key_for_grantee=base64.b64encode(wrapped).decode()))
+        db.commit()
+
+
+def batch(db, pem, chunk):
+    ids = [r[0] for r in db.query(kyc_model.KYCRecord.id).order_by(kyc_model.KYCRecord.id)]
+    for i in range(0, len(ids), chunk):
+        records = db.query(kyc_model.KYCRecord).filter(kyc_model.KYCRecord.id.in_(ids[i:i + chunk])).all()
+        kyc_grants._grant_chunk(db, records, "g", pem.encode(), "bench")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=2000)
+    ap.add_argument("--chunk", type=int, default=500)
+    args = ap.parse_args()
+
+    pem = RSA.generate(2048).publickey().export_key().decode()
+    for label, fn in (("per call", lambda db: per_call(db, pem)), ("batch", lambda db: batch(db, pem, args.chunk))):
+        db = make_db(args.records)
+        t0 = time.perf_counter()
+        fn(db)
+        elapsed = time.perf_counter() - t0
+        granted = db.query(KYCAccessGrant).count()
+        assert granted == args.records, granted
+        print("%-9s %8.2f s  %8.0f grants/s" % (label, elapsed, args.records / elapsed))
+
+
+if __name__ == "__main__":
+    main()
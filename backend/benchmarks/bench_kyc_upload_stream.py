@@ -0,0 +1,88 @@
+# benchmarks/bench_kyc_upload_stream.py
+"""
+Peak memory and time to turn an uploaded KYC file into the IPFS request body:
+
+  one buffer : file.read() + encrypt_blob (AES-GCM over the whole file, base64 out) +
+               base64 decode + multipart body built in memory        (old /kyc/upload path)
+  streamed   : stream_crypto.encrypt_stream over the spooled file, fed through
+               kyc_utils.MultipartStream                               (current)
+
+The body is consumed by a null sink instead of the network, so only the client side is
+measured. Peak memory is tracemalloc's traced peak.
+
+Run from backend/:
+    python -m benchmarks.bench_kyc_upload_stream [--sizes-mb 5 50 200] [--chunk-kb 1024]
+"""
+
+import argparse
+import base64
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("KYC_MASTER_KEY_BASE64", base64.b64encode(os.urandom(32)).decode())
+
+from app.utils import stream_crypto  # noqa: E402
+from app.utils.kyc_utils import MultipartStream, encrypt_blob, new_wrapped_data_key  # noqa: E402
+
+
+def spool(size):
+    f = tempfile.TemporaryFile()
+    block = os.urandom(1 << 20)
+    for _ in range(size >> 20):
+        f.write(block)
+    f.write(os.urandom(size % (1 << 20)))
+    f.seek(0)
+    return f
+
+
+def one_buffer(f, size, chunk):
+    content = f.read()
+    enc = encrypt_blob(content)
+    body = b"--b\r\n\r\n" + base64.b64decode(enc["ciphertext_b64"]) + b"\r\n--b--\r\n"
+    return len(body)
+
+
+def streamed(f, size, chunk):
+    key, _, _ = new_wrapped_data_key()
+    body = MultipartStream(stream_crypto.encrypt_stream(key, f, chunk), stream_crypto.encrypted_size(size, chunk))
+    sent = 0
+    for piece in body:
+        sent += len(piece)
+    assert sent == len(body)
+    return sent
+
+
+def measure(fn, size, chunk):
+    f = spool(size)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn(f, size, chunk)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    f.close()
+    return elapsed, peak
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes-mb", type=int, nargs="+", default=[5, 50, 200])
+    ap.add_argument("--chunk-kb", type=int, default=1024)
+    args = ap.parse_args()
+    chunk = args.chunk_kb * 1024
+
+    print("chunk %d KiB" % args.chunk_kb)
+    print("%8s  %22s  %22s" % ("file", "one buffer", "streamed"))
+    for mb in args.sizes_mb:
+        size = mb << 20
+        cells = []
+        for fn in (one_buffer, streamed):
+            elapsed, peak = measure(fn, size, chunk)
+            cells.append("%6.0f ms %8.1f MB" % (elapsed * 1000, peak / 1e6))
+        print("%5d MB  %22s  %22s" % (mb, cells[0], cells[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/bench_startup.py
+"""
+API startup time with the blockchain node down (or slow to come up).
+
+Each run imports app.main in a fresh interpreter, starts the app through TestClient and
+times the first GET / and GET /health. GANACHE_URL points at a closed local port, so the
+node is unreachable.
+
+Run from backend/:
+    python -m benchmarks.bench_startup [--runs 3] [--backend-dir PATH]
+
+--backend-dir lets you point the same harness at another checkout (e.g. an older revision
+in a git worktree) for before/after numbers.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+try:
+    import app.main
+except BaseException as e:
+    print(json.dumps({"import_s": time.perf_counter() - t0, "error": repr(e)[:200]}))
+    sys.exit(0)
+t_import = time.perf_counter() - t0
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as c:
+    t1 = time.perf_counter()
+    root = c.get("/").status_code
+    t_root = time.perf_counter() - t1
+    t2 = time.perf_counter()
+    h = c.get("/health")
+    t_health = time.perf_counter() - t2
+print(json.dumps({
+    "import_s": t_import,
+    "first_root_s": t_root,
+    "root_status": root,
+    "health_status": h.status_code,
+    "health": h.json() if h.status_code == 200 else None,
+}))
+"""
+
+
+def run_once(backend_dir: Path, workdir: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("GANACHE_URL", "http://127.0.0.1:9")  # discard port: connection refused
+    env.setdefault("TOURIST_DATABASE_URL", "sqlite:///%s/bench.db" % workdir)
+    env["PYTHONPATH"] = str(backend_dir)
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=300,
+    )
+    lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+    if not lines:
+        return {"error": (proc.stderr or proc.stdout)[-300:]}
+    return json.loads(lines[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--backend-dir", default=str(Path(__file__).resolve().parents[1]))
+    args = ap.parse_args()
+
+    backend_dir = Path(args.backend_dir).resolve()
+    results = []
+    for i in range(args.runs):
+        with tempfile.TemporaryDirectory() as work:
+            r = run_once(backend_dir, work)
+        results.append(r)
+        print("run %d: %s" % (i + 1, json.dumps(r)))
+
+    ok = [r for r in results if "error" not in r]
+    if ok:
+        print("median import: %.3fs  first GET /: %.4fs" % (
+            statistics.median(r["import_s"] for r in ok),
+            statistics.median(r["first_root_s"] for r in ok),
+        ))
+    else:
+        print("app did not start: median time to failure %.3fs" % statistics.median(r.get("import_s", 0) for r in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,37 @@
+"""
+Decrypt tourist profiles stored by /tourists/register (IPFS blob + wrapped key in users.profile).
+
+One profile, pretty-printed:
+    python decrypt_profile.py --db tourists.db --phone 919876543210 --privkey keys/server_private.pem
+
+After a server key rotation pass every key still in use (--privkey is repeatable); each
+profile is unwrapped with the key named by key_meta["key_version"] (records without one try
+the keys in the given order):
+    python decrypt_profile.py ... --privkey keys/server_private.pem --privkey keys/server_private_old.pem
+
+Bulk (incident response), one NDJSON line per profile on stdout or --out, written as each
+profile finishes:
+    python decrypt_profile.py --db tourists.db --privkey keys/server_private.pem --phones-file phones.txt
+    python decrypt_profile.py --db tourists.db --privkey keys/server_private.pem \\
+        --zone zone-hyderabad-charminar --at 2025-01-01T18:00 --window-minutes 30
+
+Bulk mode fetches blobs concurrently over one pooled HTTP session (--fetch-workers) and keeps
+them in --cache-dir (CIDs are content addressed, so cached blobs never go stale); key unwrap
+and AES-GCM decryption run in a process pool (--decrypt-workers) whose workers load the
+private key once.
+"""
+
 import sqlite3, json, base64, requests, argparse
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import datetime
+import math
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from requests.adapters import HTTPAdapter
+
+from app.services import crypto_service, data_key_cache
 
 def get_profile(db_path, phone):
     conn = sqlite3.connect(db_path)
@@ -15,50 +45,266 @@ def get_profile(db_path, phone):
     prof = row["profile"]
     return json.loads(prof) if isinstance(prof, str) else prof
 
-def fetch_ipfs_blob(cid, gateway):
+def fetch_ipfs_blob(cid, gateway, session=None):
     url = gateway.rstrip("/") + "/" + cid
-    r = requests.get(url, timeout=20)
+    r = (session or requests).get(url, timeout=20)
     r.raise_for_status()
     return r.content
 
-def unwrap_key(privkey_path, enc_key_b64):
-    enc = base64.b64decode(enc_key_b64)
-    with open(privkey_path, "rb") as f:
-        priv = serialization.load_pem_private_key(f.read(), password=None)
-    return priv.decrypt(enc, padding.OAEP(
-        mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None))
+def load_private_keys(privkey_paths):
+    """Loaded private keys for a path or a list of paths (None / empty: no keys)."""
+    if isinstance(privkey_paths, str):
+        privkey_paths = [privkey_paths]
+    keys = []
+    for path in privkey_paths or ():
+        with open(path, "rb") as f:
+            keys.append(crypto_service.private_key_from_pem(f.read()))
+    return keys
+
+def _rsa_unwrap(privs, key_version, data, oaep_hash):
+    # key_version (set at wrap time) names the key; older records without one try every key
+    candidates = privs if key_version is None else [k for k in privs if k.version == key_version]
+    if not candidates:
+        raise ValueError("no private key for key_version %s (pass it with --privkey)" % key_version)
+    error = None
+    for key in candidates:
+        try:
+            return crypto_service.rsa_oaep_decrypt(key, data, oaep_hash)
+        except ValueError as e:
+            error = e
+    raise error
+
+def unwrap_profile_key(privs, profile, kek_cache=None):
+    """
+    Data key of a profile with already loaded private keys (a list, or one key; none: base64-dev
+    only). OAEP hash depends on who wrapped it: SHA-1 for tourists.py (rsa-server-pem), SHA-256
+    for KYC (rsa-pem-env).
+    """
+    if privs is None:
+        privs = []
+    elif not isinstance(privs, (list, tuple)):
+        privs = [privs]
+    meta = profile.get("key_meta") or {}
+    method = meta.get("method")
+    enc_key = base64.b64decode(profile["encrypted_key_b64"])
+    if method == data_key_cache.KEK_METHOD and privs:
+        # data key AES-wrapped under a KEK; the KEK is the RSA-wrapped part (once per kek_id)
+        kek = (kek_cache or {}).get(meta.get("kek_id"))
+        if kek is None:
+            kek = _rsa_unwrap(privs, meta.get("key_version"), base64.b64decode(meta["kek_wrapped_b64"]),
+                              crypto_service.OAEP_SHA1)
+            if kek_cache is not None:
+                kek_cache[meta.get("kek_id")] = kek
+        return data_key_cache.unwrap_with_kek(kek, enc_key)
+    if method in crypto_service.OAEP_HASH_BY_METHOD and privs:
+        return _rsa_unwrap(privs, meta.get("key_version"), enc_key, crypto_service.OAEP_HASH_BY_METHOD[method])
+    # dev fallback
+    return enc_key
+
+def decrypt_profile_blob(sym_key, profile, blob):
+    nonce = base64.b64decode(profile["iv_b64"])
+    ciphertext = blob if not blob.startswith(nonce) else blob[len(nonce):]
+    return json.loads(crypto_service.aes_gcm_decrypt(sym_key, nonce, ciphertext).decode())
+
+
+# ----- bulk mode -----
+def select_users(db_path, phones=None, zone=None, near=None, radius_m=None, at=None, window_minutes=30):
+    """
+    [(phone, profile)] for the given phones, or for everyone with a location fix within radius
+    of the zone / point between at - window and at + window.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        if phones is not None:
+            rows = []
+            for i in range(0, len(phones), 500):
+                part = phones[i:i + 500]
+                rows += conn.execute(
+                    "SELECT phone_number, profile FROM users WHERE phone_number IN (%s)" % ",".join("?" * len(part)),
+                    part,
+                ).fetchall()
+        else:
+            if zone:
+                z = conn.execute("SELECT lat, lng, radius_m FROM danger_zones WHERE id = ?", (zone,)).fetchone()
+                if not z:
+                    raise ValueError("No zone " + zone)
+                lat, lng, radius = z["lat"], z["lng"], radius_m or z["radius_m"]
+            else:
+                lat, lng, radius = near[0], near[1], radius_m
+            at = at or datetime.datetime.utcnow()
+            window = datetime.timedelta(minutes=window_minutes)
+            # bounding box in SQL, exact distance below
+            dlat = radius / 111_320.0
+            dlng = radius / (111_320.0 * max(math.cos(math.radians(lat)), 1e-6))
+            fixes = conn.execute(
+                "SELECT DISTINCT l.user_id, l.lat, l.lng FROM locations l "
+                "WHERE l.timestamp BETWEEN ? AND ? AND l.lat BETWEEN ? AND ? AND l.lng BETWEEN ? AND ?",
+                (_sql_ts(at - window), _sql_ts(at + window), lat - dlat, lat + dlat, lng - dlng, lng + dlng),
+            ).fetchall()
+            user_ids = sorted({f["user_id"] for f in fixes if _distance_m(lat, lng, f["lat"], f["lng"]) <= radius})
+            rows = []
+            for i in range(0, len(user_ids), 500):
+                part = user_ids[i:i + 500]
+                rows += conn.execute(
+                    "SELECT phone_number, profile FROM users WHERE id IN (%s)" % ",".join("?" * len(part)), part
+                ).fetchall()
+    finally:
+        conn.close()
+    out = []
+    for row in rows:
+        prof = row["profile"]
+        prof = json.loads(prof) if isinstance(prof, str) else prof
+        if prof and prof.get("ipfs_cid"):
+            out.append((row["phone_number"], prof))
+    return out
+
+def _sql_ts(dt):
+    # SQLAlchemy's SQLite DateTime text format, so BETWEEN compares like for like
+    return dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def _distance_m(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * 6_371_000 * math.asin(math.sqrt(a))
+
+def _pooled_session(size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _cached_fetch(cid, gateway, session, cache_dir):
+    path = os.path.join(cache_dir, os.path.basename(cid)) if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    blob = fetch_ipfs_blob(cid, gateway, session)
+    if path:
+        tmp = "%s.%d.tmp" % (path, threading.get_ident())
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)
+    return blob
+
+# per decrypt worker process: the private keys are loaded once, KEKs once per kek_id
+_worker_privs = []
+_worker_keks = {}
+
+def _init_decrypt_worker(privkey_paths):
+    global _worker_privs
+    _worker_privs = load_private_keys(privkey_paths)
+
+def _decrypt_one(phone, profile, blob):
+    try:
+        sym_key = unwrap_profile_key(_worker_privs, profile, _worker_keks)
+        return {"phone": phone, "ipfs_cid": profile["ipfs_cid"], "profile": decrypt_profile_blob(sym_key, profile, blob)}
+    except Exception as e:
+        return {"phone": phone, "ipfs_cid": profile.get("ipfs_cid"), "error": "decrypt: %s" % e}
+
+def bulk_decrypt(users, privkey_paths, gateway, out, fetch_workers=16, decrypt_workers=None, cache_dir=None):
+    """Fetch, unwrap and decrypt every (phone, profile), writing one NDJSON line each as it finishes."""
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    session = _pooled_session(fetch_workers)
+    counts = {"ok": 0, "error": 0}
+
+    def emit(result):
+        counts["error" if "error" in result else "ok"] += 1
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+
+    decrypt_workers = os.cpu_count() if decrypt_workers is None else decrypt_workers
+    if decrypt_workers > 0:
+        pool = ProcessPoolExecutor(decrypt_workers, initializer=_init_decrypt_worker, initargs=(privkey_paths,))
+    else:
+        pool = ThreadPoolExecutor(1, initializer=_init_decrypt_worker, initargs=(privkey_paths,))
+    with ThreadPoolExecutor(fetch_workers) as fetchers, pool:
+        tags = {}
+        for phone, profile in users:
+            tags[fetchers.submit(_cached_fetch, profile["ipfs_cid"], gateway, session, cache_dir)] = ("fetch", phone, profile)
+        pending = set(tags)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, phone, profile = tags.pop(fut)
+                if kind == "decrypt":
+                    emit(fut.result())
+                    continue
+                try:
+                    blob = fut.result()
+                except Exception as e:
+                    emit({"phone": phone, "ipfs_cid": profile["ipfs_cid"], "error": "fetch: %s" % e})
+                    continue
+                dfut = pool.submit(_decrypt_one, phone, profile, blob)
+                tags[dfut] = ("decrypt", phone, profile)
+                pending.add(dfut)
+    session.close()
+    return counts
+
+def _read_phones(path):
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        return [line.strip() for line in f if line.strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
 
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
     p.add_argument("--db", required=True)
-    p.add_argument("--phone", required=True)
-    p.add_argument("--privkey", required=False, help="Path to server private PEM")
+    p.add_argument("--phone", required=False)
+    p.add_argument("--privkey", action="append", default=[],
+                   help="Path to a server private PEM; repeat for keys of earlier rotations")
     p.add_argument("--ipfs", default="http://127.0.0.1:8080/ipfs")
+    bulk = p.add_argument_group("bulk mode (NDJSON output)")
+    bulk.add_argument("--phones-file", help="one phone_number per line ('-' for stdin)")
+    bulk.add_argument("--zone", help="danger_zones id: everyone located in the zone around --at")
+    bulk.add_argument("--near", help="LAT,LNG: everyone located within --radius-m around --at")
+    bulk.add_argument("--radius-m", type=float, help="radius for --near (overrides the zone's radius)")
+    bulk.add_argument("--at", type=datetime.datetime.fromisoformat, help="UTC time, ISO 8601 (default now)")
+    bulk.add_argument("--window-minutes", type=float, default=30)
+    bulk.add_argument("--out", help="NDJSON file (default stdout)")
+    bulk.add_argument("--fetch-workers", type=int, default=16)
+    bulk.add_argument("--decrypt-workers", type=int, default=None, help="processes (default: CPUs, 0: one thread)")
+    bulk.add_argument("--cache-dir", default=".ipfs-blob-cache", help="local blob cache ('' to disable)")
     args = p.parse_args()
 
+    if args.phones_file or args.zone or args.near:
+        if args.near and not args.radius_m:
+            p.error("--near needs --radius-m")
+        users = select_users(
+            args.db,
+            phones=_read_phones(args.phones_file) if args.phones_file else None,
+            zone=args.zone,
+            near=tuple(float(x) for x in args.near.split(",")) if args.near else None,
+            radius_m=args.radius_m,
+            at=args.at,
+            window_minutes=args.window_minutes,
+        )
+        out = open(args.out, "w") if args.out else sys.stdout
+        try:
+            counts = bulk_decrypt(users, args.privkey, args.ipfs, out, args.fetch_workers,
+                                  args.decrypt_workers, args.cache_dir or None)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print("%d profiles: %d decrypted, %d failed" % (len(users), counts["ok"], counts["error"]), file=sys.stderr)
+        sys.exit(0)
+    if not args.phone:
+        p.error("--phone, --phones-file, --zone or --near is required")
+
     profile = get_profile(args.db, args.phone)
     print("Profile pointer from DB:", json.dumps(profile, indent=2))
 
     cid = profile["ipfs_cid"]
-    enc_key_b64 = profile["encrypted_key_b64"]
-    iv_b64 = profile["iv_b64"]
 
     blob = fetch_ipfs_blob(cid, args.ipfs)
     print(f"Fetched {len(blob)} bytes from IPFS")
 
     # unwrap symmetric key
-    method = profile.get("key_meta", {}).get("method")
-    if method == "rsa-server-pem" and args.privkey:
-        sym_key = unwrap_key(args.privkey, enc_key_b64)
-    else:
-        # dev fallback
-        sym_key = base64.b64decode(enc_key_b64)
-
-    nonce = base64.b64decode(iv_b64)
-    ciphertext = blob if not blob.startswith(nonce) else blob[len(nonce):]
-
-    aesgcm = AESGCM(sym_key)
-    plaintext = aesgcm.decrypt(nonce, ciphertext, None)
+    sym_key = unwrap_profile_key(load_private_keys(args.privkey), profile)
 
     print("\n=== Decrypted JSON ===")
-    print(json.dumps(json.loads(plaintext.decode()), indent=2))
+    print(json.dumps(decrypt_profile_blob(sym_key, profile, blob), indent=2))